@@ -28,92 +28,6 @@ interface ExistingNode {
   description: string
 }
 
-// Levenshtein distance for fuzzy string matching
-function levenshteinDistance(str1: string, str2: string): number {
-  const m = str1.length
-  const n = str2.length
-  const dp: number[][] = Array(m + 1)
-    .fill(null)
-    .map(() => Array(n + 1).fill(0))
-
-  for (let i = 0; i <= m; i++) dp[i][0] = i
-  for (let j = 0; j <= n; j++) dp[0][j] = j
-
-  for (let i = 1; i <= m; i++) {
-    for (let j = 1; j <= n; j++) {
-      if (str1[i - 1] === str2[j - 1]) {
-        dp[i][j] = dp[i - 1][j - 1]
-      } else {
-        dp[i][j] = Math.min(
-          dp[i - 1][j] + 1, // deletion
-          dp[i][j - 1] + 1, // insertion
-          dp[i - 1][j - 1] + 1 // substitution
-        )
-      }
-    }
-  }
-
-  return dp[m][n]
-}
-
-// Calculate similarity score (0-1, where 1 is identical)
-function stringSimilarity(str1: string, str2: string): number {
-  const maxLen = Math.max(str1.length, str2.length)
-  if (maxLen === 0) return 1
-  const distance = levenshteinDistance(str1.toLowerCase(), str2.toLowerCase())
-  return 1 - distance / maxLen
-}
-
-// Find best matching node name using fuzzy matching
-function findBestMatch(
-  query: string,
-  existingNodes: ExistingNode[],
-  threshold: number = 0.7
-): string | null {
-  let bestMatch: { name: string; score: number } | null = null
-
-  for (const node of existingNodes) {
-    const score = stringSimilarity(query.toLowerCase(), node.name.toLowerCase())
-    if (score >= threshold && (!bestMatch || score > bestMatch.score)) {
-      bestMatch = { name: node.name, score }
-    }
-  }
-
-  return bestMatch ? bestMatch.name : null
-}
-
-// Normalize entity names in relationships using fuzzy matching
-function normalizeEntityNames(
-  entities: Entity[],
-  relationships: Relationship[],
-  existingNodes: ExistingNode[]
-): { entities: Entity[]; relationships: Relationship[] } {
-  // First, normalize entity names
-  const normalizedEntities = entities.map((entity) => {
-    const match = findBestMatch(entity.name, existingNodes)
-    return {
-      ...entity,
-      name: match || entity.name,
-    }
-  })
-
-  // Then normalize relationship source/target names
-  const normalizedRelationships = relationships.map((rel) => {
-    const sourceMatch = findBestMatch(rel.source, existingNodes)
-    const targetMatch = findBestMatch(rel.target, existingNodes)
-    return {
-      ...rel,
-      source: sourceMatch || rel.source,
-      target: targetMatch || rel.target,
-    }
-  })
-
-  return {
-    entities: normalizedEntities,
-    relationships: normalizedRelationships,
-  }
-}
-
 export async function POST(request: Request) {
   try {
     let requestBody
@@ -312,17 +226,6 @@ ${existingNodesContext}${documentsContext}`
     // Log the response for debugging
     console.log('OpenAI response:', JSON.stringify(normalizedData, null, 2))
 
-    // Normalize entity names using fuzzy matching if we have existing nodes
-    if (validExistingNodes.length > 0 && normalizedData.entities.length > 0) {
-      const normalized = normalizeEntityNames(
-        normalizedData.entities,
-        normalizedData.relationships,
-        validExistingNodes
-      )
-      normalizedData.entities = normalized.entities
-      normalizedData.relationships = normalized.relationships
-    }
-
     return NextResponse.json(normalizedData)
   } catch (error) {
     console.error('Error parsing entities:', error)
@@ -20,14 +20,19 @@ import 'reactflow/dist/style.css'
 import {
   getProjects,
   createProject,
-  getCharacters,
   createCharacter,
   updateCharacter,
   deleteCharacter,
-  getRelationships,
   createRelationship,
   updateRelationship,
   deleteRelationship,
+  getProjectGraph,
+  getDocumentTree,
+  getDocument,
+  getProjectContext,
+  resolveCharacterNames,
+  saveDocument,
+  saveDocumentOrder as saveDocumentOrderApi,
   type Project,
   type Character as ApiCharacter,
   type Relationship as ApiRelationship,
@@ -35,6 +40,9 @@ import {
 } from '@/lib/api'
 import { useRouter } from 'next/navigation'
 
+// Characters of prompt context (names, descriptions and document passages) sent with a chat message
+const CONTEXT_BUDGET = 12000
+
 // Document structure
 interface DocumentItem {
   name: string
@@ -311,11 +319,7 @@ export default function DashboardPage() {
 
   const loadDocuments = useCallback(async () => {
     try {
-      const response = await fetch('/api/documents')
-      if (response.ok) {
-        const data = await response.json()
-        setDocuments(data.documents || [])
-      }
+      setDocuments(await getDocumentTree())
     } catch (err) {
       console.error('Failed to load documents:', err)
     }
@@ -326,13 +330,8 @@ export default function DashboardPage() {
       setLoadingFile(true)
       setIsEditingFile(false)
       setEditedFileContent('')
-      const response = await fetch(`/api/documents?path=${encodeURIComponent(filePath)}`)
-      if (response.ok) {
-        const data = await response.json()
-        setOpenFile({ path: filePath, name: fileName, content: data.content })
-      } else {
-        setError('Failed to load file')
-      }
+      const file = await getDocument(filePath)
+      setOpenFile({ path: filePath, name: fileName, content: file.content })
     } catch (err) {
       console.error('Failed to load file:', err)
       setError('Failed to load file')
@@ -346,25 +345,12 @@ export default function DashboardPage() {
     
     try {
       setSavingFile(true)
-      const response = await fetch('/api/documents', {
-        method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          path: openFile.path,
-          content: editedFileContent,
-        }),
-      })
-      
-      if (response.ok) {
-        setOpenFile({ ...openFile, content: editedFileContent })
-        setIsEditingFile(false)
-      } else {
-        const errorData = await response.json().catch(() => ({}))
-        setError(errorData.error || 'Failed to save file')
-      }
+      await saveDocument(openFile.path, editedFileContent)
+      setOpenFile({ ...openFile, content: editedFileContent })
+      setIsEditingFile(false)
     } catch (err) {
       console.error('Failed to save file:', err)
-      setError('Failed to save file')
+      setError((err as ApiError).message || 'Failed to save file')
     } finally {
       setSavingFile(false)
     }
@@ -399,10 +385,7 @@ export default function DashboardPage() {
       setLoading(true)
       setError(null)
       
-      const [characters, relationships] = await Promise.all([
-        getCharacters(selectedProjectId),
-        getRelationships(selectedProjectId),
-      ])
+      const { nodes: characters, edges: relationships } = await getProjectGraph(selectedProjectId)
 
       // Convert API characters to ReactFlow nodes
       const flowNodes: Node<CharacterNodeData>[] = characters.map((char) => ({
@@ -531,15 +514,7 @@ export default function DashboardPage() {
       
       const order = buildOrder(newDocuments)
       
-      const response = await fetch('/api/documents', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ order }),
-      })
-      
-      if (!response.ok) {
-        console.error('Failed to save document order')
-      }
+      await saveDocumentOrderApi(order)
     } catch (error) {
       console.error('Error saving document order:', error)
     }
@@ -1425,24 +1400,19 @@ export default function DashboardPage() {
     setIsProcessingChat(true)
 
     try {
-      // Load content of selected documents
-      const documentContents: Array<{ name: string; content: string }> = []
-      for (const doc of documentsToProcess) {
-        try {
-          const response = await fetch(`/api/documents?path=${encodeURIComponent(doc.path)}`)
-          if (response.ok) {
-            const data = await response.json()
-            documentContents.push({ name: doc.name, content: data.content })
-          }
-        } catch (err) {
-          console.error(`Failed to load document ${doc.name}:`, err)
-        }
-      }
-
-      // Prepare existing nodes for RAG context
-      const existingNodes = nodes.map((node) => ({
-        name: node.data.name,
-        description: node.data.description || '',
+      // Only the characters and document passages relevant to the message go into the prompt, within
+      // the budget; passages of the selected documents are always considered
+      const context = await getProjectContext(selectedProjectId, userMessage, {
+        budget: CONTEXT_BUDGET,
+        documents: documentsToProcess.map((doc) => doc.path),
+      })
+      const existingNodes = context.characters.map((character) => ({
+        name: character.name,
+        description: character.description || '',
+      }))
+      const documentContents = context.documents.map((doc) => ({
+        name: doc.name,
+        content: doc.chunks.map((chunk) => chunk.text).join('\n\n'),
       }))
 
       // Call the parse-entities API with existing nodes and document content for RAG
@@ -1464,7 +1434,8 @@ export default function DashboardPage() {
       }
 
       const data = await response.json()
-      const { entities, relationships, answer, isQuestion } = data
+      const { answer, isQuestion } = data
+      let { entities, relationships } = data
 
       // If this is a question, use the answer directly
       if (isQuestion && answer) {
@@ -1475,6 +1446,23 @@ export default function DashboardPage() {
         return
       }
 
+      // Resolve extracted names (possibly misspelled) to the project's characters on the backend's name index
+      if (nodes.length > 0 && entities.length > 0) {
+        const resolved = await resolveCharacterNames(selectedProjectId, [
+          ...entities.map((entity: { name: string }) => entity.name),
+          ...relationships.flatMap((rel: { source: string; target: string }) => [rel.source, rel.target]),
+        ])
+        entities = entities.map((entity: { name: string }) => ({
+          ...entity,
+          name: resolved.get(entity.name) || entity.name,
+        }))
+        relationships = relationships.map((rel: { source: string; target: string }) => ({
+          ...rel,
+          source: resolved.get(rel.source) || rel.source,
+          target: resolved.get(rel.target) || rel.target,
+        }))
+      }
+
       // Create nodes for new entities
       const createdNodes: Node<CharacterNodeData>[] = []
       const createdRelationships: Array<{ source: string; target: string; label: string }> = []
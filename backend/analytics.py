@@ -0,0 +1,415 @@
+"""
+Per-project graph analytics: degree statistics, centrality and communities.
+
+Everything is computed from the integer edge arrays of the project's cached
+CSR graph (graph_engine.ProjectGraph), never from ORM objects:
+
+    degree        in/out/total degree per character and the distribution
+    pagerank      power iteration over the directed relationships
+    betweenness   Brandes' algorithm over the undirected graph, level by
+                  level; from BETWEENNESS_SAMPLES sampled sources (scaled
+                  up) once the graph is larger than that
+    communities   modularity-maximising label propagation over the
+                  undirected graph, with community merging, and the
+                  modularity of the result
+
+Results are cached per project and tagged with the version they were
+computed at. Reads never compute: a request for a project whose result is
+missing or behind its version schedules a recomputation on the service's
+background worker and gets the older result (marked stale) or nothing yet.
+Commits that touch a project already in the cache (the change feed's commit
+listener) schedule one too. Recomputation is incremental where it can be:
+if the nodes and edges are unchanged (a description edit, a move on the
+canvas) the previous result is kept, and PageRank starts from the previous
+ranks.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from cache import TTLCache
+from versioning import get_project_version
+
+DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-10
+PAGERANK_MAX_ITERATIONS = 200
+BETWEENNESS_SAMPLES = 64
+PROPAGATION_ROUNDS = 30
+MAX_TOP = 200
+
+
+def _undirected(n, sources, targets):
+    """CSR (indptr, indices) of the simple undirected graph: no self-loops or parallel edges"""
+    keep = sources != targets
+    low = np.minimum(sources, targets)[keep]
+    high = np.maximum(sources, targets)[keep]
+    pairs = np.unique(low * n + high)
+    low, high = pairs // n, pairs % n
+    rows = np.concatenate([low, high])
+    cols = np.concatenate([high, low])
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[np.argsort(rows, kind='stable')]
+
+
+def _expand(indptr, indices, frontier):
+    """(origins, neighbours) of every edge leaving the frontier"""
+    starts = indptr[frontier]
+    lengths = indptr[frontier + 1] - starts
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.repeat(frontier, lengths), indices[offsets]
+
+
+def pagerank(n, sources, targets, start=None):
+    """PageRank of every node as (scores summing to 1, iterations)"""
+    if n == 0:
+        return np.zeros(0), 0
+    out_degree = np.bincount(sources, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    share = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    rank = np.full(n, 1.0 / n) if start is None else start / start.sum()
+    for iteration in range(1, PAGERANK_MAX_ITERATIONS + 1):
+        flow = np.bincount(targets, weights=(rank * share)[sources], minlength=n)
+        updated = (1 - DAMPING) / n + DAMPING * (flow + rank[dangling].sum() / n)
+        if np.abs(updated - rank).sum() < PAGERANK_TOLERANCE:
+            return updated, iteration
+        rank = updated
+    return rank, PAGERANK_MAX_ITERATIONS
+
+
+def betweenness(n, indptr, indices, samples=BETWEENNESS_SAMPLES, seed=0):
+    """Normalized betweenness centrality as (scores, number of sources used)"""
+    scores = np.zeros(n)
+    if n < 3:
+        return scores, n
+    if samples >= n:
+        pivots = np.arange(n)
+    else:
+        pivots = np.random.default_rng(seed).choice(n, samples, replace=False)
+
+    for source in pivots:
+        distance = np.full(n, -1, dtype=np.int64)
+        paths = np.zeros(n)
+        distance[source] = 0
+        paths[source] = 1.0
+        frontier = np.array([source], dtype=np.int64)
+        levels = []
+        depth = 0
+        # Forward: count shortest paths one BFS level at a time
+        while len(frontier):
+            origins, neighbours = _expand(indptr, indices, frontier)
+            distance[neighbours[distance[neighbours] < 0]] = depth + 1
+            on_path = distance[neighbours] == depth + 1
+            origins, neighbours = origins[on_path], neighbours[on_path]
+            if not len(neighbours):
+                break
+            paths += np.bincount(neighbours, weights=paths[origins], minlength=n)
+            levels.append((origins, neighbours))
+            frontier = np.unique(neighbours)
+            depth += 1
+        # Backward: accumulate dependencies from the deepest level up
+        dependency = np.zeros(n)
+        for origins, neighbours in reversed(levels):
+            dependency += np.bincount(
+                origins, weights=paths[origins] / paths[neighbours] * (1 + dependency[neighbours]), minlength=n
+            )
+        dependency[source] = 0
+        scores += dependency
+
+    # Each undirected path was counted from both ends
+    scores *= n / len(pivots) / 2
+    return scores / ((n - 1) * (n - 2) / 2), len(pivots)
+
+
+def _propagate(labels, owners, indices, degree, rng):
+    """Move nodes to the neighbouring community that most raises modularity until none does"""
+    n = len(labels)
+    two_m = len(indices)
+    for _ in range(PROPAGATION_ROUNDS):
+        totals = np.bincount(labels, weights=degree, minlength=n)
+        keys, counts = np.unique(owners * n + labels[indices], return_counts=True)
+        node, label = keys // n, keys % n
+        current = labels[node] == label
+        # Modularity gain of joining label, with the node itself taken out of its own community
+        gain = counts - degree[node] * (totals[label] - np.where(current, degree[node], 0)) / two_m
+        stay = -degree * (totals[labels] - degree) / two_m
+        stay[node[current]] = gain[current]
+
+        order = np.lexsort((rng.random(len(gain)), gain, node))
+        last = np.append(node[order][1:] != node[order][:-1], True)
+        best_node, best_label, best_gain = node[order][last], label[order][last], gain[order][last]
+        better = best_gain > stay[best_node] + 1e-12
+        if not better.any():
+            break
+        # Move about half of them per round so neighbours can't swap communities forever
+        move = better & (rng.random(len(best_node)) < 0.5)
+        labels[best_node[move]] = best_label[move]
+    return labels
+
+
+def _merge(labels, owners, indices, degree):
+    """Merge pairs of communities while that raises modularity; None if no pair does"""
+    two_m = len(indices)
+    merged = False
+    while True:
+        groups, labels = np.unique(labels, return_inverse=True)
+        count = len(groups)
+        totals = np.bincount(labels, weights=degree, minlength=count)
+        a, b = labels[owners], labels[indices]
+        across = a != b
+        keys, links = np.unique(a[across] * count + b[across], return_counts=True)
+        if not len(keys):
+            break
+        a, b = keys // count, keys % count
+        gain = 2 * links / two_m - 2 * totals[a] * totals[b] / (two_m * two_m)
+        order = np.lexsort((gain, a))
+        last = np.append(a[order][1:] != a[order][:-1], True)
+        best = np.full(count, -1, dtype=np.int64)
+        best[a[order][last]] = np.where(gain[order][last] > 1e-12, b[order][last], -1)
+        # Merge pairs that are each other's best partner (the best pair overall always is)
+        mutual = np.flatnonzero((best >= 0) & (best[np.maximum(best, 0)] == np.arange(count)))
+        mutual = mutual[mutual < best[mutual]]
+        if not len(mutual):
+            break
+        target = np.arange(count)
+        target[best[mutual]] = mutual
+        labels = target[labels]
+        merged = True
+    return labels if merged else None
+
+
+def communities(n, indptr, indices, seed=0):
+    """Community label per node (labels are arbitrary integers).
+
+    Label propagation that maximises modularity, then merging of community
+    pairs that raises it further, repeated until merging stops helping.
+    """
+    labels = np.arange(n, dtype=np.int64)
+    if not len(indices):
+        return labels
+    rng = np.random.default_rng(seed)
+    owners = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    degree = np.diff(indptr).astype(np.float64)
+    while True:
+        labels = _propagate(labels, owners, indices, degree, rng)
+        merged = _merge(labels, owners, indices, degree)
+        if merged is None:
+            return labels
+        labels = merged
+
+
+def modularity(n, indptr, indices, labels):
+    """Newman modularity of a labelling of the undirected graph"""
+    edges = len(indices) / 2
+    if not edges:
+        return 0.0
+    owners = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    inside = np.count_nonzero(labels[owners] == labels[indices]) / 2
+    degree_sums = np.bincount(labels, weights=np.diff(indptr).astype(np.float64), minlength=n)
+    return float(inside / edges - np.sum((degree_sums / (2 * edges)) ** 2))
+
+
+class ProjectAnalytics:
+    """Analytics of one project's graph at one version"""
+
+    def __init__(self, graph, previous=None, samples=BETWEENNESS_SAMPLES):
+        started = time.perf_counter()
+        self.project_id = graph.project_id
+        self.version = graph.version
+        self.ids = graph.ids
+        self.names = graph.names
+        n = graph.num_nodes
+        sources, targets = graph.edges
+        self.num_edges = len(sources)
+        self.edge_key = np.sort(sources * max(n, 1) + targets)
+
+        if previous is not None and np.array_equal(previous.ids, self.ids) \
+                and np.array_equal(previous.edge_key, self.edge_key):
+            # Same nodes and edges: only names (or nothing the graph sees) changed
+            self.__dict__.update({key: value for key, value in previous.__dict__.items()
+                                  if key not in ('version', 'names', 'computed_at', 'seconds')})
+            self.computed_at = time.time()
+            self.seconds = time.perf_counter() - started
+            return
+
+        self.out_degree = np.bincount(sources, minlength=n)
+        self.in_degree = np.bincount(targets, minlength=n)
+        self.degree = self.out_degree + self.in_degree
+
+        start = None
+        if previous is not None and len(previous.ids) and n:
+            # Warm start from the previous ranks; new characters start at the average
+            position = np.minimum(np.searchsorted(previous.ids, self.ids), len(previous.ids) - 1)
+            known = previous.ids[position] == self.ids
+            start = np.where(known, previous.pagerank[position], 1.0 / n)
+        self.pagerank, self.pagerank_iterations = pagerank(n, sources, targets, start)
+
+        indptr, indices = _undirected(n, sources, targets)
+        self.betweenness, self.betweenness_sources = betweenness(n, indptr, indices, samples)
+
+        labels = communities(n, indptr, indices)
+        self.modularity = modularity(n, indptr, indices, labels)
+        # Number communities by size, largest first; members ordered by PageRank
+        _, self.community, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        by_size = np.argsort(-sizes, kind='stable')
+        self.community = np.argsort(by_size)[self.community]
+        self.community_sizes = sizes[by_size]
+
+        self.computed_at = time.time()
+        self.seconds = time.perf_counter() - started
+
+    def _node(self, index, **scores):
+        return dict({'id': int(self.ids[index]), 'name': self.names[index]}, **scores)
+
+    def _top(self, values, top):
+        """Indices of the top nodes by values, ties by id"""
+        return np.lexsort((self.ids, -values))[:top]
+
+    def to_dict(self, top=20):
+        n = len(self.ids)
+        degree_values, degree_counts = np.unique(self.degree, return_counts=True)
+        # The five highest-ranked members of each of the top communities
+        order = np.lexsort((self.ids, -self.pagerank, self.community))
+        grouped = self.community[order]
+        rank = np.arange(n) - np.searchsorted(grouped, grouped)
+        members = {}
+        for index in order[(grouped < top) & (rank < 5)]:
+            members.setdefault(int(self.community[index]), []).append(self._node(index))
+        return {
+            'project_id': self.project_id,
+            'version': self.version,
+            'computed_at': self.computed_at,
+            'seconds': round(self.seconds, 3),
+            'characters': n,
+            'relationships': self.num_edges,
+            'degree': {
+                'mean': float(self.degree.mean()) if n else 0.0,
+                'median': float(np.median(self.degree)) if n else 0.0,
+                'max': int(self.degree.max()) if n else 0,
+                'isolated': int(np.count_nonzero(self.degree == 0)),
+                'distribution': [[int(value), int(count)] for value, count in zip(degree_values, degree_counts)],
+                'top': [self._node(i, degree=int(self.degree[i]), in_degree=int(self.in_degree[i]),
+                                   out_degree=int(self.out_degree[i]))
+                        for i in self._top(self.degree, top)],
+            },
+            'pagerank': {
+                'damping': DAMPING,
+                'iterations': self.pagerank_iterations,
+                'top': [self._node(i, score=float(self.pagerank[i])) for i in self._top(self.pagerank, top)],
+            },
+            'betweenness': {
+                'sources': self.betweenness_sources,
+                'exact': self.betweenness_sources >= n,
+                'top': [self._node(i, score=float(self.betweenness[i])) for i in self._top(self.betweenness, top)],
+            },
+            'communities': {
+                'count': len(self.community_sizes),
+                'modularity': round(self.modularity, 4),
+                'top': [
+                    {'id': group, 'size': int(size), 'members': members.get(group, [])}
+                    for group, size in enumerate(self.community_sizes[:top].tolist())
+                ],
+            },
+        }
+
+
+class AnalyticsService:
+    """Cached per-project analytics, recomputed on a background worker"""
+
+    def __init__(self, app, graph_cache, maxsize=64, workers=1, samples=BETWEENNESS_SAMPLES):
+        self.app = app
+        self.graph_cache = graph_cache
+        self.results = TTLCache(maxsize=maxsize, ttl=86400.0)
+        self.workers = workers
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._scheduled = set()
+        self._dirty = set()
+        self._closed = False
+        self.computed = 0
+        self.failed = 0
+
+    def get(self, project_id, version):
+        """The latest result for a project (possibly for an older version), or None.
+
+        Schedules a recomputation unless the result is for version.
+        """
+        result = self.results.get(project_id)
+        if result is None or result.version != version:
+            self.schedule(project_id)
+        return result
+
+    def schedule(self, project_id):
+        """Recompute a project's analytics on the worker (coalescing repeated requests)"""
+        with self._lock:
+            if self._closed:
+                return
+            if self._pid != os.getpid():
+                # First use in this process (or a forked copy of the parent's state)
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analytics')
+                self._scheduled.clear()
+                self._dirty.clear()
+            if project_id in self._scheduled:
+                # Already queued or running: run once more afterwards
+                self._dirty.add(project_id)
+                return
+            self._scheduled.add(project_id)
+            self._executor.submit(self._run, project_id)
+
+    def on_commit(self, project_id, since, version):
+        """Change feed commit listener: refresh projects someone has asked about"""
+        if self.results.get(project_id) is not None:
+            self.schedule(project_id)
+
+    def compute(self, project_id):
+        """Compute a project's analytics now and cache them (needs an app context)"""
+        version = get_project_version(project_id)
+        if version is None:
+            self.results.pop(project_id)
+            return None
+        previous = self.results.get(project_id)
+        if previous is not None and previous.version == version:
+            return previous
+        result = ProjectAnalytics(self.graph_cache.get(project_id, version), previous, self.samples)
+        self.results.set(project_id, result)
+        self.computed += 1
+        return result
+
+    def _run(self, project_id):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.compute(project_id)
+            except Exception:
+                self.failed += 1
+                self.app.logger.exception('Analytics for project %s failed', project_id)
+            with self._lock:
+                if project_id not in self._dirty or self._closed:
+                    self._scheduled.discard(project_id)
+                    return
+                self._dirty.discard(project_id)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return dict(self.results.stats(), computed=self.computed, failed=self.failed,
+                    scheduled=len(self._scheduled))
+
+
+def install(app, feed, graph_cache, maxsize=64, workers=1, samples=BETWEENNESS_SAMPLES):
+    """Create the app's analytics service and refresh it after committed writes"""
+    service = AnalyticsService(app, graph_cache, maxsize=maxsize, workers=workers, samples=samples)
+    feed.add_commit_listener(service.on_commit)
+    app.extensions['analytics'] = service
+    return service
@@ -1,14 +1,46 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort, stream_with_context
+from sqlalchemy import text
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import hashlib
+import hmac
 from datetime import datetime, timedelta
 import jwt
 from functools import wraps
-from models import db, User, Project, Character, CharacterRelationship, RelationshipType
+from models import (db, User, Project, Character, CharacterRelationship, RelationshipType, ExtractionJob,
+                    add_missing_columns)
+from batch import apply_batch
+from importer import ImportDocumentError, import_world
+from archive import ArchiveError, export_project, gzip_stream, import_archive, open_archive
+from graph_engine import GraphCache, GraphQueryError, UnknownCharacter, parse_direction
+from layout import DEFAULT_SPACING, LayoutError, layout_project
+from name_matcher import MatchQueryError, NameIndexCache, parse_match_request
+import search
+import changes
+import live
+import auth_cache
+import db_profile
+import metrics
+import compression
+import serialization
+import versioning
+import lifecycle
+import analytics
+import documents
+import context
+import extraction
+import mentions
+from versioning import get_project_version, project_etag
+from pagination import PaginationError, page_tag, parse_page_args, paged_response, stream_response
+from fieldsets import (CHARACTER_FIELDS, RELATIONSHIP_FIELDS, FieldsError, character_load_options,
+                       fieldset_tag, parse_fields, relationship_load_options)
+from hashing import PasswordHasher, HasherBusy, hash_method_for
 
 app = Flask(__name__)
-CORS(app)
+CORS_EXPOSE_HEADERS = ['ETag', 'Link', 'X-Next-Cursor', 'Server-Timing']
+CORS(app, expose_headers=CORS_EXPOSE_HEADERS)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -25,8 +57,203 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Engine profile: WAL and pragmas for SQLite, pool sizing for PostgreSQL (see db_profile.py)
+app.config.update(db_profile.load_settings())
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_profile.engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'], app.config
+)
+
+# Authenticated-context cache (verified users and their project ids)
+app.config['AUTH_CACHE_SIZE'] = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+app.config['AUTH_CACHE_TTL'] = float(os.environ.get('AUTH_CACHE_TTL', 60))
+
+# Password hashing runs on a small bounded pool so login bursts can't starve other requests
+app.config['PASSWORD_HASH_PROFILE'] = os.environ.get('PASSWORD_HASH_PROFILE', 'default')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+
+password_hasher = PasswordHasher(
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_QUEUE']
+)
+
+# In-memory CSR graphs for neighbourhood/path/component queries
+app.config['GRAPH_CACHE_SIZE'] = int(os.environ.get('GRAPH_CACHE_SIZE', 64))
+graph_cache = GraphCache(maxsize=app.config['GRAPH_CACHE_SIZE'])
+
+# Server-side force-directed layout: spacing is the ideal distance between related characters in canvas units
+app.config['LAYOUT_SPACING'] = float(os.environ.get('LAYOUT_SPACING', DEFAULT_SPACING))
+app.config['LAYOUT_ON_IMPORT'] = os.environ.get('LAYOUT_ON_IMPORT', 'true').lower() not in ('0', 'false', 'no')
+
+# Graph analytics (degrees, PageRank, betweenness, communities), cached per project and refreshed in the background
+app.config['ANALYTICS_CACHE_SIZE'] = int(os.environ.get('ANALYTICS_CACHE_SIZE', 64))
+app.config['ANALYTICS_WORKERS'] = int(os.environ.get('ANALYTICS_WORKERS', 1))
+app.config['ANALYTICS_BETWEENNESS_SAMPLES'] = int(
+    os.environ.get('ANALYTICS_BETWEENNESS_SAMPLES', analytics.BETWEENNESS_SAMPLES)
+)
+
+# Per-project trigram indexes for fuzzy character-name matching
+app.config['NAME_INDEX_CACHE_SIZE'] = int(os.environ.get('NAME_INDEX_CACHE_SIZE', 64))
+name_indexes = NameIndexCache(maxsize=app.config['NAME_INDEX_CACHE_SIZE'])
+
+# The markdown corpus, served from memory and kept current from filesystem notifications
+# (DOCUMENT_WATCH=auto uses watchdog when installed) or by polling every DOCUMENT_RESCAN_SECONDS
+app.config['DOCUMENTS_DIR'] = os.environ.get(
+    'DOCUMENTS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'documents')
+)
+app.config['DOCUMENT_RESCAN_SECONDS'] = float(os.environ.get('DOCUMENT_RESCAN_SECONDS', 5))
+app.config['DOCUMENT_WATCH'] = os.environ.get('DOCUMENT_WATCH', 'auto')
+app.config['DOCUMENT_CACHE_BYTES'] = int(os.environ.get('DOCUMENT_CACHE_BYTES', documents.DEFAULT_CACHE_BYTES))
+
+# Relevance-ranked prompt context: per-project character indexes and the document passage index
+app.config['CONTEXT_CACHE_SIZE'] = int(os.environ.get('CONTEXT_CACHE_SIZE', 64))
+app.config['CONTEXT_CHUNK_CHARS'] = int(os.environ.get('CONTEXT_CHUNK_CHARS', context.CHUNK_CHARS))
+
+# Character mentions in the documents (an Aho-Corasick automaton per project over names and aliases)
+app.config['MENTION_CACHE_SIZE'] = int(os.environ.get('MENTION_CACHE_SIZE', 64))
+
+# Background extraction jobs (see extraction.py): EXTRACTOR=auto uses OpenAI when the openai package and
+# OPENAI_API_KEY are available and the local stub otherwise; chunk results are cached by content hash
+app.config['EXTRACTOR'] = os.environ.get('EXTRACTOR', 'auto')
+app.config['EXTRACTION_MODEL'] = os.environ.get('EXTRACTION_MODEL', extraction.OPENAI_MODEL)
+app.config['EXTRACTION_WORKERS'] = int(os.environ.get('EXTRACTION_WORKERS', 4))
+app.config['EXTRACTION_CHUNK_CHARS'] = int(os.environ.get('EXTRACTION_CHUNK_CHARS', extraction.DEFAULT_CHUNK_CHARS))
+app.config['EXTRACTION_OVERLAP_CHARS'] = int(
+    os.environ.get('EXTRACTION_OVERLAP_CHARS', extraction.DEFAULT_OVERLAP_CHARS)
+)
+
+# Change log behind /changes?since=: entries older than the retention are compacted away
+app.config['CHANGE_LOG_RETENTION_SECONDS'] = float(os.environ.get('CHANGE_LOG_RETENTION_SECONDS', 86400))
+app.config['CHANGE_LOG_COMPACT_SECONDS'] = float(os.environ.get('CHANGE_LOG_COMPACT_SECONDS', 600))
+
+# Live updates over server-sent events; LIVE_BROKER=redis (or 'module:factory') for multi-worker deployments
+app.config['LIVE_BROKER'] = os.environ.get('LIVE_BROKER', 'local')
+app.config['LIVE_BROKER_URL'] = os.environ.get('LIVE_BROKER_URL')
+app.config['LIVE_BUFFER_SIZE'] = int(os.environ.get('LIVE_BUFFER_SIZE', live.DEFAULT_BUFFER_SIZE))
+app.config['LIVE_HEARTBEAT_SECONDS'] = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', live.DEFAULT_HEARTBEAT_SECONDS))
+
+# JSON encoding (orjson when installed), the row serializer for large listings, and response compression
+app.config['JSON_ENCODER'] = os.environ.get('JSON_ENCODER', 'auto')
+app.config['ROW_SERIALIZER'] = os.environ.get('ROW_SERIALIZER', 'true').lower() not in ('0', 'false', 'no')
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 5))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+# Request instrumentation (Server-Timing header, /api/metrics) and the slow-query log
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG')
+# /api/metrics and /api/auth/cache answer only "Authorization: Bearer <METRICS_TOKEN>"; unset, they are off
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+
+# Production serving (gunicorn.conf.py and asgi.py). The async engine defaults to DATABASE_URL on its async driver
+app.config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')
+app.config['ASGI_WSGI_THREADS'] = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+app.config['ASGI_SERIALIZE_THREADS'] = int(os.environ.get('ASGI_SERIALIZE_THREADS', 4))
+
 # Initialize database
 db.init_app(app)
+db_profile.install(app, db)
+serialization.install(app, app.config['JSON_ENCODER'])
+request_metrics = metrics.install(
+    app, db,
+    slow_query_ms=app.config['SLOW_QUERY_MS'],
+    slow_query_log=app.config['SLOW_QUERY_LOG']
+) if app.config['METRICS_ENABLED'] else None
+if app.config['COMPRESSION_ENABLED']:
+    # After metrics, so its after_request hook (which runs first) is included in the request time
+    compression.install(
+        app,
+        min_size=app.config['COMPRESS_MIN_BYTES'],
+        gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+    )
+auth_context = auth_cache.install(
+    app,
+    maxsize=app.config['AUTH_CACHE_SIZE'],
+    ttl=app.config['AUTH_CACHE_TTL']
+)
+versioning.install()
+change_feed = changes.install(
+    app,
+    retention_seconds=app.config['CHANGE_LOG_RETENTION_SECONDS'],
+    compact_seconds=app.config['CHANGE_LOG_COMPACT_SECONDS']
+)
+live_hub = live.install(
+    app, db, change_feed,
+    broker=app.config['LIVE_BROKER'],
+    broker_url=app.config['LIVE_BROKER_URL'],
+    buffer_size=app.config['LIVE_BUFFER_SIZE']
+)
+analytics_service = analytics.install(
+    app, change_feed, graph_cache,
+    maxsize=app.config['ANALYTICS_CACHE_SIZE'],
+    workers=app.config['ANALYTICS_WORKERS'],
+    samples=app.config['ANALYTICS_BETWEENNESS_SAMPLES']
+)
+document_corpus = documents.install(
+    app, app.config['DOCUMENTS_DIR'],
+    rescan_seconds=app.config['DOCUMENT_RESCAN_SECONDS'],
+    watch=app.config['DOCUMENT_WATCH'],
+    cache_bytes=app.config['DOCUMENT_CACHE_BYTES']
+)
+search_service = search.install(app, corpus=document_corpus)
+context_service = context.install(
+    app, document_corpus,
+    maxsize=app.config['CONTEXT_CACHE_SIZE'],
+    chunk_chars=app.config['CONTEXT_CHUNK_CHARS']
+)
+mention_service = mentions.install(app, document_corpus, maxsize=app.config['MENTION_CACHE_SIZE'])
+extraction_service = extraction.install(
+    app, extractor=app.config['EXTRACTOR'],
+    model=app.config['EXTRACTION_MODEL'],
+    api_key=os.environ.get('OPENAI_API_KEY'),
+    workers=app.config['EXTRACTION_WORKERS'],
+    chunk_chars=app.config['EXTRACTION_CHUNK_CHARS'],
+    overlap_chars=app.config['EXTRACTION_OVERLAP_CHARS']
+)
+server_lifecycle = lifecycle.install(app)
+
+@server_lifecycle.on_startup
+def open_database():
+    """Drop connections inherited across a fork, then fail fast if the database is unreachable"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+@server_lifecycle.on_startup
+def warm_search_index():
+    """Scan the documents, pick the search backend and index them now rather than on the first request"""
+    with app.app_context():
+        search_service.sync_documents()
+
+# Open event streams end first (clients reconnect to another worker), then pools and connections close
+server_lifecycle.on_drain(live_hub.close)
+@server_lifecycle.on_shutdown
+def close_database():
+    with app.app_context():
+        db.engine.dispose()
+
+server_lifecycle.on_shutdown(password_hasher.shutdown)
+server_lifecycle.on_shutdown(analytics_service.shutdown)
+server_lifecycle.on_shutdown(document_corpus.close)
+server_lifecycle.on_shutdown(extraction_service.shutdown)
+
+if request_metrics is not None:
+    request_metrics.add_collector(metrics.cache_collector({
+        'auth_users': auth_context.users,
+        'auth_memberships': auth_context.memberships,
+        'graphs': graph_cache,
+        'name_indexes': name_indexes,
+        'analytics': analytics_service,
+        'documents': document_corpus,
+        'context': context_service,
+        'mentions': mention_service,
+    }))
+    request_metrics.add_collector(live.stats_collector(live_hub))
 
 def generate_token(user_id):
     """Generate JWT token for user"""
@@ -36,7 +263,7 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
-def verify_token(f):
+def verify_token(f, allow_query_token=False):
     """Decorator to verify JWT token"""
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -47,13 +274,16 @@ def verify_token(f):
                 token = auth_header.split(' ')[1]  # Bearer <token>
             except IndexError:
                 return jsonify({'message': 'Invalid token format'}), 401
+        elif allow_query_token:
+            token = request.args.get('token')
         
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(int(data['user_id']))
+            with metrics.phase('auth'):
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                current_user = auth_context.get_user(int(data['user_id']))
             if not current_user:
                 return jsonify({'message': 'User not found'}), 401
         except jwt.ExpiredSignatureError:
@@ -64,6 +294,67 @@ def verify_token(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+def verify_stream_token(f):
+    """verify_token that also accepts ?token= (EventSource can't send headers)"""
+    return verify_token(f, allow_query_token=True)
+
+def verify_metrics_token(f):
+    """Decorator for operational endpoints: 404 unless METRICS_TOKEN is set, 401 without it"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        expected = app.config['METRICS_TOKEN']
+        if not expected:
+            abort(404)
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(token.encode(), expected.encode()):
+            return jsonify({'message': 'Invalid metrics token'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def verify_project_access(current_user, project_id):
+    """Abort with 404 unless the project belongs to the user (served from the auth cache).
+
+    Routes re-raise the HTTPException ahead of their catch-all handler.
+    """
+    with metrics.phase('access'):
+        owned = auth_context.owns_project(current_user.id, project_id)
+    if not owned:
+        abort(404, description='Project not found')
+
+@app.errorhandler(HTTPException)
+def http_error(e):
+    """HTTP errors as JSON, like every other API error"""
+    return jsonify({'message': e.description}), e.code
+
+def cached_response(etag, build):
+    """Answer 304 if If-None-Match matches etag, otherwise build()'s result with the ETag set.
+
+    build() may return JSON-serializable data or a ready Response. The ETags of
+    compressed representations (see compression.py) match too.
+    """
+    matched = next((tag for tag in compression.etag_variants(etag) if request.if_none_match.contains(tag)), None)
+    if matched:
+        response = app.response_class(status=304)
+        etag = matched
+    else:
+        result = build()
+        response = result if isinstance(result, app.response_class) else jsonify(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def json_bytes_response(write, *args):
+    """Response from a serialization row writer, timed as serialization"""
+    with metrics.serializing():
+        body = write(*args)
+    return app.response_class(body, mimetype='application/json')
+
+def busy_response():
+    """503 returned when the password hashing pool is saturated"""
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # ==================== AUTH ENDPOINTS ====================
 
 @app.route('/api/auth/signup', methods=['POST'])
@@ -83,9 +374,12 @@ def signup():
         if len(password) < 8:
             return jsonify({'message': 'Password must be at least 8 characters'}), 400
 
+        # Give the DB connection back to the pool while waiting on the hashing pool
+        db.session.close()
+
         # Create user
         user = User(name=name, email=email)
-        user.set_password(password)
+        password_hasher.run(user.set_password, password, hash_method_for(app.config['PASSWORD_HASH_PROFILE']))
         db.session.add(user)
         db.session.commit()
 
@@ -98,6 +392,9 @@ def signup():
             'user': user.to_dict()
         }), 201
 
+    except HasherBusy:
+        db.session.rollback()
+        return busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -114,7 +411,10 @@ def login():
 
         user = User.query.filter_by(email=email).first()
 
-        if not user or not user.check_password(password):
+        # Give the DB connection back to the pool while waiting on the hashing pool
+        db.session.close()
+
+        if not user or not password_hasher.run(user.check_password, password):
             return jsonify({'message': 'Invalid email or password'}), 401
 
         # Generate token
@@ -126,6 +426,8 @@ def login():
             'user': user.to_dict()
         }), 200
 
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -136,8 +438,17 @@ def login():
 def get_projects(current_user):
     """Get all projects for the current user"""
     try:
-        projects = Project.query.filter_by(user_id=current_user.id).all()
-        return jsonify([project.to_dict() for project in projects]), 200
+        # The list changes whenever a project is added/removed or any project's version moves
+        versions = db.session.query(Project.id, Project.version).filter_by(
+            user_id=current_user.id
+        ).order_by(Project.id).all()
+        digest = hashlib.sha1(repr([tuple(row) for row in versions]).encode()).hexdigest()[:16]
+
+        def build():
+            projects = Project.query.filter_by(user_id=current_user.id).all()
+            return [project.to_dict() for project in projects]
+
+        return cached_response(f'u{current_user.id}-{digest}', build)
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -167,8 +478,16 @@ def create_project(current_user):
 def get_project(current_user, project_id):
     """Get a specific project"""
     try:
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
-        return jsonify(project.to_dict()), 200
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        version = get_project_version(project_id)
+        return cached_response(
+            project_etag(project_id, version),
+            lambda: db.session.get(Project, project_id).to_dict()
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -177,13 +496,40 @@ def get_project(current_user, project_id):
 @app.route('/api/projects/<int:project_id>/characters', methods=['GET'])
 @verify_token
 def get_characters(current_user, project_id):
-    """Get all characters in a project"""
+    """Get all characters in a project (supports ?limit=&after=, ?stream=ndjson|json and ?fields=)"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
-        characters = Character.query.filter_by(project_id=project_id).all()
-        return jsonify([char.to_dict() for char in characters]), 200
+        page = parse_page_args(request.args)
+        fieldset = parse_fields(request.args.get('fields'), CHARACTER_FIELDS, request.args.get('summary_length'))
+        version = get_project_version(project_id)
+
+        def build():
+            query = Character.query.filter_by(project_id=project_id)
+            serialize = Character.to_dict
+            if fieldset is not None:
+                query = query.options(*character_load_options(fieldset))
+                serialize = lambda char: char.to_dict(fields=fieldset.fields)
+            if page.stream:
+                return stream_response(query, Character.id, serialize, page)
+            if page.limit:
+                return paged_response(query, Character.id, serialize, page)
+            if app.config['ROW_SERIALIZER']:
+                return json_bytes_response(
+                    serialization.write_characters,
+                    serialization.character_rows(db.session.connection(), project_id, fieldset),
+                    fieldset
+                )
+            return [serialize(char) for char in query.all()]
+
+        return cached_response(
+            project_etag(project_id, version, 'characters', fieldset_tag(fieldset), page_tag(page)), build
+        )
+    except (PaginationError, FieldsError) as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -193,7 +539,7 @@ def create_character(current_user, project_id):
     """Create a new character"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         data = request.get_json()
         name = data.get('name')
@@ -226,20 +572,66 @@ def create_character(current_user, project_id):
         db.session.commit()
 
         return jsonify(character.to_dict()), 201
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
 
+@app.route('/api/projects/<int:project_id>/characters/match', methods=['POST'])
+@verify_token
+def match_characters(current_user, project_id):
+    """Fuzzy-match a batch of names against the project's characters.
+
+    Body: {"names": [...], "limit": 3, "threshold": 0.7}. Scores are
+    1 - edit distance / longer length on case-folded names; each name gets up
+    to limit characters scoring at least threshold, best first.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        names, limit, threshold = parse_match_request(request.get_json() or {})
+        index = name_indexes.get(project_id, get_project_version(project_id))
+
+        return jsonify({
+            'results': [
+                {'name': name, 'matches': index.match(name, limit=limit, threshold=threshold)}
+                for name in names
+            ]
+        }), 200
+    except MatchQueryError as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @app.route('/api/projects/<int:project_id>/characters/<int:character_id>', methods=['GET'])
 @verify_token
 def get_character(current_user, project_id, character_id):
-    """Get a specific character with relationships"""
+    """Get a specific character with relationships (or just the keys in ?fields=)"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
-        character = Character.query.filter_by(id=character_id, project_id=project_id).first_or_404()
-        return jsonify(character.to_dict(include_relationships=True)), 200
+        fieldset = parse_fields(request.args.get('fields'), CHARACTER_FIELDS, request.args.get('summary_length'))
+        version = get_project_version(project_id)
+
+        def build():
+            query = Character.query.filter_by(id=character_id, project_id=project_id)
+            if fieldset is not None:
+                return query.options(*character_load_options(fieldset)).first_or_404().to_dict(fields=fieldset.fields)
+            character = query.first_or_404()
+            return character.to_dict(include_relationships=True)
+
+        return cached_response(
+            project_etag(project_id, version, 'character', character_id, fieldset_tag(fieldset)), build
+        )
+    except FieldsError as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -249,7 +641,7 @@ def update_character(current_user, project_id, character_id):
     """Update a character"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         character = Character.query.filter_by(id=character_id, project_id=project_id).first_or_404()
         
@@ -282,6 +674,8 @@ def update_character(current_user, project_id, character_id):
         db.session.commit()
 
         return jsonify(character.to_dict()), 200
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -292,7 +686,7 @@ def delete_character(current_user, project_id, character_id):
     """Delete a character (and all its relationships)"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         character = Character.query.filter_by(id=character_id, project_id=project_id).first_or_404()
         
@@ -300,6 +694,8 @@ def delete_character(current_user, project_id, character_id):
         db.session.commit()
 
         return jsonify({'message': 'Character deleted successfully'}), 200
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -309,13 +705,41 @@ def delete_character(current_user, project_id, character_id):
 @app.route('/api/projects/<int:project_id>/relationships', methods=['GET'])
 @verify_token
 def get_relationships(current_user, project_id):
-    """Get all relationships in a project"""
+    """Get all relationships in a project (supports ?limit=&after=, ?stream=ndjson|json and ?fields=)"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
-        relationships = CharacterRelationship.query.filter_by(project_id=project_id).all()
-        return jsonify([rel.to_dict() for rel in relationships]), 200
+        page = parse_page_args(request.args)
+        fieldset = parse_fields(request.args.get('fields'), RELATIONSHIP_FIELDS)
+        version = get_project_version(project_id)
+
+        def build():
+            query = CharacterRelationship.query.filter_by(project_id=project_id).options(
+                *relationship_load_options(fieldset)
+            )
+            serialize = CharacterRelationship.to_dict
+            if fieldset is not None:
+                serialize = lambda rel: rel.to_dict(fields=fieldset.fields)
+            if page.stream:
+                return stream_response(query, CharacterRelationship.id, serialize, page)
+            if page.limit:
+                return paged_response(query, CharacterRelationship.id, serialize, page)
+            if app.config['ROW_SERIALIZER']:
+                return json_bytes_response(
+                    serialization.write_relationships,
+                    serialization.relationship_rows(db.session.connection(), project_id, fieldset=fieldset),
+                    None, fieldset
+                )
+            return [serialize(rel) for rel in query.all()]
+
+        return cached_response(
+            project_etag(project_id, version, 'relationships', fieldset_tag(fieldset), page_tag(page)), build
+        )
+    except (PaginationError, FieldsError) as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -325,7 +749,7 @@ def create_relationship(current_user, project_id):
     """Create a new relationship between characters"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         data = request.get_json()
         source_id = data.get('source_character_id')
@@ -365,6 +789,8 @@ def create_relationship(current_user, project_id):
         db.session.commit()
 
         return jsonify(relationship.to_dict()), 201
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -375,7 +801,7 @@ def update_relationship(current_user, project_id, relationship_id):
     """Update a relationship"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         relationship = CharacterRelationship.query.filter_by(
             id=relationship_id,
@@ -396,6 +822,8 @@ def update_relationship(current_user, project_id, relationship_id):
         db.session.commit()
 
         return jsonify(relationship.to_dict()), 200
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -406,7 +834,7 @@ def delete_relationship(current_user, project_id, relationship_id):
     """Delete a relationship"""
     try:
         # Verify project belongs to user
-        project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+        verify_project_access(current_user, project_id)
         
         relationship = CharacterRelationship.query.filter_by(
             id=relationship_id,
@@ -417,19 +845,684 @@ def delete_relationship(current_user, project_id, relationship_id):
         db.session.commit()
 
         return jsonify({'message': 'Relationship deleted successfully'}), 200
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+# ==================== BATCH ENDPOINTS ====================
+
+@app.route('/api/projects/<int:project_id>/batch', methods=['POST'])
+@verify_token
+def batch_mutate(current_user, project_id):
+    """Apply a list of character/relationship create/update/delete operations in one transaction.
+
+    Body: {"operations": [{"op": "create"|"update"|"delete", "type": "character"|"relationship",
+    "id": ..., "name": ..., "data": {...}}, ...], "atomic": true}. Relationship endpoints may be
+    given as source/target_character_id or, for characters created in the same batch,
+    source/target_character_name.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object'}), 400
+        operations = data.get('operations')
+
+        if not isinstance(operations, list):
+            return jsonify({'message': 'operations must be a list'}), 400
+        if not all(isinstance(op, dict) for op in operations):
+            return jsonify({'message': 'Each operation must be an object'}), 400
+
+        results, committed = apply_batch(project_id, operations, atomic=data.get('atomic', True))
+
+        return jsonify({
+            'committed': committed,
+            'results': results
+        }), 200 if committed else 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/import', methods=['POST'])
+@verify_token
+def import_project_world(current_user, project_id):
+    """Bulk-import an extraction result ({"entities": [...], "relationships": [...]}).
+
+    Set "merge_descriptions": false to leave existing characters' descriptions alone.
+    New characters without a position are laid out next to their neighbours
+    unless "layout" is false (default: LAYOUT_ON_IMPORT). Malformed entities and
+    relationships are skipped and listed under "errors".
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Import document must be an object'}), 400
+        summary = import_world(project_id, data, merge_descriptions=data.get('merge_descriptions', True))
+        if summary['created_characters'] and data.get('layout', app.config['LAYOUT_ON_IMPORT']):
+            summary['layout'] = layout_project(project_id, 'new', spacing=app.config['LAYOUT_SPACING'])
+
+        return jsonify(summary), 200
+    except ImportDocumentError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+# ==================== ARCHIVE ENDPOINTS ====================
+
+@app.route('/api/projects/<int:project_id>/export', methods=['GET'])
+@verify_token
+def export_project_archive(current_user, project_id):
+    """Stream the whole project as an NDJSON archive (?compress=gzip for a .ndjson.gz)"""
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        compress = request.args.get('compress')
+        if compress not in (None, '', 'gzip'):
+            return jsonify({'message': 'compress must be gzip'}), 400
+
+        body = export_project(project_id)
+        filename = f'project-{project_id}.ndjson'
+        if compress == 'gzip':
+            body = gzip_stream(body)
+            filename += '.gz'
+        response = app.response_class(
+            stream_with_context(body),
+            mimetype='application/gzip' if compress == 'gzip' else 'application/x-ndjson'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/restore', methods=['POST'])
+@verify_token
+def restore_project_archive(current_user):
+    """Create a new project from an archive sent as the raw request body (plain or gzip).
+
+    ?name= overrides the archived project name.
+    """
+    try:
+        summary = import_archive(
+            open_archive(request.stream),
+            user_id=current_user.id,
+            project_name=request.args.get('name')
+        )
+        return jsonify(summary), 201
+    except ArchiveError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+# ==================== GRAPH ENDPOINTS ====================
+
+@app.route('/api/projects/<int:project_id>/graph', methods=['GET'])
+@verify_token
+def get_project_graph(current_user, project_id):
+    """Get all characters (nodes) and relationships (edges) of a project in one response.
+
+    Uses a fixed number of queries regardless of graph size: the project version
+    (enough to answer a matching If-None-Match with 304), then one each for the
+    project, the characters and the relationships. Edge endpoint names are
+    resolved from the already-loaded characters instead of lazy backrefs.
+    ?fields= and ?edge_fields= narrow the node and edge documents.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        fieldset = parse_fields(request.args.get('fields'), CHARACTER_FIELDS, request.args.get('summary_length'))
+        edge_fieldset = parse_fields(request.args.get('edge_fields'), RELATIONSHIP_FIELDS)
+        version = get_project_version(project_id)
+
+        def build():
+            project = db.session.get(Project, project_id)
+            if app.config['ROW_SERIALIZER']:
+                return json_bytes_response(
+                    serialization.write_graph, db.session.connection(), project, fieldset, edge_fieldset
+                )
+            characters = Character.query.filter_by(project_id=project_id)
+            relationships = CharacterRelationship.query.filter_by(project_id=project_id)
+            if fieldset is not None:
+                characters = characters.options(*character_load_options(fieldset))
+            if edge_fieldset is not None:
+                relationships = relationships.options(*relationship_load_options(edge_fieldset))
+            characters = characters.all()
+            character_names = None
+            if fieldset is None or 'name' in fieldset.fields:
+                character_names = {char.id: char.name for char in characters}
+            elif edge_fieldset is None:
+                relationships = relationships.options(*relationship_load_options(None))
+            node_fields = fieldset.fields if fieldset is not None else None
+            edge_fields = edge_fieldset.fields if edge_fieldset is not None else None
+
+            return {
+                'project': project.to_dict(),
+                'nodes': [char.to_dict(fields=node_fields) for char in characters],
+                'edges': [rel.to_dict(character_names=character_names, fields=edge_fields)
+                          for rel in relationships.all()]
+            }
+
+        return cached_response(
+            project_etag(project_id, version, 'graph', fieldset_tag(fieldset), fieldset_tag(edge_fieldset)), build
+        )
+    except FieldsError as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/changes', methods=['GET'])
+@verify_token
+def get_project_changes(current_user, project_id):
+    """Characters and relationships written after ?since=<version>, with tombstones for deletes.
+
+    Answers reset=true (re-fetch /graph) when the change log no longer reaches
+    back to since. Reads only the logged rows, so a poll costs what changed.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        try:
+            since = int(request.args['since'])
+        except (KeyError, ValueError):
+            return jsonify({'message': 'since must be an integer version'}), 400
+
+        version = get_project_version(project_id)
+        return cached_response(
+            project_etag(project_id, version, 'since', since),
+            lambda: change_feed.changes_since(project_id, since)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/events', methods=['GET'])
+@verify_stream_token
+def stream_project_events(current_user, project_id):
+    """Server-sent events for every committed change to the project.
+
+    Each 'changes' event carries a /changes payload and the project version as
+    its id; Last-Event-ID (or ?last_event_id=) resumes from that version.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_version = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return jsonify({'message': 'Last-Event-ID must be a project version'}), 400
+
+        version = get_project_version(project_id)
+        response = app.response_class(
+            live.stream(live_hub, project_id, last_version, version, app.config['LIVE_HEARTBEAT_SECONDS']),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+def graph_query(current_user, project_id, kind, parse_args, run):
+    """Run a query against the project's cached graph and return a conditional response.
+
+    parse_args() reads and validates the query string; run(graph, *args) answers it.
+    The ETag is keyed on kind and the parsed arguments, so each query has its own.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        args = parse_args()
+        version = get_project_version(project_id)
+        digest = hashlib.sha1(repr(args).encode()).hexdigest()[:16]
+        return cached_response(
+            project_etag(project_id, version, 'graph', kind, digest),
+            lambda: run(graph_cache.get(project_id, version), *args)
+        )
+    except UnknownCharacter as e:
+        return jsonify({'message': f'Character {e.args[0]} not found in this project'}), 404
+    except GraphQueryError as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+def int_arg(name, default=None):
+    """Read an integer query parameter, raising GraphQueryError if it is missing or invalid"""
+    value = request.args.get(name, default)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise GraphQueryError(f'{name} must be an integer')
+
+@app.route('/api/projects/<int:project_id>/graph/neighborhood', methods=['GET'])
+@verify_token
+def get_neighborhood(current_user, project_id):
+    """Characters within ?depth= hops (default 1, max 6) of ?character_id="""
+    def parse_args():
+        character_id = int_arg('character_id')
+        depth = int_arg('depth', 1)
+        if not 0 <= depth <= 6:
+            raise GraphQueryError('depth must be between 0 and 6')
+        return character_id, depth, parse_direction(request.args.get('direction'))
+
+    def run(graph, character_id, depth, direction):
+        return {
+            'character_id': character_id,
+            'depth': depth,
+            'direction': direction,
+            'nodes': graph.k_hop(character_id, depth, direction)
+        }
+
+    return graph_query(current_user, project_id, 'neighborhood', parse_args, run)
+
+@app.route('/api/projects/<int:project_id>/graph/path', methods=['GET'])
+@verify_token
+def get_shortest_path(current_user, project_id):
+    """Fewest-hop path between ?source= and ?target= characters"""
+    def parse_args():
+        return int_arg('source'), int_arg('target'), parse_direction(request.args.get('direction'))
+
+    def run(graph, source, target, direction):
+        result = graph.shortest_path(source, target, direction)
+        if result is None:
+            return {'direction': direction, 'path': None, 'relationship_ids': [], 'length': None}
+        path, relationship_ids = result
+        return {
+            'direction': direction,
+            'path': path,
+            'relationship_ids': relationship_ids,
+            'length': len(relationship_ids)
+        }
+
+    return graph_query(current_user, project_id, 'path', parse_args, run)
+
+@app.route('/api/projects/<int:project_id>/graph/components', methods=['GET'])
+@verify_token
+def get_components(current_user, project_id):
+    """Connected components (ignoring edge direction), largest first"""
+    def run(graph):
+        components = graph.components()
+        return {
+            'count': len(components),
+            'components': [[graph.node(i) for i in component] for component in components]
+        }
+
+    return graph_query(current_user, project_id, 'components', tuple, run)
+
+@app.route('/api/projects/<int:project_id>/analytics', methods=['GET'])
+@verify_token
+def get_project_analytics(current_user, project_id):
+    """Degree statistics, PageRank and betweenness centrality, and communities of the project's graph.
+
+    Never computed on the request: a result behind the project version comes
+    back with stale=true while a fresh one is computed in the background, and
+    a project without one yet answers 202 (retry shortly). ?top= (default 20,
+    max 200) limits the ranked lists.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        top = int_arg('top', 20)
+        if not 1 <= top <= analytics.MAX_TOP:
+            raise GraphQueryError(f'top must be between 1 and {analytics.MAX_TOP}')
+
+        version = get_project_version(project_id)
+        result = analytics_service.get(project_id, version)
+        if result is None:
+            response = jsonify({'project_id': project_id, 'version': version, 'status': 'pending'})
+            response.headers['Retry-After'] = '1'
+            return response, 202
+        if result.version != version:
+            return jsonify(dict(result.to_dict(top), stale=True)), 200
+        return cached_response(
+            project_etag(project_id, version, 'analytics', top),
+            lambda: dict(result.to_dict(top), stale=False)
+        )
+    except GraphQueryError as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/layout', methods=['POST'])
+@verify_token
+def layout_project_characters(current_user, project_id):
+    """Compute force-directed positions for the project's characters and save them.
+
+    {"mode": "new"} (the default) places only characters without a position;
+    {"mode": "all"} lays out every character. Optional "iterations",
+    "spacing" (default LAYOUT_SPACING) and "seed".
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        data = request.get_json(silent=True) or {}
+        summary = layout_project(
+            project_id,
+            mode=data.get('mode', 'new'),
+            iterations=data.get('iterations'),
+            spacing=data.get('spacing', app.config['LAYOUT_SPACING']),
+            seed=data.get('seed', 0)
+        )
+        summary['version'] = get_project_version(project_id)
+        return jsonify(summary), 200
+    except LayoutError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
 
+# ==================== SEARCH ENDPOINTS ====================
+
+@app.route('/api/projects/<int:project_id>/search', methods=['GET'])
+@verify_token
+def search_project(current_user, project_id):
+    """Ranked full-text search with snippets.
+
+    ?q= is required; ?kinds= is a comma-separated subset of character,relationship,document
+    and ?limit= defaults to 20 (max 100).
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'message': 'q is required'}), 400
+
+        kinds = tuple(k for k in (request.args.get('kinds') or ','.join(search.KINDS)).split(',') if k)
+        if not kinds or any(kind not in search.KINDS for kind in kinds):
+            return jsonify({'message': f"kinds must be a subset of: {', '.join(search.KINDS)}"}), 400
+
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({'message': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, 100))
+
+        return jsonify({
+            'query': query,
+            'results': search_service.search(project_id, query, kinds=kinds, limit=limit)
+        }), 200
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/context', methods=['GET'])
+@verify_token
+def get_project_context(current_user, project_id):
+    """Characters and document passages most relevant to ?q=, within ?budget= characters (default 8000).
+
+    ?kinds= is a comma-separated subset of character,document; each ?document= path
+    is always considered, its unmatched passages ranked after every match.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        try:
+            query, budget, kinds, paths = context.parse_context_args(request.args)
+        except context.ContextQueryError as e:
+            return jsonify({'message': str(e)}), 400
+
+        version = get_project_version(project_id)
+        fingerprint = document_corpus.fingerprint() if 'document' in kinds else ''
+        digest = hashlib.sha1(repr((query, budget, kinds, paths)).encode()).hexdigest()[:16]
+        return cached_response(
+            project_etag(project_id, version, 'context', fingerprint, digest),
+            lambda: context_service.retrieve(
+                db.session.connection(), project_id, version, query, budget=budget, kinds=kinds, documents=paths
+            )
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/mentions', methods=['GET'])
+@verify_token
+def get_project_mentions(current_user, project_id):
+    """Where the project's characters are named in the documents, with [start, end) offsets.
+
+    ?character= (repeatable) and ?document= narrow the result; ?context=N
+    (at most 500) adds the text around each mention.
+    """
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        try:
+            character_ids, path, span_context = mentions.parse_mention_args(request.args)
+        except mentions.MentionQueryError as e:
+            return jsonify({'message': str(e)}), 400
+
+        version = get_project_version(project_id)
+        digest = hashlib.sha1(repr((character_ids, path, span_context)).encode()).hexdigest()[:16]
+        return cached_response(
+            project_etag(project_id, version, 'mentions', document_corpus.fingerprint(), digest),
+            lambda: mention_service.mentions(
+                db.session.connection(), project_id, version, character_ids, path=path, context=span_context
+            )
+        )
+    except UnknownCharacter as e:
+        return jsonify({'message': f'Character {e.args[0]} not found in this project'}), 404
+    except documents.DocumentNotFound as e:
+        return jsonify({'message': str(e)}), 404
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+# ==================== EXTRACTION ENDPOINTS ====================
+
+@app.route('/api/projects/<int:project_id>/extractions', methods=['POST'])
+@verify_token
+def start_extraction(current_user, project_id):
+    """Queue entity extraction over {text} or a corpus {document}; answers 202 with the job to poll"""
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object with text or document'}), 400
+        source = data.get('document')
+        if source:
+            document = document_corpus.read(source)
+            source, text = document['path'], document['content']
+        else:
+            text = data.get('text')
+        job = extraction_service.submit(project_id, text, source=source)
+        response = jsonify(job.to_dict(include_result=False))
+        response.headers['Location'] = f'/api/projects/{project_id}/extractions/{job.id}'
+        return response, 202
+    except documents.DocumentNotFound as e:
+        return jsonify({'message': str(e)}), 404
+    except (documents.DocumentError, extraction.ExtractionError) as e:
+        return jsonify({'message': str(e)}), 400
+    except extraction.ExtractionClosed as e:
+        return jsonify({'message': str(e)}), 503
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/extractions', methods=['GET'])
+@verify_token
+def list_extractions(current_user, project_id):
+    """The project's 50 most recent extraction jobs, without their results"""
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        jobs = ExtractionJob.query.filter_by(project_id=project_id)\
+            .order_by(ExtractionJob.id.desc()).limit(50).all()
+        extraction_service.reap(jobs)
+        return jsonify({'jobs': [job.to_dict(include_result=False) for job in jobs]}), 200
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/projects/<int:project_id>/extractions/<int:job_id>', methods=['GET'])
+@verify_token
+def get_extraction(current_user, project_id, job_id):
+    """Status and progress of an extraction job, and its merged {entities, relationships} once done"""
+    try:
+        # Verify project belongs to user
+        verify_project_access(current_user, project_id)
+
+        job = ExtractionJob.query.filter_by(id=job_id, project_id=project_id).first()
+        if not job:
+            return jsonify({'message': 'Extraction job not found'}), 404
+        extraction_service.reap([job])
+        return jsonify(job.to_dict()), 200
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+# ==================== DOCUMENT ENDPOINTS ====================
+
+@app.route('/api/documents', methods=['GET'])
+@verify_token
+def get_documents(current_user):
+    """The ordered folder tree of the markdown corpus"""
+    try:
+        fingerprint, tree = document_corpus.tree()
+        return cached_response(f'documents-{fingerprint}', lambda: {'documents': tree})
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/documents/file', methods=['GET'])
+@verify_token
+def get_document(current_user):
+    """One file's content and metadata (?path=, '.md' optional)"""
+    try:
+        path, (mtime, size) = document_corpus.stat(request.args.get('path'))
+        return cached_response(f'document-{mtime}-{size}', lambda: document_corpus.read(path))
+    except documents.DocumentNotFound as e:
+        return jsonify({'message': str(e)}), 404
+    except documents.DocumentError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/documents/batch', methods=['POST'])
+@verify_token
+def get_documents_batch(current_user):
+    """Several files in one request: {"paths": [...]}; paths that don't exist are listed under missing"""
+    try:
+        data = request.get_json(silent=True) or {}
+        return jsonify(document_corpus.read_many(data.get('paths'))), 200
+    except documents.DocumentError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/documents/file', methods=['PUT'])
+@verify_token
+def save_document(current_user):
+    """Replace (or create) a file in an existing folder: {"path", "content"}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('path') or data.get('content') is None:
+            return jsonify({'message': 'Path and content are required'}), 400
+        return jsonify(document_corpus.write(data['path'], data['content'])), 200
+    except documents.DocumentNotFound as e:
+        return jsonify({'message': str(e)}), 404
+    except documents.DocumentError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/documents/order', methods=['PUT'])
+@verify_token
+def save_document_order(current_user):
+    """Replace the folder ordering: {"order": {folder path: [child paths]}}, '.' for the top level"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if 'order' not in data:
+            return jsonify({'message': 'Order is required'}), 400
+        document_corpus.save_order(data['order'])
+        return jsonify({'success': True}), 200
+    except documents.DocumentNotFound as e:
+        return jsonify({'message': str(e)}), 404
+    except documents.DocumentError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 # ==================== HEALTH CHECK ====================
 
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'}), 200
 
+@app.route('/api/metrics', methods=['GET'])
+@verify_metrics_token
+def get_metrics():
+    """Request, SQL and cache metrics in the Prometheus text exposition format"""
+    if request_metrics is None:
+        abort(404)
+    return app.response_class(request_metrics.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/auth/cache', methods=['GET'])
+@verify_metrics_token
+def auth_cache_stats():
+    """Hit/miss counters of the authenticated-context cache"""
+    return jsonify(auth_context.stats()), 200
+
+# ==================== SERVING ====================
+
+def create_app():
+    """App factory for production servers: gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+    The app is configured when this module is imported; this starts the
+    per-process resources registered with server_lifecycle (see lifecycle.py).
+    """
+    server_lifecycle.start()
+    return app
+
 # ==================== INITIALIZE DATABASE ====================
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        add_missing_columns()
     app.run(debug=True, port=5000)
@@ -0,0 +1,332 @@
+"""
+Streaming project archives (backup and migration).
+
+An archive is NDJSON, one record per line, in this order:
+
+    {"type": "header", "format": "worldbuilder-archive", "version": 1, ...}
+    {"type": "user", "data": {...}}                 owner (password hash only if asked for)
+    {"type": "relationship_type", "data": {...}}    types the relationships use
+    {"type": "project", "data": {...}}
+    {"type": "character", "data": {...}}            one per character
+    {"type": "relationship", "data": {...}}         one per relationship
+    {"type": "footer", "counts": {...}}
+
+Rows are read through a server-side cursor and written as they arrive, and
+imports insert in fixed-size batches, so memory does not grow with the
+project. The exception is the old -> new character id map an import needs
+to remap relationship endpoints. Archives may be gzip-compressed; readers
+detect that from the magic bytes.
+"""
+
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import DateTime, select
+from models import db, User, Project, Character, CharacterRelationship, RelationshipType
+import changes
+import search
+import versioning
+
+FORMAT = 'worldbuilder-archive'
+FORMAT_VERSION = 1
+BATCH_SIZE = 1000
+GZIP_MAGIC = b'\x1f\x8b'
+
+users_table = User.__table__
+projects_table = Project.__table__
+characters_table = Character.__table__
+relationships_table = CharacterRelationship.__table__
+types_table = RelationshipType.__table__
+
+
+class ArchiveError(ValueError):
+    """Raised when an archive is malformed or can't be applied"""
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _line(record):
+    return (json.dumps(record, default=_json_default, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _row(row, exclude=()):
+    return {key: value for key, value in row._mapping.items() if key not in exclude}
+
+
+def export_project(project_id, include_credentials=False):
+    """Yield an archive of a project as NDJSON lines (bytes)"""
+    conn = db.session.connection()
+    streaming = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE)
+    counts = {'relationship_types': 0, 'characters': 0, 'relationships': 0}
+
+    project = conn.execute(select(projects_table).where(projects_table.c.id == project_id)).first()
+    if project is None:
+        raise ArchiveError(f'Project {project_id} not found')
+    owner = conn.execute(select(users_table).where(users_table.c.id == project.user_id)).first()
+
+    yield _line({
+        'type': 'header', 'format': FORMAT, 'version': FORMAT_VERSION,
+        'exported_at': datetime.utcnow(), 'project_id': project_id
+    })
+    yield _line({'type': 'user', 'data': _row(owner, () if include_credentials else ('password_hash',))})
+
+    used_types = select(relationships_table.c.relationship_type_id).where(
+        relationships_table.c.project_id == project_id
+    ).distinct()
+    for row in conn.execute(select(types_table).where(types_table.c.id.in_(used_types)).order_by(types_table.c.id)):
+        counts['relationship_types'] += 1
+        yield _line({'type': 'relationship_type', 'data': _row(row)})
+
+    yield _line({'type': 'project', 'data': _row(project, ('version',))})
+
+    for row in streaming.execute(
+        select(characters_table).where(characters_table.c.project_id == project_id).order_by(characters_table.c.id)
+    ):
+        counts['characters'] += 1
+        yield _line({'type': 'character', 'data': _row(row, ('project_id',))})
+
+    for row in streaming.execute(
+        select(relationships_table).where(relationships_table.c.project_id == project_id)
+        .order_by(relationships_table.c.id)
+    ):
+        counts['relationships'] += 1
+        yield _line({'type': 'relationship', 'data': _row(row, ('project_id',))})
+
+    yield _line({'type': 'footer', 'counts': counts})
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compress an iterable of bytes chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        # Compress in ~64 KiB slices so each yielded piece is worth sending
+        if size >= 65536:
+            data = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if data:
+                yield data
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def open_archive(stream):
+    """Wrap a binary stream as a line reader, transparently gunzipping"""
+    reader = stream if isinstance(stream, io.BufferedReader) else io.BufferedReader(stream)
+    if reader.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=reader)
+    return reader
+
+
+def _values(table, data, exclude):
+    """Column values for an insert from an archived row, parsing datetimes"""
+    values = {}
+    for column in table.columns:
+        if column.name in exclude or column.name not in data:
+            continue
+        value = data[column.name]
+        if isinstance(column.type, DateTime) and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        values[column.name] = value
+    return values
+
+
+class _Restore:
+    """State of one import: id maps and pending insert batches"""
+
+    def __init__(self, conn, user_id, project_name, create_owner):
+        self.conn = conn
+        self.user_id = user_id
+        self.project_name = project_name
+        self.create_owner = create_owner
+        self.project_id = None
+        self.type_ids = {}
+        self.character_ids = {}
+        self.pending_characters = []
+        self.pending_relationships = []
+        self.counts = {'relationship_types': 0, 'characters': 0, 'relationships': 0, 'skipped_relationships': 0}
+
+    def user(self, data):
+        """Resolve the archive's owner when no target user was given"""
+        if self.user_id is not None:
+            return
+        user = User.query.filter_by(email=data.get('email')).first()
+        if user is None:
+            if not (self.create_owner and data.get('email') and data.get('password_hash')):
+                raise ArchiveError(f"User {data.get('email')} does not exist")
+            user = User(**_values(users_table, data, ('id',)))
+            db.session.add(user)
+            db.session.flush()
+        self.user_id = user.id
+
+    def relationship_type(self, data):
+        name = data.get('name')
+        if not name:
+            raise ArchiveError('relationship_type record without a name')
+        type_id = self.conn.execute(select(types_table.c.id).where(types_table.c.name == name)).scalar()
+        if type_id is None:
+            type_id = self.conn.execute(
+                types_table.insert().values(**_values(types_table, data, ('id',)))
+            ).inserted_primary_key[0]
+            self.counts['relationship_types'] += 1
+        self.type_ids[data.get('id')] = type_id
+
+    def project(self, data):
+        if self.project_id is not None:
+            raise ArchiveError('Archive contains more than one project')
+        if self.user_id is None:
+            raise ArchiveError('Archive has no owner and no target user was given')
+        values = _values(projects_table, data, ('id', 'user_id', 'version'))
+        values.update(user_id=self.user_id)
+        if self.project_name:
+            values['name'] = self.project_name
+        if not values.get('name'):
+            raise ArchiveError('project record without a name')
+        # Through the ORM so the owner's cached project memberships are invalidated on commit
+        project = Project(**values)
+        db.session.add(project)
+        db.session.flush()
+        self.project_id = project.id
+
+    def character(self, data):
+        self._require_project()
+        if self.pending_relationships:
+            raise ArchiveError('character records must come before relationship records')
+        values = _values(characters_table, data, ('id', 'project_id'))
+        values['project_id'] = self.project_id
+        self.pending_characters.append((data.get('id'), values))
+        if len(self.pending_characters) >= BATCH_SIZE:
+            self.flush_characters()
+
+    def relationship(self, data):
+        self._require_project()
+        self.flush_characters()
+        values = _values(relationships_table, data, ('id', 'project_id'))
+        values['project_id'] = self.project_id
+        values['source_character_id'] = self.character_ids.get(data.get('source_character_id'))
+        values['target_character_id'] = self.character_ids.get(data.get('target_character_id'))
+        values['relationship_type_id'] = self.type_ids.get(data.get('relationship_type_id'))
+        if values['source_character_id'] is None or values['target_character_id'] is None:
+            self.counts['skipped_relationships'] += 1
+            return
+        self.pending_relationships.append(values)
+        if len(self.pending_relationships) >= BATCH_SIZE:
+            self.flush_relationships()
+
+    def flush_characters(self):
+        if not self.pending_characters:
+            return
+        rows = [values for _, values in self.pending_characters]
+        self.conn.execute(characters_table.insert(), rows)
+        # Names are unique per project, so they map the batch back to its new ids
+        new_ids = dict(self.conn.execute(
+            select(characters_table.c.name, characters_table.c.id).where(
+                characters_table.c.project_id == self.project_id,
+                characters_table.c.name.in_([row['name'] for row in rows])
+            )
+        ).all())
+        for old_id, values in self.pending_characters:
+            self.character_ids[old_id] = new_ids[values['name']]
+        search.record_changes(db.session, character_ids=[new_ids[row['name']] for row in rows])
+        self.counts['characters'] += len(rows)
+        self.pending_characters = []
+
+    def flush_relationships(self):
+        if not self.pending_relationships:
+            return
+        last_id = self.conn.execute(
+            select(relationships_table.c.id).order_by(relationships_table.c.id.desc()).limit(1)
+        ).scalar() or 0
+        self.conn.execute(relationships_table.insert(), self.pending_relationships)
+        search.record_changes(db.session, relationship_ids=[row[0] for row in self.conn.execute(
+            select(relationships_table.c.id).where(
+                relationships_table.c.project_id == self.project_id, relationships_table.c.id > last_id
+            )
+        )])
+        self.counts['relationships'] += len(self.pending_relationships)
+        self.pending_relationships = []
+
+    def _require_project(self):
+        if self.project_id is None:
+            raise ArchiveError('project record must come before characters and relationships')
+
+
+def import_archive(lines, user_id=None, project_name=None, create_owner=False):
+    """Create a new project from archive lines and commit.
+
+    lines is any iterable of NDJSON lines (bytes or str), e.g. open_archive(f).
+    The project belongs to user_id, or when that is None to the archive's
+    owner matched by email (created from the archived record, which must
+    include the password hash, if create_owner is set). Returns the new
+    project id and per-kind counts.
+    """
+    conn = db.session.connection()
+    restore = _Restore(conn, user_id, project_name, create_owner)
+    header = footer = None
+
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ArchiveError(f'Line {number} is not valid JSON')
+            if not isinstance(record, dict):
+                raise ArchiveError(f'Line {number} is not a JSON object')
+
+            kind = record.get('type')
+            data = record.get('data') if isinstance(record.get('data'), dict) else {}
+            if header is None:
+                if kind != 'header' or record.get('format') != FORMAT:
+                    raise ArchiveError('Not a WorldBuilder archive')
+                if record.get('version') != FORMAT_VERSION:
+                    raise ArchiveError(f"Unsupported archive version {record.get('version')}")
+                header = record
+            elif kind == 'user':
+                restore.user(data)
+            elif kind == 'relationship_type':
+                restore.relationship_type(data)
+            elif kind == 'project':
+                restore.project(data)
+            elif kind == 'character':
+                restore.character(data)
+            elif kind == 'relationship':
+                restore.relationship(data)
+            elif kind == 'footer':
+                footer = record
+            else:
+                raise ArchiveError(f'Line {number} has unknown record type {kind!r}')
+
+        if header is None or restore.project_id is None:
+            raise ArchiveError('Archive has no project')
+        if footer is None:
+            raise ArchiveError('Archive is truncated (no footer)')
+        restore.flush_characters()
+        restore.flush_relationships()
+
+        expected = footer.get('counts') or {}
+        received = {
+            'characters': restore.counts['characters'],
+            'relationships': restore.counts['relationships'] + restore.counts['skipped_relationships'],
+        }
+        for kind, count in received.items():
+            if expected.get(kind, count) != count:
+                raise ArchiveError(f'Archive is incomplete: {kind} count does not match its footer')
+    except (OSError, EOFError) as e:
+        raise ArchiveError(f'Could not read archive: {e}')
+
+    versioning.bump_versions(conn, {restore.project_id})
+    # A new project has no clients to catch up, so its change log starts after the restore
+    changes.reset_floor(conn, restore.project_id)
+    db.session.commit()
+    return {'project_id': restore.project_id, **restore.counts}
+
@@ -0,0 +1,375 @@
+"""
+ASGI entry point (pip install uvicorn a2wsgi aiosqlite), run from backend/:
+
+    uvicorn asgi:application --workers 4 --timeout-graceful-shutdown 30
+
+The hot reads are served on the event loop, with async SQLAlchemy sessions on
+ASYNC_DATABASE_URL (by default DATABASE_URL on its async driver):
+
+    GET /api/projects/<id>/graph           ?fields=&edge_fields=&summary_length=
+    GET /api/projects/<id>/characters      ?fields=&summary_length=
+    GET /api/projects/<id>/relationships   ?fields=
+    GET /api/projects/<id>/changes         ?since=
+    GET /api/projects/<id>/events          server-sent events
+
+A slow query then waits without holding a thread, and an open event stream
+costs a subscriber buffer instead of a thread. Serializing rows and
+compressing bodies is CPU work and runs on a small pool
+(ASGI_SERIALIZE_THREADS). Responses match the Flask routes': same ETags and
+304s, fieldsets, compression and CORS headers.
+
+Every other request, including paged and streamed listings and every write,
+goes to the Flask app on a bounded thread pool (ASGI_WSGI_THREADS). So do
+the listings when ROW_SERIALIZER is off.
+
+Lifespan startup runs app.create_app(). On shutdown, event streams end
+first, then the pools and both engines close.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+import compression
+import db_profile
+import live
+import serialization
+from app import (CORS_EXPOSE_HEADERS, app as flask_app, auth_context, change_feed, create_app, db, live_hub,
+                 request_metrics, server_lifecycle)
+from fieldsets import CHARACTER_FIELDS, RELATIONSHIP_FIELDS, FieldsError, fieldset_tag, parse_fields
+from models import Project
+from pagination import PageArgs
+from versioning import project_etag
+
+logger = logging.getLogger('worldbuilder.asgi')
+
+ROUTE = re.compile(r'^/api/projects/(\d+)/(graph|characters|relationships|changes|events)$')
+# Metric labels match the Flask endpoints serving the same routes
+ENDPOINTS = {
+    'graph': 'get_project_graph', 'characters': 'get_characters', 'relationships': 'get_relationships',
+    'changes': 'get_project_changes', 'events': 'stream_project_events',
+}
+EXPOSE_HEADERS = ', '.join(sorted(CORS_EXPOSE_HEADERS))
+
+
+class HTTPError(Exception):
+    """Answered as {'message': message} with status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """The parts of an ASGI http scope the async routes read"""
+
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+
+
+class Response:
+    """Status, headers and either a body or an async iterator of str chunks"""
+
+    def __init__(self, status=200, body=b'', content_type='application/json', headers=None, stream=None):
+        self.status = status
+        self.body = body
+        self.stream = stream
+        self.headers = Headers(headers or {})
+        if content_type is not None:
+            self.headers['Content-Type'] = content_type
+
+
+def error_response(status, message):
+    return Response(status, serialization.dumps({'message': message}))
+
+
+class Application:
+    """ASGI app: async routes for the hot reads, the Flask app for everything else"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.wsgi = WSGIMiddleware(flask_app, workers=self.config['ASGI_WSGI_THREADS'])
+        self.cpu = ThreadPoolExecutor(max_workers=self.config['ASGI_SERIALIZE_THREADS'], thread_name_prefix='serialize')
+        self.engine = None
+        self.sessions = None
+        self._startup_lock = asyncio.Lock()
+
+    # ---- lifecycle ----
+
+    async def startup(self):
+        async with self._startup_lock:
+            if self.engine is not None:
+                return
+            await asyncio.to_thread(create_app)
+            if threading.current_thread() is threading.main_thread():
+                server_lifecycle.drain_on_signals()
+            url = self.config['ASYNC_DATABASE_URL']
+            if not url:
+                with self.flask_app.app_context():
+                    url = db.engine.url.render_as_string(hide_password=False)
+            url = db_profile.async_database_url(url)
+            self.engine = create_async_engine(url, **db_profile.engine_options(url, self.config))
+            db_profile.install_engine(self.engine.sync_engine, self.config)
+            self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def shutdown(self):
+        # Ends open event streams if no signal did already
+        server_lifecycle.drain()
+        if self.engine is not None:
+            await self.engine.dispose()
+        await asyncio.to_thread(self.wsgi.executor.shutdown)
+        self.cpu.shutdown()
+        await asyncio.to_thread(server_lifecycle.stop)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception('Startup failed')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ---- dispatch ----
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = ROUTE.match(scope['path'])
+            if match:
+                request = Request(scope)
+                if self.serves(match.group(2), request):
+                    if self.engine is None:
+                        # Servers without lifespan events start the app on the first request
+                        await self.startup()
+                    response = await self.respond(match.group(2), int(match.group(1)), request)
+                    return await self.send_response(response, request, receive, send)
+        await self.wsgi(scope, receive, send)
+
+    def serves(self, route, request):
+        """Whether the async route handles this request (the rest goes to Flask)"""
+        if route in ('graph', 'characters', 'relationships') and not self.config['ROW_SERIALIZER']:
+            return False
+        if route in ('characters', 'relationships') and any(name in request.args for name in PageArgs._fields):
+            return False
+        return True
+
+    async def respond(self, route, project_id, request):
+        started = time.perf_counter()
+        try:
+            async with self.sessions() as session:
+                user = await self.authenticate(session, request, allow_query_token=route == 'events')
+                if not await auth_context.owns_project_async(session, user.id, project_id):
+                    raise HTTPError(404, 'Project not found')
+                response = await getattr(self, route)(session, request, project_id)
+        except HTTPError as e:
+            response = error_response(e.status, str(e))
+        except FieldsError as e:
+            response = error_response(400, str(e))
+        except Exception as e:
+            logger.exception('Async %s of project %s failed', route, project_id)
+            response = error_response(500, str(e))
+
+        total = time.perf_counter() - started
+        if response.stream is None:
+            response.headers['Server-Timing'] = f'total;dur={total * 1000:.2f}'
+        if request_metrics is not None:
+            request_metrics.request_seconds.observe(total, ENDPOINTS[route], 'GET', f'{response.status // 100}xx')
+        return response
+
+    async def authenticate(self, session, request, allow_query_token=False):
+        """verify_token() for async routes: the user, or HTTPError(401)"""
+        token = None
+        authorization = request.headers.get('Authorization')
+        if authorization is not None:
+            parts = authorization.split(' ')
+            if len(parts) < 2:
+                raise HTTPError(401, 'Invalid token format')
+            token = parts[1]
+        elif allow_query_token:
+            token = request.args.get('token')
+        if not token:
+            raise HTTPError(401, 'Token is missing')
+
+        try:
+            data = jwt.decode(token, self.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise HTTPError(401, 'Token has expired')
+        except jwt.InvalidTokenError:
+            raise HTTPError(401, 'Invalid token')
+        user = await auth_context.get_user_async(session, int(data['user_id']))
+        if user is None:
+            raise HTTPError(401, 'User not found')
+        return user
+
+    async def run_cpu(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.cpu, fn, *args)
+
+    async def project_version(self, session, project_id):
+        result = await session.execute(select(Project.version).where(Project.id == project_id))
+        return result.scalar()
+
+    async def conditional(self, request, etag, build):
+        """cached_response() for async routes: 304 on a matching If-None-Match, else build()'s bytes"""
+        if_none_match = parse_etags(request.headers.get('If-None-Match'))
+        matched = next((tag for tag in compression.etag_variants(etag) if if_none_match.contains(tag)), None)
+        headers = {'Cache-Control': 'private, no-cache'}
+        if matched:
+            headers['ETag'] = quote_etag(matched)
+            return Response(304, content_type=None, headers=headers)
+
+        body = await build()
+        if self.config['COMPRESSION_ENABLED'] and len(body) >= self.config['COMPRESS_MIN_BYTES']:
+            headers['Vary'] = 'Accept-Encoding'
+            encoding = compression.negotiate(parse_accept_header(request.headers.get('Accept-Encoding')))
+            if encoding is not None:
+                compressed = await self.run_cpu(
+                    compression.compress, body, encoding,
+                    self.config['COMPRESS_GZIP_LEVEL'], self.config['COMPRESS_BROTLI_QUALITY']
+                )
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers['Content-Encoding'] = encoding
+                    etag = f'{etag}-{encoding}'
+        headers['ETag'] = quote_etag(etag)
+        return Response(200, body, headers=headers)
+
+    # ---- routes ----
+
+    async def graph(self, session, request, project_id):
+        fieldset = parse_fields(request.args.get('fields'), CHARACTER_FIELDS, request.args.get('summary_length'))
+        edge_fieldset = parse_fields(request.args.get('edge_fields'), RELATIONSHIP_FIELDS)
+        version = await self.project_version(session, project_id)
+
+        async def build():
+            project = await session.get(Project, project_id)
+            conn = await session.connection()
+            rows = await conn.run_sync(serialization.graph_rows, project_id, fieldset, edge_fieldset)
+            return await self.run_cpu(
+                serialization.write_graph_rows, project.to_dict(), *rows, fieldset, edge_fieldset
+            )
+
+        return await self.conditional(
+            request, project_etag(project_id, version, 'graph', fieldset_tag(fieldset), fieldset_tag(edge_fieldset)), build
+        )
+
+    async def characters(self, session, request, project_id):
+        fieldset = parse_fields(request.args.get('fields'), CHARACTER_FIELDS, request.args.get('summary_length'))
+        version = await self.project_version(session, project_id)
+
+        async def build():
+            conn = await session.connection()
+            rows = await conn.run_sync(serialization.character_rows, project_id, fieldset)
+            return await self.run_cpu(serialization.write_characters, rows, fieldset)
+
+        return await self.conditional(
+            request, project_etag(project_id, version, 'characters', fieldset_tag(fieldset)), build
+        )
+
+    async def relationships(self, session, request, project_id):
+        fieldset = parse_fields(request.args.get('fields'), RELATIONSHIP_FIELDS)
+        version = await self.project_version(session, project_id)
+
+        async def build():
+            conn = await session.connection()
+            rows = await conn.run_sync(serialization.relationship_rows, project_id, fieldset=fieldset)
+            return await self.run_cpu(serialization.write_relationships, rows, None, fieldset)
+
+        return await self.conditional(
+            request, project_etag(project_id, version, 'relationships', fieldset_tag(fieldset)), build
+        )
+
+    async def changes(self, session, request, project_id):
+        try:
+            since = int(request.args['since'])
+        except (KeyError, ValueError):
+            raise HTTPError(400, 'since must be an integer version')
+        version = await self.project_version(session, project_id)
+
+        async def build():
+            payload = await session.run_sync(
+                lambda sync_session: change_feed.changes_since(project_id, since, session=sync_session)
+            )
+            return serialization.dumps(payload)
+
+        return await self.conditional(request, project_etag(project_id, version, 'since', since), build)
+
+    async def events(self, session, request, project_id):
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_version = int(last_event_id) if last_event_id else None
+        except ValueError:
+            raise HTTPError(400, 'Last-Event-ID must be a project version')
+
+        version = await self.project_version(session, project_id)
+        frames = live.stream_async(live_hub, project_id, last_version, version, self.config['LIVE_HEARTBEAT_SECONDS'])
+        return Response(
+            content_type='text/event-stream; charset=utf-8',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}, stream=frames
+        )
+
+    # ---- sending ----
+
+    async def send_response(self, response, request, receive, send):
+        headers = response.headers
+        origin = request.headers.get('Origin')
+        headers['Access-Control-Allow-Origin'] = origin or '*'
+        headers['Access-Control-Expose-Headers'] = EXPOSE_HEADERS
+        if origin:
+            headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Origin']))
+        if response.stream is None:
+            headers['Content-Length'] = str(len(response.body))
+
+        await send({
+            'type': 'http.response.start', 'status': response.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        })
+        if response.stream is None:
+            await send({'type': 'http.response.body', 'body': response.body})
+        else:
+            await self.send_stream(response.stream, receive, send)
+
+    async def send_stream(self, chunks, receive, send):
+        """Send chunks until they run out (the hub closed the stream) or the client goes away"""
+        async def pump():
+            async for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await chunks.aclose()
+
+
+application = Application(flask_app)
@@ -0,0 +1,156 @@
+"""
+Cache of authenticated users and their project memberships.
+
+verify_token and the per-route ownership checks hit this cache instead of the
+database. Entries are invalidated from SQLAlchemy session events whenever a
+User or Project row is committed, and expire after a TTL as a backstop for
+changes made by other processes.
+
+Those events only fire in the process that made the change: a project created
+by another worker or a CLI isn't in the cached set yet. So a project missing
+from the set is looked up once more before access is refused (owns_project),
+and the set is reloaded if it turns out to be there.
+"""
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User, Project
+from cache import TTLCache
+
+
+class AuthContextCache:
+    """Caches detached User snapshots and per-user project id sets"""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.users = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.memberships = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_user(self, user_id):
+        """Return a session-bound User for user_id, or None if it doesn't exist"""
+        snapshot = self.users.get(user_id)
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = _snapshot(user)
+            self.users.set(user_id, snapshot)
+        # Attach a copy of the snapshot to this request's session without a SELECT
+        return db.session.merge(snapshot, load=False)
+
+    def project_ids(self, user_id):
+        """Return the set of project ids owned by user_id"""
+        project_ids = self.memberships.get(user_id)
+        if project_ids is None:
+            rows = db.session.query(Project.id).filter_by(user_id=user_id).all()
+            project_ids = frozenset(row[0] for row in rows)
+            self.memberships.set(user_id, project_ids)
+        return project_ids
+
+    def owns_project(self, user_id, project_id):
+        """Whether user_id owns project_id; a cache miss is checked against the database"""
+        if project_id in self.project_ids(user_id):
+            return True
+        owned = db.session.query(Project.id).filter_by(id=project_id, user_id=user_id).first() is not None
+        if owned:
+            self.memberships.pop(user_id)
+        return owned
+
+    async def get_user_async(self, session, user_id):
+        """get_user() for an AsyncSession; returns the detached snapshot itself"""
+        snapshot = self.users.get(user_id)
+        if snapshot is None:
+            user = await session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = _snapshot(user)
+            self.users.set(user_id, snapshot)
+        return snapshot
+
+    async def project_ids_async(self, session, user_id):
+        """project_ids() for an AsyncSession"""
+        project_ids = self.memberships.get(user_id)
+        if project_ids is None:
+            result = await session.execute(select(Project.id).where(Project.user_id == user_id))
+            project_ids = frozenset(result.scalars())
+            self.memberships.set(user_id, project_ids)
+        return project_ids
+
+    async def owns_project_async(self, session, user_id, project_id):
+        """owns_project() for an AsyncSession"""
+        if project_id in await self.project_ids_async(session, user_id):
+            return True
+        result = await session.execute(
+            select(Project.id).where(Project.id == project_id, Project.user_id == user_id)
+        )
+        owned = result.first() is not None
+        if owned:
+            self.memberships.pop(user_id)
+        return owned
+
+    def invalidate_user(self, user_id):
+        self.users.pop(user_id)
+        self.memberships.pop(user_id)
+
+    def clear(self):
+        self.users.clear()
+        self.memberships.clear()
+
+    def stats(self):
+        return {
+            'users': self.users.stats(),
+            'memberships': self.memberships.stats()
+        }
+
+
+def _snapshot(user):
+    """Copy a loaded User into a detached instance safe to share across sessions"""
+    snapshot = User(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        password_hash=user.password_hash,
+        created_at=user.created_at
+    )
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def _affected_user_ids(session):
+    """Collect ids of users whose cached user or membership data a flush changes"""
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            if obj.id is not None:
+                user_ids.add(obj.id)
+        elif isinstance(obj, Project):
+            history = inspect(obj).attrs.user_id.history
+            user_ids.update(uid for uid in history.sum() if uid is not None)
+            if obj.user_id is not None:
+                user_ids.add(obj.user_id)
+    return user_ids
+
+
+def install(app, maxsize=1024, ttl=60.0):
+    """Create the app's auth cache and hook invalidation into session commits"""
+    auth_cache = AuthContextCache(maxsize=maxsize, ttl=ttl)
+    app.extensions['auth_cache'] = auth_cache
+
+    @event.listens_for(db.session, 'before_flush')
+    def collect_before_flush(session, flush_context, instances):
+        session.info.setdefault('auth_invalidations', set()).update(_affected_user_ids(session))
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_after_flush(session, flush_context):
+        # New rows only have their ids after the flush
+        session.info.setdefault('auth_invalidations', set()).update(_affected_user_ids(session))
+
+    @event.listens_for(db.session, 'after_commit')
+    def invalidate_after_commit(session):
+        for user_id in session.info.pop('auth_invalidations', ()):
+            auth_cache.invalidate_user(user_id)
+
+    @event.listens_for(db.session, 'after_soft_rollback')
+    def discard_after_rollback(session, previous_transaction):
+        session.info.pop('auth_invalidations', None)
+
+    return auth_cache
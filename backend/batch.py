@@ -0,0 +1,352 @@
+"""
+Batch mutations for characters and relationships.
+
+Applies a list of mixed create/update/delete operations against one project
+inside a single transaction. Names and ids referenced by the operations are
+resolved with a couple of bulk queries up front instead of one lookup per op.
+
+Writes are flushed once at the end, except that an op taking a name an
+earlier op freed (by deleting or renaming its character) flushes first. The
+unit of work orders INSERTs before UPDATEs before DELETEs, so without that
+flush "delete A, create A" or a rename swap through a temporary name would
+break the unique name constraint instead of applying in order.
+"""
+
+from datetime import datetime
+from sqlalchemy import or_
+from models import db, Character, CharacterRelationship
+
+OPS = ('create', 'update', 'delete')
+TYPES = ('character', 'relationship')
+
+
+class BatchError(Exception):
+    """Raised when a single operation in a batch cannot be applied"""
+
+
+def _ref_of(op):
+    """Return the character reference (id or name) an op targets"""
+    if op.get('id') is not None:
+        return op['id']
+    return op.get('name')
+
+
+def _data_of(op):
+    data = op.get('data') or {}
+    if not isinstance(data, dict):
+        raise BatchError('data must be an object')
+    return data
+
+
+def _character_endpoint(data, side):
+    """Return the id or name given for one end of a relationship"""
+    if data.get(f'{side}_character_id') is not None:
+        return data[f'{side}_character_id']
+    return data.get(f'{side}_character_name')
+
+
+class BatchContext:
+    """Bulk-loaded lookup tables for one batch, kept in sync as ops apply"""
+
+    def __init__(self, project_id, operations):
+        self.project_id = project_id
+        self.by_id = {}
+        self.by_name = {}
+        self.relationships = {}
+        self.edges = set()
+
+        # Names freed by deletes and renames since the last flush
+        self.freed = set()
+
+        char_ids, char_names, rel_ids = set(), set(), set()
+        for op in operations:
+            data = op.get('data')
+            data = data if isinstance(data, dict) else {}
+            if op.get('type') == 'character':
+                ref = _ref_of(op)
+                if isinstance(ref, int):
+                    char_ids.add(ref)
+                elif isinstance(ref, str) and ref:
+                    char_names.add(ref)
+                if isinstance(data.get('name'), str) and data['name']:
+                    char_names.add(data['name'])
+            elif op.get('type') == 'relationship':
+                if isinstance(op.get('id'), int):
+                    rel_ids.add(op['id'])
+                for side in ('source', 'target'):
+                    ref = _character_endpoint(data, side)
+                    if isinstance(ref, int):
+                        char_ids.add(ref)
+                    elif isinstance(ref, str) and ref:
+                        char_names.add(ref)
+
+        if char_ids or char_names:
+            characters = Character.query.filter(
+                Character.project_id == project_id,
+                or_(Character.id.in_(char_ids), Character.name.in_(char_names))
+            ).all()
+            for char in characters:
+                self.add_character(char)
+
+        if rel_ids:
+            for rel in CharacterRelationship.query.filter(
+                CharacterRelationship.project_id == project_id,
+                CharacterRelationship.id.in_(rel_ids)
+            ).all():
+                self.relationships[rel.id] = rel
+
+        # Existing edges between the referenced characters, for duplicate checks
+        known_ids = list(self.by_id)
+        if known_ids:
+            rows = db.session.query(
+                CharacterRelationship.source_character_id,
+                CharacterRelationship.target_character_id
+            ).filter(
+                CharacterRelationship.project_id == project_id,
+                CharacterRelationship.source_character_id.in_(known_ids)
+            ).all()
+            self.edges.update((source, target) for source, target in rows)
+
+    def add_character(self, char):
+        if char.id is not None:
+            self.by_id[char.id] = char
+        self.by_name[char.name] = char
+
+    def remove_character(self, char):
+        self.by_id.pop(char.id, None)
+        self.by_name.pop(char.name, None)
+
+    def resolve_character(self, ref):
+        char = None
+        if isinstance(ref, int):
+            char = self.by_id.get(ref)
+        elif isinstance(ref, str):
+            char = self.by_name.get(ref)
+        if char is None:
+            raise BatchError(f'Character not found: {ref}')
+        return char
+
+    def character_key(self, char):
+        # Pending characters have no id until flush; key them by identity
+        return char.id or id(char)
+
+    def edge_key(self, source, target):
+        return (self.character_key(source), self.character_key(target))
+
+    def claim_name(self, name):
+        """Flush before name is taken if an earlier op freed it, so the rows change in op order"""
+        if name in self.freed:
+            self.flush()
+
+    def flush(self):
+        """Flush pending writes, re-keying the edges of characters that just got ids"""
+        pending = {id(char): char for char in self.by_name.values() if char.id is None}
+        db.session.flush()
+        self.freed.clear()
+        for char in pending.values():
+            self.by_id[char.id] = char
+        if pending:
+            self.edges = {
+                (pending[source].id if source in pending else source,
+                 pending[target].id if target in pending else target)
+                for source, target in self.edges
+            }
+
+
+def _character_data_of(op):
+    """op's data, checked before anything is applied so a bad field fails only its op"""
+    data = _data_of(op)
+    for field in ('position', 'colors'):
+        if data.get(field) is not None and not isinstance(data[field], dict):
+            raise BatchError(f'{field} must be an object')
+    return data
+
+
+def _apply_character_fields(character, data):
+    """Copy the editable character fields present in data onto character"""
+    if 'description' in data:
+        character.description = data['description']
+
+    if 'position' in data:
+        position = data['position'] or {}
+        character.position_x = position.get('x')
+        character.position_y = position.get('y')
+
+    if 'colors' in data:
+        colors = data['colors'] or {}
+        character.bg_color = colors.get('bg')
+        character.border_color = colors.get('border')
+        character.text_color = colors.get('text')
+        character.icon_color = colors.get('icon')
+
+    if 'metadata' in data:
+        character.extra_data = data['metadata']
+
+
+def _create_character(ctx, op):
+    data = _character_data_of(op)
+    name = data.get('name')
+    if not isinstance(name, str) or not name:
+        raise BatchError('Character name is required')
+    if name in ctx.by_name:
+        raise BatchError('Character with this name already exists in this project')
+
+    ctx.claim_name(name)
+    character = Character(project_id=ctx.project_id, name=name, description='', extra_data={})
+    _apply_character_fields(character, data)
+    db.session.add(character)
+    ctx.add_character(character)
+    return character
+
+
+def _update_character(ctx, op):
+    data = _character_data_of(op)
+    character = ctx.resolve_character(_ref_of(op))
+
+    if 'name' in data and data['name'] != character.name:
+        name = data['name']
+        if not isinstance(name, str) or not name:
+            raise BatchError('Character name is required')
+        existing = ctx.by_name.get(name)
+        if existing is not None and existing is not character:
+            raise BatchError('Character with this name already exists in this project')
+        ctx.claim_name(name)
+        ctx.remove_character(character)
+        ctx.freed.add(character.name)
+        character.name = name
+        ctx.add_character(character)
+
+    _apply_character_fields(character, data)
+    character.updated_at = datetime.utcnow()
+    return character
+
+
+def _delete_character(ctx, op):
+    character = ctx.resolve_character(_ref_of(op))
+    if character.id is None:
+        # Created earlier in this batch: it must exist before it can be deleted
+        ctx.flush()
+    key = ctx.character_key(character)
+    ctx.edges = {edge for edge in ctx.edges if key not in edge}
+    ctx.remove_character(character)
+    ctx.freed.add(character.name)
+    db.session.delete(character)  # Cascade will delete relationships
+    return None
+
+
+def _create_relationship(ctx, op):
+    data = _data_of(op)
+    source_ref = _character_endpoint(data, 'source')
+    target_ref = _character_endpoint(data, 'target')
+    if source_ref is None or target_ref is None:
+        raise BatchError('Source and target characters are required')
+
+    source = ctx.resolve_character(source_ref)
+    target = ctx.resolve_character(target_ref)
+    if source is target:
+        raise BatchError('Cannot create relationship to self')
+
+    key = ctx.edge_key(source, target)
+    if key in ctx.edges:
+        raise BatchError('Relationship already exists')
+
+    relationship = CharacterRelationship(
+        project_id=ctx.project_id,
+        source_character=source,
+        target_character=target,
+        label=data.get('label', ''),
+        relationship_type_id=data.get('relationship_type_id'),
+        extra_data=data.get('metadata', {})
+    )
+    db.session.add(relationship)
+    ctx.edges.add(key)
+    return relationship
+
+
+def _resolve_relationship(ctx, op):
+    relationship = ctx.relationships.get(op['id']) if isinstance(op.get('id'), int) else None
+    if relationship is None:
+        raise BatchError(f"Relationship not found: {op.get('id')}")
+    return relationship
+
+
+def _update_relationship(ctx, op):
+    data = _data_of(op)
+    relationship = _resolve_relationship(ctx, op)
+
+    if 'label' in data:
+        relationship.label = data['label']
+
+    if 'relationship_type_id' in data:
+        relationship.relationship_type_id = data['relationship_type_id']
+
+    if 'metadata' in data:
+        relationship.extra_data = data['metadata']
+
+    return relationship
+
+
+def _delete_relationship(ctx, op):
+    relationship = _resolve_relationship(ctx, op)
+    ctx.relationships.pop(relationship.id, None)
+    ctx.edges.discard((relationship.source_character_id, relationship.target_character_id))
+    db.session.delete(relationship)
+    return None
+
+
+HANDLERS = {
+    ('create', 'character'): _create_character,
+    ('update', 'character'): _update_character,
+    ('delete', 'character'): _delete_character,
+    ('create', 'relationship'): _create_relationship,
+    ('update', 'relationship'): _update_relationship,
+    ('delete', 'relationship'): _delete_relationship,
+}
+
+
+def apply_batch(project_id, operations, atomic=True):
+    """Apply operations to a project and commit once.
+
+    Returns (results, committed). Each result describes one op in input order.
+    With atomic=True any failing op rolls back the whole batch; otherwise
+    failing ops are skipped and the rest are committed.
+    """
+    ctx = BatchContext(project_id, operations)
+    results = []
+    applied = []
+    failed = False
+
+    for index, op in enumerate(operations):
+        result = {'index': index, 'op': op.get('op'), 'type': op.get('type')}
+        handler = HANDLERS.get((op.get('op'), op.get('type')))
+        if handler is None:
+            result.update(status='error', message=f'Unsupported operation: {op.get("op")} {op.get("type")}')
+            failed = True
+        else:
+            try:
+                obj = handler(ctx, op)
+                result['status'] = 'ok'
+                applied.append((result, obj))
+            except BatchError as e:
+                result.update(status='error', message=str(e))
+                failed = True
+        results.append(result)
+
+    if failed and atomic:
+        db.session.rollback()
+        return results, False
+
+    # Flush so new rows get ids, then serialize before the commit expires them
+    db.session.flush()
+    names = {char.id: char.name for char in ctx.by_id.values()}
+    names.update({char.id: char.name for char in ctx.by_name.values()})
+    for result, obj in applied:
+        if isinstance(obj, Character):
+            result['id'] = obj.id
+            result['character'] = obj.to_dict()
+        elif isinstance(obj, CharacterRelationship):
+            result['id'] = obj.id
+            result['relationship'] = obj.to_dict(character_names=names)
+
+    db.session.commit()
+    return results, True
@@ -0,0 +1,5 @@
+"""
+Backend benchmarks. Run from the backend directory, e.g.:
+
+    python -m benchmarks.login_storm
+"""
@@ -0,0 +1,49 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks never touch the development database: unless DATABASE_URL is
+already set, setup_environment() points the app at a throwaway SQLite file.
+"""
+
+import os
+import tempfile
+
+
+def setup_environment(**config):
+    """Point the app at a scratch database and apply config env vars.
+
+    Must be called before importing app.
+    """
+    if not os.environ.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='worldbuilder-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    for key, value in config.items():
+        os.environ.setdefault(key, str(value))
+    return os.environ['DATABASE_URL']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """p50/p95/p99/max in milliseconds for a list of latencies in seconds"""
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0
+    }
+
+
+def signup(client, email, password='benchmark-password', name='Benchmark User'):
+    """Create a user through the API and return auth headers"""
+    response = client.post('/api/auth/signup', json={'name': name, 'email': email, 'password': password})
+    token = response.get_json()['token']
+    return {'Authorization': f'Bearer {token}'}
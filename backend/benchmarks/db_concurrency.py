@@ -0,0 +1,141 @@
+"""
+Mixed read/write concurrency benchmark for the database engine profiles.
+
+Seeds a project, then runs reader threads (graph and paged character
+listings) alongside writer threads (character creates and updates) for a
+fixed time. Each profile runs in its own process against its own scratch
+database, because the engine is configured when the app is imported.
+
+    python -m benchmarks.db_concurrency --readers 8 --writers 4 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import summarize
+
+PROFILES = ('default', 'tuned')
+
+
+def run_profile(args):
+    """Benchmark body, run in a child process with DB_ENGINE_PROFILE already set"""
+    from benchmarks.common import setup_environment, signup
+    setup_environment(PASSWORD_HASH_PROFILE='fast')
+
+    from app import app, db
+    from importer import import_world
+
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    headers = signup(client, 'concurrency@example.com')
+    project_id = client.post('/api/projects', json={'name': 'Concurrency'}, headers=headers).get_json()['id']
+
+    rng = random.Random(0)
+    names = [f'Character {i}' for i in range(args.characters)]
+    with app.app_context():
+        summary = import_world(project_id, {
+            'entities': [{'name': name, 'description': 'Seeded.'} for name in names],
+            'relationships': [
+                {'source': rng.choice(names), 'target': rng.choice(names), 'label': 'knows'}
+                for _ in range(args.characters * 2)
+            ]
+        })
+    character_ids = list(summary['characters'].values())
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+
+    def record(kind, started, response):
+        elapsed = time.perf_counter() - started
+        with lock:
+            if response.status_code >= 400:
+                errors[kind] += 1
+            else:
+                latencies[kind].append(elapsed)
+
+    def reader(seed):
+        local = app.test_client()
+        pick = random.Random(seed)
+        while not stop.is_set():
+            if pick.random() < 0.5:
+                path = f'/api/projects/{project_id}/graph'
+            else:
+                path = f'/api/projects/{project_id}/characters?limit=100&after={pick.choice(character_ids)}'
+            started = time.perf_counter()
+            record('read', started, local.get(path, headers=headers))
+
+    def writer(seed):
+        local = app.test_client()
+        pick = random.Random(seed)
+        count = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            if pick.random() < 0.5:
+                count += 1
+                response = local.post(f'/api/projects/{project_id}/characters', json={
+                    'name': f'Writer {seed}-{count}', 'description': 'Added under load.'
+                }, headers=headers)
+            else:
+                response = local.put(
+                    f'/api/projects/{project_id}/characters/{pick.choice(character_ids)}',
+                    json={'description': f'Updated {count}'}, headers=headers
+                )
+            record('write', started, response)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    result = {'profile': os.environ['DB_ENGINE_PROFILE']}
+    for kind in ('read', 'write'):
+        result[kind] = dict(summarize(latencies[kind]), errors=errors[kind],
+                            per_second=len(latencies[kind]) / args.seconds)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--characters', type=int, default=500)
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args)
+        return
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile')
+    for profile in args.profiles:
+        env = dict(os.environ, DB_ENGINE_PROFILE=profile)
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.db_concurrency', '--child'] + sys.argv[1:],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile}:')
+        for kind in ('read', 'write'):
+            stats = result[kind]
+            print(f"  {kind:<6} {stats['per_second']:8.1f}/s  p50 {stats['p50_ms']:7.1f}ms  "
+                  f"p95 {stats['p95_ms']:7.1f}ms  p99 {stats['p99_ms']:7.1f}ms  errors {stats['errors']}")
+
+
+if __name__ == '__main__':
+    main()
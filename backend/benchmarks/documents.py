@@ -0,0 +1,92 @@
+"""
+Document corpus benchmark.
+
+Generates markdown corpora of increasing size (--folders-per-level folders
+per level, --files-per-folder files in each) and times, per size:
+
+    walk       a fresh full scan and tree build, the cost every request paid
+               when the directory was walked per request
+    tree       the cached tree (what a request costs after warm-up)
+    rebuild    saving one file, then the tree (only its folder's branch is rebuilt)
+    read       one file (a stat plus the cached content)
+    batch      --batch files in one call
+    poll       one background poll (a stat per directory and file)
+
+    python -m benchmarks.documents --sizes 200,2000,20000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import summarize
+from documents import DocumentCorpus
+
+
+def generate_corpus(root, files, files_per_folder, folders_per_level, body):
+    folders = [root]
+    while len(folders) * files_per_folder < files:
+        folders = [os.path.join(parent, f'Folder {i}') for parent in folders for i in range(folders_per_level)]
+    paths = []
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+        for i in range(files_per_folder):
+            if len(paths) == files:
+                return paths
+            path = os.path.join(folder, f'Document {i}.md')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(body)
+            paths.append(os.path.relpath(path, root).replace(os.sep, '/'))
+    return paths
+
+
+def timed(action, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        action()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)['p50_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='200,2000,20000')
+    parser.add_argument('--files-per-folder', type=int, default=50)
+    parser.add_argument('--folders-per-level', type=int, default=8)
+    parser.add_argument('--file-bytes', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    body = ('The chronicle of the realm continues. ' * (args.file_bytes // 38 + 1))[:args.file_bytes]
+    print(f"{'files':>8}{'walk ms':>10}{'tree ms':>10}{'rebuild ms':>12}{'read ms':>10}{'batch ms':>10}{'poll ms':>10}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        root = tempfile.mkdtemp(prefix='worldbuilder-docs-')
+        try:
+            paths = generate_corpus(root, size, args.files_per_folder, args.folders_per_level, body)
+            walk = timed(lambda: DocumentCorpus(root, watch='off').tree(), max(1, args.repeat // 10))
+
+            corpus = DocumentCorpus(root, watch='off')
+            corpus.tree()
+            for path in paths[:args.batch]:
+                corpus.read(path)
+            tree = timed(corpus.tree, args.repeat)
+
+            def rebuild():
+                corpus.write(paths[-1], body)
+                corpus.tree()
+
+            read = timed(lambda: corpus.read(paths[0]), args.repeat)
+            batch = timed(lambda: corpus.read_many(paths[:args.batch]), args.repeat)
+            rebuilt = timed(rebuild, max(1, args.repeat // 10))
+            poll = timed(corpus.poll, max(1, args.repeat // 10))
+            print(f'{len(paths):>8}{walk:>10.2f}{tree:>10.4f}{rebuilt:>12.2f}{read:>10.3f}{batch:>10.3f}{poll:>10.2f}')
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
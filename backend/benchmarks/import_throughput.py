@@ -0,0 +1,85 @@
+"""
+Bulk import throughput benchmark.
+
+Imports a synthetic extraction document through importer.import_world and
+reports rows/sec, then replays a slice of the same document the way the
+dashboard does today (one POST per character and per relationship) for
+comparison.
+
+    python -m benchmarks.import_throughput --entities 5000 --relationships 10000
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.common import setup_environment, signup
+
+setup_environment(PASSWORD_HASH_PROFILE='fast')
+
+from app import app, db  # noqa: E402
+from importer import import_world  # noqa: E402
+
+
+def make_document(entities, relationships, seed=0):
+    rng = random.Random(seed)
+    names = [f'Character {i}' for i in range(entities)]
+    return {
+        'entities': [{'name': name, 'description': f'{name} of house {rng.randint(1, 50)}.'} for name in names],
+        'relationships': [
+            {'source': rng.choice(names), 'target': rng.choice(names), 'label': rng.choice(['ally of', 'enemy of', 'sibling of'])}
+            for _ in range(relationships)
+        ]
+    }
+
+
+def per_request_import(client, headers, project_id, document):
+    """Replay a document the way the dashboard does: one request per row"""
+    ids = {}
+    for entity in document['entities']:
+        response = client.post(f'/api/projects/{project_id}/characters', json=entity, headers=headers)
+        ids[entity['name']] = response.get_json()['id']
+    for rel in document['relationships']:
+        if rel['source'] in ids and rel['target'] in ids:
+            client.post(f'/api/projects/{project_id}/relationships', json={
+                'source_character_id': ids[rel['source']],
+                'target_character_id': ids[rel['target']],
+                'label': rel['label']
+            }, headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entities', type=int, default=5000)
+    parser.add_argument('--relationships', type=int, default=10000)
+    parser.add_argument('--baseline-entities', type=int, default=200,
+                        help='Size of the slice replayed one request per row')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    headers = signup(client, 'importer@example.com')
+    bulk_project = client.post('/api/projects', json={'name': 'Bulk'}, headers=headers).get_json()['id']
+    rest_project = client.post('/api/projects', json={'name': 'Per request'}, headers=headers).get_json()['id']
+
+    document = make_document(args.entities, args.relationships)
+    with app.app_context():
+        start = time.perf_counter()
+        summary = import_world(bulk_project, document)
+        elapsed = time.perf_counter() - start
+    rows = summary['created_characters'] + summary['created_relationships']
+    print(f'bulk import:  {rows} rows in {elapsed:.2f}s  ({rows / elapsed:,.0f} rows/sec)  {summary["skipped_relationships"]} edges skipped')
+
+    ratio = args.baseline_entities / max(args.entities, 1)
+    sample = make_document(args.baseline_entities, int(args.relationships * ratio), seed=1)
+    start = time.perf_counter()
+    per_request_import(client, headers, rest_project, sample)
+    elapsed = time.perf_counter() - start
+    rows = len(sample['entities']) + len(sample['relationships'])
+    print(f'per request:  {rows} rows in {elapsed:.2f}s  ({rows / elapsed:,.0f} rows/sec)')
+
+
+if __name__ == '__main__':
+    main()
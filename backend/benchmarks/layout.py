@@ -0,0 +1,107 @@
+"""
+Server-side layout benchmark.
+
+Generates a world, then times layout.layout_project end to end (load, force
+simulation, bulk write-back): a full layout of every character, and
+incremental placement after clearing the positions of --new-fraction of
+them, as an extraction import would leave them. Reports the time and a few
+layout measures, in units of the spacing:
+
+    edge       median length of a relationship
+    pair       median distance between two random characters
+    nearest    median distance to the nearest other character (on a sample)
+
+A good layout has edges much shorter than random pairs, and nearest
+distances near 1.
+
+    python -m benchmarks.layout --characters 20000 --relationships 60000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import setup_environment, signup
+
+setup_environment(PASSWORD_HASH_PROFILE='fast')
+
+from sqlalchemy import select, update  # noqa: E402
+
+from app import app, db  # noqa: E402
+from benchmarks.worldgen import generate_world  # noqa: E402
+from layout import DEFAULT_SPACING, layout_project  # noqa: E402
+from models import Character, CharacterRelationship  # noqa: E402
+
+
+def measure(project_id, spacing, rng):
+    conn = db.session.connection()
+    characters = Character.__table__
+    relationships = CharacterRelationship.__table__
+    rows = conn.execute(
+        select(characters.c.id, characters.c.position_x, characters.c.position_y)
+        .where(characters.c.project_id == project_id).order_by(characters.c.id)
+    ).all()
+    ids = np.array([row[0] for row in rows])
+    pos = np.array([(row[1], row[2]) for row in rows], dtype=np.float64)
+    edges = np.array([(row[0], row[1]) for row in conn.execute(
+        select(relationships.c.source_character_id, relationships.c.target_character_id)
+        .where(relationships.c.project_id == project_id)
+    )])
+    edge = np.linalg.norm(pos[np.searchsorted(ids, edges[:, 0])] - pos[np.searchsorted(ids, edges[:, 1])], axis=1)
+    a, b = rng.integers(0, len(pos), (2, 20000))
+    pair = np.linalg.norm(pos[a] - pos[b], axis=1)
+    sample = rng.choice(len(pos), min(500, len(pos)), replace=False)
+    nearest = [np.partition(np.linalg.norm(pos - pos[i], axis=1), 1)[1] for i in sample]
+    return np.median(edge) / spacing, np.median(pair) / spacing, np.median(nearest) / spacing
+
+
+def clear_positions(project_id, fraction, rng):
+    characters = Character.__table__
+    ids = [row[0] for row in db.session.execute(
+        select(characters.c.id).where(characters.c.project_id == project_id)
+    )]
+    cleared = [int(i) for i in rng.choice(ids, int(len(ids) * fraction), replace=False)]
+    db.session.execute(
+        update(characters).where(characters.c.id.in_(cleared)).values(position_x=None, position_y=None)
+    )
+    db.session.commit()
+    return len(cleared)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=20000)
+    parser.add_argument('--relationships', type=int, default=60000)
+    parser.add_argument('--new-fraction', type=float, default=0.05)
+    parser.add_argument('--spacing', type=float, default=DEFAULT_SPACING)
+    parser.add_argument('--iterations', type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = signup(client, f'layout-{time.time_ns()}@example.com')
+    project_id = client.post('/api/projects', json={'name': 'Layout'}, headers=headers).get_json()['id']
+
+    with app.app_context():
+        generate_world(project_id, args.characters, args.relationships)
+
+        print(f'{args.characters} characters, {args.relationships} relationships\n')
+        print(f"{'run':<28}{'placed':>8}{'seconds':>9}{'edge':>8}{'pair':>8}{'nearest':>9}")
+        print(f"{'generated (random)':<28}{'-':>8}{'-':>9}" + ''.join(
+            f'{value:>8.2f}' for value in measure(project_id, args.spacing, rng)))
+
+        runs = [('all', None), ('new', args.new_fraction)]
+        for mode, fraction in runs:
+            if fraction is not None:
+                clear_positions(project_id, fraction, rng)
+            summary = layout_project(project_id, mode, iterations=args.iterations, spacing=args.spacing)
+            edge, pair, nearest = measure(project_id, args.spacing, rng)
+            label = mode if fraction is None else f'{mode} ({fraction:.0%} cleared)'
+            print(f"{label:<28}{summary['placed']:>8}{summary['seconds']:>9.2f}{edge:>8.2f}{pair:>8.2f}{nearest:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
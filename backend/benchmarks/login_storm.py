@@ -0,0 +1,96 @@
+"""
+Login storm benchmark.
+
+Measures read endpoint latency on its own and while many clients hammer
+/api/auth/login, once with password hashing inline in the request thread and
+once on the bounded hashing pool. With the pool, read latency should stay
+close to the baseline and excess logins are rejected with 503.
+
+    python -m benchmarks.login_storm --login-threads 16 --reads 300
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import setup_environment, summarize, signup
+
+setup_environment(PASSWORD_HASH_PROFILE='default')
+
+import app as app_module  # noqa: E402
+from app import app, db  # noqa: E402
+from hashing import PasswordHasher  # noqa: E402
+
+PASSWORD = 'benchmark-password'
+
+
+def measure_reads(headers, path, count):
+    client = app.test_client()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def login_worker(stop, counts, lock):
+    client = app.test_client()
+    while not stop.is_set():
+        response = client.post('/api/auth/login', json={'email': 'storm@example.com', 'password': PASSWORD})
+        with lock:
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            time.sleep(0.005)
+
+
+def run_phase(label, headers, path, reads, login_threads):
+    stop = threading.Event()
+    counts, lock = {}, threading.Lock()
+    threads = [threading.Thread(target=login_worker, args=(stop, counts, lock)) for _ in range(login_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2 if login_threads else 0)
+    latencies = measure_reads(headers, path, reads)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    stats = summarize(latencies)
+    print(f"{label:<24} p50={stats['p50_ms']:7.2f}ms  p95={stats['p95_ms']:7.2f}ms  "
+          f"p99={stats['p99_ms']:7.2f}ms  logins={counts}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--reads', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=app.config['PASSWORD_HASH_WORKERS'])
+    parser.add_argument('--queue', type=int, default=app.config['PASSWORD_HASH_QUEUE'])
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    headers = signup(client, 'reader@example.com')
+    signup(client, 'storm@example.com', password=PASSWORD)
+    project_id = client.post('/api/projects', json={'name': 'Bench'}, headers=headers).get_json()['id']
+    for i in range(50):
+        client.post(f'/api/projects/{project_id}/characters', json={'name': f'Character {i}'}, headers=headers)
+    path = f'/api/projects/{project_id}/characters'
+
+    print(f"hash profile={app.config['PASSWORD_HASH_PROFILE']}  login threads={args.login_threads}")
+    run_phase('baseline (no logins)', headers, path, args.reads, 0)
+
+    app_module.password_hasher = PasswordHasher(workers=0)
+    run_phase('storm, inline hashing', headers, path, args.reads, args.login_threads)
+
+    app_module.password_hasher = PasswordHasher(workers=args.workers, max_queue=args.queue)
+    run_phase(f'storm, pool {args.workers}+{args.queue}', headers, path, args.reads, args.login_threads)
+    app_module.password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Fuzzy name matching benchmark.
+
+Times a batch of misspelled queries against casts of increasing size, once
+through name_matcher's trigram index and once with the all-pairs Levenshtein
+scan the extraction route used to do, and checks both agree.
+
+    python -m benchmarks.name_match --sizes 1000 10000 50000 --queries 200
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.common import summarize
+from name_matcher import DEFAULT_THRESHOLD, NameIndex, normalize, similarity
+
+SYLLABLES = ['ar', 'bel', 'cor', 'dra', 'el', 'fen', 'gal', 'hor', 'is', 'kal',
+             'lor', 'mir', 'nor', 'or', 'pel', 'quin', 'ran', 'sil', 'tor', 'va', 'wyn', 'zor']
+
+
+def make_names(count, rng):
+    names = set()
+    while len(names) < count:
+        first = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        names.add(f'{first} {last}')
+    return sorted(names)
+
+
+def misspell(name, rng):
+    chars = list(name)
+    for _ in range(rng.randint(0, 2)):
+        position = rng.randrange(len(chars))
+        chars[position] = rng.choice('aeiourst')
+    return ''.join(chars)
+
+
+def all_pairs(query, names, threshold):
+    key = normalize(query)
+    return sorted(
+        (i for i, name in enumerate(names) if similarity(key, normalize(name)) >= threshold),
+        key=lambda i: (-similarity(key, normalize(names[i])), names[i])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--baseline-queries', type=int, default=20,
+                        help='Queries timed with the all-pairs scan (it is slow)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for size in args.sizes:
+        names = make_names(size, rng)
+        started = time.perf_counter()
+        index = NameIndex(1, 0, list(enumerate(names)))
+        build_seconds = time.perf_counter() - started
+        queries = [misspell(rng.choice(names), rng) for _ in range(args.queries)]
+
+        indexed = []
+        for query in queries:
+            started = time.perf_counter()
+            index.match(query, limit=3, threshold=args.threshold)
+            indexed.append(time.perf_counter() - started)
+
+        scanned = []
+        for query in queries[:args.baseline_queries]:
+            started = time.perf_counter()
+            expected = all_pairs(query, names, args.threshold)[:3]
+            scanned.append(time.perf_counter() - started)
+            got = [match['id'] for match in index.match(query, limit=3, threshold=args.threshold)]
+            assert got == expected, (query, got, expected)
+
+        print(f'{size} characters (index built in {build_seconds * 1000:.0f}ms)')
+        for label, latencies in (('trigram index', indexed), ('all-pairs scan', scanned)):
+            stats = summarize(latencies)
+            print(f"  {label:<15} p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  ({stats['count']} queries)")
+
+
+if __name__ == '__main__':
+    main()
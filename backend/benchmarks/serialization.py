@@ -0,0 +1,88 @@
+"""
+Serialization and compression benchmark.
+
+Generates a synthetic world with long descriptions, then fetches the full
+character list, relationship list and graph once per combination of
+
+    serializer   orm+json (to_dict() and the standard library, the old path),
+                 orm+orjson, rows+json, rows+orjson (serialization.py)
+    encoding     identity, gzip, br (when brotli is installed)
+
+and reports bytes on the wire and CPU time per response (process time, so
+it is not inflated by waiting).
+
+    python -m benchmarks.serialization --characters 5000 --relationships 15000 --description-words 120
+"""
+
+import argparse
+import time
+
+from benchmarks.common import setup_environment, signup, summarize
+
+setup_environment(PASSWORD_HASH_PROFILE='fast', METRICS_ENABLED='false')
+
+from app import app, db  # noqa: E402
+import compression  # noqa: E402
+import serialization  # noqa: E402
+from benchmarks.worldgen import generate_world  # noqa: E402
+
+ROUTES = ('characters', 'relationships', 'graph')
+
+
+def serializers():
+    modes = [('orm+json', False, 'json'), ('rows+json', True, 'json')]
+    if serialization.orjson is not None:
+        modes[1:1] = [('orm+orjson', False, 'orjson')]
+        modes.append(('rows+orjson', True, 'orjson'))
+    return modes
+
+
+def measure(client, path, headers, iterations):
+    cpu, wall, size = [], [], 0
+    for _ in range(iterations):
+        started_cpu, started = time.process_time(), time.perf_counter()
+        response = client.get(path, headers=headers)
+        size = len(response.get_data())
+        cpu.append(time.process_time() - started_cpu)
+        wall.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise SystemExit(f'{path} answered {response.status_code}')
+    return size, summarize(cpu)['p50_ms'], summarize(wall)['p50_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--relationships', type=int, default=15000)
+    parser.add_argument('--description-words', type=int, default=120)
+    parser.add_argument('--metadata-keys', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = signup(client, 'serialization@example.com')
+    project_id = client.post('/api/projects', json={'name': 'Serialization'}, headers=headers).get_json()['id']
+    with app.app_context():
+        generate_world(project_id, args.characters, args.relationships, args.description_words, args.metadata_keys)
+
+    encodings = ('identity',) + tuple(reversed(compression.available_encodings()))
+    print(f'{args.characters} characters, {args.relationships} relationships, '
+          f'{args.description_words}-word descriptions; p50 of {args.iterations} requests\n')
+    print(f"{'route':<14}{'serializer':<14}{'encoding':<10}{'bytes':>12}{'cpu ms':>10}{'wall ms':>10}")
+    for route in ROUTES:
+        path = f'/api/projects/{project_id}/{route}'
+        for name, rows, encoder in serializers():
+            app.config['ROW_SERIALIZER'] = rows
+            serialization.use_encoder(encoder)
+            for encoding in encodings:
+                size, cpu_ms, wall_ms = measure(
+                    client, path, dict(headers, **{'Accept-Encoding': encoding}), args.iterations
+                )
+                print(f'{route:<14}{name:<14}{encoding:<10}{size:>12,}{cpu_ms:>10.1f}{wall_ms:>10.1f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Serving-mode load test.
+
+Generates a world in a scratch database, then serves it under each mode in
+turn (a separate server process) and runs closed-loop HTTP clients against
+it at each concurrency level:
+
+    dev        app.run(threaded=True), the development server: a thread per connection
+    gunicorn   gunicorn -c gunicorn.conf.py 'app:create_app()': --workers processes x --threads
+    uvicorn    uvicorn asgi:application --workers N: async hot reads, Flask on a thread pool
+
+Each client loops over the canvas graph (?fields=name,position with endpoint
+ids for edges) and a /changes poll, with a login (password hashing, CPU
+heavy) every --login-every requests. --streams holds that many event streams
+open throughout, as live clients would; under gunicorn each one occupies a
+request thread, under uvicorn none do.
+
+Reports requests per second, latency percentiles and errors (5xx responses,
+timeouts, refused connections) per mode and concurrency.
+
+    python -m benchmarks.serving --characters 2000 --relationships 6000 --concurrency 1,8,32 --streams 16
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import setup_environment, signup, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('dev', 'gunicorn', 'uvicorn')
+PASSWORD = 'benchmark-password'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port, args):
+    if mode == 'dev':
+        return [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    if mode == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers), '--log-level', 'warning', '--timeout-graceful-shutdown', '5']
+
+
+def available(mode):
+    if mode == 'gunicorn':
+        return importlib.util.find_spec('gunicorn') is not None
+    if mode == 'uvicorn':
+        return all(importlib.util.find_spec(name) for name in ('uvicorn', 'a2wsgi', 'aiosqlite'))
+    return True
+
+
+def start_server(mode, args):
+    port = free_port()
+    env = dict(os.environ, WEB_BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(args.workers),
+               WEB_THREADS=str(args.threads), LIVE_HEARTBEAT_SECONDS='5')
+    process = subprocess.Popen(server_command(mode, port, args), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise SystemExit(f'{mode} server did not come up on port {port}')
+
+
+def stop_server(process):
+    """SIGTERM, then the time it took to exit (graceful shutdown included)"""
+    started = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.perf_counter() - started
+
+
+def hold_streams(port, path, count, stop):
+    """Open count event streams and keep reading them until stop is set"""
+    def hold():
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            while not stop.is_set():
+                try:
+                    if not response.read1(4096):
+                        return
+                except socket.timeout:
+                    continue
+        except OSError:
+            return
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=hold, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_clients(port, requests, concurrency, seconds, timeout):
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(offset):
+        conn = None
+        index = offset
+        while time.monotonic() < deadline:
+            method, path, body, headers = requests[index % len(requests)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                error = f'{response.status}' if response.status >= 500 else None
+            except socket.timeout:
+                error, conn = 'timeout', None
+            except OSError as e:
+                error, conn = type(e).__name__, None
+                time.sleep(0.01)
+            with lock:
+                if error is None:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[error] = errors.get(error, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--streams', type=int, default=0)
+    parser.add_argument('--login-every', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--characters', type=int, default=2000)
+    parser.add_argument('--relationships', type=int, default=6000)
+    parser.add_argument('--hash-profile', default='pbkdf2')
+    args = parser.parse_args()
+
+    # Servers read these from the environment too
+    setup_environment(PASSWORD_HASH_PROFILE=args.hash_profile, METRICS_ENABLED='false')
+
+    from app import app, db
+    from benchmarks.worldgen import generate_world
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = signup(client, 'serving@example.com', password=PASSWORD)
+    project_id = client.post('/api/projects', json={'name': 'Serving'}, headers=headers).get_json()['id']
+    with app.app_context():
+        generate_world(project_id, args.characters, args.relationships)
+    version = client.get(f'/api/projects/{project_id}', headers=headers).get_json()['version']
+
+    base = f'/api/projects/{project_id}'
+    reads = [
+        ('GET', f'{base}/graph?fields=name,position&edge_fields=source_character_id,target_character_id', None, headers),
+        ('GET', f'{base}/changes?since={version - 1}', None, headers),
+    ]
+    login = ('POST', '/api/auth/login', json.dumps({'email': 'serving@example.com', 'password': PASSWORD}),
+             {'Content-Type': 'application/json'})
+    requests = [reads[i % len(reads)] for i in range(max(1, args.login_every - 1))] + [login]
+    token = headers['Authorization'].split(' ')[1]
+
+    print(f'{args.characters} characters, {args.relationships} relationships; {args.workers} workers, '
+          f'{args.threads} threads; {args.streams} open streams; {args.seconds:.0f}s per level\n')
+    print(f"{'mode':<10}{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  errors")
+    for mode in args.modes.split(','):
+        if not available(mode):
+            print(f'{mode:<10}  skipped: not installed')
+            continue
+        process, port = start_server(mode, args)
+        stop_streams = threading.Event()
+        hold_streams(port, f'{base}/events?token={token}', args.streams, stop_streams)
+        try:
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                latencies, errors, elapsed = run_clients(port, requests, concurrency, args.seconds, args.timeout)
+                stats = summarize(latencies)
+                failed = ', '.join(f'{name}: {count}' for name, count in sorted(errors.items())) or '-'
+                print(f"{mode:<10}{concurrency:>8}{stats['count'] / elapsed:>9.1f}{stats['p50_ms']:>9.1f}"
+                      f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}  {failed}")
+        finally:
+            stop_streams.set()
+            print(f'{mode:<10}  shutdown took {stop_server(process):.1f}s\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Endpoint benchmark suite.
+
+Generates a synthetic world (see benchmarks.worldgen), then drives every
+route in app.py through the Flask test client and reports, per route,
+p50/p95/p99 latency, throughput and the number of SQL statements per
+request. With --concurrency N each route's iterations are spread over N
+client threads.
+
+Results are written as JSON (by default to benchmarks/results/, named after
+the current commit) so a later run can be compared against them:
+
+    python -m benchmarks.suite --characters 2000 --relationships 6000
+    python -m benchmarks.suite --compare benchmarks/results/<earlier>.json
+    python -m benchmarks.suite --only graph search --concurrency 8
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.common import setup_environment, signup, summarize
+
+setup_environment(PASSWORD_HASH_PROFILE='fast', METRICS_TOKEN='benchmark')
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+
+from app import app, db  # noqa: E402
+from benchmarks.worldgen import generate_world  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class World:
+    """The generated project plus a few handles the scenarios need"""
+
+    def __init__(self, client, headers, project_id, character_ids, relationship_ids, names):
+        self.client = client
+        self.headers = headers
+        self.project_id = project_id
+        self.character_ids = character_ids
+        self.relationship_ids = relationship_ids
+        self.names = names
+        self.graph_etag = None
+        self.serial = itertools.count()
+        self.lock = threading.Lock()
+
+    def next_serial(self):
+        with self.lock:
+            return next(self.serial)
+
+    def pick(self, values, i):
+        return values[(i * 7919) % len(values)]
+
+    @property
+    def base(self):
+        return f'/api/projects/{self.project_id}'
+
+    def throwaway_character(self, client):
+        response = client.post(f'{self.base}/characters', json={'name': f'Throwaway {self.next_serial()}'},
+                               headers=self.headers)
+        return response.get_json()['id']
+
+    def throwaway_relationship(self, client):
+        source = self.throwaway_character(client)
+        response = client.post(f'{self.base}/relationships', json={
+            'source_character_id': source,
+            'target_character_id': self.character_ids[0],
+            'label': 'throwaway of'
+        }, headers=self.headers)
+        return response.get_json()['id']
+
+
+class Scenario:
+    """One route exercised with per-iteration inputs.
+
+    prepare(world, client, i) runs untimed and returns (path, options) for
+    the timed request; options may carry json and extra headers.
+    """
+
+    def __init__(self, name, method, prepare, writes=False):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.writes = writes
+
+
+def _get(path_fn):
+    return lambda world, client, i: (path_fn(world, i), {})
+
+
+def _graph_etag(world, client, i):
+    if i == 0 or world.graph_etag is None:
+        world.graph_etag = client.get(f'{world.base}/graph', headers=world.headers).headers['ETag']
+    return f'{world.base}/graph', {'headers': {'If-None-Match': world.graph_etag}}
+
+
+def _changes_after_edit(world, client, i):
+    since = client.get(world.base, headers=world.headers).get_json()['version']
+    client.put(f'{world.base}/characters/{world.pick(world.character_ids, i)}',
+               json={'description': f'Edited {i}'}, headers=world.headers)
+    return f'{world.base}/changes?since={since}', {}
+
+
+def _batch(world, client, i):
+    serial = world.next_serial()
+    operations = [
+        {'op': 'create', 'type': 'character', 'name': f'Batch {serial}-{n}', 'data': {'name': f'Batch {serial}-{n}'}}
+        for n in range(25)
+    ] + [
+        {'op': 'create', 'type': 'relationship', 'data': {
+            'source_character_name': f'Batch {serial}-{n}',
+            'target_character_id': world.pick(world.character_ids, i + n),
+            'label': 'batched with'
+        }}
+        for n in range(25)
+    ]
+    return f'{world.base}/batch', {'json': {'operations': operations}}
+
+
+def _import(world, client, i):
+    serial = world.next_serial()
+    names = [f'Imported {serial}-{n}' for n in range(50)]
+    return f'{world.base}/import', {'json': {
+        'entities': [{'name': name, 'description': 'Imported by the benchmark.'} for name in names],
+        'relationships': [
+            {'source': name, 'target': world.pick(world.names, i + n), 'label': 'imported with'}
+            for n, name in enumerate(names)
+        ]
+    }}
+
+
+SCENARIOS = [
+    # Reads first, so write scenarios don't invalidate their caches mid-run
+    Scenario('health', 'GET', _get(lambda w, i: '/api/health')),
+    Scenario('auth_cache_stats', 'GET', lambda w, c, i: (
+        '/api/auth/cache', {'headers': {'Authorization': f"Bearer {app.config['METRICS_TOKEN']}"}}
+    )),
+    Scenario('list_projects', 'GET', _get(lambda w, i: '/api/projects')),
+    Scenario('get_project', 'GET', _get(lambda w, i: w.base)),
+    Scenario('list_characters', 'GET', _get(lambda w, i: f'{w.base}/characters')),
+    Scenario('list_characters_page', 'GET', _get(
+        lambda w, i: f'{w.base}/characters?limit=100&after={w.pick(w.character_ids, i)}')),
+    Scenario('stream_characters', 'GET', _get(lambda w, i: f'{w.base}/characters?stream=ndjson')),
+    Scenario('get_character', 'GET', _get(lambda w, i: f'{w.base}/characters/{w.pick(w.character_ids, i)}')),
+    Scenario('list_relationships', 'GET', _get(lambda w, i: f'{w.base}/relationships')),
+    Scenario('list_relationships_page', 'GET', _get(
+        lambda w, i: f'{w.base}/relationships?limit=100&after={w.pick(w.relationship_ids, i)}')),
+    Scenario('graph', 'GET', _get(lambda w, i: f'{w.base}/graph')),
+    Scenario('graph_not_modified', 'GET', _graph_etag),
+    Scenario('graph_neighborhood', 'GET', _get(
+        lambda w, i: f'{w.base}/graph/neighborhood?character_id={w.pick(w.character_ids, i)}&depth=2')),
+    Scenario('graph_path', 'GET', _get(
+        lambda w, i: f'{w.base}/graph/path?source={w.pick(w.character_ids, i)}'
+                     f'&target={w.pick(w.character_ids, i + 1)}')),
+    Scenario('graph_components', 'GET', _get(lambda w, i: f'{w.base}/graph/components')),
+    Scenario('analytics', 'GET', _get(lambda w, i: f'{w.base}/analytics')),
+    Scenario('search', 'GET', _get(lambda w, i: f"{w.base}/search?q={['dragon', 'silver tower', 'oath', 'kal'][i % 4]}")),
+    Scenario('match_characters', 'POST', lambda w, c, i: (f'{w.base}/characters/match', {'json': {
+        'names': [w.pick(w.names, i + n).lower()[:-1] for n in range(20)]
+    }})),
+
+    # Writes
+    Scenario('login', 'POST', lambda w, c, i: ('/api/auth/login', {'json': {
+        'email': 'suite@example.com', 'password': 'benchmark-password'
+    }}), writes=True),
+    Scenario('signup', 'POST', lambda w, c, i: ('/api/auth/signup', {'json': {
+        'name': 'Suite', 'email': f'suite-{w.next_serial()}@example.com', 'password': 'benchmark-password'
+    }}), writes=True),
+    Scenario('create_project', 'POST', lambda w, c, i: ('/api/projects', {'json': {
+        'name': f'Suite project {w.next_serial()}'
+    }}), writes=True),
+    Scenario('create_character', 'POST', lambda w, c, i: (f'{w.base}/characters', {'json': {
+        'name': f'Created {w.next_serial()}', 'description': 'Created by the benchmark.'
+    }}), writes=True),
+    Scenario('update_character', 'PUT', lambda w, c, i: (
+        f'{w.base}/characters/{w.pick(w.character_ids, i)}', {'json': {'description': f'Updated {i}'}}
+    ), writes=True),
+    Scenario('delete_character', 'DELETE', lambda w, c, i: (
+        f'{w.base}/characters/{w.throwaway_character(c)}', {}
+    ), writes=True),
+    Scenario('create_relationship', 'POST', lambda w, c, i: (f'{w.base}/relationships', {'json': {
+        'source_character_id': w.pick(w.character_ids, i),
+        'target_character_id': w.pick(w.character_ids, i + 3),
+        'label': 'benchmarked with'
+    }}), writes=True),
+    Scenario('update_relationship', 'PUT', lambda w, c, i: (
+        f'{w.base}/relationships/{w.pick(w.relationship_ids, i)}', {'json': {'label': f'label {i}'}}
+    ), writes=True),
+    Scenario('delete_relationship', 'DELETE', lambda w, c, i: (
+        f'{w.base}/relationships/{w.throwaway_relationship(c)}', {}
+    ), writes=True),
+    Scenario('changes_after_edit', 'GET', _changes_after_edit, writes=True),
+    Scenario('batch', 'POST', _batch, writes=True),
+    Scenario('import', 'POST', _import, writes=True),
+    Scenario('layout', 'POST', lambda w, c, i: (f'{w.base}/layout', {'json': {'mode': 'new'}}), writes=True),
+]
+
+
+class QueryCounter:
+    """Counts SQL statements executed by the current thread"""
+
+    def __init__(self, engine):
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+
+def run_scenario(world, scenario, iterations, concurrency, counter):
+    """Run a scenario and return its latency, throughput and query statistics"""
+    latencies, queries, failures, busy = [], [], [], []
+    lock = threading.Lock()
+    indices = iter(range(iterations))
+
+    def worker():
+        client = app.test_client()
+        timed = 0.0
+        while True:
+            with lock:
+                i = next(indices, None)
+            if i is None:
+                with lock:
+                    busy.append(timed)
+                return
+            path, options = scenario.prepare(world, client, i)
+            headers = dict(world.headers, **options.get('headers', {}))
+            counter.reset()
+            started = time.perf_counter()
+            response = client.open(path, method=scenario.method, json=options.get('json'), headers=headers)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            timed += elapsed
+            with lock:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    failures.append(response.status_code)
+
+    # One untimed warm-up request fills caches the way steady-state traffic would
+    path, options = scenario.prepare(world, world.client, 0)
+    world.client.open(path, method=scenario.method, json=options.get('json'),
+                      headers=dict(world.headers, **options.get('headers', {})))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Throughput over the time clients spent in timed requests, leaving out untimed preparation
+    elapsed = max(busy) if busy else 0.0
+    stats = summarize(latencies)
+    stats.update(
+        throughput_rps=len(latencies) / elapsed if elapsed else 0.0,
+        queries_per_request=sum(queries) / len(queries) if queries else 0.0,
+        max_queries=max(queries) if queries else 0,
+        errors=len(failures),
+    )
+    return stats
+
+
+def build_world(args):
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = signup(client, 'suite@example.com')
+    project_id = client.post('/api/projects', json={'name': 'Benchmark World'}, headers=headers).get_json()['id']
+
+    started = time.perf_counter()
+    with app.app_context():
+        character_ids, relationship_ids = generate_world(
+            project_id, args.characters, args.relationships, args.description_words,
+            args.metadata_keys, args.skew, args.seed
+        )
+        from models import Character
+        names = [name for (name,) in db.session.query(Character.name).filter_by(project_id=project_id)]
+    print(f'Generated {len(character_ids)} characters and {len(relationship_ids)} relationships '
+          f'in {time.perf_counter() - started:.1f}s')
+    return World(client, headers, project_id, character_ids, relationship_ids, names)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, params, baseline, tolerance):
+    """Print per-route changes against a stored run; return the names of regressed routes"""
+    regressed = []
+    print(f"\nAgainst {baseline['meta']['commit']} ({baseline['meta']['timestamp']}):")
+    differing = sorted(
+        key for key in ('characters', 'relationships', 'description_words', 'metadata_keys', 'skew',
+                        'seed', 'iterations', 'concurrency')
+        if baseline['meta']['params'].get(key) != params.get(key)
+    )
+    if differing:
+        print(f"  warning: runs differ in {', '.join(differing)}; timings are not directly comparable")
+    for name, current in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        ratio = current['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 1.0
+        more_queries = current['queries_per_request'] > before['queries_per_request'] + 0.5
+        flag = ''
+        if ratio > 1 + tolerance or more_queries:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print(f"  {name:<26} p50 {before['p50_ms']:8.2f} -> {current['p50_ms']:8.2f}ms ({ratio - 1:+.0%})  "
+              f"queries {before['queries_per_request']:.1f} -> {current['queries_per_request']:.1f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=2000)
+    parser.add_argument('--relationships', type=int, default=6000)
+    parser.add_argument('--description-words', type=int, default=40)
+    parser.add_argument('--metadata-keys', type=int, default=4)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=30, help='Timed requests per route')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads per route')
+    parser.add_argument('--only', nargs='+', metavar='ROUTE', help='Run only these scenarios')
+    parser.add_argument('--reads-only', action='store_true', help='Skip scenarios that write')
+    parser.add_argument('--output', help='Where to write the JSON results (default: benchmarks/results/)')
+    parser.add_argument('--compare', metavar='RESULTS_JSON', help='Earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative p50 slowdown reported as a regression')
+    args = parser.parse_args()
+
+    scenarios = [
+        s for s in SCENARIOS
+        if (not args.only or s.name in args.only) and not (args.reads_only and s.writes)
+    ]
+    unknown = set(args.only or ()) - {s.name for s in SCENARIOS}
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    world = build_world(args)
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    print(f'{args.iterations} requests per route, {args.concurrency} client thread(s)\n')
+    print(f"{'route':<26} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9} {'queries':>8} {'errors':>7}")
+    results = {}
+    for scenario in scenarios:
+        stats = run_scenario(world, scenario, args.iterations, args.concurrency, counter)
+        results[scenario.name] = stats
+        print(f"{scenario.name:<26} {stats['p50_ms']:8.2f}ms {stats['p95_ms']:7.2f}ms {stats['p99_ms']:7.2f}ms "
+              f"{stats['throughput_rps']:9.1f} {stats['queries_per_request']:8.1f} {stats['errors']:7d}")
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, report['meta']['params'], json.load(f), args.tolerance)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Synthetic world generator.
+
+Writes a parameterized world (characters with descriptions and metadata of
+a given size, relationships with a skewed degree distribution so a few
+characters become hubs) straight into the characters and
+character_relationships tables with chunked executemany inserts. The
+project version is bumped and the search index and change log told about
+the new rows, exactly as the bulk importer does.
+
+Used by the benchmark suite; can also fill a development database:
+
+    python -m benchmarks.worldgen --email test@example.com --characters 5000 --relationships 20000
+"""
+
+import argparse
+import itertools
+import random
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+WORDS = (
+    'ancient banner border castle crown dagger dragon ember exile forest fortress glade harbor '
+    'heir honor island king knight legend loyal mage marsh mist night oath order prince queen '
+    'raven rebel ruin sage scholar sea shadow siege silver spy storm sword temple throne tower '
+    'traitor valley vow war ward watcher winter witch wolf'
+).split()
+SYLLABLES = ['ar', 'bel', 'cor', 'dra', 'el', 'fen', 'gal', 'hor', 'is', 'kal',
+             'lor', 'mir', 'nor', 'or', 'pel', 'quin', 'ran', 'sil', 'tor', 'va', 'wyn', 'zor']
+LABELS = ['ally of', 'enemy of', 'sibling of', 'serves', 'mentor of', 'rival of', 'married to', 'commands']
+CHUNK_SIZE = 5000
+
+
+def _names(rng, taken=()):
+    """Unique pronounceable names (case-insensitively distinct from taken), in order"""
+    seen = {name.lower() for name in taken}
+    for serial in itertools.count():
+        first = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        name = f'{first} {last}'
+        if name.lower() in seen:
+            name = f'{name} {serial}'
+            if name.lower() in seen:
+                continue
+        seen.add(name.lower())
+        yield name
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.' if words else ''
+
+
+def _metadata(rng, keys):
+    return {f'attr_{i}': rng.choice(WORDS) for i in range(keys)}
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        yield rows[start:start + CHUNK_SIZE]
+
+
+def generate_world(project_id, characters=1000, relationships=3000, description_words=40,
+                   metadata_keys=4, skew=1.0, seed=0):
+    """Insert a synthetic world into a project and commit.
+
+    skew is the exponent of the Zipf-like weights used to pick relationship
+    endpoints (0 for uniform). Returns the new character and relationship ids.
+    """
+    from models import db, Character, CharacterRelationship
+    import changes
+    import search
+    import versioning
+
+    characters_table = Character.__table__
+    relationships_table = CharacterRelationship.__table__
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    conn = db.session.connection()
+
+    last_character_id = conn.execute(select(func.max(characters_table.c.id))).scalar() or 0
+    last_relationship_id = conn.execute(select(func.max(relationships_table.c.id))).scalar() or 0
+
+    names = _names(rng, conn.execute(
+        select(characters_table.c.name).where(characters_table.c.project_id == project_id)
+    ).scalars())
+    character_rows = [
+        {
+            'project_id': project_id,
+            'name': next(names),
+            'description': _text(rng, description_words),
+            'position_x': rng.uniform(0, 4000),
+            'position_y': rng.uniform(0, 4000),
+            'bg_color': 'bg-blue-100',
+            'border_color': 'border-blue-200',
+            'text_color': 'text-gray-dark',
+            'icon_color': 'text-blue-600',
+            'extra_data': _metadata(rng, metadata_keys),
+            'created_at': now,
+            'updated_at': now,
+        }
+        for _ in range(characters)
+    ]
+    for chunk in _chunks(character_rows):
+        conn.execute(characters_table.insert(), chunk)
+
+    character_ids = [row[0] for row in conn.execute(
+        select(characters_table.c.id)
+        .where(characters_table.c.project_id == project_id, characters_table.c.id > last_character_id)
+        .order_by(characters_table.c.id)
+    )]
+
+    relationship_ids = []
+    if len(character_ids) > 1 and relationships:
+        weights = list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(len(character_ids))))
+        hubs = character_ids[:]
+        rng.shuffle(hubs)
+        relationship_rows = []
+        for _ in range(relationships):
+            source, target = rng.choices(hubs, cum_weights=weights, k=2)
+            while target == source:
+                target = rng.choice(character_ids)
+            relationship_rows.append({
+                'project_id': project_id,
+                'source_character_id': source,
+                'target_character_id': target,
+                'label': rng.choice(LABELS),
+                'extra_data': _metadata(rng, metadata_keys // 2),
+                'created_at': now,
+            })
+        for chunk in _chunks(relationship_rows):
+            conn.execute(relationships_table.insert(), chunk)
+        relationship_ids = [row[0] for row in conn.execute(
+            select(relationships_table.c.id)
+            .where(relationships_table.c.project_id == project_id, relationships_table.c.id > last_relationship_id)
+            .order_by(relationships_table.c.id)
+        )]
+
+    versioning.bump_versions(conn, {project_id})
+    search.record_changes(db.session, character_ids=character_ids, relationship_ids=relationship_ids)
+    changes.record_changes(conn, project_id, character_ids=character_ids, relationship_ids=relationship_ids)
+    db.session.commit()
+    return character_ids, relationship_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True, help='Owner of the generated project')
+    parser.add_argument('--project', default='Synthetic World', help='Project name (created if missing)')
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--relationships', type=int, default=3000)
+    parser.add_argument('--description-words', type=int, default=40)
+    parser.add_argument('--metadata-keys', type=int, default=4)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import app
+    from models import db, User, Project
+
+    with app.app_context():
+        user = User.query.filter_by(email=args.email).first()
+        if not user:
+            raise SystemExit(f'No user with email {args.email}')
+        project = Project.query.filter_by(user_id=user.id, name=args.project).first()
+        if not project:
+            project = Project(user_id=user.id, name=args.project, description='Generated world')
+            db.session.add(project)
+            db.session.commit()
+
+        character_ids, relationship_ids = generate_world(
+            project.id, args.characters, args.relationships, args.description_words,
+            args.metadata_keys, args.skew, args.seed
+        )
+        print(f'Added {len(character_ids)} characters and {len(relationship_ids)} relationships '
+              f'to project {project.id} ({project.name})')
+
+
+if __name__ == '__main__':
+    main()
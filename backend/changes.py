@@ -0,0 +1,329 @@
+"""
+Per-project change log and the incremental change feed.
+
+Every flush that creates, updates or deletes a character or relationship
+writes one project_changes row per touched row, stamped with the project
+version the flush bumped to (so changes.install() must run after
+versioning.install()). The log keeps only the latest change per row: a
+rewrite replaces the previous entry and a delete turns it into a tombstone,
+so GET /changes?since=<version> reads exactly the rows written after that
+version and the log never holds more than one entry per row.
+
+Compaction drops entries older than the retention period and raises the
+project's changes_floor to the newest version it dropped. A project's floor
+is NULL until its log starts: the first logged write sets it to the version
+before that write, so a new project's feed answers from version 0. Projects
+from before the log start at their first write or changes_since() read,
+whichever comes first. A client whose since is below the floor (or who has
+never synced) gets reset=true and should re-fetch the full graph.
+
+Bulk writes such as importer.import_world bypass the ORM and call
+record_changes() directly, after bumping the version.
+
+Once a transaction that wrote log entries commits, the feed's commit
+listeners (see live.py) are called with each project's id, the version
+before the transaction and the version after it.
+"""
+
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, inspect, or_, select
+from models import db, Project, Character, CharacterRelationship, ProjectChange
+
+CHARACTER = 'character'
+RELATIONSHIP = 'relationship'
+CHUNK_SIZE = 500
+
+projects_table = Project.__table__
+changes_table = ProjectChange.__table__
+relationships_table = CharacterRelationship.__table__
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _relationships_of(conn, character_ids):
+    """Ids of relationships touching any of the characters"""
+    found = set()
+    for chunk in _chunks(character_ids):
+        found.update(conn.execute(
+            select(relationships_table.c.id).where(or_(
+                relationships_table.c.source_character_id.in_(chunk),
+                relationships_table.c.target_character_id.in_(chunk)
+            ))
+        ).scalars())
+    return found
+
+
+def write_entries(conn, project_id, entries, version=None):
+    """Replace the log entries of the given rows and return their version.
+
+    entries maps (kind, id) to True for deletes and False for upserts; the
+    version defaults to the project's current one.
+    """
+    if not entries:
+        return version
+    if version is None:
+        version = conn.execute(
+            select(projects_table.c.version).where(projects_table.c.id == project_id)
+        ).scalar()
+    # The first logged write starts the log: everything from the version before it is answerable
+    conn.execute(
+        projects_table.update()
+        .where(projects_table.c.id == project_id, projects_table.c.changes_floor.is_(None))
+        .values(changes_floor=version - 1)
+    )
+    for kind in (CHARACTER, RELATIONSHIP):
+        for chunk in _chunks(ref_id for entry_kind, ref_id in entries if entry_kind == kind):
+            conn.execute(changes_table.delete().where(
+                changes_table.c.project_id == project_id,
+                changes_table.c.kind == kind,
+                changes_table.c.ref_id.in_(chunk)
+            ))
+    now = datetime.utcnow()
+    rows = [
+        {'project_id': project_id, 'kind': kind, 'ref_id': ref_id, 'version': version,
+         'deleted': deleted, 'changed_at': now}
+        for (kind, ref_id), deleted in entries.items()
+    ]
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(changes_table.insert(), rows[start:start + CHUNK_SIZE])
+    return version
+
+
+def _note_version(session, project_id, version):
+    """Remember a project's version range written by the session's transaction"""
+    if version is None:
+        return
+    written = session.info.setdefault('change_versions', {})
+    # Every write bumps the version by one, so the first write started from version - 1
+    since = written.get(project_id, (version - 1, version))[0]
+    written[project_id] = (since, version)
+
+
+def record_changes(conn, project_id, character_ids=(), relationship_ids=(),
+                   deleted_characters=(), deleted_relationships=()):
+    """Log rows written outside the ORM; call after versioning.bump_versions()
+
+    conn must be db.session's connection, so commit listeners hear about it.
+    """
+    entries = {(CHARACTER, ref_id): False for ref_id in character_ids}
+    entries.update(((RELATIONSHIP, ref_id), False) for ref_id in relationship_ids)
+    entries.update(((CHARACTER, ref_id), True) for ref_id in deleted_characters)
+    entries.update(((RELATIONSHIP, ref_id), True) for ref_id in deleted_relationships)
+    _note_version(db.session, project_id, write_entries(conn, project_id, entries))
+
+
+def reset_floor(conn, project_id):
+    """Start a project's log at its current version (after writes that weren't logged)"""
+    conn.execute(
+        projects_table.update().where(projects_table.c.id == project_id)
+        .values(changes_floor=projects_table.c.version)
+    )
+
+
+def changed_ids(conn, project_id, kind, since, version):
+    """(written ids, deleted ids) of kind logged after version since, up to version;
+    None if the log can't answer from since (below the floor, or the log isn't started)"""
+    floor = conn.execute(
+        select(projects_table.c.changes_floor).where(projects_table.c.id == project_id)
+    ).scalar()
+    if floor is None or since < floor or since > version:
+        return None
+    written, deleted = set(), set()
+    for ref_id, is_deleted in conn.execute(
+        select(changes_table.c.ref_id, changes_table.c.deleted).where(
+            changes_table.c.project_id == project_id,
+            changes_table.c.kind == kind,
+            changes_table.c.version > since
+        )
+    ):
+        (deleted if is_deleted else written).add(ref_id)
+    return written - deleted, deleted
+
+
+def compact(conn, retention_seconds):
+    """Drop log entries older than retention_seconds, raising each project's floor past them"""
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    expired = conn.execute(
+        select(changes_table.c.project_id, func.max(changes_table.c.version))
+        .where(changes_table.c.changed_at < cutoff)
+        .group_by(changes_table.c.project_id)
+    ).all()
+    for project_id, floor in expired:
+        conn.execute(
+            projects_table.update().where(projects_table.c.id == project_id)
+            .values(changes_floor=func.max(func.coalesce(projects_table.c.changes_floor, 0), floor))
+        )
+        conn.execute(changes_table.delete().where(
+            changes_table.c.project_id == project_id, changes_table.c.version <= floor
+        ))
+    return len(expired)
+
+
+def _load_rows(session, model, ids):
+    rows = []
+    for chunk in _chunks(sorted(ids)):
+        rows.extend(session.query(model).filter(model.id.in_(chunk)).all())
+    return rows
+
+
+def changes_since(project_id, since, session=None):
+    """Characters and relationships written after version since, plus tombstones.
+
+    Returns reset=True, without rows, if the log can't answer from since.
+    Uses db.session unless another session is given.
+    """
+    session = session or db.session
+    conn = session.connection()
+    version, floor = conn.execute(
+        select(projects_table.c.version, projects_table.c.changes_floor)
+        .where(projects_table.c.id == project_id)
+    ).one()
+    if floor is None:
+        # Nothing logged yet: the log can answer from now on
+        reset_floor(conn, project_id)
+        session.commit()
+        conn = session.connection()
+        floor = version
+
+    result = {'project_id': project_id, 'since': since, 'version': version}
+    if since < floor or since > version:
+        result['reset'] = True
+        return result
+
+    upserts = {CHARACTER: set(), RELATIONSHIP: set()}
+    deleted = {CHARACTER: [], RELATIONSHIP: []}
+    for kind, ref_id, is_deleted in conn.execute(
+        select(changes_table.c.kind, changes_table.c.ref_id, changes_table.c.deleted)
+        .where(changes_table.c.project_id == project_id, changes_table.c.version > since)
+        .order_by(changes_table.c.version, changes_table.c.id)
+    ):
+        (deleted[kind].append if is_deleted else upserts[kind].add)(ref_id)
+
+    characters = _load_rows(session, Character, upserts[CHARACTER])
+    relationships = _load_rows(session, CharacterRelationship, upserts[RELATIONSHIP])
+    character_names = {char.id: char.name for char in characters}
+    missing = {rel.source_character_id for rel in relationships} | {rel.target_character_id for rel in relationships}
+    missing -= character_names.keys()
+    for chunk in _chunks(missing):
+        character_names.update(conn.execute(
+            select(Character.id, Character.name).where(Character.id.in_(chunk))
+        ).all())
+
+    result.update(
+        reset=False,
+        characters=[char.to_dict() for char in characters],
+        relationships=[rel.to_dict(character_names=character_names) for rel in relationships],
+        deleted={'characters': deleted[CHARACTER], 'relationships': deleted[RELATIONSHIP]}
+    )
+    return result
+
+
+class ChangeFeed:
+    """Serves the change feed and compacts the log at most every compact_seconds"""
+
+    def __init__(self, retention_seconds=86400.0, compact_seconds=600.0):
+        self.retention_seconds = retention_seconds
+        self.compact_seconds = compact_seconds
+        self._last_compaction = None
+        self.commit_listeners = []
+
+    def add_commit_listener(self, listener):
+        """Call listener(project_id, since, version) after each commit that wrote log entries"""
+        self.commit_listeners.append(listener)
+
+    def notify(self, written):
+        for project_id, (since, version) in written.items():
+            for listener in self.commit_listeners:
+                listener(project_id, since, version)
+
+    def maybe_compact(self, session=None):
+        now = time.monotonic()
+        if self._last_compaction is not None and now - self._last_compaction < self.compact_seconds:
+            return
+        self._last_compaction = now
+        session = session or db.session
+        compact(session.connection(), self.retention_seconds)
+        session.commit()
+
+    def changes_since(self, project_id, since, session=None):
+        self.maybe_compact(session)
+        return changes_since(project_id, since, session=session)
+
+
+def _pending():
+    return {'entries': {}, 'renamed': {}, 'deleted_projects': set()}
+
+
+def install(app, retention_seconds=86400.0, compact_seconds=600.0):
+    """Create the app's change feed and hook change logging into flushes"""
+    feed = ChangeFeed(retention_seconds=retention_seconds, compact_seconds=compact_seconds)
+    app.extensions['changes'] = feed
+
+    @event.listens_for(db.session, 'before_flush')
+    def collect_changes(session, flush_context, instances):
+        pending = session.info.setdefault('change_log', _pending())
+        entries = pending['entries']
+        conn = None
+        for obj in session.deleted:
+            if isinstance(obj, Project) and obj.id is not None:
+                pending['deleted_projects'].add(obj.id)
+            elif isinstance(obj, Character) and obj.id is not None:
+                entries[(obj.project_id, CHARACTER, obj.id)] = True
+                # Their relationships disappear with them; note the ids while they still exist
+                conn = conn or session.connection()
+                for ref_id in _relationships_of(conn, [obj.id]):
+                    entries[(obj.project_id, RELATIONSHIP, ref_id)] = True
+            elif isinstance(obj, CharacterRelationship) and obj.id is not None:
+                entries[(obj.project_id, RELATIONSHIP, obj.id)] = True
+        for obj in session.dirty:
+            if isinstance(obj, Character) and session.is_modified(obj, include_collections=False):
+                entries.setdefault((obj.project_id, CHARACTER, obj.id), False)
+                # Relationships embed their endpoints' names
+                if inspect(obj).attrs.name.history.has_changes():
+                    pending['renamed'][obj.id] = obj.project_id
+            elif isinstance(obj, CharacterRelationship) and session.is_modified(obj, include_collections=False):
+                entries.setdefault((obj.project_id, RELATIONSHIP, obj.id), False)
+
+    @event.listens_for(db.session, 'after_flush')
+    def write_changes(session, flush_context):
+        pending = session.info.pop('change_log', None) or _pending()
+        entries = pending['entries']
+        for obj in session.new:
+            if isinstance(obj, Character):
+                entries[(obj.project_id, CHARACTER, obj.id)] = False
+            elif isinstance(obj, CharacterRelationship):
+                entries[(obj.project_id, RELATIONSHIP, obj.id)] = False
+        conn = session.connection()
+        if pending['renamed']:
+            for ref_id, project_id in conn.execute(
+                select(relationships_table.c.id, relationships_table.c.project_id).where(or_(
+                    relationships_table.c.source_character_id.in_(pending['renamed']),
+                    relationships_table.c.target_character_id.in_(pending['renamed'])
+                ))
+            ):
+                entries.setdefault((project_id, RELATIONSHIP, ref_id), False)
+
+        by_project = {}
+        for (project_id, kind, ref_id), deleted in entries.items():
+            if project_id not in pending['deleted_projects']:
+                by_project.setdefault(project_id, {})[(kind, ref_id)] = deleted
+        for project_id, project_entries in by_project.items():
+            _note_version(session, project_id, write_entries(conn, project_id, project_entries))
+
+    @event.listens_for(db.session, 'after_commit')
+    def publish_changes(session):
+        written = session.info.pop('change_versions', None)
+        if written:
+            feed.notify(written)
+
+    @event.listens_for(db.session, 'after_soft_rollback')
+    def discard_changes(session, previous_transaction):
+        session.info.pop('change_log', None)
+        session.info.pop('change_versions', None)
+
+    return feed
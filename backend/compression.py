@@ -0,0 +1,77 @@
+"""
+Negotiated response compression.
+
+JSON and text responses of at least COMPRESS_MIN_BYTES are compressed with
+brotli (when the brotli package is installed) or gzip, whichever the
+client's Accept-Encoding prefers. A compressed response's ETag gets the
+encoding appended ("p1-v7" becomes "p1-v7-gzip"), so caches never confuse
+the two representations; cached_response() accepts either form in
+If-None-Match. Streamed responses (NDJSON listings, exports, event streams)
+are left alone.
+"""
+
+import zlib
+from flask import request
+import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv'}
+
+
+def available_encodings():
+    """Encodings this server can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings):
+    """Best encoding acceptable to the client (a werkzeug Accept), or None"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def etag_variants(etag):
+    """The identity ETag and its per-encoding forms"""
+    return [etag] + [f'{etag}-{encoding}' for encoding in available_encodings()]
+
+
+def compress(data, encoding, gzip_level=5, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def install(app, min_size=1024, gzip_level=5, brotli_quality=4):
+    """Compress eligible responses in an after_request hook"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        with metrics.phase('compress'):
+            compressed = compress(data, encoding, gzip_level, brotli_quality)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
@@ -0,0 +1,305 @@
+"""
+Relevance-ranked context for the extraction prompt.
+
+GET /api/projects/<id>/context?q=...&budget=N returns the characters and
+document passages that best match q, as many as fit in N characters,
+instead of the whole world. Both sides are ranked with BM25
+(search.InvertedIndex in any-term mode):
+
+    characters   one index per project (name weighted over description),
+                 cached per project version and caught up from the change
+                 log when the version moves, so a write re-indexes only the
+                 characters it touched
+    documents    one index over the corpus (documents.py), whose files are
+                 split into passages at headings and paragraphs; a file is
+                 re-chunked only when its mtime changes
+
+Scores of the two kinds aren't on the same scale, so each is divided by its
+kind's best score before the lists are merged. The budget is filled greedily
+in rank order, skipping items that no longer fit. Documents the caller names
+(?document=) are always candidates: their passages that don't match q follow
+the matching ones in document order, so a selected document is included as
+far as the budget allows.
+"""
+
+import re
+import threading
+from sqlalchemy import select
+from cache import TTLCache
+from changes import CHARACTER, changed_ids
+from documents import DocumentError, DocumentNotFound, normalize_path
+from models import Character
+from search import InvertedIndex, load_characters, tokenize
+
+KINDS = ('character', 'document')
+DEFAULT_BUDGET = 8000
+MAX_BUDGET = 200000
+CHUNK_CHARS = 800
+MAX_CANDIDATES = 500
+CHARACTER_FIELDS = {'name': 3.0, 'description': 1.0}
+CHUNK_FIELDS = {'title': 2.0, 'body': 1.0}
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+characters_table = Character.__table__
+
+
+class ContextQueryError(ValueError):
+    pass
+
+
+def _split_long(paragraph, size):
+    """Pieces of at most size characters, cut at sentence ends where possible"""
+    pieces, current = [], ''
+    for sentence in SENTENCE_RE.split(paragraph):
+        while len(sentence) > size:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:size])
+            sentence = sentence[size:]
+        if current and len(current) + 1 + len(sentence) > size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_markdown(text, size=CHUNK_CHARS):
+    """[(heading path, passage)] of a markdown document: sections split at headings,
+    their paragraphs packed into passages of about size characters"""
+    sections, headings, paragraphs, lines = [], [], [], []
+
+    def end_paragraph():
+        if lines:
+            paragraphs.append('\n'.join(lines))
+            lines.clear()
+
+    def end_section():
+        end_paragraph()
+        if paragraphs:
+            sections.append((' / '.join(title for _, title in headings), list(paragraphs)))
+            paragraphs.clear()
+
+    for line in (text or '').splitlines():
+        heading = HEADING_RE.match(line)
+        if heading:
+            end_section()
+            level = len(heading.group(1))
+            headings[:] = [(lvl, title) for lvl, title in headings if lvl < level] + [(level, heading.group(2))]
+        elif line.strip():
+            lines.append(line.strip())
+        else:
+            end_paragraph()
+    end_section()
+
+    chunks = []
+    for heading, section in sections:
+        current = ''
+        for paragraph in section:
+            for piece in (_split_long(paragraph, size) if len(paragraph) > size else [paragraph]):
+                if current and len(current) + 2 + len(piece) > size:
+                    chunks.append((heading, current))
+                    current = piece
+                else:
+                    current = f'{current}\n\n{piece}' if current else piece
+        if current:
+            chunks.append((heading, current))
+    return chunks
+
+
+class CharacterIndex:
+    """BM25 index of one project's characters at a version"""
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.version = None
+        self.index = InvertedIndex(CHARACTER_FIELDS)
+        self.lock = threading.Lock()
+
+    def rebuild(self, conn, version):
+        self.index = InvertedIndex(CHARACTER_FIELDS)
+        for cid, name, description in conn.execute(
+            select(characters_table.c.id, characters_table.c.name, characters_table.c.description)
+            .where(characters_table.c.project_id == self.project_id)
+        ):
+            self.index.add(cid, {'name': name, 'description': description or ''})
+        self.version = version
+
+    def catch_up(self, conn, version):
+        """Apply the characters written since self.version; False if the change log can't tell"""
+        changed = changed_ids(conn, self.project_id, CHARACTER, self.version, version)
+        if changed is None:
+            return False
+        written, deleted = changed
+        for cid in deleted:
+            self.index.remove(cid)
+        for cid, _, name, description in load_characters(conn, written):
+            self.index.add(cid, {'name': name, 'description': description or ''})
+        self.version = version
+        return True
+
+
+class DocumentChunks:
+    """BM25 index of the corpus's passages, re-chunking files whose mtime changed"""
+
+    def __init__(self, corpus, chunk_chars=CHUNK_CHARS):
+        self.corpus = corpus
+        self.chunk_chars = chunk_chars
+        self.index = InvertedIndex(CHUNK_FIELDS)
+        self.files = {}
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def sync(self):
+        """Bring the index up to the corpus's generation (call with self.lock held)"""
+        if self.corpus is None or self.generation == self.corpus.generation:
+            return
+        generation, found = self.corpus.file_index()
+        for rel in [rel for rel in self.files if rel not in found]:
+            self._remove(rel)
+        for rel, (mtime, _) in found.items():
+            if self.files.get(rel, (None,))[0] != mtime:
+                self._add(rel, mtime)
+        self.generation = generation
+
+    def _remove(self, rel):
+        _, count = self.files.pop(rel)
+        for position in range(count):
+            self.index.remove((rel, position))
+
+    def _add(self, rel, mtime):
+        if rel in self.files:
+            self._remove(rel)
+        try:
+            document = self.corpus.read(rel)
+        except DocumentNotFound:
+            return
+        chunks = chunk_markdown(document['content'], self.chunk_chars)
+        for position, (heading, passage) in enumerate(chunks):
+            title = f"{document['name']} {heading}".strip()
+            self.index.add((rel, position), {'title': title, 'body': passage}, payload=(document['name'], heading))
+        self.files[rel] = (mtime, len(chunks))
+
+    def chunk_keys(self, rel):
+        return [(rel, position) for position in range(self.files.get(rel, (None, 0))[1])]
+
+
+def _normalized(hits):
+    top = hits[0][0] if hits else 0
+    return [(score / top if top else 0.0, key) for score, key in hits]
+
+
+class ContextService:
+    """Per-project character indexes plus the shared passage index"""
+
+    def __init__(self, corpus, maxsize=64, ttl=3600.0, chunk_chars=CHUNK_CHARS):
+        self.characters = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.chunks = DocumentChunks(corpus, chunk_chars)
+        self._lock = threading.Lock()
+        self.rebuilt = 0
+        self.caught_up = 0
+
+    def character_index(self, conn, project_id, version):
+        with self._lock:
+            entry = self.characters.get(project_id)
+            if entry is None:
+                entry = CharacterIndex(project_id)
+                self.characters.set(project_id, entry)
+        with entry.lock:
+            if entry.version != version:
+                if entry.version is not None and entry.catch_up(conn, version):
+                    self.caught_up += 1
+                else:
+                    entry.rebuild(conn, version)
+                    self.rebuilt += 1
+        return entry
+
+    def retrieve(self, conn, project_id, version, query, budget=DEFAULT_BUDGET, kinds=KINDS, documents=()):
+        """The characters and passages most relevant to query that fit in budget characters"""
+        candidates = []
+        if 'character' in kinds:
+            entry = self.character_index(conn, project_id, version)
+            with entry.lock:
+                for score, cid in _normalized(entry.index.search(query, MAX_CANDIDATES, match_all=False)):
+                    fields, _ = entry.index.records[cid]
+                    item = {'id': cid, 'name': fields['name'], 'description': fields['description'],
+                            'score': round(score, 4)}
+                    candidates.append((score, 0, len(fields['name']) + len(fields['description']), 'character', item))
+
+        if 'document' in kinds:
+            wanted = set(documents)
+            with self.chunks.lock:
+                self.chunks.sync()
+                accept = (lambda key: key[0] in wanted) if wanted else None
+                hits = _normalized(self.chunks.index.search(query, MAX_CANDIDATES, accept=accept, match_all=False))
+                found = {key for _, key in hits}
+                # Unmatched passages of the documents asked for, in reading order after every match
+                hits += [(0.0, key) for rel in documents for key in self.chunks.chunk_keys(rel) if key not in found]
+                for rank, (score, key) in enumerate(hits):
+                    fields, (name, heading) = self.chunks.index.records[key]
+                    item = {'path': key[0], 'name': name, 'chunk': key[1], 'heading': heading,
+                            'text': fields['body'], 'score': round(score, 4)}
+                    candidates.append((score, rank, len(fields['body']), 'document', item))
+
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        remaining, truncated = budget, False
+        characters, passages = [], []
+        for score, _, cost, kind, item in candidates:
+            if cost > remaining:
+                truncated = True
+                continue
+            remaining -= cost
+            (characters if kind == 'character' else passages).append(item)
+
+        # Passages regrouped per document (best document first) and back in reading order
+        grouped = {}
+        for item in passages:
+            grouped.setdefault(item['path'], {'path': item['path'], 'name': item['name'], 'chunks': []})['chunks'].append(item)
+        for group in grouped.values():
+            group['chunks'].sort(key=lambda item: item['chunk'])
+        return {
+            'query': query,
+            'terms': list(dict.fromkeys(tokenize(query))),
+            'budget': budget,
+            'used': budget - remaining,
+            'truncated': truncated,
+            'characters': characters,
+            'documents': list(grouped.values()),
+        }
+
+    def stats(self):
+        return dict(self.characters.stats(), rebuilt=self.rebuilt, caught_up=self.caught_up,
+                    passages=len(self.chunks.index))
+
+
+def parse_context_args(args):
+    """(query, budget, kinds, documents) from a request's query string"""
+    query = (args.get('q') or '').strip()
+    if not query:
+        raise ContextQueryError('q is required')
+    try:
+        budget = int(args.get('budget', DEFAULT_BUDGET))
+    except ValueError:
+        raise ContextQueryError('budget must be an integer')
+    if not 1 <= budget <= MAX_BUDGET:
+        raise ContextQueryError(f'budget must be between 1 and {MAX_BUDGET}')
+    kinds = tuple(kind for kind in (args.get('kinds') or ','.join(KINDS)).split(',') if kind)
+    if not kinds or any(kind not in KINDS for kind in kinds):
+        raise ContextQueryError(f"kinds must be a subset of: {', '.join(KINDS)}")
+    try:
+        documents = list(dict.fromkeys(normalize_path(path) for path in args.getlist('document')))
+    except DocumentError as e:
+        raise ContextQueryError(f'document: {e}')
+    return query, budget, kinds, documents
+
+
+def install(app, corpus, maxsize=64, chunk_chars=CHUNK_CHARS):
+    """Create the app's context service"""
+    service = ContextService(corpus, maxsize=maxsize, chunk_chars=chunk_chars)
+    app.extensions['context'] = service
+    return service
@@ -0,0 +1,130 @@
+"""
+Database engine profiles.
+
+The profile is chosen with DB_ENGINE_PROFILE and applied when the app is
+created:
+
+    default   SQLAlchemy's stock engine settings
+    tuned     (the default) for SQLite: WAL journal, synchronous=NORMAL, a
+              busy timeout, a larger page cache and in-memory temp tables on
+              every new connection. For server databases (PostgreSQL via
+              DATABASE_URL): a sized pool with pre-ping and connection
+              recycling.
+
+In WAL mode readers keep reading the last committed snapshot while a writer
+commits, and a second writer waits up to the busy timeout for the lock
+instead of failing straight away with "database is locked".
+
+The ASGI server's async engine (see asgi.py) gets the same profile, on the
+async driver for the database: aiosqlite for SQLite, asyncpg for PostgreSQL.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+PROFILES = ('default', 'tuned')
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def _setting(name, default, cast=int):
+    return cast(os.environ.get(name, default))
+
+
+def load_settings():
+    """Engine profile settings from the environment"""
+    return {
+        'DB_ENGINE_PROFILE': os.environ.get('DB_ENGINE_PROFILE', 'tuned'),
+        # SQLite
+        'SQLITE_BUSY_TIMEOUT_MS': _setting('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'SQLITE_CACHE_SIZE_KB': _setting('SQLITE_CACHE_SIZE_KB', 65536),
+        'SQLITE_MMAP_SIZE': _setting('SQLITE_MMAP_SIZE', 268435456),
+        'SQLITE_SYNCHRONOUS': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        # Connection pool (server databases, and SQLite files)
+        'DB_POOL_SIZE': _setting('DB_POOL_SIZE', 10),
+        'DB_MAX_OVERFLOW': _setting('DB_MAX_OVERFLOW', 20),
+        'DB_POOL_TIMEOUT': _setting('DB_POOL_TIMEOUT', 30, float),
+        'DB_POOL_RECYCLE': _setting('DB_POOL_RECYCLE', 1800),
+        'DB_STATEMENT_CACHE_SIZE': _setting('DB_STATEMENT_CACHE_SIZE', 256),
+    }
+
+
+def engine_options(database_url, settings):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URL under the configured profile"""
+    profile = settings['DB_ENGINE_PROFILE']
+    if profile not in PROFILES:
+        raise ValueError(f"DB_ENGINE_PROFILE must be one of: {', '.join(PROFILES)}")
+    if profile == 'default':
+        return {}
+
+    url = make_url(database_url)
+    options = {'query_cache_size': max(500, settings['DB_STATEMENT_CACHE_SIZE'] * 2)}
+    if url.get_backend_name() == 'sqlite':
+        # Timeouts are handled by busy_timeout; the driver's own prepared statement cache is sized up
+        options['connect_args'] = {
+            'timeout': settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0,
+            'cached_statements': settings['DB_STATEMENT_CACHE_SIZE'],
+        }
+        if url.database and url.database != ':memory:':
+            options.update(
+                pool_size=settings['DB_POOL_SIZE'],
+                max_overflow=settings['DB_MAX_OVERFLOW'],
+                pool_timeout=settings['DB_POOL_TIMEOUT'],
+            )
+    else:
+        options.update(
+            pool_size=settings['DB_POOL_SIZE'],
+            max_overflow=settings['DB_MAX_OVERFLOW'],
+            pool_timeout=settings['DB_POOL_TIMEOUT'],
+            pool_recycle=settings['DB_POOL_RECYCLE'],
+            pool_pre_ping=True,
+            pool_use_lifo=True,
+        )
+    return options
+
+
+def async_database_url(database_url):
+    """database_url on its backend's async driver (URLs already naming one are kept)"""
+    url = make_url(database_url)
+    if url.get_dialect().is_async:
+        return database_url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver known for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}').render_as_string(hide_password=False)
+
+
+def sqlite_pragmas(settings):
+    """PRAGMA statements run on each new SQLite connection"""
+    return [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA synchronous={settings['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(settings['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(settings['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(settings['SQLITE_MMAP_SIZE'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def install(app, db):
+    """Run the profile's per-connection setup on the app's engine"""
+    with app.app_context():
+        install_engine(db.engine, app.config)
+
+
+def install_engine(engine, config):
+    """Run the profile's per-connection setup on an engine (an async engine's sync_engine too)"""
+    settings = {key: config[key] for key in load_settings()}
+    if settings['DB_ENGINE_PROFILE'] == 'default' or engine.dialect.name != 'sqlite':
+        return
+
+    statements = sqlite_pragmas(settings)
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
@@ -0,0 +1,579 @@
+"""
+The documents/ markdown corpus, served from memory.
+
+DocumentCorpus scans the directory once and keeps
+
+    directories   {relative dir: (mtime_ns, [(entry name, is_dir)])}
+    files         {relative path: (mtime_ns, size)}
+    order         the parsed .order.json ({dir: [child paths]}, '.' for the root)
+    contents      file texts, in an LRU bounded by DOCUMENT_CACHE_BYTES
+
+and rebuilds the ordered tree only when one of those changed (the change
+counter, generation, tells this process's caches what moved). ETags use
+fingerprint() instead, a digest of the files' paths, mtimes and sizes, the
+folders and the ordering: the counter differs between workers and restarts,
+the fingerprint only when the corpus does. It is built from per-directory
+digests cached alongside the subtrees, so a change rehashes only its branch.
+
+Requests never walk the directory: changes made outside the API are picked
+up on a background thread, from filesystem notifications when the watchdog
+package is installed, otherwise by polling every DOCUMENT_RESCAN_SECONDS (a
+stat per directory and file; only directories whose mtime moved are listed
+again). Reading a file stats that one file, so an edit is never served
+stale, and writes through the API update the cache directly.
+
+search.py indexes the corpus's files instead of walking the directory itself.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import stat
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger('worldbuilder.documents')
+
+EXTENSION = '.md'
+ORDER_FILE = '.order.json'
+WATCH_MODES = ('auto', 'notify', 'poll', 'off')
+MAX_BATCH = 100
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+# Notifications arrive in bursts (an editor's save is several events): gather them briefly
+NOTIFY_SETTLE_SECONDS = 0.05
+
+
+class DocumentError(ValueError):
+    """Invalid document request; DocumentNotFound for paths that don't exist"""
+
+
+class DocumentNotFound(DocumentError):
+    pass
+
+
+def normalize_path(path):
+    """Relative path of a markdown file ('.md' added when missing); rejects escapes and hidden names"""
+    if not isinstance(path, str) or not path.strip():
+        raise DocumentError('path is required')
+    path = path.strip().replace('\\', '/')
+    if not path.endswith(EXTENSION):
+        path += EXTENSION
+    if path.startswith('/') or any(part in ('', '.', '..') or part.startswith('.') for part in path.split('/')):
+        raise DocumentError('Invalid path')
+    return path
+
+
+def _modified(mtime_ns):
+    return datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).isoformat()
+
+
+def _join(parent, name):
+    return f'{parent}/{name}' if parent else name
+
+
+def _write_atomic(path, text):
+    """Write through a hidden temporary file in the same directory, then rename over path"""
+    # Unique per process and thread, so concurrent saves of one file don't share a temporary
+    temporary = os.path.join(
+        os.path.dirname(path), f'.{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    )
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class DocumentCorpus:
+    """Cached tree, metadata and contents of a markdown directory"""
+
+    def __init__(self, root, rescan_seconds=5.0, watch='auto', cache_bytes=DEFAULT_CACHE_BYTES):
+        if watch not in WATCH_MODES:
+            raise ValueError(f"DOCUMENT_WATCH must be one of {', '.join(WATCH_MODES)}, not {watch!r}")
+        self.root = os.path.abspath(root) if root else None
+        self.rescan_seconds = rescan_seconds
+        self.watch = watch
+        self.cache_bytes = cache_bytes
+        self.generation = 0
+        self._fingerprint = (None, None)
+        self.mode = None
+        self._dirs = {}
+        self._files = {}
+        self._order = {}
+        self._order_mtime = None
+        self._subtrees = {}
+        self._digests = {}
+        self._contents = OrderedDict()
+        self._content_bytes = 0
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._pid = None
+        self._closed = False
+        self._wake = threading.Event()
+        self._pending = set()
+        self._observer = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.polls = 0
+
+    def _abs(self, rel):
+        return os.path.join(self.root, *rel.split('/')) if rel else self.root
+
+    def _changed(self, rel=None):
+        """Count a change inside directory rel (None: the ordering) and drop the affected cached subtrees"""
+        self.generation += 1
+        if rel is None:
+            self._subtrees.clear()
+            return
+        while True:
+            self._subtrees.pop(rel, None)
+            self._digests.pop(rel, None)
+            if not rel:
+                return
+            rel = posixpath.dirname(rel)
+
+    # -------------------- scanning --------------------
+
+    def _scan_dir(self, rel):
+        """(Re)list one directory: register new subdirectories and files, forget vanished ones"""
+        path = self._abs(rel)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                scanned = sorted(it, key=lambda entry: entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            self._drop_dir(rel)
+            return
+        entries = []
+        for entry in scanned:
+            if entry.name.startswith('.'):
+                continue
+            child = _join(rel, entry.name)
+            if entry.is_dir():
+                entries.append((entry.name, True))
+                if child not in self._dirs:
+                    self._scan_dir(child)
+            elif entry.is_file() and entry.name.endswith(EXTENSION):
+                entries.append((entry.name, False))
+                info = entry.stat()
+                if self._files.get(child) != (info.st_mtime_ns, info.st_size):
+                    self._files[child] = (info.st_mtime_ns, info.st_size)
+                    self._evict(child)
+        previous = self._dirs.get(rel)
+        if previous is not None:
+            current = set(entries)
+            for name, is_dir in previous[1]:
+                if (name, is_dir) not in current:
+                    (self._drop_dir if is_dir else self._drop_file)(_join(rel, name))
+        self._dirs[rel] = (mtime, entries)
+        self._changed(rel)
+
+    def _drop_dir(self, rel):
+        entries = self._dirs.pop(rel, None)
+        if entries is None:
+            return
+        for name, is_dir in entries[1]:
+            (self._drop_dir if is_dir else self._drop_file)(_join(rel, name))
+        self._changed(posixpath.dirname(rel))
+
+    def _drop_file(self, rel):
+        if self._files.pop(rel, None) is not None:
+            self._evict(rel)
+            self._changed(posixpath.dirname(rel))
+
+    def _check_dir(self, rel):
+        """Re-list a directory if its mtime moved (an entry was added, removed or renamed)"""
+        try:
+            mtime = os.stat(self._abs(rel)).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            mtime = None
+        with self._lock:
+            known = self._dirs.get(rel)
+            if known is None or known[0] == mtime:
+                return
+            if mtime is None:
+                self._drop_dir(rel)
+            else:
+                self._scan_dir(rel)
+
+    def _check_file(self, rel):
+        try:
+            info = os.stat(self._abs(rel))
+            meta = (info.st_mtime_ns, info.st_size)
+        except (FileNotFoundError, NotADirectoryError):
+            meta = None
+        with self._lock:
+            known = self._files.get(rel)
+            if known is None or known == meta:
+                return
+            if meta is None:
+                self._drop_file(rel)
+            else:
+                self._files[rel] = meta
+                self._evict(rel)
+                self._changed(posixpath.dirname(rel))
+
+    def _check_order(self):
+        if not self.root:
+            return
+        path = self._abs(ORDER_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime == self._order_mtime:
+                return
+            order = {}
+            if mtime is not None:
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        order = json.load(f)
+                except (OSError, ValueError):
+                    logger.warning('Ignoring unreadable %s', path)
+                if not isinstance(order, dict):
+                    order = {}
+            self._order, self._order_mtime = order, mtime
+            self._changed(None)
+
+    def load(self):
+        """Scan the whole directory (the one full walk; later changes are incremental)"""
+        with self._lock:
+            self._dirs, self._files, self._subtrees, self._digests = {}, {}, {}, {}
+            self._contents.clear()
+            self._content_bytes = 0
+            if self.root and os.path.isdir(self.root):
+                self._scan_dir('')
+            self._order_mtime = None
+            self._check_order()
+            self._loaded = True
+
+    def poll(self):
+        """Stat every known directory and file, applying what changed"""
+        with self._lock:
+            dirs, files = list(self._dirs), list(self._files)
+        for rel in dirs:
+            self._check_dir(rel)
+        for rel in files:
+            self._check_file(rel)
+        self._check_order()
+        self.polls += 1
+
+    def _apply_notifications(self, paths):
+        dirs = set()
+        for rel in paths:
+            if rel == ORDER_FILE:
+                self._check_order()
+                continue
+            dirs.add(posixpath.dirname(rel))
+            if rel in self._dirs:
+                dirs.add(rel)
+            elif rel in self._files:
+                self._check_file(rel)
+        for rel in dirs:
+            self._check_dir(rel)
+
+    # -------------------- background refresh --------------------
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+        self.start()
+
+    def start(self):
+        """Start watching or polling for outside changes, once per process"""
+        with self._lock:
+            if self._pid == os.getpid() or self._closed:
+                return
+            # Threads and observers don't survive a fork: each worker starts its own
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._pending = set()
+            self._observer = self._start_observer() if self.watch in ('auto', 'notify') and self.root else None
+            if self._observer is None and self.watch == 'notify':
+                raise RuntimeError('DOCUMENT_WATCH=notify needs the watchdog package (pip install watchdog)')
+            if self._observer is not None:
+                self.mode = 'notify'
+            elif self.watch == 'off' or self.rescan_seconds <= 0 or not self.root:
+                # Only changes made through the API (and files read) are noticed
+                self.mode = 'off'
+                return
+            else:
+                self.mode = 'poll'
+            threading.Thread(target=self._run, args=(self._wake,), name='documents', daemon=True).start()
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+        if not os.path.isdir(self.root):
+            return None
+        corpus = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type not in ('opened', 'closed', 'closed_no_write'):
+                    corpus._notify(event.src_path, getattr(event, 'dest_path', None))
+
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(Handler(), self.root, recursive=True)
+        observer.start()
+        return observer
+
+    def _notify(self, *paths):
+        with self._lock:
+            for path in paths:
+                if path:
+                    rel = os.path.relpath(os.fsdecode(path), self.root).replace(os.sep, '/')
+                    self._pending.add('' if rel == '.' else rel)
+        self._wake.set()
+
+    def _run(self, wake):
+        while not self._closed:
+            notified = wake.wait(None if self._observer is not None else self.rescan_seconds)
+            if self._closed:
+                return
+            try:
+                if notified:
+                    wake.clear()
+                    if self._observer is not None:
+                        time.sleep(NOTIFY_SETTLE_SECONDS)
+                        with self._lock:
+                            paths, self._pending = self._pending, set()
+                        self._apply_notifications(paths)
+                        continue
+                self.poll()
+            except Exception:
+                logger.exception('Refreshing documents failed')
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            observer, self._observer = self._observer, None
+            started = self._pid == os.getpid()
+        self._wake.set()
+        if observer is not None and started:
+            observer.stop()
+            observer.join(timeout=5)
+
+    # -------------------- reads --------------------
+
+    def tree(self):
+        """(fingerprint, ordered tree) of directories and markdown files, as the dashboard shows them"""
+        self.ensure_loaded()
+        with self._lock:
+            return self._digest(), self._build('')
+
+    def fingerprint(self):
+        """Digest of the corpus's folders, files (path, mtime, size) and ordering, for ETags"""
+        self.ensure_loaded()
+        with self._lock:
+            return self._digest()
+
+    def _digest(self):
+        if self._fingerprint[0] != self.generation:
+            digest = hashlib.sha1(self._dir_digest('').encode())
+            digest.update(json.dumps(self._order, sort_keys=True).encode('utf-8', 'surrogateescape'))
+            self._fingerprint = (self.generation, digest.hexdigest()[:20])
+        return self._fingerprint[1]
+
+    def _dir_digest(self, rel):
+        """Digest of a directory's entries, cached until something inside it changes"""
+        cached = self._digests.get(rel)
+        if cached is None:
+            lines = []
+            for name, is_dir in self._dirs.get(rel, (None, ()))[1]:
+                child = _join(rel, name)
+                if is_dir:
+                    lines.append(f'd {name} {self._dir_digest(child)}')
+                else:
+                    mtime, size = self._files.get(child, (None, None))
+                    lines.append(f'f {name} {mtime} {size}')
+            cached = hashlib.sha1('\n'.join(lines).encode('utf-8', 'surrogateescape')).hexdigest()
+            self._digests[rel] = cached
+        return cached
+
+    def _build(self, rel):
+        """Items of a directory, cached until something inside it changes"""
+        cached = self._subtrees.get(rel)
+        if cached is not None:
+            return cached
+        known = self._dirs.get(rel)
+        if known is None:
+            return []
+        entries = dict(known[1])
+        ordered = [path.rsplit('/', 1)[-1] for path in self._order.get(rel or '.') or () if isinstance(path, str)]
+        items, seen = [], set()
+        for name in ordered + [name for name, _ in known[1]]:
+            if name in seen or name not in entries:
+                continue
+            seen.add(name)
+            child = _join(rel, name)
+            if entries[name]:
+                items.append({'name': name, 'path': child, 'type': 'directory', 'children': self._build(child)})
+            elif child in self._files:
+                mtime, size = self._files[child]
+                items.append({'name': name[:-len(EXTENSION)], 'path': child, 'type': 'file',
+                              'size': size, 'modified': _modified(mtime)})
+        self._subtrees[rel] = items
+        return items
+
+    def stat(self, path):
+        """(relative path, (mtime_ns, size)) of a file, checked against the disk"""
+        self.ensure_loaded()
+        rel = normalize_path(path)
+        try:
+            info = os.stat(self._abs(rel)) if self.root else None
+        except (FileNotFoundError, NotADirectoryError):
+            info = None
+        if info is None or not stat.S_ISREG(info.st_mode):
+            with self._lock:
+                self._drop_file(rel)
+            raise DocumentNotFound('File not found')
+        meta = (info.st_mtime_ns, info.st_size)
+        with self._lock:
+            known = self._files.get(rel)
+            if known != meta:
+                if known is None and posixpath.dirname(rel) in self._dirs:
+                    self._scan_dir(posixpath.dirname(rel))
+                self._files[rel] = meta
+                self._evict(rel)
+                self._changed(posixpath.dirname(rel))
+        return rel, meta
+
+    def read(self, path):
+        """A file's content and metadata"""
+        rel, meta = self.stat(path)
+        return self._document(rel, meta, self._content(rel, meta))
+
+    def read_many(self, paths):
+        """Several files at once: {'documents': [...], 'missing': [paths not found]}"""
+        if not isinstance(paths, list) or not paths:
+            raise DocumentError('paths must be a non-empty list')
+        if len(paths) > MAX_BATCH:
+            raise DocumentError(f'At most {MAX_BATCH} paths per request')
+        documents, missing = [], []
+        for path in dict.fromkeys(normalize_path(path) for path in paths):
+            try:
+                documents.append(self.read(path))
+            except DocumentNotFound:
+                missing.append(path)
+        return {'documents': documents, 'missing': missing}
+
+    @staticmethod
+    def _metadata(rel, meta):
+        return {'path': rel, 'name': posixpath.basename(rel)[:-len(EXTENSION)],
+                'size': meta[1], 'modified': _modified(meta[0])}
+
+    def _document(self, rel, meta, content):
+        return dict(self._metadata(rel, meta), content=content)
+
+    def _content(self, rel, meta):
+        with self._lock:
+            cached = self._contents.get(rel)
+            if cached is not None and cached[0] == meta:
+                self._contents.move_to_end(rel)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        with open(self._abs(rel), encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        self._remember(rel, meta, content)
+        return content
+
+    def _remember(self, rel, meta, content):
+        with self._lock:
+            if meta[1] > self.cache_bytes:
+                return
+            self._evict(rel)
+            self._contents[rel] = (meta, content)
+            self._content_bytes += meta[1]
+            while self._content_bytes > self.cache_bytes:
+                _, (old_meta, _) = self._contents.popitem(last=False)
+                self._content_bytes -= old_meta[1]
+                self.evictions += 1
+
+    def _evict(self, rel):
+        cached = self._contents.pop(rel, None)
+        if cached is not None:
+            self._content_bytes -= cached[0][1]
+
+    def file_index(self):
+        """(generation, {relative path: (mtime_ns, absolute path)}) of every markdown file"""
+        self.ensure_loaded()
+        with self._lock:
+            return self.generation, {rel: (meta[0], self._abs(rel)) for rel, meta in self._files.items()}
+
+    # -------------------- writes --------------------
+
+    def write(self, path, content):
+        """Replace (or create) a file; its folder must exist"""
+        if not isinstance(content, str):
+            raise DocumentError('content must be a string')
+        self.ensure_loaded()
+        rel = normalize_path(path)
+        parent = posixpath.dirname(rel)
+        if not self.root or not os.path.isdir(self._abs(parent)):
+            raise DocumentNotFound('Folder not found')
+        _write_atomic(self._abs(rel), content)
+        info = os.stat(self._abs(rel))
+        meta = (info.st_mtime_ns, info.st_size)
+        with self._lock:
+            if rel not in self._files and parent in self._dirs:
+                self._scan_dir(parent)
+            self._files[rel] = meta
+            self._changed(parent)
+        self._remember(rel, meta, content)
+        return self._metadata(rel, meta)
+
+    def save_order(self, order):
+        """Replace .order.json ({dir: [child paths]}, '.' for the root)"""
+        if not isinstance(order, dict) or not all(
+            isinstance(key, str) and isinstance(value, list) and all(isinstance(p, str) for p in value)
+            for key, value in order.items()
+        ):
+            raise DocumentError('order must map folder paths to lists of paths')
+        self.ensure_loaded()
+        if not self.root or not os.path.isdir(self.root):
+            raise DocumentNotFound('Documents folder not found')
+        path = self._abs(ORDER_FILE)
+        _write_atomic(path, json.dumps(order, indent=2))
+        with self._lock:
+            self._order, self._order_mtime = order, os.stat(path).st_mtime_ns
+            self._changed(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._contents),
+                'bytes': self._content_bytes,
+                'max_bytes': self.cache_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'files': len(self._files),
+                'directories': len(self._dirs),
+                'generation': self.generation,
+                'mode': self.mode,
+                'polls': self.polls,
+            }
+
+
+def install(app, root, rescan_seconds=5.0, watch='auto', cache_bytes=DEFAULT_CACHE_BYTES):
+    """Create the app's document corpus"""
+    corpus = DocumentCorpus(root, rescan_seconds=rescan_seconds, watch=watch, cache_bytes=cache_bytes)
+    app.extensions['documents'] = corpus
+    return corpus
@@ -0,0 +1,458 @@
+"""
+Background entity extraction jobs.
+
+POST /api/projects/<id>/extractions queues a job over submitted text or a
+document of the corpus and answers 202 straight away. The text is split
+into overlapping chunks (EXTRACTION_CHUNK_CHARS long, the last
+EXTRACTION_OVERLAP_CHARS of each repeated at the start of the next, cut at
+sentence and paragraph ends) and every chunk runs on a worker pool of
+EXTRACTION_WORKERS threads through the configured extractor:
+
+    stub            deterministic and local: capitalised names and a few
+                    relationship phrasings, for development and tests
+    openai          the chat completions model (EXTRACTION_MODEL) with the
+                    extraction rules of the dashboard's parse-entities route;
+                    needs the openai package and OPENAI_API_KEY
+    auto            openai when both are available, otherwise stub
+    module:factory  any factory returning an object with a name and
+                    extract(text) -> {entities, relationships}
+
+Chunk results are stored in extraction_cache under a hash of the extractor's
+name and the chunk's text, so resubmitting unchanged text (or a document
+with one edited section) only extracts the chunks that changed. When the
+last chunk of a job finishes, the results are merged in text order:
+entities by case-insensitive name, with their descriptions combined, and
+relationships by source, target and label.
+
+Status and progress live on the job row, so GET .../extractions/<job id>
+can be answered by any server process; the chunks run in the process that
+accepted the job, whose host and pid are recorded on the row. Jobs still
+running at shutdown are marked failed, and so are jobs whose process died
+without shutting down: a job read while unfinished is failed if its process
+ran on this host and is gone (or is this one and no longer runs it).
+"""
+
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from context import SENTENCE_RE
+from models import db, ExtractionCache, ExtractionJob
+
+EXTRACTORS = ('auto', 'stub', 'openai')
+DEFAULT_CHUNK_CHARS = 4000
+DEFAULT_OVERLAP_CHARS = 400
+MAX_TEXT_CHARS = 2000000
+OPENAI_MODEL = 'gpt-4o-mini'
+# Part of the openai extractor's name (and so of its cache keys): bump when the prompt changes
+PROMPT_VERSION = 1
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+
+jobs_table = ExtractionJob.__table__
+cache_table = ExtractionCache.__table__
+
+
+class ExtractionError(ValueError):
+    pass
+
+
+class ExtractionClosed(RuntimeError):
+    """Raised by submit() once the service is shutting down"""
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _process_alive(pid):
+    if os.name == 'nt':
+        # os.kill(pid, 0) would terminate the process on Windows: assume it lives
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pieces(text, size):
+    """(sentence, starts a paragraph) pairs of text; sentences longer than size are cut"""
+    for paragraph in PARAGRAPH_RE.split(text or ''):
+        paragraph = paragraph.strip()
+        starts = True
+        for sentence in SENTENCE_RE.split(paragraph) if paragraph else ():
+            for start in range(0, len(sentence), size):
+                yield sentence[start:start + size], starts
+                starts = False
+
+
+def _join(pieces):
+    parts = []
+    for position, (piece, starts) in enumerate(pieces):
+        if position:
+            parts.append('\n\n' if starts else ' ')
+        parts.append(piece)
+    return ''.join(parts)
+
+
+def split_chunks(text, size=DEFAULT_CHUNK_CHARS, overlap=DEFAULT_OVERLAP_CHARS):
+    """Chunks of at most about size characters; each after the first starts with the
+    last sentences of the one before (up to overlap characters), so a statement that
+    straddles a boundary is read whole by one of them"""
+    chunks, current, length = [], [], 0
+    for piece, starts in _pieces(text, size):
+        if current and length + len(piece) > size:
+            chunks.append(_join(current))
+            carried, kept = [], 0
+            for previous in reversed(current):
+                if kept + len(previous[0]) + 2 > overlap:
+                    break
+                carried.insert(0, previous)
+                kept += len(previous[0]) + 2
+            current, length = (carried, kept) if kept + len(piece) <= size else ([], 0)
+        current.append((piece, starts))
+        length += len(piece) + 2
+    if current:
+        chunks.append(_join(current))
+    return chunks
+
+
+def normalize_result(data):
+    """{entities: [{name, description}], relationships: [{source, target, label}]} with string fields"""
+    data = data if isinstance(data, dict) else {}
+    entities = [
+        {'name': str(entity.get('name') or '').strip(), 'description': str(entity.get('description') or '').strip()}
+        for entity in data.get('entities') or () if isinstance(entity, dict)
+    ]
+    relationships = [
+        {key: str(rel.get(key) or '').strip() for key in ('source', 'target', 'label')}
+        for rel in data.get('relationships') or () if isinstance(rel, dict)
+    ]
+    return {
+        'entities': [entity for entity in entities if entity['name']],
+        'relationships': [rel for rel in relationships if rel['source'] and rel['target']],
+    }
+
+
+def _key(name):
+    return ' '.join(name.casefold().split())
+
+
+def merge_results(results):
+    """One {entities, relationships} result from per-chunk results in text order"""
+    entities = {}
+    for result in results:
+        for entity in result['entities']:
+            merged = entities.setdefault(_key(entity['name']), {'name': entity['name'], 'description': ''})
+            description = entity['description']
+            if description and description not in merged['description']:
+                merged['description'] = f"{merged['description']} {description}".strip()
+
+    def spelling(name):
+        # Endpoints take the spelling of the entity they name, when there is one
+        entity = entities.get(_key(name))
+        return entity['name'] if entity else name
+
+    relationships, seen = [], set()
+    for result in results:
+        for rel in result['relationships']:
+            source, target = spelling(rel['source']), spelling(rel['target'])
+            key = (_key(source), _key(target), _key(rel['label']))
+            if key not in seen:
+                seen.add(key)
+                relationships.append({'source': source, 'target': target, 'label': rel['label']})
+    return {'entities': list(entities.values()), 'relationships': relationships}
+
+
+class StubExtractor:
+    """Deterministic local extractor, no model involved.
+
+    Entities are runs of capitalised words ("of"/"the" allowed inside) with
+    leading sentence words such as "The" or "When" dropped; the description
+    is the first sentence that mentions them. Relationships come from
+    phrasings between two names in a sentence: "A is the X of B",
+    "A's X is B", "A <verb>ed B" and "B was <verb>ed by A".
+    """
+
+    name = 'stub'
+    NAME_RE = re.compile(r'\b[A-Z][\w-]*(?:\s+(?:(?:of|the)\s+)*[A-Z][\w-]*)*')
+    LEADING = frozenset((
+        'A An The He She It They We I You His Her Its Their Our In On At By For From With As But And Or If '
+        'When While After Before Then There This That These Those Once Now So Yet Still Meanwhile Chapter'
+    ).split())
+    TITLE_OF = re.compile(r',?\s+(?:is|was|became|remains)\s+(?:the|a|an)\s+([a-z]+(?:\s+[a-z]+){0,2}?\s+(?:of|to))\s+')
+    POSSESSIVE = re.compile(r"['’]s\s+([a-z]+)\s+(?:is|was)\s+")
+    PASSIVE = re.compile(r'\s+(?:was|were)\s+([a-z]+ed)\s+by\s+')
+    ACTIVE = re.compile(r'\s+([a-z]+ed)\s+')
+
+    def _names(self, sentence):
+        """(name, start, end) of the names in a sentence (whitespace already collapsed)"""
+        found = []
+        for match in self.NAME_RE.finditer(sentence):
+            words, skipped = match.group(0).split(' '), 0
+            while words and words[0] in self.LEADING:
+                skipped += len(words.pop(0)) + 1
+            while words and words[0] in ('of', 'the'):
+                skipped += len(words.pop(0)) + 1
+            if words:
+                name = ' '.join(words)
+                found.append((name, match.start() + skipped, match.start() + skipped + len(name)))
+        return found
+
+    def extract(self, text):
+        entities, relationships = {}, []
+        for sentence in SENTENCE_RE.split(' '.join(text.split())):
+            names = self._names(sentence)
+            for name, _, _ in names:
+                entities.setdefault(name, sentence[:300])
+            for (first, _, first_end), (second, second_start, _) in zip(names, names[1:]):
+                between = sentence[first_end:second_start]
+                for pattern, label, reverse in ((self.TITLE_OF, '{}', False), (self.POSSESSIVE, '{} of', False),
+                                                (self.PASSIVE, '{}', True), (self.ACTIVE, '{}', False)):
+                    match = pattern.fullmatch(between)
+                    if match:
+                        source, target = (second, first) if reverse else (first, second)
+                        relationships.append({'source': source, 'target': target, 'label': label.format(match.group(1))})
+                        break
+        return {
+            'entities': [{'name': name, 'description': description} for name, description in entities.items()],
+            'relationships': relationships,
+        }
+
+
+class OpenAIExtractor:
+    """Chat completions extraction (needs the openai package)"""
+
+    PROMPT = """You extract entities and relationships from text about a fictional world.
+
+Rules:
+1. Only extract information that is EXPLICITLY stated in the text. Do not infer or add details.
+2. Entity descriptions contain only facts the text states; use an empty string if there are none.
+3. Extract ALL relationships, however they are phrased, with the acting entity as source:
+   "X is the killer of Y", "X killed Y", "Y was killed by X" and "X, who killed Y" all give
+   {"source": "X", "target": "Y", "label": "killer of"}; "X's enemy is Y" gives label "enemy of".
+4. Labels are short and descriptive ("brother of", "ruler of", "exiled from", "ally of").
+5. Use names exactly as they appear in the text.
+
+Respond with JSON: {"entities": [{"name", "description"}], "relationships": [{"source", "target", "label"}]}"""
+
+    def __init__(self, model=OPENAI_MODEL, api_key=None):
+        try:
+            from openai import OpenAI
+        except ImportError:
+            raise RuntimeError('EXTRACTOR=openai needs the openai package (pip install openai)')
+        self.client = OpenAI(api_key=api_key)
+        self.model = model
+        self.name = f'openai:{model}:v{PROMPT_VERSION}'
+
+    def extract(self, text):
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{'role': 'system', 'content': self.PROMPT}, {'role': 'user', 'content': text}],
+            response_format={'type': 'json_object'},
+            # Deterministic as far as the API allows, since results are cached by text
+            temperature=0,
+        )
+        return json.loads(completion.choices[0].message.content or '{}')
+
+
+def make_extractor(spec, model=OPENAI_MODEL, api_key=None):
+    """Extractor named by spec: 'auto', 'stub', 'openai', or 'module:factory' called without arguments"""
+    if spec == 'auto':
+        spec = 'openai' if api_key and importlib.util.find_spec('openai') else 'stub'
+    if spec == 'stub':
+        return StubExtractor()
+    if spec == 'openai':
+        if not api_key:
+            raise RuntimeError('EXTRACTOR=openai needs OPENAI_API_KEY')
+        return OpenAIExtractor(model=model, api_key=api_key)
+    module_name, _, factory = spec.partition(':')
+    if not factory:
+        raise ValueError(f"EXTRACTOR must be one of {', '.join(EXTRACTORS)} or 'module:factory', not {spec!r}")
+    return getattr(importlib.import_module(module_name), factory)()
+
+
+def chunk_key(extractor_name, chunk):
+    return hashlib.sha256(f'{extractor_name}\0{chunk}'.encode('utf-8')).hexdigest()
+
+
+class _Job:
+    """In-process state of a job whose chunks are running here"""
+
+    def __init__(self, job_id, chunks):
+        self.id = job_id
+        self.chunks = chunks
+        self.results = [None] * len(chunks)
+        self.remaining = len(chunks)
+        self.started = False
+        self.failed = False
+        self.lock = threading.Lock()
+
+
+class ExtractionService:
+    """Queues jobs' chunks on a worker pool and records progress and results on the job rows"""
+
+    def __init__(self, app, extractor, workers=4, chunk_chars=DEFAULT_CHUNK_CHARS,
+                 overlap_chars=DEFAULT_OVERLAP_CHARS):
+        self.app = app
+        self.extractor = extractor
+        self.workers = workers
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._closed = False
+        self.extracted = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    def submit(self, project_id, text, source=None):
+        """Create a job for text and queue its chunks; returns the committed ExtractionJob"""
+        if not isinstance(text, str):
+            raise ExtractionError('text must be a string')
+        if not text.strip():
+            raise ExtractionError('Nothing to extract: the text is empty')
+        if len(text) > MAX_TEXT_CHARS:
+            raise ExtractionError(f'Text is too long (at most {MAX_TEXT_CHARS} characters)')
+        if self._closed:
+            raise ExtractionClosed('The server is shutting down')
+        chunks = split_chunks(text, self.chunk_chars, self.overlap_chars)
+        job = ExtractionJob(project_id=project_id, status='queued', source=source, worker=_worker_id(),
+                            extractor=self.extractor.name, chunks_total=len(chunks))
+        db.session.add(job)
+        db.session.commit()
+
+        state = _Job(job.id, chunks)
+        with self._lock:
+            if self._closed:
+                # Shutdown began while the row was being written
+                self._finish(state, status='failed', error='Interrupted by server shutdown')
+                raise ExtractionClosed('The server is shutting down')
+            if self._pid != os.getpid():
+                # First use in this process (or a forked copy of the parent's state)
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='extraction')
+                self._jobs = {}
+            self._jobs[job.id] = state
+            for position in range(len(chunks)):
+                self._executor.submit(self._run_chunk, state, position)
+        return job
+
+    def _run_chunk(self, state, position):
+        if state.failed:
+            return
+        chunk = state.chunks[position]
+        key = chunk_key(self.extractor.name, chunk)
+        try:
+            with self.app.app_context():
+                with state.lock:
+                    start, state.started = not state.started, True
+                if start:
+                    db.session.execute(update(jobs_table).where(
+                        jobs_table.c.id == state.id, jobs_table.c.status == 'queued'
+                    ).values(status='running'))
+                    db.session.commit()
+
+                result = db.session.execute(select(cache_table.c.result).where(cache_table.c.key == key)).scalar()
+                cached = result is not None
+                if not cached:
+                    result = normalize_result(self.extractor.extract(chunk))
+                    try:
+                        db.session.execute(insert(cache_table).values(key=key, result=result, created_at=datetime.utcnow()))
+                        db.session.commit()
+                    except IntegrityError:
+                        # The same chunk finished concurrently (a repeated passage, or another job)
+                        db.session.rollback()
+                db.session.execute(update(jobs_table).where(jobs_table.c.id == state.id).values(
+                    chunks_done=jobs_table.c.chunks_done + 1,
+                    chunks_cached=jobs_table.c.chunks_cached + int(cached)
+                ))
+                db.session.commit()
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.extracted += 1
+
+            with state.lock:
+                state.results[position] = result
+                state.remaining -= 1
+                last = state.remaining == 0 and not state.failed
+            if last:
+                self._finish(state, status='done', result=merge_results(state.results))
+        except Exception as e:
+            self.app.logger.exception('Extraction job %s failed on chunk %s', state.id, position)
+            with state.lock:
+                first_failure, state.failed = not state.failed, True
+            if first_failure:
+                self.failed += 1
+                self._finish(state, status='failed', error=str(e) or type(e).__name__)
+
+    def _finish(self, state, status, result=None, error=None):
+        # The row is final before the job leaves _jobs, so reap() never sees it unfinished and untracked
+        with self.app.app_context():
+            db.session.execute(update(jobs_table).where(jobs_table.c.id == state.id).values(
+                status=status, result=result, error=error, finished_at=datetime.utcnow()
+            ))
+            db.session.commit()
+        with self._lock:
+            self._jobs.pop(state.id, None)
+
+    def _orphaned(self, job):
+        host, _, pid = (job.worker or '').rpartition(':')
+        if job.status not in ('queued', 'running') or host != socket.gethostname() or not pid.isdigit():
+            return False
+        if int(pid) == os.getpid():
+            with self._lock:
+                return job.id not in self._jobs
+        return not _process_alive(int(pid))
+
+    def reap(self, jobs):
+        """Mark failed the unfinished jobs among jobs whose process is gone; call before serving them"""
+        orphaned = [job.id for job in jobs if self._orphaned(job)]
+        if not orphaned:
+            return
+        db.session.execute(update(jobs_table).where(
+            jobs_table.c.id.in_(orphaned), jobs_table.c.status.in_(('queued', 'running'))
+        ).values(status='failed', error='Interrupted: the server process running it stopped',
+                 finished_at=datetime.utcnow()))
+        db.session.commit()
+        for job in jobs:
+            if job.id in orphaned:
+                db.session.refresh(job)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is None or self._pid != os.getpid():
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        for state in list(self._jobs.values()):
+            state.failed = True
+            self._finish(state, status='failed', error='Interrupted by server shutdown')
+
+    def stats(self):
+        return {'extractor': self.extractor.name, 'running': len(self._jobs), 'extracted': self.extracted,
+                'cache_hits': self.cache_hits, 'failed': self.failed}
+
+
+def install(app, extractor='auto', model=OPENAI_MODEL, api_key=None, workers=4,
+            chunk_chars=DEFAULT_CHUNK_CHARS, overlap_chars=DEFAULT_OVERLAP_CHARS):
+    """Create the app's extraction service"""
+    service = ExtractionService(app, make_extractor(extractor, model=model, api_key=api_key), workers=workers,
+                                chunk_chars=chunk_chars, overlap_chars=overlap_chars)
+    app.extensions['extraction'] = service
+    return service
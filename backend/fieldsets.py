@@ -0,0 +1,140 @@
+"""
+Sparse fieldsets for character and relationship responses.
+
+Character and relationship endpoints accept ?fields=a,b,c to return only
+those keys of each document (id is always included), e.g.
+
+    GET /api/projects/1/graph?fields=name,position&edge_fields=source_character_id,target_character_id
+
+Only the columns behind the requested keys are loaded: the ORM paths use
+load_only(), so description and extra_data stay deferred unless asked for,
+and the row serializer selects just those columns. Characters also offer
+'summary', the description cut to ?summary_length= characters (default 160)
+by the database, so long prose never leaves it.
+"""
+
+import hashlib
+from collections import namedtuple
+from sqlalchemy import case, func, literal
+from sqlalchemy.orm import joinedload, load_only, with_expression
+from models import Character, CharacterRelationship
+
+CHARACTER_FIELDS = (
+    'id', 'project_id', 'name', 'description', 'summary', 'position', 'colors', 'metadata',
+    'created_at', 'updated_at'
+)
+RELATIONSHIP_FIELDS = (
+    'id', 'project_id', 'source_character_id', 'target_character_id', 'source_character_name',
+    'target_character_name', 'label', 'relationship_type_id', 'metadata', 'created_at'
+)
+NAME_FIELDS = ('source_character_name', 'target_character_name')
+DEFAULT_SUMMARY_LENGTH = 160
+MAX_SUMMARY_LENGTH = 5000
+ELLIPSIS = '…'
+
+Fieldset = namedtuple('Fieldset', ['fields', 'summary_length'])
+
+
+class FieldsError(ValueError):
+    """Raised for unknown field names or an invalid summary_length"""
+
+
+def parse_fields(value, allowed, summary_length=None):
+    """Fieldset for a ?fields= value, or None (every field) when it is empty.
+
+    Fields come back in the documents' own order, with id always first.
+    """
+    if value is None or not value.strip():
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = sorted(requested - set(allowed))
+    if unknown:
+        raise FieldsError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    requested.add('id')
+
+    length = DEFAULT_SUMMARY_LENGTH
+    if summary_length not in (None, ''):
+        try:
+            length = int(summary_length)
+        except ValueError:
+            raise FieldsError('summary_length must be an integer')
+        if not 1 <= length <= MAX_SUMMARY_LENGTH:
+            raise FieldsError(f'summary_length must be between 1 and {MAX_SUMMARY_LENGTH}')
+    return Fieldset(tuple(name for name in allowed if name in requested), length)
+
+
+def fieldset_tag(fieldset):
+    """Short ETag part identifying a fieldset ('' for all fields)"""
+    if fieldset is None:
+        return ''
+    key = ','.join(fieldset.fields)
+    if 'summary' in fieldset.fields:
+        key += f';{fieldset.summary_length}'
+    return 'f' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+
+
+def summary_expression(column, length):
+    """SQL for column cut to length characters, with an ellipsis if it was longer"""
+    return case(
+        (func.length(column) > length, func.rtrim(func.substr(column, 1, length)).concat(literal(ELLIPSIS))),
+        else_=column
+    )
+
+
+CHARACTER_COLUMNS = {
+    'id': ('id',),
+    'project_id': ('project_id',),
+    'name': ('name',),
+    'description': ('description',),
+    'summary': (),
+    'position': ('position_x', 'position_y'),
+    'colors': ('bg_color', 'border_color', 'text_color', 'icon_color'),
+    'metadata': ('extra_data',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
+
+RELATIONSHIP_COLUMNS = {
+    'id': ('id',),
+    'project_id': ('project_id',),
+    'source_character_id': ('source_character_id',),
+    'target_character_id': ('target_character_id',),
+    'source_character_name': ('source_character_id',),
+    'target_character_name': ('target_character_id',),
+    'label': ('label',),
+    'relationship_type_id': ('relationship_type_id',),
+    'metadata': ('extra_data',),
+    'created_at': ('created_at',),
+}
+
+
+def needs_names(fieldset):
+    """Whether relationship documents of this fieldset carry endpoint names"""
+    return fieldset is None or any(name in fieldset.fields for name in NAME_FIELDS)
+
+
+def character_load_options(fieldset):
+    """Query options loading only the columns a character fieldset needs"""
+    columns = {column for name in fieldset.fields for column in CHARACTER_COLUMNS[name]}
+    options = [load_only(*(getattr(Character, column) for column in sorted(columns)))]
+    if 'summary' in fieldset.fields:
+        options.append(with_expression(
+            Character.summary, summary_expression(Character.description, fieldset.summary_length)
+        ))
+    return options
+
+
+def relationship_load_options(fieldset):
+    """Query options loading only the columns a relationship fieldset needs (None: all of them).
+
+    Endpoint names are eager-loaded, without the rest of the endpoints' columns,
+    so to_dict() doesn't issue a SELECT per edge.
+    """
+    options = []
+    if fieldset is not None:
+        columns = {column for name in fieldset.fields for column in RELATIONSHIP_COLUMNS[name]}
+        options.append(load_only(*(getattr(CharacterRelationship, column) for column in sorted(columns))))
+    if needs_names(fieldset):
+        for endpoint in (CharacterRelationship.source_character, CharacterRelationship.target_character):
+            options.append(joinedload(endpoint).load_only(Character.name))
+    return options
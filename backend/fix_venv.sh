@@ -25,7 +25,7 @@ pip install --upgrade pip
 
 # Install dependencies (using SQLite-friendly version)
 echo "Installing dependencies..."
-pip install Flask==3.0.0 Flask-CORS==4.0.0 python-dotenv==1.0.0 Werkzeug==3.0.1 PyJWT==2.8.0 Flask-SQLAlchemy==3.1.1
+pip install Flask==3.0.0 Flask-CORS==4.0.0 python-dotenv==1.0.0 Werkzeug==3.0.1 PyJWT==2.8.0 Flask-SQLAlchemy==3.1.1 'numpy>=1.24'
 
 echo ""
 echo "✅ Virtual environment fixed!"
@@ -0,0 +1,217 @@
+"""
+In-memory graph queries over a project's characters and relationships.
+
+Each project's graph is held as compact CSR arrays (NumPy integer arrays of
+row offsets and neighbour indices) built straight from the
+character_relationships table. Graphs are cached per project and tagged with
+the project version they were built at; any write bumps the version, so a
+stale graph is rebuilt on the next query.
+"""
+
+import threading
+import numpy as np
+from sqlalchemy import select
+from models import db, Character, CharacterRelationship
+from cache import TTLCache
+
+DIRECTIONS = ('out', 'in', 'both')
+
+
+class GraphQueryError(ValueError):
+    """Raised for invalid graph query parameters"""
+
+
+class UnknownCharacter(KeyError):
+    """Raised when a character id is not part of the project graph"""
+
+
+def _csr(rows, cols, edge_ids, n):
+    """Build (indptr, indices, edge ids) for edges rows[i] -> cols[i]"""
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order], edge_ids[order]
+
+
+def _gather(indptr, indices, edge_ids, frontier):
+    """Neighbours of every node in frontier as (origins, neighbours, edge ids)"""
+    starts = indptr[frontier]
+    lengths = indptr[frontier + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.repeat(frontier, lengths), indices[offsets], edge_ids[offsets]
+
+
+class ProjectGraph:
+    """Immutable CSR snapshot of one project's graph at one version"""
+
+    def __init__(self, project_id, version, node_ids, names, sources, targets, edge_ids):
+        self.project_id = project_id
+        self.version = version
+
+        order = np.argsort(node_ids)
+        self.ids = np.asarray(node_ids, dtype=np.int64)[order]
+        self.names = [names[i] for i in order]
+        n = len(self.ids)
+
+        src = np.searchsorted(self.ids, np.asarray(sources, dtype=np.int64))
+        tgt = np.searchsorted(self.ids, np.asarray(targets, dtype=np.int64))
+        eids = np.asarray(edge_ids, dtype=np.int64)
+        self.num_edges = len(eids)
+
+        self.csr = {
+            'out': _csr(src, tgt, eids, n),
+            'in': _csr(tgt, src, eids, n),
+            'both': _csr(np.concatenate([src, tgt]), np.concatenate([tgt, src]), np.concatenate([eids, eids]), n),
+        }
+        self._sources = src
+        self._targets = tgt
+        self._components = None
+
+    @property
+    def num_nodes(self):
+        return len(self.ids)
+
+    @property
+    def edges(self):
+        """(sources, targets) node index arrays, one entry per relationship"""
+        return self._sources, self._targets
+
+    def index_of(self, character_id):
+        i = int(np.searchsorted(self.ids, character_id))
+        if i >= len(self.ids) or self.ids[i] != character_id:
+            raise UnknownCharacter(character_id)
+        return i
+
+    def node(self, index):
+        return {'id': int(self.ids[index]), 'name': self.names[index]}
+
+    def k_hop(self, character_id, depth, direction='both'):
+        """Nodes within depth hops of a character as a list of node dicts with distance"""
+        indptr, indices, edge_ids = self.csr[direction]
+        start = self.index_of(character_id)
+        distance = np.full(self.num_nodes, -1, dtype=np.int64)
+        distance[start] = 0
+        frontier = np.array([start], dtype=np.int64)
+
+        for hop in range(1, depth + 1):
+            _, neighbours, _ = _gather(indptr, indices, edge_ids, frontier)
+            neighbours = np.unique(neighbours)
+            frontier = neighbours[distance[neighbours] < 0]
+            if not len(frontier):
+                break
+            distance[frontier] = hop
+
+        reached = np.nonzero(distance >= 0)[0]
+        reached = reached[np.argsort(distance[reached], kind='stable')]
+        return [dict(self.node(i), distance=int(distance[i])) for i in reached]
+
+    def shortest_path(self, source_id, target_id, direction='both'):
+        """Fewest-hop path as (nodes, relationship ids), or None if unreachable"""
+        indptr, indices, edge_ids = self.csr[direction]
+        start = self.index_of(source_id)
+        goal = self.index_of(target_id)
+
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        parent_edge = np.full(self.num_nodes, -1, dtype=np.int64)
+        parent[start] = start
+        frontier = np.array([start], dtype=np.int64)
+
+        while len(frontier) and parent[goal] < 0:
+            origins, neighbours, via = _gather(indptr, indices, edge_ids, frontier)
+            unseen = parent[neighbours] < 0
+            neighbours, first = np.unique(neighbours[unseen], return_index=True)
+            parent[neighbours] = origins[unseen][first]
+            parent_edge[neighbours] = via[unseen][first]
+            frontier = neighbours
+
+        if parent[goal] < 0:
+            return None
+
+        path, relationships = [goal], []
+        while path[-1] != start:
+            relationships.append(int(parent_edge[path[-1]]))
+            path.append(int(parent[path[-1]]))
+        path.reverse()
+        relationships.reverse()
+        return [self.node(i) for i in path], relationships
+
+    def components(self):
+        """Weakly connected components as lists of node indices, largest first"""
+        if self._components is not None:
+            return self._components
+
+        labels = np.arange(self.num_nodes, dtype=np.int64)
+        if self.num_edges:
+            # Min-label propagation with pointer jumping until labels settle
+            while True:
+                previous = labels.copy()
+                np.minimum.at(labels, self._sources, labels[self._targets])
+                np.minimum.at(labels, self._targets, labels[self._sources])
+                labels = labels[labels]
+                if np.array_equal(labels, previous):
+                    break
+
+        order = np.argsort(labels, kind='stable')
+        boundaries = np.nonzero(np.diff(labels[order]))[0] + 1
+        groups = np.split(order, boundaries) if self.num_nodes else []
+        groups.sort(key=len, reverse=True)
+        self._components = groups
+        return groups
+
+
+def build_graph(project_id, version):
+    """Load a project's nodes and edges with two queries and build its CSR graph"""
+    characters = Character.__table__
+    relationships = CharacterRelationship.__table__
+    conn = db.session.connection()
+
+    nodes = conn.execute(
+        select(characters.c.id, characters.c.name).where(characters.c.project_id == project_id)
+    ).all()
+    edges = conn.execute(
+        select(relationships.c.id, relationships.c.source_character_id, relationships.c.target_character_id)
+        .where(relationships.c.project_id == project_id)
+    ).all()
+
+    return ProjectGraph(
+        project_id,
+        version,
+        node_ids=[row[0] for row in nodes],
+        names=[row[1] for row in nodes],
+        sources=[row[1] for row in edges],
+        targets=[row[2] for row in edges],
+        edge_ids=[row[0] for row in edges]
+    )
+
+
+class GraphCache:
+    """Per-project graphs keyed by project id, rebuilt when the version moves"""
+
+    def __init__(self, maxsize=64, ttl=3600.0):
+        self.graphs = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, project_id, version):
+        graph = self.graphs.get(project_id)
+        if graph is not None and graph.version == version:
+            return graph
+        with self._lock:
+            graph = self.graphs.get(project_id)
+            if graph is None or graph.version != version:
+                graph = build_graph(project_id, version)
+                self.graphs.set(project_id, graph)
+        return graph
+
+    def stats(self):
+        return self.graphs.stats()
+
+
+def parse_direction(value):
+    direction = value or 'both'
+    if direction not in DIRECTIONS:
+        raise GraphQueryError(f"direction must be one of: {', '.join(DIRECTIONS)}")
+    return direction
@@ -0,0 +1,52 @@
+"""
+gunicorn settings for the WSGI app (pip install gunicorn), run from backend/:
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+Each worker is a process with WEB_THREADS request threads (gthread), so
+WEB_WORKERS x WEB_THREADS requests run at once; more wait in the listen
+backlog. Event streams hold a thread each for as long as they're open, so
+deployments with many live clients are better served by asgi.py.
+
+On SIGTERM a worker first ends its event streams (lifecycle drain), then
+finishes in-flight requests for up to WEB_GRACEFUL_TIMEOUT seconds and
+closes its pools and connections.
+"""
+
+import os
+import sys
+
+bind = os.environ.get('WEB_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_WORKERS', 2))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_class = 'gthread'
+backlog = int(os.environ.get('WEB_BACKLOG', 2048))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+# Import the app once in the master; workers then start their own pools and threads in post_fork
+preload_app = os.environ.get('WEB_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _lifecycle():
+    app_module = sys.modules.get('app')
+    return app_module.server_lifecycle if app_module is not None else None
+
+
+def post_fork(server, worker):
+    lifecycle = _lifecycle()
+    if lifecycle is not None:
+        # Preloaded: the app was imported by the master, so this process's resources start here
+        lifecycle.start()
+
+
+def post_worker_init(worker):
+    lifecycle = _lifecycle()
+    if lifecycle is not None:
+        lifecycle.drain_on_signals()
+
+
+def worker_exit(server, worker):
+    lifecycle = _lifecycle()
+    if lifecycle is not None:
+        lifecycle.stop()
@@ -0,0 +1,64 @@
+"""
+Bounded worker pool for password hashing.
+
+Password hashing is deliberately CPU-heavy. Running it inline lets a burst of
+signups/logins take every request thread, so signup and login hand the work
+to a small dedicated executor instead. When the executor and its queue are
+full, callers get HasherBusy right away and the route answers 503.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Werkzeug hash methods per cost profile. "fast" is for tests and benchmarks only.
+HASH_PROFILES = {
+    'default': 'scrypt',
+    'scrypt': 'scrypt',
+    'pbkdf2': 'pbkdf2:sha256:600000',
+    'fast': 'pbkdf2:sha256:1000',
+}
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool has no free worker or queue slot"""
+
+
+def hash_method_for(profile):
+    """Resolve a profile name (or a raw Werkzeug method string) to a hash method"""
+    return HASH_PROFILES.get(profile, profile)
+
+
+class PasswordHasher:
+    """Runs hashing callables on a fixed pool with a bounded queue.
+
+    workers=0 disables the pool and runs callables inline.
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=30.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher') if workers else None
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and return its result, or raise HasherBusy"""
+        if self._executor is None:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy('Password hashing queue is full')
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.timeout)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
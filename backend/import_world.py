@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Bulk-import an extraction document into a project.
+
+The document is JSON shaped like the /api/parse-entities output:
+    {"entities": [{"name": ..., "description": ...}],
+     "relationships": [{"source": ..., "target": ..., "label": ...}]}
+
+Usage:
+    python import_world.py world.json --email test@example.com --project Eldoria
+    python import_world.py world.json --project-id 1
+"""
+
+import argparse
+import json
+import sys
+import time
+from app import app
+from models import User, Project
+from importer import import_world
+from layout import layout_project
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-import entities and relationships into a project')
+    parser.add_argument('path', help="JSON document, or '-' for stdin")
+    parser.add_argument('--email', help='Owner of the project (with --project)')
+    parser.add_argument('--project', help='Project name (with --email)')
+    parser.add_argument('--project-id', type=int, help='Project id')
+    parser.add_argument('--no-merge-descriptions', action='store_true',
+                        help="Don't append new description text to existing characters")
+    parser.add_argument('--no-layout', action='store_true',
+                        help="Don't lay out new characters that have no position")
+    args = parser.parse_args()
+
+    if args.path == '-':
+        document = json.load(sys.stdin)
+    else:
+        with open(args.path, encoding='utf-8') as f:
+            document = json.load(f)
+
+    with app.app_context():
+        if args.project_id:
+            project = Project.query.get(args.project_id)
+        else:
+            user = User.query.filter_by(email=args.email).first()
+            project = Project.query.filter_by(user_id=user.id, name=args.project).first() if user else None
+        if not project:
+            print("❌ Project not found.")
+            sys.exit(1)
+
+        start = time.perf_counter()
+        summary = import_world(project.id, document, merge_descriptions=not args.no_merge_descriptions)
+        if summary['created_characters'] and app.config['LAYOUT_ON_IMPORT'] and not args.no_layout:
+            summary['layout'] = layout_project(project.id, 'new', spacing=app.config['LAYOUT_SPACING'])
+        elapsed = time.perf_counter() - start
+
+        print(f"✓ Imported into '{project.name}' in {elapsed:.2f}s")
+        print(f"  Characters created: {summary['created_characters']}")
+        print(f"  Characters updated: {summary['updated_characters']}")
+        print(f"  Relationships created: {summary['created_relationships']}")
+        print(f"  Relationships skipped: {summary['skipped_relationships']}")
+        for error in summary['errors']:
+            print(f"  ⚠ {error['type']} {error['index']}: {error['message']}")
+        if 'layout' in summary:
+            print(f"  Characters placed: {summary['layout']['placed']} in {summary['layout']['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
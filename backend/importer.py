@@ -0,0 +1,235 @@
+"""
+Bulk world import.
+
+Takes an extraction document ({"entities": [{name, description}],
+"relationships": [{source, target, label}]}, the shape produced by
+/api/parse-entities) and applies it to a project in a handful of statements:
+one query builds a name -> id index, characters are inserted with one
+executemany, appended descriptions are written with another, and edges are
+resolved through the index and inserted with a final executemany.
+
+Matching follows the dashboard: names compare case-insensitively, new
+description text is appended to an existing character's description, names
+only mentioned in relationships become characters with an empty description,
+and edges that already exist (or point at the same character) are skipped.
+"""
+
+from datetime import datetime
+from sqlalchemy import bindparam, select
+from models import db, Character, CharacterRelationship
+import changes
+import search
+import versioning
+
+characters_table = Character.__table__
+relationships_table = CharacterRelationship.__table__
+
+
+class ImportDocumentError(ValueError):
+    """Raised when an import document is malformed"""
+
+
+def _name_index(conn, project_id):
+    """Map lowercased character name -> (id, name) for a project"""
+    rows = conn.execute(
+        select(characters_table.c.id, characters_table.c.name)
+        .where(characters_table.c.project_id == project_id)
+    )
+    return {name.lower(): (char_id, name) for char_id, name in rows}
+
+
+def _clean_name(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _entity_problem(entity):
+    """Why an entity can't be imported, or None when its fields have usable types"""
+    if not isinstance(entity, dict):
+        return 'Entity must be an object'
+    if not _clean_name(entity.get('name')):
+        return 'name is required'
+    for field in ('position', 'colors', 'metadata'):
+        if entity.get(field) is not None and not isinstance(entity[field], dict):
+            return f'{field} must be an object'
+    if entity.get('description') is not None and not isinstance(entity['description'], str):
+        return 'description must be a string'
+    return None
+
+
+def _relationship_problem(rel):
+    """Why a relationship can't be imported, or None"""
+    if not isinstance(rel, dict):
+        return 'Relationship must be an object'
+    if not _clean_name(rel.get('source')) or not _clean_name(rel.get('target')):
+        return 'source and target are required'
+    if rel.get('label') is not None and not isinstance(rel['label'], str):
+        return 'label must be a string'
+    return None
+
+
+def validate_document(document):
+    """Return (entities, relationships) lists from an import document"""
+    if not isinstance(document, dict):
+        raise ImportDocumentError('Import document must be an object')
+    entities = document.get('entities') or []
+    relationships = document.get('relationships') or []
+    if not isinstance(entities, list) or not isinstance(relationships, list):
+        raise ImportDocumentError('entities and relationships must be lists')
+    return entities, relationships
+
+
+def import_world(project_id, document, merge_descriptions=True):
+    """Apply an import document to a project and commit.
+
+    Returns a summary with counts, a name -> id map of every character the
+    document referenced, and the entities and relationships that were rejected
+    (by type and index) and why.
+    """
+    entities, relationships = validate_document(document)
+    conn = db.session.connection()
+    now = datetime.utcnow()
+
+    index = _name_index(conn, project_id)
+
+    # Plan character inserts and description updates, deduplicated by name
+    new_characters = {}
+    appended = {}
+    errors = []
+    for number, entity in enumerate(entities):
+        problem = _entity_problem(entity)
+        if problem:
+            errors.append({'type': 'entity', 'index': number, 'message': problem})
+            continue
+        name = _clean_name(entity.get('name'))
+        key = name.lower()
+        description = (entity.get('description') or '').strip()
+
+        if key in index:
+            if merge_descriptions and description:
+                appended.setdefault(index[key][0], []).append(description)
+        elif key in new_characters:
+            if description:
+                pending = new_characters[key]
+                pending['description'] = '\n\n'.join(filter(None, [pending['description'], description]))
+        else:
+            position = entity.get('position') or {}
+            colors = entity.get('colors') or {}
+            new_characters[key] = {
+                'project_id': project_id,
+                'name': name,
+                'description': description,
+                'position_x': position.get('x'),
+                'position_y': position.get('y'),
+                'bg_color': colors.get('bg'),
+                'border_color': colors.get('border'),
+                'text_color': colors.get('text'),
+                'icon_color': colors.get('icon'),
+                'extra_data': entity.get('metadata') or {},
+                'created_at': now,
+                'updated_at': now,
+            }
+
+    edges = []
+    for number, rel in enumerate(relationships):
+        problem = _relationship_problem(rel)
+        if problem:
+            errors.append({'type': 'relationship', 'index': number, 'message': problem})
+            continue
+        source = _clean_name(rel['source'])
+        target = _clean_name(rel['target'])
+        edges.append((source, target, rel.get('label') or 'connected to'))
+        for name in (source, target):
+            key = name.lower()
+            if key not in index and key not in new_characters:
+                new_characters[key] = {
+                    'project_id': project_id,
+                    'name': name,
+                    'description': '',
+                    'position_x': None,
+                    'position_y': None,
+                    'bg_color': None,
+                    'border_color': None,
+                    'text_color': None,
+                    'icon_color': None,
+                    'extra_data': {},
+                    'created_at': now,
+                    'updated_at': now,
+                }
+
+    if new_characters:
+        conn.execute(characters_table.insert(), list(new_characters.values()))
+        index = _name_index(conn, project_id)
+
+    if appended:
+        current = dict(conn.execute(
+            select(characters_table.c.id, characters_table.c.description)
+            .where(characters_table.c.id.in_(list(appended)))
+        ).all())
+        conn.execute(
+            characters_table.update()
+            .where(characters_table.c.id == bindparam('_id'))
+            .values(description=bindparam('_description'), updated_at=now),
+            [
+                {
+                    '_id': char_id,
+                    '_description': '\n\n'.join(filter(None, [current.get(char_id)] + additions))
+                }
+                for char_id, additions in appended.items()
+            ]
+        )
+
+    # Resolve edge endpoints through the index and skip existing/duplicate edges
+    existing_edges = set(conn.execute(
+        select(relationships_table.c.source_character_id, relationships_table.c.target_character_id)
+        .where(relationships_table.c.project_id == project_id)
+    ).all())
+    new_edges = []
+    skipped = 0
+    for source, target, label in edges:
+        source_id = index[source.lower()][0]
+        target_id = index[target.lower()][0]
+        if source_id == target_id or (source_id, target_id) in existing_edges:
+            skipped += 1
+            continue
+        existing_edges.add((source_id, target_id))
+        new_edges.append({
+            'project_id': project_id,
+            'source_character_id': source_id,
+            'target_character_id': target_id,
+            'label': label,
+            'extra_data': {},
+            'created_at': now,
+        })
+
+    created_relationships = []
+    if new_edges:
+        created_relationships = list(conn.execute(
+            relationships_table.insert().returning(relationships_table.c.id), new_edges
+        ).scalars())
+
+    # Core statements bypass the ORM flush hooks, so bump the version and re-index here
+    if new_characters or appended or new_edges:
+        versioning.bump_versions(conn, {project_id})
+        touched_characters = [index[key][0] for key in new_characters] + list(appended)
+        search.record_changes(
+            db.session,
+            character_ids=touched_characters,
+            relationship_ids=created_relationships
+        )
+        changes.record_changes(
+            conn, project_id, character_ids=touched_characters, relationship_ids=created_relationships
+        )
+
+    db.session.commit()
+
+    referenced = set(new_characters) | {_clean_name(e.get('name')).lower() for e in entities
+                                        if _entity_problem(e) is None}
+    referenced |= {name.lower() for source, target, _ in edges for name in (source, target)}
+    return {
+        'created_characters': len(new_characters),
+        'updated_characters': len(appended),
+        'created_relationships': len(new_edges),
+        'skipped_relationships': skipped,
+        'characters': {index[key][1]: index[key][0] for key in referenced if key in index},
+        'errors': errors
+    }
@@ -6,13 +6,14 @@ Run this to create the database and tables.
 
 import os
 from app import app, db
-from models import User, Project, Character, CharacterRelationship, RelationshipType
+from models import User, Project, Character, CharacterRelationship, RelationshipType, add_missing_columns
 
 def init_database():
     """Initialize the database with tables"""
     with app.app_context():
         # Create all tables
         db.create_all()
+        add_missing_columns()
         print("✓ Database tables created successfully")
         
         # Create some default relationship types
@@ -0,0 +1,114 @@
+"""
+Process startup and graceful shutdown.
+
+app.py configures the app when it is imported; what has to exist once per
+serving process (a connection pool that isn't shared across a fork, the live
+hub's thread) is registered here and started by app.create_app(), which
+gunicorn calls in each worker (gunicorn.conf.py) and asgi.py calls on
+lifespan startup. Shutdown runs in two steps:
+
+    drain      as soon as the server is asked to stop: ends long-lived work
+               such as event streams, so in-flight requests can finish
+    shutdown   once the server has stopped: stops worker pools, closes
+               the database connections
+
+Both run at most once per process; an atexit hook covers servers (like the
+development server) that never call stop().
+"""
+
+import atexit
+import logging
+import os
+import signal
+import threading
+
+logger = logging.getLogger('worldbuilder.lifecycle')
+
+
+class Lifecycle:
+    """Ordered startup, drain and shutdown hooks of one app"""
+
+    def __init__(self):
+        self.startup_hooks = []
+        self.drain_hooks = []
+        self.shutdown_hooks = []
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._drained = False
+        self._stopped = False
+
+    def on_startup(self, hook):
+        self.startup_hooks.append(hook)
+        return hook
+
+    def on_drain(self, hook):
+        self.drain_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        self.shutdown_hooks.append(hook)
+        return hook
+
+    @property
+    def started(self):
+        return self._started_pid == os.getpid()
+
+    def start(self):
+        """Run the startup hooks, once per process (again in a forked child)"""
+        with self._lock:
+            if self.started:
+                return
+            self._started_pid = os.getpid()
+            self._drained = self._stopped = False
+        for hook in self.startup_hooks:
+            hook()
+        atexit.register(self.stop)
+
+    def drain(self):
+        """Run the drain hooks (idempotent)"""
+        with self._lock:
+            if self._drained or not self.started:
+                return
+            self._drained = True
+        self._run(self.drain_hooks)
+
+    def stop(self):
+        """Drain if that hasn't happened, then run the shutdown hooks in reverse order (idempotent)"""
+        self.drain()
+        with self._lock:
+            if self._stopped or not self.started:
+                return
+            self._stopped = True
+        self._run(reversed(self.shutdown_hooks))
+
+    def drain_on_signals(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Drain before the server's own handler for these signals runs.
+
+        Must be called from the main thread, after the server installed its handlers.
+        """
+        for signum in signals:
+            previous = signal.getsignal(signum)
+            if not callable(previous):
+                continue
+
+            def handle(received, frame, previous=previous):
+                # Off the signal handler: drain hooks take locks the interrupted code may hold
+                threading.Thread(target=self.drain, name='lifecycle-drain', daemon=True).start()
+                previous(received, frame)
+
+            signal.signal(signum, handle)
+
+    @staticmethod
+    def _run(hooks):
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception('Lifecycle hook %s failed', getattr(hook, '__name__', hook))
+
+
+def install(app):
+    """Create the app's lifecycle"""
+    lifecycle = Lifecycle()
+    app.extensions['lifecycle'] = lifecycle
+    return lifecycle
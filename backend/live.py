@@ -0,0 +1,408 @@
+"""
+Live project updates over server-sent events.
+
+When a transaction that changed a project commits, the change feed (see
+changes.py) reports the project's version range and that notification is
+published through a broker. Every worker process runs a hub subscribed to
+the broker; for each notification about a project with local subscribers,
+the hub reads the changes once and fans the event out to every subscriber's
+bounded buffer. GET /api/projects/<id>/events streams those buffers:
+
+    id: 42
+    event: changes
+    data: {"project_id": 1, "since": 41, "version": 42, "characters": [...], ...}
+
+The event id is the project version, so a reconnecting EventSource sends
+Last-Event-ID and the stream resumes from the change log. Subscribers that
+fall behind (full buffer, or a notification that skips versions) are caught
+up from the change log as well; when the log can't reach back far enough
+they get a 'reset' event and should re-fetch the graph.
+
+LocalBroker delivers in-process and suits a single worker. Multi-worker
+deployments set LIVE_BROKER=redis (needs the redis package) or point
+LIVE_BROKER at a 'module:factory' returning their own broker.
+
+The hub subscribes to the broker and starts its dispatcher thread with the
+first stream of each process, so a server may import the app before forking
+its workers. Hub.close() ends every open stream when a worker shuts down;
+clients reconnect elsewhere with Last-Event-ID.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import queue
+import threading
+from collections import deque
+from sqlalchemy.orm import Session
+import changes
+
+DEFAULT_BUFFER_SIZE = 64
+DEFAULT_HEARTBEAT_SECONDS = 15.0
+RETRY_MILLISECONDS = 3000
+
+
+class LocalBroker:
+    """In-process broker: publish() calls every subscribed callback directly"""
+
+    def __init__(self):
+        self._callbacks = []
+
+    def publish(self, message):
+        for callback in list(self._callbacks):
+            callback(message)
+
+    def subscribe(self, callback):
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    def close(self):
+        self._callbacks = []
+
+
+class RedisBroker:
+    """Broker over a Redis pub/sub channel, shared by every worker process"""
+
+    def __init__(self, url='redis://localhost:6379/0', channel='worldbuilder:changes'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('LIVE_BROKER=redis needs the redis package (pip install redis)')
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread = None
+
+    def publish(self, message):
+        self._client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, callback):
+        def handle(raw):
+            callback(json.loads(raw['data']))
+
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: handle})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+def make_broker(spec='local', url=None):
+    """Broker named by spec: 'local', 'redis', or 'module:factory' called with url"""
+    if spec in (None, '', 'local'):
+        return LocalBroker()
+    if spec == 'redis':
+        return RedisBroker(url) if url else RedisBroker()
+    module_name, _, factory = spec.partition(':')
+    if not factory:
+        raise ValueError(f"LIVE_BROKER must be 'local', 'redis' or 'module:factory', not {spec!r}")
+    return getattr(importlib.import_module(module_name), factory)(url)
+
+
+class Subscriber:
+    """One stream's bounded event buffer.
+
+    waker, if given, is called (from the hub's thread) whenever an event
+    arrives or the subscriber is closed; async streams use it instead of
+    blocking in next_event().
+    """
+
+    def __init__(self, project_id, last_version, buffer_size=DEFAULT_BUFFER_SIZE, waker=None):
+        self.project_id = project_id
+        self.last_version = last_version
+        self.overflowed = False
+        self.closed = False
+        self._events = deque()
+        self._buffer_size = buffer_size
+        self._ready = threading.Condition()
+        self._waker = waker
+
+    def deliver(self, event):
+        with self._ready:
+            if len(self._events) >= self._buffer_size:
+                # Drop what's buffered; the stream catches up from the change log instead
+                self._events.clear()
+                self.overflowed = True
+            self._events.append(event)
+            self._ready.notify()
+        if self._waker is not None:
+            self._waker()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+        if self._waker is not None:
+            self._waker()
+
+    def next_event(self, timeout):
+        """Next buffered event, or None after timeout.
+
+        Raises Overflow if events were dropped and Closed once the hub shuts down.
+        """
+        with self._ready:
+            if not self._events and not self.overflowed and not self.closed:
+                self._ready.wait(timeout)
+            if self.closed:
+                raise Closed()
+            if self.overflowed:
+                self.overflowed = False
+                self._events.clear()
+                raise Overflow()
+            return self._events.popleft() if self._events else None
+
+
+class Overflow(Exception):
+    """Raised by Subscriber.next_event when the buffer dropped events"""
+
+
+class Closed(Exception):
+    """Raised by Subscriber.next_event when the hub has closed the stream"""
+
+
+class Hub:
+    """Per-process registry of subscribers, fed by the broker"""
+
+    def __init__(self, app, db, broker, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.app = app
+        self.db = db
+        self.broker = broker
+        self.buffer_size = buffer_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._notifications = queue.Queue()
+        self._published = 0
+        self._delivered = 0
+        self._started_pid = None
+        self._closed = False
+
+    def start(self):
+        """Subscribe to the broker and start the dispatcher, once per process"""
+        with self._lock:
+            if self._started_pid == os.getpid() or self._closed:
+                return
+            # Threads don't survive a fork: a worker forked from a started process starts its own
+            self._started_pid = os.getpid()
+            self._notifications = queue.Queue()
+            threading.Thread(target=self._dispatch, args=(self._notifications,), name='live-hub', daemon=True).start()
+        self.broker.subscribe(self._receive)
+
+    def close(self):
+        """Stop dispatching and end every open stream"""
+        with self._lock:
+            self._closed = True
+            subscribers = [sub for subs in self._subscribers.values() for sub in subs]
+            self._subscribers = {}
+            started = self._started_pid == os.getpid()
+            self._started_pid = None
+        if started:
+            self._notifications.put(None)
+            self.broker.close()
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def publish(self, project_id, since, version):
+        """Change feed commit listener"""
+        self._published += 1
+        self.broker.publish({'project_id': project_id, 'since': since, 'version': version})
+
+    def subscribe(self, project_id, last_version, waker=None):
+        self.start()
+        subscriber = Subscriber(project_id, last_version, self.buffer_size, waker=waker)
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._subscribers.setdefault(project_id, set()).add(subscriber)
+        if closed:
+            subscriber.close()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.project_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.project_id]
+
+    def read_changes(self, project_id, since):
+        """Change feed payload from since, in a session of its own"""
+        with self.app.app_context(), Session(self.db.engine) as session:
+            return changes.changes_since(project_id, since, session=session)
+
+    def _receive(self, message):
+        # Only projects with streams in this process are worth a read
+        with self._lock:
+            if message['project_id'] in self._subscribers:
+                self._notifications.put(message)
+
+    def _dispatch(self, notifications):
+        while True:
+            message = notifications.get()
+            if message is None:
+                return
+            with self._lock:
+                subscribers = list(self._subscribers.get(message['project_id'], ()))
+            if not subscribers:
+                continue
+            try:
+                event = self.read_changes(message['project_id'], message['since'])
+            except Exception:
+                self.app.logger.exception('Could not read changes for project %s', message['project_id'])
+                continue
+            for subscriber in subscribers:
+                subscriber.deliver(event)
+            self._delivered += len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            streams = sum(len(subscribers) for subscribers in self._subscribers.values())
+            projects = len(self._subscribers)
+        return {
+            'broker': type(self.broker).__name__, 'projects': projects, 'streams': streams,
+            'published': self._published, 'delivered': self._delivered
+        }
+
+
+def format_event(event):
+    """SSE frame for a change feed payload"""
+    name = 'reset' if event.get('reset') else 'changes'
+    data = json.dumps(event, separators=(',', ':'))
+    return f"id: {event['version']}\nevent: {name}\ndata: {data}\n\n"
+
+
+def _action(subscriber, event):
+    """What a stream does with a delivered event: 'skip', 'catch_up' or 'send'"""
+    if event['version'] <= subscriber.last_version:
+        return 'skip'
+    if event.get('reset') or event['since'] > subscriber.last_version:
+        # Missed a notification (or the event started past us): read from our own version
+        return 'catch_up'
+    return 'send'
+
+
+def _caught_up(subscriber, event):
+    """Frame for a catch-up read, or None if there was nothing new"""
+    if event['version'] != subscriber.last_version or event.get('reset'):
+        subscriber.last_version = event['version']
+        return format_event(event)
+    return None
+
+
+def stream(hub, project_id, last_version, current_version, heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+    """Generate the SSE frames of one subscription.
+
+    Starts from last_version (the client's Last-Event-ID) when given, or the
+    current version. Comment frames keep idle connections open.
+    """
+    subscriber = hub.subscribe(project_id, current_version if last_version is None else last_version)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        if subscriber.last_version != current_version:
+            yield from _catch_up(hub, subscriber)
+        while True:
+            try:
+                event = subscriber.next_event(heartbeat_seconds)
+            except Overflow:
+                yield from _catch_up(hub, subscriber)
+                continue
+            except Closed:
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            action = _action(subscriber, event)
+            if action == 'catch_up':
+                yield from _catch_up(hub, subscriber)
+            elif action == 'send':
+                subscriber.last_version = event['version']
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def _catch_up(hub, subscriber):
+    frame = _caught_up(subscriber, hub.read_changes(subscriber.project_id, subscriber.last_version))
+    if frame is not None:
+        yield frame
+
+
+async def stream_async(hub, project_id, last_version, current_version, heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+    """stream() for asyncio servers: waits on the event loop instead of holding a thread.
+
+    Change log reads for catch-ups run in a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:  # the loop is gone, and the stream with it
+            pass
+
+    subscriber = hub.subscribe(project_id, current_version if last_version is None else last_version, waker=wake)
+
+    async def catch_up():
+        event = await asyncio.to_thread(hub.read_changes, subscriber.project_id, subscriber.last_version)
+        return _caught_up(subscriber, event)
+
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        if subscriber.last_version != current_version:
+            frame = await catch_up()
+            if frame is not None:
+                yield frame
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            ready.clear()
+            # Drain everything buffered since the last wake-up
+            while True:
+                try:
+                    event = subscriber.next_event(0)
+                except Overflow:
+                    event, action = None, 'catch_up'
+                except Closed:
+                    return
+                else:
+                    if event is None:
+                        break
+                    action = _action(subscriber, event)
+                if action == 'catch_up':
+                    frame = await catch_up()
+                    if frame is not None:
+                        yield frame
+                elif action == 'send':
+                    subscriber.last_version = event['version']
+                    yield format_event(event)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def stats_collector(hub):
+    """Metrics collector exposing open streams and published/delivered event counts"""
+    def collect():
+        stats = hub.stats()
+        return [
+            '# TYPE worldbuilder_live_streams gauge', f"worldbuilder_live_streams {stats['streams']}",
+            '# TYPE worldbuilder_live_published_total counter', f"worldbuilder_live_published_total {stats['published']}",
+            '# TYPE worldbuilder_live_delivered_total counter', f"worldbuilder_live_delivered_total {stats['delivered']}",
+        ]
+    return collect
+
+
+def install(app, db, feed, broker='local', broker_url=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Create the app's hub and publish the change feed's commits through the broker"""
+    hub = Hub(app, db, make_broker(broker, broker_url), buffer_size=buffer_size)
+    feed.add_commit_listener(hub.publish)
+    app.extensions['live'] = hub
+    return hub
@@ -0,0 +1,339 @@
+"""
+Where the project's characters are mentioned in the documents corpus.
+
+GET /api/projects/<id>/mentions lists, per character, the documents that
+name it and the [start, end) offsets of every mention (in characters of the
+file's content). The names of a project's characters, plus any aliases (a
+list of strings under "aliases" in a character's metadata), are compiled
+into one Aho-Corasick automaton. Each document is then scanned once for the
+whole cast, however many names there are. Matching ignores case and accepts
+whole words only. Overlaps go to the leftmost, then longest name, so "Mira
+Valen" wins over "Mira". A name shared by several characters is a mention of
+each of them.
+
+The index is kept per project and refreshed on request:
+
+    documents    files whose mtime changed are rescanned, removed files
+                 drop out (following the corpus generation, documents.py)
+    characters   the change log says which characters were written since the
+                 index's version; only the documents that mention one whose
+                 names changed, or contain every word of one of its new
+                 names, are rescanned
+"""
+
+import posixpath
+import re
+import threading
+from collections import deque
+from sqlalchemy import select
+from cache import TTLCache
+from changes import CHARACTER, changed_ids
+from documents import EXTENSION, DocumentError, DocumentNotFound, normalize_path
+from graph_engine import UnknownCharacter
+from models import Character
+
+MIN_NAME_CHARS = 2
+MAX_CONTEXT_CHARS = 500
+
+WORD_RE = re.compile(r'\w+')
+_SPACES = str.maketrans('\t\n\r\f\v ', '      ')
+
+characters_table = Character.__table__
+
+
+class MentionQueryError(ValueError):
+    pass
+
+
+def fold(text):
+    """text lower-cased and with whitespace as plain spaces, keeping every offset"""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # A few characters lower-case to several ("İ"): leave those as they are
+        folded = ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+    return folded.translate(_SPACES)
+
+
+def patterns_of(name, extra_data):
+    """Folded name and aliases a character is recognised by"""
+    aliases = (extra_data or {}).get('aliases') if isinstance(extra_data, dict) else None
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    names = [name] + [alias for alias in aliases or () if isinstance(alias, str)]
+    patterns = (fold(' '.join(name.split())) for name in names if name)
+    return tuple(sorted({pattern for pattern in patterns if len(pattern) >= MIN_NAME_CHARS}))
+
+
+class Automaton:
+    """Aho-Corasick automaton over folded patterns, each carrying a value"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for pattern, value in patterns:
+            state = 0
+            for char in pattern:
+                following = self.goto[state].get(char)
+                if following is None:
+                    following = len(self.goto)
+                    self.goto[state][char] = following
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = following
+            self.out[state] += ((len(pattern), value),)
+
+        # Failure links breadth first, so a state's fallback is complete before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                fallback = self.goto[fallback].get(char, 0)
+                self.fail[following] = fallback
+                self.out[following] += self.out[fallback]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def scan(self, text):
+        """(start, end, value) of the whole-word matches in folded text, leftmost-longest"""
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        found = []
+        state = 0
+        for position, char in enumerate(text):
+            if state == 0:
+                state = root.get(char, 0)
+            else:
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+            if out[state]:
+                end = position + 1
+                for length, value in out[state]:
+                    found.append((end - length, end, value))
+
+        matches, covered = [], 0
+        for start, end, value in sorted(found, key=lambda match: (match[0], -match[1])):
+            if start >= covered and _whole_word(text, start, end):
+                matches.append((start, end, value))
+                covered = end
+        return matches
+
+
+def _whole_word(text, start, end):
+    before = text[start - 1] if start else ' '
+    after = text[end] if end < len(text) else ' '
+    return not ((_is_word(before) and _is_word(text[start])) or (_is_word(after) and _is_word(text[end - 1])))
+
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+
+def build_automaton(names):
+    """Automaton over {character id: (name, patterns)}, each pattern valued with its characters' ids"""
+    owners = {}
+    for cid, (_, patterns) in names.items():
+        for pattern in patterns:
+            owners.setdefault(pattern, []).append(cid)
+    return Automaton((pattern, tuple(cids)) for pattern, cids in owners.items())
+
+
+def load_names(conn, project_id, ids=None):
+    """{character id: (name, patterns)} of a project's characters, or of ids among them"""
+    query = select(characters_table.c.id, characters_table.c.name, characters_table.c.extra_data).where(
+        characters_table.c.project_id == project_id
+    )
+    if ids is not None:
+        if not ids:
+            return {}
+        query = query.where(characters_table.c.id.in_(sorted(ids)))
+    return {cid: (name, patterns_of(name, extra_data)) for cid, name, extra_data in conn.execute(query)}
+
+
+class MentionIndex:
+    """Mentions of one project's characters across the corpus"""
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.version = None
+        self.generation = None
+        self.names = {}
+        self.automaton = None
+        # {path: (mtime, {character id: [(start, end)]})}
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def characters_changed(self, conn, version):
+        """Apply the characters written since self.version. Returns the paths whose mentions
+        went stale and the word sets of the new names, or None when everything needs a rescan"""
+        changed = None
+        if self.version is not None:
+            changed = changed_ids(conn, self.project_id, CHARACTER, self.version, version)
+        if changed is None:
+            self.names = load_names(conn, self.project_id)
+            self.automaton = None
+            self.documents.clear()
+            return None
+        written, deleted = changed
+        fresh = load_names(conn, self.project_id, written)
+        # Renames matter only when they change what is looked for
+        stale = {cid for cid in written | deleted if self.names.get(cid, (None, ()))[1] != fresh.get(cid, (None, ()))[1]}
+        for cid in deleted:
+            self.names.pop(cid, None)
+        self.names.update(fresh)
+        if not stale:
+            return set(), []
+        self.automaton = None
+        wanted = [set(WORD_RE.findall(pattern)) for cid in stale if cid in fresh for pattern in fresh[cid][1]]
+        return {path for path, (_, found) in self.documents.items() if not stale.isdisjoint(found)}, wanted
+
+
+class MentionService:
+    """Per-project mention indexes over the shared corpus"""
+
+    def __init__(self, corpus, maxsize=64, ttl=3600.0):
+        self.corpus = corpus
+        self.indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+        # {path: (mtime, words)} shared by every project, to find the documents a new name can be in
+        self.words = {}
+        self._lock = threading.Lock()
+        self.scanned = 0
+        self.rebuilt = 0
+
+    def _scan(self, entry, path, mtime):
+        try:
+            content = self.corpus.read(path)['content']
+        except DocumentNotFound:
+            entry.documents.pop(path, None)
+            return
+        text = fold(content)
+        if self.words.get(path, (None,))[0] != mtime:
+            self.words[path] = (mtime, frozenset(WORD_RE.findall(text)))
+        found = {}
+        for start, end, cids in entry.automaton.scan(text):
+            for cid in cids:
+                found.setdefault(cid, []).append((start, end))
+        entry.documents[path] = (mtime, found)
+        self.scanned += 1
+
+    def refresh(self, conn, entry, version):
+        """Bring an index up to the project version and the corpus generation (call with entry.lock held)"""
+        rescan = set()
+        if entry.version != version:
+            changed = entry.characters_changed(conn, version)
+            entry.version = version
+            if changed is None:
+                entry.generation = None
+                self.rebuilt += 1
+            else:
+                rescan, wanted = changed
+                if wanted:
+                    rescan |= {path for path, (_, words) in list(self.words.items())
+                               if path in entry.documents and any(name <= words for name in wanted)}
+        if entry.generation == self.corpus.generation and not rescan:
+            return
+        if entry.automaton is None:
+            entry.automaton = build_automaton(entry.names)
+        generation, files = self.corpus.file_index()
+        for path in [path for path in entry.documents if path not in files]:
+            del entry.documents[path]
+        for path, (mtime, _) in files.items():
+            if path in rescan or entry.documents.get(path, (None,))[0] != mtime:
+                self._scan(entry, path, mtime)
+        with self._lock:
+            for path in [path for path in self.words if path not in files]:
+                del self.words[path]
+        entry.generation = generation
+
+    def index(self, conn, project_id, version):
+        with self._lock:
+            entry = self.indexes.get(project_id)
+            if entry is None:
+                entry = MentionIndex(project_id)
+                self.indexes.set(project_id, entry)
+        with entry.lock:
+            self.refresh(conn, entry, version)
+        return entry
+
+    def mentions(self, conn, project_id, version, character_ids=(), path=None, context=0):
+        """Mentions per character, best covered first; limited to character_ids and/or one document"""
+        entry = self.index(conn, project_id, version)
+        with entry.lock:
+            for cid in character_ids:
+                if cid not in entry.names:
+                    raise UnknownCharacter(cid)
+            if path is None:
+                documents = entry.documents.items()
+            elif path in entry.documents:
+                documents = [(path, entry.documents[path])]
+            else:
+                raise DocumentNotFound('File not found')
+            wanted = set(character_ids) or entry.names.keys()
+            found = {}
+            for rel, (_, mentions) in documents:
+                for cid, spans in mentions.items():
+                    if cid in wanted:
+                        found.setdefault(cid, []).append((rel, spans))
+
+            characters = []
+            for cid in character_ids or found:
+                located = sorted(found.get(cid, ()), key=lambda item: (-len(item[1]), item[0]))
+                characters.append({
+                    'id': cid,
+                    'name': entry.names[cid][0],
+                    'mentions': sum(len(spans) for _, spans in located),
+                    'documents': [self._document(rel, spans, context) for rel, spans in located],
+                })
+            scanned = len(entry.documents)
+        if not character_ids:
+            characters.sort(key=lambda item: (-item['mentions'], item['name']))
+        return {'characters': characters, 'documents_scanned': scanned}
+
+    def _document(self, path, spans, context):
+        document = {'path': path, 'name': posixpath.basename(path)[:-len(EXTENSION)], 'count': len(spans),
+                    'spans': [list(span) for span in spans]}
+        if context:
+            try:
+                content = self.corpus.read(path)['content']
+            except DocumentNotFound:
+                content = ''
+            document['snippets'] = [' '.join(content[max(0, start - context):end + context].split())
+                                    for start, end in spans]
+        return document
+
+    def stats(self):
+        return dict(self.indexes.stats(), scanned=self.scanned, rebuilt=self.rebuilt)
+
+
+def parse_mention_args(args):
+    """(character ids, document path, context characters) from a request's query string"""
+    try:
+        character_ids = list(dict.fromkeys(int(value) for value in args.getlist('character')))
+    except ValueError:
+        raise MentionQueryError('character must be an integer id')
+    path = args.get('document')
+    try:
+        path = normalize_path(path) if path else None
+    except DocumentError as e:
+        raise MentionQueryError(f'document: {e}')
+    try:
+        context = int(args.get('context', 0))
+    except ValueError:
+        raise MentionQueryError('context must be an integer')
+    if not 0 <= context <= MAX_CONTEXT_CHARS:
+        raise MentionQueryError(f'context must be between 0 and {MAX_CONTEXT_CHARS}')
+    return character_ids, path, context
+
+
+def install(app, corpus, maxsize=64):
+    """Create the app's mention service"""
+    service = MentionService(corpus, maxsize=maxsize)
+    app.extensions['mentions'] = service
+    return service
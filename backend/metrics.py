@@ -0,0 +1,278 @@
+"""
+Request instrumentation.
+
+Every request records its SQL statement count and time (from engine cursor
+events), time spent in named phases (token verification, the ownership
+check), JSON serialization time and total time. The numbers are returned in
+a Server-Timing header, so they show up in the browser's network panel:
+
+    Server-Timing: db;dur=3.1;desc="4 queries", auth;dur=0.4, access;dur=0.2,
+                   serialize;dur=12.8, total;dur=19.6
+
+and aggregated into per-endpoint histograms served in the Prometheus text
+format on /api/metrics. Statements slower than SLOW_QUERY_MS are logged to
+the 'worldbuilder.slow_queries' logger (and SLOW_QUERY_LOG, if set).
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from bisect import bisect_left
+from flask import g, has_request_context, request
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+slow_query_logger = logging.getLogger('worldbuilder.slow_queries')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Labelled cumulative histogram in the Prometheus data model"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in series]
+        for label_values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = ('le', _number(bound))
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+class Counter:
+    """Labelled monotonically increasing counter"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labels, key)} {_number(value)}' for key, value in values)
+        return lines
+
+
+class Metrics:
+    """The app's metric registry"""
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'worldbuilder_request_duration_seconds', 'Total request handling time',
+            ('endpoint', 'method', 'status'))
+        self.db_seconds = Histogram(
+            'worldbuilder_request_db_seconds', 'Time spent executing SQL per request', ('endpoint',))
+        self.queries = Histogram(
+            'worldbuilder_request_queries', 'SQL statements executed per request', ('endpoint',),
+            buckets=QUERY_BUCKETS)
+        self.serialize_seconds = Histogram(
+            'worldbuilder_request_serialize_seconds', 'JSON encoding time per request', ('endpoint',))
+        self.phase_seconds = Histogram(
+            'worldbuilder_request_phase_seconds', 'Time spent in named request phases',
+            ('endpoint', 'phase'))
+        self.slow_queries = Counter(
+            'worldbuilder_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS', ('endpoint',))
+        self.collectors = []
+
+    def add_collector(self, collect):
+        """Register a callable returning extra exposition lines at scrape time"""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in (self.request_seconds, self.db_seconds, self.queries, self.serialize_seconds,
+                       self.phase_seconds, self.slow_queries):
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+def _current():
+    """Per-request accumulator, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('_instrumentation')
+
+
+@contextmanager
+def phase(name):
+    """Time a block as a named phase of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current = _current()
+        if current is not None:
+            current['phases'][name] = current['phases'].get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def serializing():
+    """Count a block as response serialization time"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current = _current()
+        if current is not None:
+            current['serialize'] += time.perf_counter() - started
+
+
+class TimedJSONProvider(JSONProvider):
+    """Wraps the app's JSON provider, adding encoding time to the current request's timings"""
+
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self.provider = provider
+
+    def dumps(self, obj, **kwargs):
+        with serializing():
+            return self.provider.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.provider.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with serializing():
+            return self.provider.response(*args, **kwargs)
+
+
+def server_timing(current, total):
+    """Server-Timing header value for one request"""
+    entries = [f'db;dur={current["db"] * 1000:.2f};desc="{current["queries"]} queries"']
+    entries += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in current['phases'].items()]
+    entries.append(f'serialize;dur={current["serialize"] * 1000:.2f}')
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def install(app, db, slow_query_ms=100.0, slow_query_log=None):
+    """Hook instrumentation into the app's requests and engine; returns the registry"""
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    app.json = TimedJSONProvider(app, app.json)
+
+    if slow_query_log:
+        handler = logging.FileHandler(slow_query_log)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+    if not slow_query_logger.level:
+        slow_query_logger.setLevel(logging.WARNING)
+    slow_threshold = slow_query_ms / 1000.0
+    local = threading.local()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        local.started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def finish_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - getattr(local, 'started', time.perf_counter())
+        current = _current()
+        if current is not None:
+            current['queries'] += 1
+            current['db'] += elapsed
+        if elapsed >= slow_threshold:
+            endpoint = request.endpoint if has_request_context() else None
+            metrics.slow_queries.inc(endpoint or 'none')
+            slow_query_logger.warning(
+                '%.1fms %s %s%s', elapsed * 1000, endpoint or '-', ' '.join(statement.split())[:2000],
+                ' (executemany)' if executemany else ''
+            )
+
+    @app.before_request
+    def start_request():
+        g._instrumentation = {
+            'started': time.perf_counter(), 'queries': 0, 'db': 0.0, 'serialize': 0.0, 'phases': {}
+        }
+
+    @app.after_request
+    def finish_request(response):
+        current = _current()
+        if current is None:
+            return response
+        total = time.perf_counter() - current['started']
+        endpoint = request.endpoint or 'unmatched'
+        response.headers['Server-Timing'] = server_timing(current, total)
+
+        metrics.request_seconds.observe(total, endpoint, request.method, f'{response.status_code // 100}xx')
+        metrics.db_seconds.observe(current['db'], endpoint)
+        metrics.queries.observe(current['queries'], endpoint)
+        metrics.serialize_seconds.observe(current['serialize'], endpoint)
+        for name, seconds in current['phases'].items():
+            metrics.phase_seconds.observe(seconds, endpoint, name)
+        return response
+
+    return metrics
+
+
+def cache_collector(caches):
+    """Collector exposing hit/miss/eviction counters and sizes of TTLCaches, keyed by name"""
+    def collect():
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        lines = []
+        for metric, key, kind in (('worldbuilder_cache_hits_total', 'hits', 'counter'),
+                                  ('worldbuilder_cache_misses_total', 'misses', 'counter'),
+                                  ('worldbuilder_cache_evictions_total', 'evictions', 'counter'),
+                                  ('worldbuilder_cache_entries', 'size', 'gauge')):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(f'{metric}{_labels(("cache",), (name,))} {values[key]}' for name, values in sorted(stats.items()))
+        return lines
+    return collect
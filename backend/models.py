@@ -1,11 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import JSON
+from sqlalchemy import JSON, inspect, text
+from sqlalchemy.orm import query_expression
+from sqlalchemy.schema import CreateColumn
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
 
+def add_missing_columns():
+    """Add model columns that are missing from existing tables.
+
+    db.create_all() only creates missing tables, so databases created before a
+    column was added to a model need it added here. Must run in an app context.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+
+
 class User(db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
@@ -19,9 +39,9 @@ class User(db.Model):
     # Relationships
     projects = db.relationship('Project', backref='user', lazy=True, cascade='all, delete-orphan')
     
-    def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password, method='scrypt'):
+        """Hash and set password (method is a Werkzeug hash method string)"""
+        self.password_hash = generate_password_hash(password, method=method)
     
     def check_password(self, password):
         """Check if password matches"""
@@ -47,6 +67,11 @@ class Project(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped on every write to the project's characters/relationships (see versioning.py)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Oldest version the change log can answer ?since= from (see changes.py); NULL until
+    # the first logged write (or change feed read) starts the log
+    changes_floor = db.Column(db.Integer)
     
     # Relationships
     characters = db.relationship('Character', backref='project', lazy=True, cascade='all, delete-orphan')
@@ -59,6 +84,7 @@ class Project(db.Model):
             'user_id': self.user_id,
             'name': self.name,
             'description': self.description,
+            'version': self.version,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -81,6 +107,8 @@ class Character(db.Model):
     extra_data = db.Column(JSON)  # For flexible additional attributes (renamed from metadata - reserved word)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Truncated description, set only by queries that ask for it (fieldsets.character_load_options)
+    summary = query_expression()
     
     # Relationships
     outgoing_relationships = db.relationship(
@@ -104,8 +132,15 @@ class Character(db.Model):
         db.Index('idx_characters_name', 'name'),
     )
     
-    def to_dict(self, include_relationships=False):
-        """Convert character to dictionary"""
+    def to_dict(self, include_relationships=False, fields=None):
+        """Convert character to dictionary
+
+        Pass fields (see fieldsets.py) to include only those keys, touching
+        only the columns behind them.
+        """
+        if fields is not None:
+            return {name: self._field(name) for name in fields}
+
         data = {
             'id': self.id,
             'project_id': self.project_id,
@@ -134,6 +169,20 @@ class Character(db.Model):
         
         return data
 
+    def _field(self, name):
+        if name == 'position':
+            if self.position_x is None or self.position_y is None:
+                return None
+            return {'x': self.position_x, 'y': self.position_y}
+        if name == 'colors':
+            return {'bg': self.bg_color, 'border': self.border_color, 'text': self.text_color, 'icon': self.icon_color}
+        if name == 'metadata':
+            return self.extra_data or {}
+        if name in ('created_at', 'updated_at'):
+            value = getattr(self, name)
+            return value.isoformat() if value else None
+        return getattr(self, name)
+
 
 class RelationshipType(db.Model):
     """Relationship type model (optional, for predefined relationship types)"""
@@ -174,18 +223,115 @@ class CharacterRelationship(db.Model):
         db.Index('idx_relationships_project', 'project_id'),
     )
     
-    def to_dict(self):
-        """Convert relationship to dictionary"""
+    def to_dict(self, character_names=None, fields=None):
+        """Convert relationship to dictionary
+
+        Pass character_names (a {character_id: name} map) to resolve endpoint
+        names without touching the lazy source/target backrefs, and fields
+        (see fieldsets.py) to include only those keys.
+        """
+        if fields is not None:
+            return {name: self._field(name, character_names) for name in fields}
+
+        if character_names is not None:
+            source_name = character_names.get(self.source_character_id)
+            target_name = character_names.get(self.target_character_id)
+        else:
+            source_name = self.source_character.name if self.source_character else None
+            target_name = self.target_character.name if self.target_character else None
+
         return {
             'id': self.id,
             'project_id': self.project_id,
             'source_character_id': self.source_character_id,
             'target_character_id': self.target_character_id,
-            'source_character_name': self.source_character.name if self.source_character else None,
-            'target_character_name': self.target_character.name if self.target_character else None,
+            'source_character_name': source_name,
+            'target_character_name': target_name,
             'label': self.label,
             'relationship_type_id': self.relationship_type_id,
             'metadata': self.extra_data or {},
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+    def _field(self, name, character_names=None):
+        if name in ('source_character_name', 'target_character_name'):
+            character_id = self.source_character_id if name == 'source_character_name' else self.target_character_id
+            if character_names is not None:
+                return character_names.get(character_id)
+            character = self.source_character if name == 'source_character_name' else self.target_character
+            return character.name if character else None
+        if name == 'metadata':
+            return self.extra_data or {}
+        if name == 'created_at':
+            return self.created_at.isoformat() if self.created_at else None
+        return getattr(self, name)
+
+
+class ProjectChange(db.Model):
+    """Change log entry: the latest write to one character or relationship (see changes.py)"""
+    __tablename__ = 'project_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'character' or 'relationship'
+    ref_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    project = db.relationship('Project', backref=db.backref('changes', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'kind', 'ref_id', name='unique_change_per_row'),
+        db.Index('idx_project_changes_version', 'project_id', 'version'),
+    )
+
+
+class ExtractionJob(db.Model):
+    """Background entity extraction over a text or document, chunk by chunk (see extraction.py)"""
+    __tablename__ = 'extraction_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done or failed
+    source = db.Column(db.String(1024))  # document path, or NULL for submitted text
+    worker = db.Column(db.String(255))  # host:pid of the process running the chunks
+    extractor = db.Column(db.String(100), nullable=False)
+    chunks_total = db.Column(db.Integer, nullable=False, default=0)
+    chunks_done = db.Column(db.Integer, nullable=False, default=0)
+    chunks_cached = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    project = db.relationship('Project', backref=db.backref('extraction_jobs', lazy=True, cascade='all, delete-orphan'))
+
+    def to_dict(self, include_result=True):
+        data = {
+            'id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'source': self.source,
+            'extractor': self.extractor,
+            'progress': {
+                'total': self.chunks_total,
+                'done': self.chunks_done,
+                'cached': self.chunks_cached,
+            },
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+
+class ExtractionCache(db.Model):
+    """Extraction result of one chunk, keyed by a hash of the extractor and the chunk's text"""
+    __tablename__ = 'extraction_cache'
+
+    key = db.Column(db.String(64), primary_key=True)
+    result = db.Column(JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
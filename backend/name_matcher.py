@@ -0,0 +1,221 @@
+"""
+Fuzzy character-name matching against a per-project trigram index.
+
+The dashboard resolves extracted names through this index. Scores are
+1 - levenshtein(a, b) / max(len(a), len(b)) on case-folded names. Instead of
+running the DP against every character, each project keeps an inverted index
+from padded trigrams to names. A name within edit distance d of the query
+must share at least (grams - 3 * d) trigrams with it. Shared counts for the
+whole cast come from one bincount over the query's postings lists, and only
+names that clear that count (and whose length is in range) are verified with
+a banded Levenshtein. Indexes are cached per project and rebuilt when its
+version moves.
+"""
+
+import bisect
+import re
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from sqlalchemy import select
+from models import db, Character
+from cache import TTLCache
+
+GRAM = 3
+DEFAULT_THRESHOLD = 0.7
+DEFAULT_LIMIT = 3
+MAX_LIMIT = 20
+MAX_QUERIES = 500
+
+_whitespace = re.compile(r'\s+')
+
+
+class MatchQueryError(ValueError):
+    """Raised for invalid match request parameters"""
+
+
+def normalize(name):
+    """Case-fold and collapse whitespace"""
+    return _whitespace.sub(' ', name).strip().casefold()
+
+
+def trigrams(text):
+    """Padded trigrams of text, numbered per occurrence so repeats count as a multiset"""
+    padded = '\0' * (GRAM - 1) + text + '\0' * (GRAM - 1)
+    seen = Counter()
+    grams = []
+    for i in range(len(padded) - GRAM + 1):
+        gram = padded[i:i + GRAM]
+        grams.append((gram, seen[gram]))
+        seen[gram] += 1
+    return grams
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """Edit distance between a and b, or None if it exceeds max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        # Only cells within max_distance of the diagonal can stay under the bound
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        if low > 1:
+            current[low - 1] = max_distance + 1
+        for j in range(low, high + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        for j in range(high + 1, len(b) + 1):
+            current[j] = max_distance + 1
+        if row_min > max_distance:
+            return None
+        previous = current
+    distance = previous[len(b)]
+    return distance if distance <= max_distance else None
+
+
+def similarity(a, b):
+    """1 - normalized edit distance of two already-normalized names"""
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    distance = bounded_levenshtein(a, b, longest)
+    return 1.0 - distance / longest
+
+
+class NameIndex:
+    """Trigram postings over one project's character names at one version"""
+
+    def __init__(self, project_id, version, characters):
+        self.project_id = project_id
+        self.version = version
+        self.ids = []
+        self.names = []
+        self.keys = []
+        self.exact = defaultdict(list)
+        postings = defaultdict(list)
+
+        for char_id, name in characters:
+            key = normalize(name or '')
+            slot = len(self.ids)
+            self.ids.append(char_id)
+            self.names.append(name)
+            self.keys.append(key)
+            self.exact[key].append(slot)
+            for gram in trigrams(key):
+                postings[gram].append(slot)
+
+        self.postings = {gram: np.asarray(slots, dtype=np.int32) for gram, slots in postings.items()}
+        self.lengths = np.fromiter((len(key) for key in self.keys), dtype=np.int64, count=len(self.keys))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _candidates(self, key, threshold):
+        """Slots that can possibly reach threshold against key, most shared trigrams first.
+
+        Returns (slots, shared trigram counts) for names whose length and
+        shared count are compatible with the threshold.
+        """
+        grams = trigrams(key)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        shared = np.bincount(np.concatenate(hits), minlength=len(self)) if hits else np.zeros(len(self), dtype=np.int64)
+
+        longest = np.maximum(self.lengths, len(key))
+        max_distance = np.floor((1 - threshold) * longest + 1e-9).astype(np.int64)
+        possible = (np.abs(self.lengths - len(key)) <= max_distance) & (shared >= longest + GRAM - 1 - GRAM * max_distance)
+        slots = np.nonzero(possible)[0]
+        slots = slots[np.argsort(-shared[slots], kind='stable')]
+        return slots.tolist(), shared[slots].tolist()
+
+    def match(self, name, limit=DEFAULT_LIMIT, threshold=DEFAULT_THRESHOLD):
+        """Top matches for name as dicts with id, name and score, best first"""
+        key = normalize(name)
+        if not key or not len(self):
+            return []
+        exact = self.exact.get(key, ())
+        if len(exact) >= limit:
+            exact = sorted(exact, key=lambda slot: (self.names[slot], slot))
+            return [{'id': self.ids[slot], 'name': self.names[slot], 'score': 1.0} for slot in exact[:limit]]
+
+        scored = []
+        best_scores = []
+        bar = threshold
+        for slot, shared in zip(*self._candidates(key, threshold)):
+            # Once limit matches are known, the rest must tie or beat the worst of them
+            longest = max(len(key), len(self.keys[slot]))
+            max_distance = int((1 - bar) * longest + 1e-9)
+            if shared < longest + GRAM - 1 - GRAM * max_distance:
+                continue
+            distance = bounded_levenshtein(key, self.keys[slot], max_distance)
+            if distance is None:
+                continue
+            score = 1.0 - distance / longest
+            if score >= bar:
+                scored.append((-score, self.names[slot], slot))
+                bisect.insort(best_scores, score)
+                if len(best_scores) >= limit:
+                    bar = max(bar, best_scores[-limit])
+
+        scored.sort()
+        return [
+            {'id': self.ids[slot], 'name': self.names[slot], 'score': round(-negative, 4)}
+            for negative, _, slot in scored[:limit]
+        ]
+
+
+def build_index(project_id, version):
+    """Load a project's character names with one query and index them"""
+    characters = Character.__table__
+    rows = db.session.connection().execute(
+        select(characters.c.id, characters.c.name)
+        .where(characters.c.project_id == project_id)
+        .order_by(characters.c.id)
+    ).all()
+    return NameIndex(project_id, version, rows)
+
+
+class NameIndexCache:
+    """Per-project name indexes keyed by project id, rebuilt when the version moves"""
+
+    def __init__(self, maxsize=64, ttl=3600.0):
+        self.indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, project_id, version):
+        index = self.indexes.get(project_id)
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = self.indexes.get(project_id)
+            if index is None or index.version != version:
+                index = build_index(project_id, version)
+                self.indexes.set(project_id, index)
+        return index
+
+    def stats(self):
+        return self.indexes.stats()
+
+
+def parse_match_request(data):
+    """Validate a match request body and return (names, limit, threshold)"""
+    names = data.get('names')
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise MatchQueryError('names must be a list of strings')
+    if len(names) > MAX_QUERIES:
+        raise MatchQueryError(f'At most {MAX_QUERIES} names can be matched per request')
+
+    limit = data.get('limit', DEFAULT_LIMIT)
+    threshold = data.get('threshold', DEFAULT_THRESHOLD)
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_LIMIT:
+        raise MatchQueryError(f'limit must be an integer between 1 and {MAX_LIMIT}')
+    if not isinstance(threshold, (int, float)) or isinstance(threshold, bool) or not 0 < threshold <= 1:
+        raise MatchQueryError('threshold must be a number in (0, 1]')
+    return names, limit, float(threshold)
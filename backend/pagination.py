@@ -0,0 +1,130 @@
+"""
+Keyset pagination and streamed listings.
+
+List endpoints accept:
+    ?limit=N&after=ID   one page of rows with id > ID, ordered by id. The body is
+                        still a plain JSON list; the cursor for the next page is
+                        sent in the X-Next-Cursor and Link headers.
+    ?stream=ndjson      every row as one JSON object per line
+    ?stream=json        every row as a chunked JSON array
+Streams read through a server-side cursor in batches, so the full list is
+never held in memory.
+"""
+
+from collections import namedtuple
+from urllib.parse import urlencode
+from flask import Response, current_app, request, stream_with_context
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+PageArgs = namedtuple('PageArgs', ['limit', 'after', 'stream'])
+
+
+class PaginationError(ValueError):
+    """Raised for invalid limit/after/stream query parameters"""
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+
+
+def parse_page_args(args):
+    """Read limit/after/stream from request args"""
+    limit = _int_arg(args, 'limit')
+    after = _int_arg(args, 'after')
+    stream = args.get('stream') or None
+
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise PaginationError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise PaginationError(f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+    if limit is None and after is not None and stream is None:
+        limit = DEFAULT_PAGE_SIZE
+
+    return PageArgs(limit=limit, after=after, stream=stream)
+
+
+def page_tag(page):
+    """Short ETag part identifying a page or stream ('' for the full list)"""
+    parts = []
+    if page.stream:
+        parts.append(f's{page.stream}')
+    if page.limit is not None:
+        parts.append(f'l{page.limit}')
+    if page.after is not None:
+        parts.append(f'a{page.after}')
+    return ''.join(parts)
+
+
+def paged_response(query, id_column, serialize, page):
+    """Return one keyset page of query as a JSON list with next-page headers"""
+    if page.after is not None:
+        query = query.filter(id_column > page.after)
+    rows = query.order_by(id_column).limit(page.limit + 1).all()
+
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    response = current_app.response_class(
+        current_app.json.dumps([serialize(row) for row in rows]),
+        mimetype='application/json'
+    )
+
+    if has_more:
+        next_cursor = rows[-1].id
+        args = request.args.to_dict()
+        args.update(limit=page.limit, after=next_cursor)
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def _iter_rows(query, id_column, after):
+    if after is not None:
+        query = query.filter(id_column > after)
+    query = query.order_by(id_column).yield_per(STREAM_BATCH_SIZE)
+    for row in query:
+        yield row
+
+
+def _chunked(pieces, size=100):
+    """Join pieces into one chunk per size items to keep writes reasonably large"""
+    buffer = []
+    for piece in pieces:
+        buffer.append(piece)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_response(query, id_column, serialize, page):
+    """Stream every row of query (after page.after) as NDJSON or a chunked JSON array"""
+    dumps = current_app.json.dumps
+
+    def generate_ndjson():
+        for row in _iter_rows(query, id_column, page.after):
+            yield dumps(serialize(row)) + '\n'
+
+    def generate_json():
+        yield '['
+        separator = ''
+        for row in _iter_rows(query, id_column, page.after):
+            yield separator + dumps(serialize(row))
+            separator = ','
+        yield ']'
+
+    generate = generate_ndjson if page.stream == 'ndjson' else generate_json
+    return Response(stream_with_context(_chunked(generate())), mimetype=STREAM_FORMATS[page.stream])
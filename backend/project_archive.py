@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Export a project to, or restore one from, a streaming NDJSON archive.
+
+Archives ending in .gz are gzip-compressed on export; imports detect
+compression on their own.
+
+Usage:
+    python project_archive.py export --project-id 1 -o eldoria.ndjson.gz
+    python project_archive.py export --email test@example.com --project Eldoria -o - > eldoria.ndjson
+    python project_archive.py import eldoria.ndjson.gz --email other@example.com --name "Eldoria (copy)"
+    python project_archive.py import eldoria.ndjson.gz --create-owner
+"""
+
+import argparse
+import sys
+import time
+from app import app
+from models import User, Project
+from archive import ArchiveError, export_project, gzip_stream, import_archive, open_archive
+
+
+def find_project(args):
+    if args.project_id:
+        return Project.query.get(args.project_id)
+    user = User.query.filter_by(email=args.email).first()
+    return Project.query.filter_by(user_id=user.id, name=args.project).first() if user else None
+
+
+def export_command(args):
+    with app.app_context():
+        project = find_project(args)
+        if not project:
+            print("❌ Project not found.", file=sys.stderr)
+            sys.exit(1)
+
+        start = time.perf_counter()
+        chunks = export_project(project.id, include_credentials=args.include_credentials)
+        if args.output.endswith('.gz'):
+            chunks = gzip_stream(chunks)
+
+        out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+        print(f"✓ Exported '{project.name}' ({written / 1024:.0f} KiB) in {time.perf_counter() - start:.2f}s",
+              file=sys.stderr)
+
+
+def import_command(args):
+    with app.app_context():
+        user_id = None
+        if args.email:
+            user = User.query.filter_by(email=args.email).first()
+            if not user:
+                print(f"❌ User {args.email} not found.", file=sys.stderr)
+                sys.exit(1)
+            user_id = user.id
+
+        stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        start = time.perf_counter()
+        try:
+            summary = import_archive(open_archive(stream), user_id=user_id, project_name=args.name,
+                                     create_owner=args.create_owner)
+        except ArchiveError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        print(f"✓ Restored project {summary['project_id']} in {time.perf_counter() - start:.2f}s")
+        print(f"  Characters: {summary['characters']}")
+        print(f"  Relationships: {summary['relationships']} ({summary['skipped_relationships']} skipped)")
+        print(f"  Relationship types created: {summary['relationship_types']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or restore a project archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='Write a project archive')
+    export_parser.add_argument('--project-id', type=int, help='Project id')
+    export_parser.add_argument('--email', help='Owner of the project (with --project)')
+    export_parser.add_argument('--project', help='Project name (with --email)')
+    export_parser.add_argument('-o', '--output', required=True, help="Archive path ('.gz' to compress), or '-' for stdout")
+    export_parser.add_argument('--include-credentials', action='store_true',
+                               help="Include the owner's password hash so --create-owner can recreate the account")
+    export_parser.set_defaults(run=export_command)
+
+    import_parser = commands.add_parser('import', help='Create a new project from an archive')
+    import_parser.add_argument('path', help="Archive path, or '-' for stdin")
+    import_parser.add_argument('--email', help="Owner of the new project (default: the archive's owner)")
+    import_parser.add_argument('--name', help='Name for the new project (default: the archived name)')
+    import_parser.add_argument('--create-owner', action='store_true',
+                               help="Create the archive's owner if missing (needs --include-credentials on export)")
+    import_parser.set_defaults(run=import_command)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
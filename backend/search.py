@@ -0,0 +1,567 @@
+"""
+Full-text search over characters, relationships and the documents/ corpus.
+
+On SQLite the index is an FTS5 virtual table living in the same database,
+ranked with bm25() and highlighted with snippet(). Other databases fall back
+to an in-process BM25 inverted index with the same interface.
+
+The index is kept up to date incrementally: session flush hooks collect the
+ids of characters and relationships a transaction touches and re-index just
+those rows (the FTS5 table is written in the same transaction), and Core
+bulk writes such as importer.import_world call record_changes() directly.
+Markdown files come from the document corpus (documents.py), which notices
+changes to the directory; a search re-indexes the files whose mtime changed
+whenever the corpus's generation has moved since the last one.
+"""
+
+import heapq
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter, defaultdict
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from models import db, Project, Character, CharacterRelationship
+
+KINDS = ('character', 'relationship', 'document')
+MARK_OPEN, MARK_CLOSE, ELLIPSIS = '<mark>', '</mark>', '…'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+IN_CHUNK = 500
+
+characters_table = Character.__table__
+relationships_table = CharacterRelationship.__table__
+
+
+def tokenize(value):
+    """Lowercased word tokens of a string"""
+    return WORD_RE.findall((value or '').lower())
+
+
+def make_snippet(value, terms, width=160):
+    """Window of value around the first query term, with matches wrapped in <mark>"""
+    value = value or ''
+    if not terms:
+        return value[:width] + (ELLIPSIS if len(value) > width else '')
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(t) for t in terms) + r')\w*', re.IGNORECASE)
+    match = pattern.search(value)
+    start = max(0, match.start() - width // 3) if match else 0
+    end = min(len(value), start + width)
+    window = pattern.sub(lambda m: f'{MARK_OPEN}{m.group(0)}{MARK_CLOSE}', value[start:end])
+    return (ELLIPSIS if start else '') + window + (ELLIPSIS if end < len(value) else '')
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class InvertedIndex:
+    """BM25 inverted index over small multi-field records.
+
+    Records are added and removed individually, so the index can be kept in
+    sync incrementally. Field weights scale term frequencies per field.
+    """
+
+    def __init__(self, field_weights, k1=1.2, b=0.75):
+        self.field_weights = field_weights
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.records = {}
+        self._total_length = 0.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, key, fields, payload=None):
+        """Index (or re-index) a record; fields maps field name -> text"""
+        self.remove(key)
+        weighted = Counter()
+        length = 0.0
+        for field, weight in self.field_weights.items():
+            tokens = tokenize(fields.get(field))
+            length += weight * len(tokens)
+            for token in tokens:
+                weighted[token] += weight
+        for token, tf in weighted.items():
+            self.postings[token][key] = tf
+        self.lengths[key] = length
+        self.records[key] = (fields, payload)
+        self._total_length += length
+
+    def remove(self, key):
+        record = self.records.pop(key, None)
+        if record is None:
+            return
+        fields, _ = record
+        for token in {t for field in self.field_weights for t in tokenize(fields.get(field))}:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[token]
+        self._total_length -= self.lengths.pop(key, 0.0)
+
+    def _matching(self, term, prefix):
+        if not prefix:
+            return [term] if term in self.postings else []
+        return [t for t in self.postings if t.startswith(term)]
+
+    def search(self, query, limit=20, accept=None, match_all=True):
+        """Return [(score, key)] for records containing every query term (last term as prefix).
+
+        With match_all=False a record needs any one of the (whole) terms and
+        its score sums over those it contains, for ranking by natural-language
+        queries rather than search-box input. Terms in more than half of the
+        records ("the", "of") are then skipped unless no other term is left:
+        their idf is near zero and their postings are the longest.
+        """
+        terms = tokenize(query)
+        n = len(self.records)
+        if not match_all:
+            terms = list(dict.fromkeys(terms))
+            rare = [term for term in terms if len(self.postings.get(term, ())) <= n / 2]
+            terms = rare or terms
+        if not terms or not self.records:
+            return []
+        average = (self._total_length / n) or 1.0
+
+        scores = None
+        for position, term in enumerate(terms):
+            term_scores = defaultdict(float)
+            for token in self._matching(term, prefix=match_all and position == len(terms) - 1):
+                postings = self.postings[token]
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[key] / average)
+                    term_scores[key] += idf * tf * (self.k1 + 1) / norm
+            if scores is None:
+                scores = term_scores
+            elif not match_all:
+                for key, value in term_scores.items():
+                    scores[key] += value
+            else:
+                scores = {key: scores[key] + value for key, value in term_scores.items() if key in scores}
+            if not scores and match_all:
+                return []
+
+        return heapq.nsmallest(
+            limit,
+            ((score, key) for key, score in scores.items() if accept is None or accept(key)),
+            key=lambda item: (-item[0], str(item[1]))
+        )
+
+
+def load_characters(conn, ids):
+    """(id, project_id, name, description) rows for character ids"""
+    rows = []
+    for chunk in _chunks(ids):
+        rows.extend(conn.execute(
+            select(characters_table.c.id, characters_table.c.project_id,
+                   characters_table.c.name, characters_table.c.description)
+            .where(characters_table.c.id.in_(chunk))
+        ).all())
+    return rows
+
+
+def load_relationships(conn, ids=None, character_ids=None, project_id=None):
+    """(id, project_id, source name, target name, label) rows for relationship ids,
+    relationships touching character_ids, or every relationship of a project"""
+    source = characters_table.alias('source')
+    target = characters_table.alias('target')
+    query = select(
+        relationships_table.c.id, relationships_table.c.project_id,
+        source.c.name, target.c.name, relationships_table.c.label
+    ).join(source, source.c.id == relationships_table.c.source_character_id
+    ).join(target, target.c.id == relationships_table.c.target_character_id)
+
+    if project_id is not None:
+        return conn.execute(query.where(relationships_table.c.project_id == project_id)).all()
+
+    rows = []
+    for chunk in _chunks(ids or ()):
+        rows.extend(conn.execute(query.where(relationships_table.c.id.in_(chunk))).all())
+    for chunk in _chunks(character_ids or ()):
+        rows.extend(conn.execute(query.where(
+            relationships_table.c.source_character_id.in_(chunk)
+            | relationships_table.c.target_character_id.in_(chunk)
+        )).all())
+    return rows
+
+
+def relationship_title(source_name, target_name):
+    return f'{source_name} → {target_name}'
+
+
+def _read_text(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def _document_title(relative):
+    return os.path.splitext(os.path.basename(relative))[0]
+
+
+class Fts5Backend:
+    """Search index stored in an SQLite FTS5 table next to the data.
+
+    Row ids are derived from the source row so updates are point writes:
+    2*id for characters, 2*id+1 for relationships and a negative path hash
+    for documents.
+    """
+
+    name = 'fts5'
+    TABLE = 'search_index'
+
+    def __init__(self):
+        self._documents = {}
+
+    @classmethod
+    def create(cls, conn):
+        """Create the FTS5 table if needed; returns (backend, created) or None if FTS5 is unavailable"""
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': cls.TABLE}
+        ).first()
+        if exists:
+            return cls(), False
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {cls.TABLE} USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, project_id UNINDEXED, title, body, "
+                "tokenize = 'porter unicode61')"
+            ))
+        except OperationalError:
+            return None
+        return cls(), True
+
+    def _delete(self, conn, rowids):
+        for chunk in _chunks(rowids):
+            conn.execute(text(f'DELETE FROM {self.TABLE} WHERE rowid IN ({",".join(str(int(r)) for r in chunk)})'))
+
+    def _insert(self, conn, rows):
+        if rows:
+            conn.execute(text(
+                f'INSERT INTO {self.TABLE} (rowid, kind, ref_id, project_id, title, body) '
+                'VALUES (:rowid, :kind, :ref_id, :project_id, :title, :body)'
+            ), rows)
+
+    def apply(self, conn, characters, relationships, deleted_characters, deleted_relationships, session=None):
+        self._delete(conn, [2 * cid for cid in deleted_characters] + [2 * rid + 1 for rid in deleted_relationships])
+        self._delete(conn, [2 * row[0] for row in characters] + [2 * row[0] + 1 for row in relationships])
+        self._insert(conn, [
+            {'rowid': 2 * cid, 'kind': 'character', 'ref_id': cid, 'project_id': pid, 'title': name, 'body': description or ''}
+            for cid, pid, name, description in characters
+        ] + [
+            {'rowid': 2 * rid + 1, 'kind': 'relationship', 'ref_id': rid, 'project_id': pid,
+             'title': relationship_title(source, target), 'body': label or ''}
+            for rid, pid, source, target, label in relationships
+        ])
+
+    def backfill(self, conn):
+        """Index every existing character and relationship (used when the table is first created)"""
+        conn.execute(text(
+            f"INSERT INTO {self.TABLE} (rowid, kind, ref_id, project_id, title, body) "
+            "SELECT 2 * id, 'character', id, project_id, name, coalesce(description, '') FROM characters"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {self.TABLE} (rowid, kind, ref_id, project_id, title, body) "
+            "SELECT 2 * r.id + 1, 'relationship', r.id, r.project_id, s.name || ' → ' || t.name, coalesce(r.label, '') "
+            "FROM character_relationships r "
+            "JOIN characters s ON s.id = r.source_character_id "
+            "JOIN characters t ON t.id = r.target_character_id"
+        ))
+
+    @staticmethod
+    def _document_rowid(relative):
+        return -(zlib.crc32(relative.encode('utf-8')) + 1)
+
+    def sync_documents(self, conn, found, first_sync):
+        if first_sync:
+            conn.execute(text(f'DELETE FROM {self.TABLE} WHERE rowid < 0'))
+            self._documents = {}
+        changed = [rel for rel, (mtime, _) in found.items() if self._documents.get(rel) != mtime]
+        removed = [rel for rel in self._documents if rel not in found]
+        self._delete(conn, [self._document_rowid(rel) for rel in changed + removed])
+        self._insert(conn, [
+            {'rowid': self._document_rowid(rel), 'kind': 'document', 'ref_id': rel, 'project_id': None,
+             'title': _document_title(rel), 'body': _read_text(found[rel][1])}
+            for rel in changed
+        ])
+        for rel in removed:
+            self._documents.pop(rel, None)
+        for rel in changed:
+            self._documents[rel] = found[rel][0]
+
+    @staticmethod
+    def _match_expression(query):
+        terms = tokenize(query)
+        if not terms:
+            return None
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, conn, project_id, query, kinds, limit):
+        expression = self._match_expression(query)
+        if expression is None:
+            return []
+        kind_list = ', '.join(f"'{kind}'" for kind in kinds)
+        rows = conn.execute(text(
+            f"SELECT kind, ref_id, project_id, title, "
+            f"snippet({self.TABLE}, -1, :open, :close, :ellipsis, 24) AS snippet, "
+            f"bm25({self.TABLE}, 0, 0, 0, 5.0, 1.0) AS rank "
+            f"FROM {self.TABLE} WHERE {self.TABLE} MATCH :expression "
+            f"AND kind IN ({kind_list}) AND (project_id = :project_id OR project_id IS NULL) "
+            f"ORDER BY rank LIMIT :limit"
+        ), {
+            'open': MARK_OPEN, 'close': MARK_CLOSE, 'ellipsis': ELLIPSIS,
+            'expression': expression, 'project_id': project_id, 'limit': limit
+        }).all()
+        return [
+            {'kind': kind, 'id': ref_id, 'title': title, 'snippet': snippet, 'score': round(-rank, 6)}
+            for kind, ref_id, _, title, snippet, rank in rows
+        ]
+
+
+class MemoryBackend:
+    """Portable in-process BM25 index for databases without FTS5.
+
+    Each project's index remembers the project version it reflects; writes
+    from this process are applied incrementally after commit, and a version
+    that moved elsewhere (another worker) triggers a rebuild of that project.
+    """
+
+    name = 'memory'
+    FIELDS = {'title': 5.0, 'body': 1.0}
+
+    def __init__(self):
+        self.projects = {}
+        self.versions = {}
+        self.documents = InvertedIndex(self.FIELDS)
+        self._document_mtimes = {}
+        self._lock = threading.RLock()
+
+    def _project_index(self, project_id):
+        index = self.projects.get(project_id)
+        if index is None:
+            index = self.projects[project_id] = InvertedIndex(self.FIELDS)
+        return index
+
+    def _apply_rows(self, characters, relationships, deleted_characters, deleted_relationships, versions):
+        with self._lock:
+            for index in self.projects.values():
+                for cid in deleted_characters:
+                    index.remove(('character', cid))
+                for rid in deleted_relationships:
+                    index.remove(('relationship', rid))
+            for cid, pid, name, description in characters:
+                if pid in self.projects:
+                    self.projects[pid].add(('character', cid), {'title': name, 'body': description})
+            for rid, pid, source, target, label in relationships:
+                if pid in self.projects:
+                    self.projects[pid].add(('relationship', rid), {'title': relationship_title(source, target), 'body': label})
+            for pid, version in versions.items():
+                if pid in self.projects:
+                    self.versions[pid] = version
+
+    def apply(self, conn, characters, relationships, deleted_characters, deleted_relationships, session=None):
+        project_ids = {row[1] for row in characters} | {row[1] for row in relationships}
+        versions = dict(conn.execute(
+            select(Project.__table__.c.id, Project.__table__.c.version)
+            .where(Project.__table__.c.id.in_(project_ids))
+        ).all()) if project_ids else {}
+        changes = (characters, relationships, deleted_characters, deleted_relationships, versions)
+        if session is None:
+            self._apply_rows(*changes)
+        else:
+            # Only visible to other requests once the transaction commits
+            session.info.setdefault('search_memory_changes', []).append(changes)
+
+    def after_commit(self, session):
+        for changes in session.info.pop('search_memory_changes', ()):
+            self._apply_rows(*changes)
+
+    def _rebuild_project(self, conn, project_id, version):
+        index = InvertedIndex(self.FIELDS)
+        for cid, name, description in conn.execute(
+            select(characters_table.c.id, characters_table.c.name, characters_table.c.description)
+            .where(characters_table.c.project_id == project_id)
+        ):
+            index.add(('character', cid), {'title': name, 'body': description})
+        for rid, _, source, target, label in load_relationships(conn, project_id=project_id):
+            index.add(('relationship', rid), {'title': relationship_title(source, target), 'body': label})
+        with self._lock:
+            self.projects[project_id] = index
+            self.versions[project_id] = version
+
+    def sync_documents(self, conn, found, first_sync):
+        with self._lock:
+            for rel in [rel for rel in self._document_mtimes if rel not in found]:
+                self.documents.remove(('document', rel))
+                del self._document_mtimes[rel]
+            for rel, (mtime, path) in found.items():
+                if self._document_mtimes.get(rel) != mtime:
+                    self.documents.add(('document', rel), {'title': _document_title(rel), 'body': _read_text(path)})
+                    self._document_mtimes[rel] = mtime
+
+    def search(self, conn, project_id, query, kinds, limit):
+        version = conn.execute(
+            select(Project.__table__.c.version).where(Project.__table__.c.id == project_id)
+        ).scalar()
+        if project_id not in self.projects or self.versions.get(project_id) != version:
+            self._rebuild_project(conn, project_id, version)
+
+        accept = lambda key: key[0] in kinds
+        terms = tokenize(query)
+        hits = []
+        with self._lock:
+            for index in (self.projects[project_id], self.documents):
+                for score, key in index.search(query, limit, accept):
+                    fields, _ = index.records[key]
+                    snippet = make_snippet(fields.get('body'), terms)
+                    if MARK_OPEN not in snippet:
+                        snippet = make_snippet(fields['title'], terms)
+                    hits.append({
+                        'kind': key[0], 'id': key[1], 'title': fields['title'],
+                        'snippet': snippet, 'score': round(score, 6)
+                    })
+        hits.sort(key=lambda hit: -hit['score'])
+        return hits[:limit]
+
+
+class SearchService:
+    """Chooses a backend on first use and routes index updates and queries to it"""
+
+    def __init__(self, corpus=None):
+        self.corpus = corpus
+        self.backend = None
+        self._synced_generation = None
+        self._lock = threading.Lock()
+
+    def ensure_backend(self, conn):
+        if self.backend is None:
+            with self._lock:
+                if self.backend is None:
+                    created = Fts5Backend.create(conn) if conn.dialect.name == 'sqlite' else None
+                    if created is None:
+                        self.backend = MemoryBackend()
+                    else:
+                        backend, is_new = created
+                        if is_new:
+                            backend.backfill(conn)
+                        self.backend = backend
+        return self.backend
+
+    def record_changes(self, session, character_ids=(), relationship_ids=(),
+                       deleted_characters=(), deleted_relationships=(), renamed_characters=()):
+        """Re-index the given rows inside the session's current transaction"""
+        conn = session.connection()
+        backend = self.ensure_backend(conn)
+        characters = load_characters(conn, set(character_ids) - set(deleted_characters))
+        relationships = load_relationships(
+            conn, ids=set(relationship_ids) - set(deleted_relationships), character_ids=renamed_characters
+        )
+        deferred = session if isinstance(backend, MemoryBackend) else None
+        backend.apply(conn, characters, relationships, set(deleted_characters), set(deleted_relationships), deferred)
+
+    def sync_documents(self):
+        """Re-index markdown files whose mtime changed since the last sync"""
+        generation, found = (self.corpus.generation, None) if self.corpus is not None else (0, {})
+        if generation == self._synced_generation:
+            return
+        if self.corpus is not None:
+            generation, found = self.corpus.file_index()
+        with db.engine.begin() as conn:
+            backend = self.ensure_backend(conn)
+            backend.sync_documents(conn, found, first_sync=self._synced_generation is None)
+        self._synced_generation = generation
+
+    def search(self, project_id, query, kinds=KINDS, limit=20):
+        self.sync_documents()
+        conn = db.session.connection()
+        return self.ensure_backend(conn).search(conn, project_id, query, kinds, limit)
+
+    def stats(self):
+        return {'backend': self.backend.name if self.backend else None}
+
+
+_service = None
+
+
+def record_changes(session, **changes):
+    """Re-index rows written outside the ORM (no-op when search isn't installed)"""
+    if _service is not None:
+        _service.record_changes(session, **changes)
+
+
+def _empty_pending():
+    return {
+        'characters': set(), 'relationships': set(),
+        'deleted_characters': set(), 'deleted_relationships': set(), 'renamed': set()
+    }
+
+
+def install(app, corpus=None):
+    """Create the app's search service and hook incremental indexing into flushes"""
+    global _service
+    service = _service = SearchService(corpus=corpus)
+    app.extensions['search'] = service
+
+    @event.listens_for(db.session, 'before_flush')
+    def collect_search_changes(session, flush_context, instances):
+        pending = session.info.setdefault('search_pending', _empty_pending())
+        conn = None
+        for obj in session.deleted:
+            if isinstance(obj, Character) and obj.id is not None:
+                pending['deleted_characters'].add(obj.id)
+                # Their relationships disappear with them; note the ids while they still exist
+                conn = conn or session.connection()
+                pending['deleted_relationships'].update(row[0] for row in conn.execute(
+                    select(relationships_table.c.id).where(
+                        (relationships_table.c.source_character_id == obj.id)
+                        | (relationships_table.c.target_character_id == obj.id)
+                    )
+                ))
+            elif isinstance(obj, CharacterRelationship) and obj.id is not None:
+                pending['deleted_relationships'].add(obj.id)
+        for obj in session.dirty:
+            if isinstance(obj, Character) and session.is_modified(obj, include_collections=False):
+                pending['characters'].add(obj.id)
+                if inspect(obj).attrs.name.history.has_changes():
+                    pending['renamed'].add(obj.id)
+            elif isinstance(obj, CharacterRelationship) and session.is_modified(obj, include_collections=False):
+                pending['relationships'].add(obj.id)
+
+    @event.listens_for(db.session, 'after_flush')
+    def apply_search_changes(session, flush_context):
+        pending = session.info.pop('search_pending', None) or _empty_pending()
+        for obj in session.new:
+            if isinstance(obj, Character):
+                pending['characters'].add(obj.id)
+            elif isinstance(obj, CharacterRelationship):
+                pending['relationships'].add(obj.id)
+        if any(pending.values()):
+            service.record_changes(
+                session,
+                character_ids=pending['characters'],
+                relationship_ids=pending['relationships'],
+                deleted_characters=pending['deleted_characters'],
+                deleted_relationships=pending['deleted_relationships'],
+                renamed_characters=pending['renamed']
+            )
+
+    @event.listens_for(db.session, 'after_commit')
+    def publish_search_changes(session):
+        if isinstance(service.backend, MemoryBackend):
+            service.backend.after_commit(session)
+
+    @event.listens_for(db.session, 'after_soft_rollback')
+    def discard_search_changes(session, previous_transaction):
+        session.info.pop('search_pending', None)
+        session.info.pop('search_memory_changes', None)
+
+    return service
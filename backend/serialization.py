@@ -0,0 +1,355 @@
+"""
+Fast JSON serialization.
+
+Two pieces:
+
+- A pluggable encoder. JSON_ENCODER=orjson (the default when the package is
+  installed) encodes every jsonify() response with orjson; JSON_ENCODER=json
+  keeps the standard library. Output matches Flask's provider either way
+  (sorted keys, datetimes as HTTP dates).
+
+- A row writer for the big list and graph endpoints. It selects plain
+  columns through Core and writes each row straight into a JSON template,
+  with no ORM objects and no intermediate dicts. JSON and DateTime columns
+  are read as their stored text, so the per-row json.loads() and datetime
+  parsing are skipped too. The documents match Character.to_dict() and
+  CharacterRelationship.to_dict(), except that keys come in model order.
+  With a fieldset (see fieldsets.py) only the requested keys' columns are
+  selected.
+"""
+
+import json
+from json.encoder import encode_basestring
+from sqlalchemy import String, select, type_coerce
+from flask.json.provider import DefaultJSONProvider
+from models import Character, CharacterRelationship
+from fieldsets import needs_names, summary_expression
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+characters_table = Character.__table__
+relationships_table = CharacterRelationship.__table__
+
+# Falsy JSON values, which to_dict() turns into {} ('metadata': extra_data or {})
+EMPTY_JSON = {None, '', 'null', '{}', '[]', '""', '0', '0.0', 'false'}
+
+
+class Encoder:
+    """Encodes values to JSON bytes"""
+
+    name = 'json'
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+    def value(self, value):
+        """A scalar (str, int, float, bool or None)"""
+        if isinstance(value, str):
+            return encode_basestring(value).encode('utf-8')
+        return json.dumps(value).encode('utf-8')
+
+
+class OrjsonEncoder(Encoder):
+    name = 'orjson'
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+
+    def value(self, value):
+        return orjson.dumps(value)
+
+
+def make_encoder(name='auto'):
+    """Encoder named 'json', 'orjson', or 'auto' (orjson when installed)"""
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_ENCODER=orjson needs the orjson package (pip install orjson)')
+        return OrjsonEncoder()
+    if name == 'json':
+        return Encoder()
+    raise ValueError(f"JSON_ENCODER must be 'auto', 'orjson' or 'json', not {name!r}")
+
+
+_encoder = make_encoder()
+
+
+def use_encoder(name):
+    """Switch the encoder used by the JSON provider and the row writers"""
+    global _encoder
+    _encoder = make_encoder(name)
+    return _encoder
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with the configured encoder"""
+
+    def dumps(self, obj, **kwargs):
+        # response() always passes separators; the encoders are compact anyway
+        kwargs.pop('separators', None)
+        if kwargs:
+            # Pretty-printing (debug mode) and other options stay with the standard library
+            return super().dumps(obj, **kwargs)
+        return _encoder.dumps(obj, default=self.default, sort_keys=self.sort_keys).decode('utf-8')
+
+
+def _raw(column):
+    """Select a column without its result processor (stored JSON text, stored datetime text)"""
+    return type_coerce(column, String).label(column.name)
+
+
+def _datetime(value):
+    if value is None:
+        return b'null'
+    if isinstance(value, str):
+        # SQLite stores 'YYYY-MM-DD HH:MM:SS.ffffff'; isoformat() omits zero microseconds
+        if value.endswith('.000000'):
+            value = value[:-7]
+        return b'"' + value.replace(' ', 'T', 1).encode('utf-8') + b'"'
+    return b'"' + value.isoformat().encode('utf-8') + b'"'
+
+
+def _metadata(value, enc):
+    if isinstance(value, str) or value is None:
+        return b'{}' if value in EMPTY_JSON else value.encode('utf-8')
+    # Drivers that decode JSON themselves (e.g. psycopg2) hand back objects
+    return enc.dumps(value or {})
+
+
+CHARACTER_COLUMNS = [
+    characters_table.c.id, characters_table.c.project_id, characters_table.c.name,
+    characters_table.c.description, characters_table.c.position_x, characters_table.c.position_y,
+    characters_table.c.bg_color, characters_table.c.border_color, characters_table.c.text_color,
+    characters_table.c.icon_color, _raw(characters_table.c.extra_data),
+    _raw(characters_table.c.created_at), _raw(characters_table.c.updated_at),
+]
+
+CHARACTER_TEMPLATE = (
+    b'{"id":%d,"project_id":%d,"name":%s,"description":%s,"position":%s,'
+    b'"colors":{"bg":%s,"border":%s,"text":%s,"icon":%s},"metadata":%s,"created_at":%s,"updated_at":%s}'
+)
+
+RELATIONSHIP_TEMPLATE = (
+    b'{"id":%d,"project_id":%d,"source_character_id":%d,"target_character_id":%d,'
+    b'"source_character_name":%s,"target_character_name":%s,"label":%s,"relationship_type_id":%s,'
+    b'"metadata":%s,"created_at":%s}'
+)
+
+
+def _int(enc, value):
+    return b'%d' % value
+
+
+def _scalar(enc, value):
+    return enc.value(value)
+
+
+def _position(enc, x, y):
+    return b'{"x":%s,"y":%s}' % (enc.value(x), enc.value(y)) if x is not None and y is not None else b'null'
+
+
+def _colors(enc, bg, border, text, icon):
+    return b'{"bg":%s,"border":%s,"text":%s,"icon":%s}' % (
+        enc.value(bg), enc.value(border), enc.value(text), enc.value(icon)
+    )
+
+
+def _metadata_field(enc, value):
+    return _metadata(value, enc)
+
+
+def _datetime_field(enc, value):
+    return _datetime(value)
+
+
+def _character_field(name, summary_length):
+    """(columns, write) behind one key of a character document"""
+    c = characters_table.c
+    return {
+        'id': ([c.id], _int),
+        'project_id': ([c.project_id], _int),
+        'name': ([c.name], _scalar),
+        'description': ([c.description], _scalar),
+        'summary': ([summary_expression(c.description, summary_length).label('summary')], _scalar),
+        'position': ([c.position_x, c.position_y], _position),
+        'colors': ([c.bg_color, c.border_color, c.text_color, c.icon_color], _colors),
+        'metadata': ([_raw(c.extra_data)], _metadata_field),
+        'created_at': ([_raw(c.created_at)], _datetime_field),
+        'updated_at': ([_raw(c.updated_at)], _datetime_field),
+    }[name]
+
+
+def _relationship_field(name, source, target):
+    c = relationships_table.c
+    return {
+        'id': ([c.id], _int),
+        'project_id': ([c.project_id], _int),
+        'source_character_id': ([c.source_character_id], _int),
+        'target_character_id': ([c.target_character_id], _int),
+        'source_character_name': ([source.c.name], _scalar),
+        'target_character_name': ([target.c.name], _scalar),
+        'label': ([c.label], _scalar),
+        'relationship_type_id': ([c.relationship_type_id], _scalar),
+        'metadata': ([_raw(c.extra_data)], _metadata_field),
+        'created_at': ([_raw(c.created_at)], _datetime_field),
+    }[name]
+
+
+class Projection:
+    """Selected columns and per-key writers for a fieldset"""
+
+    def __init__(self, fields):
+        self.columns = []
+        self.layout = []
+        for name, (columns, write) in fields:
+            start = len(self.columns)
+            self.columns.extend(columns)
+            self.layout.append((b'"%s":' % name.encode('utf-8'), start, len(self.columns), write))
+
+    def write(self, rows):
+        enc = _encoder
+        layout = self.layout
+        parts = [
+            b'{' + b','.join(key + write(enc, *row[start:end]) for key, start, end, write in layout) + b'}'
+            for row in rows
+        ]
+        return b'[' + b','.join(parts) + b']'
+
+
+def character_rows(conn, project_id, fieldset=None):
+    """Character rows of a project for write_characters(), ordered by id"""
+    columns = CHARACTER_COLUMNS
+    if fieldset is not None:
+        columns = Projection(
+            (name, _character_field(name, fieldset.summary_length)) for name in fieldset.fields
+        ).columns
+    return conn.execute(
+        select(*columns).where(characters_table.c.project_id == project_id).order_by(characters_table.c.id)
+    ).all()
+
+
+def write_characters(rows, fieldset=None):
+    """JSON array bytes of character rows (from character_rows with the same fieldset)"""
+    if fieldset is not None:
+        return Projection(
+            (name, _character_field(name, fieldset.summary_length)) for name in fieldset.fields
+        ).write(rows)
+    enc = _encoder
+    value = enc.value
+    parts = []
+    for (id_, project_id, name, description, x, y, bg, border, text, icon,
+         extra, created_at, updated_at) in rows:
+        position = b'{"x":%s,"y":%s}' % (value(x), value(y)) if x is not None and y is not None else b'null'
+        parts.append(CHARACTER_TEMPLATE % (
+            id_, project_id, value(name), value(description), position,
+            value(bg), value(border), value(text), value(icon),
+            _metadata(extra, enc), _datetime(created_at), _datetime(updated_at)
+        ))
+    return b'[' + b','.join(parts) + b']'
+
+
+def _relationship_projection(fieldset):
+    source = characters_table.alias('source')
+    target = characters_table.alias('target')
+    return Projection((name, _relationship_field(name, source, target)) for name in fieldset.fields), source, target
+
+
+def relationship_rows(conn, project_id, with_names=True, fieldset=None):
+    """Relationship rows of a project for write_relationships(), ordered by id.
+
+    with_names joins the endpoints' names in; leave it off when the caller
+    already has them (see write_relationships). With a fieldset, names are
+    joined in only if it asks for them.
+    """
+    rel = relationships_table
+    if fieldset is not None:
+        projection, source, target = _relationship_projection(fieldset)
+        query = select(*projection.columns)
+        if needs_names(fieldset):
+            query = query.select_from(
+                rel.outerjoin(source, source.c.id == rel.c.source_character_id)
+                .outerjoin(target, target.c.id == rel.c.target_character_id)
+            )
+        return conn.execute(query.where(rel.c.project_id == project_id).order_by(rel.c.id)).all()
+
+    columns = [rel.c.id, rel.c.project_id, rel.c.source_character_id, rel.c.target_character_id,
+               rel.c.label, rel.c.relationship_type_id, _raw(rel.c.extra_data), _raw(rel.c.created_at)]
+    query = select(*columns)
+    if with_names:
+        source = characters_table.alias('source')
+        target = characters_table.alias('target')
+        query = select(*columns, source.c.name, target.c.name).select_from(
+            rel.outerjoin(source, source.c.id == rel.c.source_character_id)
+            .outerjoin(target, target.c.id == rel.c.target_character_id)
+        )
+    return conn.execute(query.where(rel.c.project_id == project_id).order_by(rel.c.id)).all()
+
+
+def write_relationships(rows, character_names=None, fieldset=None):
+    """JSON array bytes of relationship rows (from relationship_rows with the same fieldset).
+
+    Endpoint names come from the rows, or from character_names ({id: name})
+    for rows selected with with_names=False.
+    """
+    if fieldset is not None:
+        return _relationship_projection(fieldset)[0].write(rows)
+    enc = _encoder
+    value = enc.value
+    parts = []
+    for row in rows:
+        id_, project_id, source_id, target_id, label, type_id, extra, created_at = row[:8]
+        if character_names is None:
+            source_name, target_name = row[8], row[9]
+        else:
+            source_name, target_name = character_names.get(source_id), character_names.get(target_id)
+        parts.append(RELATIONSHIP_TEMPLATE % (
+            id_, project_id, source_id, target_id, value(source_name), value(target_name),
+            value(label), value(type_id), _metadata(extra, enc), _datetime(created_at)
+        ))
+    return b'[' + b','.join(parts) + b']'
+
+
+def graph_rows(conn, project_id, fieldset=None, edge_fieldset=None):
+    """Node rows, edge rows and (if the edges need it) a names map for write_graph_rows()"""
+    nodes = character_rows(conn, project_id, fieldset)
+    # Full nodes carry every name, so full edges needn't join them in again
+    character_names = {row[0]: row[2] for row in nodes} if fieldset is None and edge_fieldset is None else None
+    edges = relationship_rows(conn, project_id, with_names=character_names is None, fieldset=edge_fieldset)
+    return nodes, edges, character_names
+
+
+def write_graph_rows(project_dict, nodes, edges, character_names, fieldset=None, edge_fieldset=None):
+    """JSON object bytes of the /graph payload from graph_rows()"""
+    return b''.join([
+        b'{"project":', _encoder.dumps(project_dict),
+        b',"nodes":', write_characters(nodes, fieldset),
+        b',"edges":', write_relationships(edges, character_names, edge_fieldset),
+        b'}'
+    ])
+
+
+def write_graph(conn, project, fieldset=None, edge_fieldset=None):
+    """JSON object bytes of the /graph payload, with optional node and edge fieldsets"""
+    return write_graph_rows(
+        project.to_dict(), *graph_rows(conn, project.id, fieldset, edge_fieldset), fieldset, edge_fieldset
+    )
+
+
+def dumps(obj):
+    """JSON bytes of obj encoded as jsonify() would, for responses built outside Flask"""
+    return _encoder.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True)
+
+
+def install(app, encoder_name='auto'):
+    """Select the encoder and make it the app's JSON provider; returns the encoder"""
+    selected = use_encoder(encoder_name)
+    app.json = FastJSONProvider(app)
+    return selected
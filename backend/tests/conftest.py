@@ -0,0 +1,58 @@
+"""
+Shared fixtures: the app on a throwaway SQLite database and corpus copy.
+
+app.py configures itself from the environment when it is imported, so the
+environment is set here first. Every test signs up its own user, so tests
+share one database without seeing each other's projects.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_workdir = tempfile.mkdtemp(prefix='worldbuilder-tests-')
+shutil.copytree(os.path.join(BACKEND, '..', 'documents'), os.path.join(_workdir, 'documents'))
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    'DOCUMENTS_DIR': os.path.join(_workdir, 'documents'),
+    'DOCUMENT_WATCH': 'off',
+    'PASSWORD_HASH_PROFILE': 'fast',
+    'EXTRACTOR': 'stub',
+})
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    yield app_module.app
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    """Authorization headers of a freshly signed-up user"""
+    response = client.post('/api/auth/signup', json={
+        'name': 'Tester', 'email': f'{uuid.uuid4().hex}@example.com', 'password': 'correct horse'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture
+def project(client, auth):
+    """Id of a new project owned by the auth user"""
+    return client.post('/api/projects', json={'name': 'Test world'}, headers=auth).get_json()['id']
@@ -0,0 +1,129 @@
+"""Graph analytics (GET /api/projects/<id>/analytics) and the algorithms behind it"""
+
+import itertools
+import time
+
+import numpy as np
+
+import analytics
+import app as app_module
+
+
+def poll(client, auth, project, timeout=10):
+    """The first non-202 analytics response, and whether a 202 came first"""
+    deadline = time.monotonic() + timeout
+    pending = False
+    while time.monotonic() < deadline:
+        response = client.get(f'/api/projects/{project}/analytics', headers=auth)
+        if response.status_code != 202:
+            return response, pending
+        pending = True
+        assert response.headers['Retry-After'] == '1'
+        time.sleep(0.02)
+    raise AssertionError('analytics never finished')
+
+
+def fresh(client, auth, project, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response, _ = poll(client, auth, project)
+        if not response.get_json()['stale']:
+            return response
+        time.sleep(0.02)
+    raise AssertionError('analytics stayed stale')
+
+
+def test_results_are_computed_in_the_background(client, auth, project, monkeypatch):
+    base = f'/api/projects/{project}'
+    ids = {name: client.post(f'{base}/characters', json={'name': name}, headers=auth).get_json()['id']
+           for name in ('Hub', 'Mira', 'Oren', 'Sela')}
+    for name in ('Mira', 'Oren', 'Sela'):
+        client.post(f'{base}/relationships', json={
+            'source_character_id': ids[name], 'target_character_id': ids['Hub'], 'label': 'serves'
+        }, headers=auth)
+
+    response, pending = poll(client, auth, project)
+
+    assert pending
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['characters'], body['relationships'], body['stale']) == (4, 3, False)
+    assert body['degree']['top'][0] == {'id': ids['Hub'], 'name': 'Hub', 'degree': 3, 'in_degree': 3,
+                                        'out_degree': 0}
+    assert body['pagerank']['top'][0]['id'] == body['betweenness']['top'][0]['id'] == ids['Hub']
+    revalidated = client.get(f'{base}/analytics', headers={**auth, 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+    # Hold the refresh back so the stale result is what the next read sees
+    with monkeypatch.context() as held:
+        held.setattr(app_module.analytics_service, 'schedule', lambda project_id: None)
+        client.post(f'{base}/characters', json={'name': 'Tavi'}, headers=auth)
+        stale = client.get(f'{base}/analytics', headers=auth).get_json()
+    assert stale['stale'] and stale['characters'] == 4
+    assert fresh(client, auth, project).get_json()['characters'] == 5
+
+
+def test_bad_top_is_400(client, auth, project):
+    for top in (0, analytics.MAX_TOP + 1, 'x'):
+        assert client.get(f'/api/projects/{project}/analytics?top={top}', headers=auth).status_code == 400
+
+
+def test_pagerank_matches_the_dense_definition():
+    rng = np.random.default_rng(5)
+    n = 30
+    sources, targets = rng.integers(0, n, 80), rng.integers(0, n, 80)
+    sources[:3] = targets[:3] = 0  # self-loops count as links; node n - 1 may dangle
+
+    scores, _ = analytics.pagerank(n, sources, targets)
+
+    links = np.zeros((n, n))
+    np.add.at(links, (sources, targets), 1)
+    out = links.sum(axis=1)
+    transition = np.where(out[:, None] > 0, links / np.maximum(out, 1)[:, None], 1.0 / n)
+    google = analytics.DAMPING * transition + (1 - analytics.DAMPING) / n
+    rank = np.full(n, 1.0 / n)
+    for _ in range(500):
+        rank = rank @ google
+    assert np.allclose(scores, rank, atol=1e-9)
+
+
+def test_exact_betweenness_matches_brute_force():
+    rng = np.random.default_rng(9)
+    n = 12
+    pairs = {tuple(sorted(pair)) for pair in rng.integers(0, n, (25, 2)) if pair[0] != pair[1]}
+    sources, targets = np.array(sorted(pairs)).T
+    indptr, indices = analytics._undirected(n, sources, targets)
+
+    scores, used = analytics.betweenness(n, indptr, indices, samples=n)
+
+    neighbours = [set(indices[indptr[i]:indptr[i + 1]]) for i in range(n)]
+
+    def shortest_paths(s, t):
+        paths, frontier = [], [[s]]
+        while frontier and not paths:
+            paths = [p for p in frontier if p[-1] == t]
+            seen = {node for p in frontier for node in p}
+            frontier = [p + [m] for p in frontier for m in neighbours[p[-1]] if m not in seen]
+        return paths
+
+    expected = np.zeros(n)
+    for s, t in itertools.combinations(range(n), 2):
+        paths = shortest_paths(s, t)
+        for path in paths:
+            for node in path[1:-1]:
+                expected[node] += 1 / len(paths)
+    assert used == n
+    assert np.allclose(scores, expected / ((n - 1) * (n - 2) / 2))
+
+
+def test_communities_split_two_joined_cliques():
+    clique = list(itertools.combinations(range(6), 2))
+    pairs = clique + [(a + 6, b + 6) for a, b in clique] + [(0, 6)]
+    sources, targets = np.array(pairs).T
+    indptr, indices = analytics._undirected(12, sources, targets)
+
+    labels = analytics.communities(12, indptr, indices)
+
+    assert len(set(labels[:6])) == len(set(labels[6:])) == 1
+    assert labels[0] != labels[6]
+    assert analytics.modularity(12, indptr, indices, labels) > 0.4
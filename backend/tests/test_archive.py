@@ -0,0 +1,77 @@
+"""Project export (GET /api/projects/<id>/export) and restore (POST /api/projects/restore)"""
+
+import gzip
+import json
+
+import pytest
+
+
+def graph(client, auth, project):
+    body = client.get(f'/api/projects/{project}/graph', headers=auth).get_json()
+    nodes = sorted((node['name'], node['description']) for node in body['nodes'])
+    edges = sorted((edge['source_character_name'], edge['target_character_name'], edge['label'])
+                   for edge in body['edges'])
+    return nodes, edges
+
+
+@pytest.fixture
+def world(client, auth, project):
+    base = f'/api/projects/{project}'
+    mira = client.post(f'{base}/characters', json={'name': 'Mira', 'description': 'Cartographer'},
+                       headers=auth).get_json()
+    oren = client.post(f'{base}/characters', json={'name': 'Oren', 'description': 'Keeper'},
+                       headers=auth).get_json()
+    client.post(f'{base}/relationships', json={
+        'source_character_id': mira['id'], 'target_character_id': oren['id'], 'label': 'mentor of'
+    }, headers=auth)
+    return project
+
+
+@pytest.mark.parametrize('compress', ['', 'gzip'])
+def test_export_then_restore_round_trips(client, auth, world, compress):
+    response = client.get(f'/api/projects/{world}/export?compress={compress}', headers=auth)
+    assert response.status_code == 200
+    archive = response.get_data()
+    if compress:
+        assert response.mimetype == 'application/gzip'
+        lines = gzip.decompress(archive).splitlines()
+    else:
+        lines = archive.splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r['type'] for r in records] == [
+        'header', 'user', 'project', 'character', 'character', 'relationship', 'footer'
+    ]
+    assert 'password_hash' not in records[1]['data']
+
+    restored = client.post('/api/projects/restore?name=Copy', data=archive, headers=auth)
+
+    assert restored.status_code == 201, restored.get_json()
+    summary = restored.get_json()
+    assert (summary['characters'], summary['relationships']) == (2, 1)
+    copy = summary['project_id']
+    assert copy != world
+    assert graph(client, auth, copy) == graph(client, auth, world)
+    assert client.get(f'/api/projects/{copy}', headers=auth).get_json()['name'] == 'Copy'
+
+
+def test_truncated_archive_is_rejected(client, auth, world):
+    lines = client.get(f'/api/projects/{world}/export', headers=auth).get_data().splitlines(keepends=True)
+    before = len(client.get('/api/projects', headers=auth).get_json())
+
+    truncated = client.post('/api/projects/restore', data=b''.join(lines[:-2]), headers=auth)
+    tampered = client.post('/api/projects/restore', data=b''.join(lines[:-2] + lines[-1:]), headers=auth)
+
+    assert truncated.status_code == 400 and 'truncated' in truncated.get_json()['message']
+    assert tampered.status_code == 400 and 'incomplete' in tampered.get_json()['message']
+    assert client.post('/api/projects/restore', data=b'{"type":"nope"}\n', headers=auth).status_code == 400
+    assert len(client.get('/api/projects', headers=auth).get_json()) == before
+
+
+def test_export_needs_access(client, auth, world):
+    other = client.post('/api/auth/signup', json={
+        'name': 'Other', 'email': f'other-{world}@example.com', 'password': 'correct horse'
+    }).get_json()['token']
+
+    response = client.get(f'/api/projects/{world}/export', headers={'Authorization': f'Bearer {other}'})
+
+    assert response.status_code in (403, 404)
@@ -0,0 +1,106 @@
+"""The ASGI entry point: async hot reads answer like the Flask routes, the rest falls through"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('a2wsgi')
+pytest.importorskip('aiosqlite')
+
+import asgi  # noqa: E402
+
+
+@pytest.fixture
+def world(client, auth, project):
+    base = f'/api/projects/{project}'
+    ids = [client.post(f'{base}/characters', json={'name': f'Character {i}', 'description': 'Lore ' * 100},
+                       headers=auth).get_json()['id'] for i in range(5)]
+    for source, target in zip(ids, ids[1:]):
+        client.post(f'{base}/relationships', json={
+            'source_character_id': source, 'target_character_id': target, 'label': 'knows'
+        }, headers=auth)
+    return project
+
+
+@pytest.fixture
+def serve(app):
+    """Run (method, path, headers, body) requests through a fresh ASGI app on one event loop"""
+    application = asgi.Application(app)
+
+    async def request(method, path, headers, body=b''):
+        path, _, query = path.partition('?')
+        if body:
+            headers = {**headers, 'Content-Length': str(len(body))}
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+            'raw_path': path.encode(), 'root_path': '', 'query_string': query.encode(),
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        }
+        messages = iter([{'type': 'http.request', 'body': body, 'more_body': False}])
+        sent = []
+
+        async def receive():
+            return next(messages, {'type': 'http.disconnect'})
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        start = sent[0]
+        response_headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+        return start['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+    def run(*requests):
+        async def main():
+            try:
+                return [await request(*args) for args in requests]
+            finally:
+                if application.engine is not None:
+                    await application.engine.dispose()
+        return asyncio.run(main())
+
+    yield run
+    application.wsgi.executor.shutdown()
+    application.cpu.shutdown()
+
+
+@pytest.mark.parametrize('path', ['graph', 'characters', 'relationships', 'characters?fields=name,summary'])
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+def test_hot_reads_match_flask(client, auth, world, serve, path, encoding):
+    url = f'/api/projects/{world}/{path}'
+    headers = {**auth, 'Accept-Encoding': encoding}
+    expected = client.get(url, headers=headers)
+
+    [(status, response_headers, body)] = serve(('GET', url, headers))
+
+    assert status == 200
+    assert body == expected.get_data()
+    assert response_headers['etag'] == expected.headers['ETag']
+    assert response_headers.get('content-encoding') == expected.headers.get('Content-Encoding')
+
+    [(status, _, body)] = serve(('GET', url, {**headers, 'If-None-Match': expected.headers['ETag']}))
+    assert (status, body) == (304, b'')
+
+
+def test_errors_match_flask(client, auth, world, serve):
+    requests = [
+        ('GET', f'/api/projects/{world}/graph', {}),
+        ('GET', f'/api/projects/{world}/characters?fields=secret', auth),
+        ('GET', f'/api/projects/{world + 100000}/relationships', auth),
+    ]
+    expected = [client.get(path, headers=headers).status_code for _, path, headers in requests]
+
+    assert [status for status, _, _ in serve(*requests)] == expected == [401, 400, 404]
+
+
+def test_other_requests_go_to_flask(auth, world, serve):
+    body = json.dumps({'name': 'Through Flask'}).encode()
+    created, listed = serve(
+        ('POST', f'/api/projects/{world}/characters', {**auth, 'Content-Type': 'application/json'}, body),
+        ('GET', f'/api/projects/{world}/characters', auth),
+    )
+
+    assert created[0] == 201
+    assert 'Through Flask' in [char['name'] for char in json.loads(listed[2])]
@@ -0,0 +1,78 @@
+"""Batch mutations apply in input order (POST /api/projects/<id>/batch)"""
+
+
+def batch(client, auth, project, operations, **options):
+    return client.post(f'/api/projects/{project}/batch', json=dict(options, operations=operations), headers=auth)
+
+
+def names(client, auth, project):
+    characters = client.get(f'/api/projects/{project}/characters', headers=auth).get_json()
+    return {char['id']: char['name'] for char in characters}
+
+
+def create(name):
+    return {'op': 'create', 'type': 'character', 'data': {'name': name}}
+
+
+def rename(ref, name):
+    return {'op': 'update', 'type': 'character', 'name': ref, 'data': {'name': name}}
+
+
+def test_delete_then_recreate_same_name(client, auth, project):
+    assert batch(client, auth, project, [create('A'), create('B')]).status_code == 200
+
+    response = batch(client, auth, project, [
+        {'op': 'delete', 'type': 'character', 'name': 'A'},
+        create('A'),
+        {'op': 'create', 'type': 'relationship',
+         'data': {'source_character_name': 'A', 'target_character_name': 'B', 'label': 'ally of'}},
+    ])
+
+    assert response.status_code == 200, response.get_json()
+    assert sorted(names(client, auth, project).values()) == ['A', 'B']
+    relationships = client.get(f'/api/projects/{project}/relationships', headers=auth).get_json()
+    assert [rel['label'] for rel in relationships] == ['ally of']
+
+
+def test_rename_swap(client, auth, project):
+    batch(client, auth, project, [create('A'), create('B')])
+    before = {name: cid for cid, name in names(client, auth, project).items()}
+
+    response = batch(client, auth, project, [rename('A', 'tmp'), rename('B', 'A'), rename('tmp', 'B')])
+
+    assert response.status_code == 200, response.get_json()
+    after = names(client, auth, project)
+    assert after[before['A']] == 'B'
+    assert after[before['B']] == 'A'
+
+
+def test_create_then_delete_in_one_batch(client, auth, project):
+    response = batch(client, auth, project, [create('A'), {'op': 'delete', 'type': 'character', 'name': 'A'}, create('A')])
+
+    assert response.status_code == 200, response.get_json()
+    assert list(names(client, auth, project).values()) == ['A']
+
+
+def test_malformed_operations_are_rejected(client, auth, project):
+    assert batch(client, auth, project, ['create A']).status_code == 400
+    assert batch(client, auth, project, [{'op': 'create', 'type': 'character', 'data': ['A']}]).status_code == 400
+    assert batch(client, auth, project, [{'op': 'update', 'type': 'character', 'name': ['A'], 'data': {}}]).status_code == 400
+    assert client.post(f'/api/projects/{project}/batch', json=[create('A')], headers=auth).status_code == 400
+    assert names(client, auth, project) == {}
+
+
+def test_malformed_fields_fail_only_their_op(client, auth, project):
+    batch(client, auth, project, [create('A')])
+
+    response = batch(client, auth, project, [
+        {'op': 'update', 'type': 'character', 'name': 'A', 'data': {'name': 'Renamed', 'position': [1, 2]}},
+        {'op': 'create', 'type': 'character', 'data': {'name': 'B', 'colors': 'red'}},
+        create('C'),
+    ], atomic=False)
+
+    assert response.status_code == 200, response.get_json()
+    results = response.get_json()['results']
+    assert [result['message'] for result in results[:2]] == ['position must be an object', 'colors must be an object']
+    assert sorted(names(client, auth, project).values()) == ['A', 'C']
+    assert batch(client, auth, project, [create('D'), {'op': 'create', 'type': 'character',
+                                                      'data': {'name': 'E', 'position': 'here'}}]).status_code == 400
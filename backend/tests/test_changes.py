@@ -0,0 +1,52 @@
+"""Change feed (GET /api/projects/<id>/changes) and the change log floor"""
+
+import app as app_module
+from models import Project
+
+
+def changes(client, auth, project, since):
+    response = client.get(f'/api/projects/{project}/changes?since={since}', headers=auth)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def add(client, auth, project, name):
+    response = client.post(f'/api/projects/{project}/characters', json={'name': name}, headers=auth)
+    assert response.status_code == 201
+
+
+def names(feed):
+    return [char['name'] for char in feed['characters']]
+
+
+def test_new_project_syncs_from_version_0(client, auth, project):
+    add(client, auth, project, 'Mira')
+    add(client, auth, project, 'Oren')
+
+    feed = changes(client, auth, project, 0)
+    assert feed['reset'] is False
+    assert names(feed) == ['Mira', 'Oren']
+    assert names(changes(client, auth, project, 1)) == ['Oren']
+
+
+def test_read_before_any_write(client, auth, project):
+    empty = changes(client, auth, project, 0)
+    assert empty['reset'] is False
+    assert names(empty) == []
+
+    add(client, auth, project, 'Mira')
+    assert names(changes(client, auth, project, 0)) == ['Mira']
+
+
+def test_project_from_before_the_log_starts_at_its_first_write(client, auth, project):
+    # As add_missing_columns() leaves it: writes happened, none of them logged
+    with app_module.app.app_context():
+        app_module.db.session.query(Project).filter_by(id=project).update({'version': 5, 'changes_floor': None})
+        app_module.db.session.commit()
+
+    add(client, auth, project, 'Mira')
+
+    assert changes(client, auth, project, 0)['reset'] is True
+    feed = changes(client, auth, project, 5)
+    assert feed['reset'] is False
+    assert names(feed) == ['Mira']
@@ -0,0 +1,81 @@
+"""Database engine profiles: per-connection SQLite pragmas and pool options"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import db_profile
+from app import db
+
+
+def tuned_engine(path, **overrides):
+    settings = {**db_profile.load_settings(), 'DB_ENGINE_PROFILE': 'tuned', **overrides}
+    url = f'sqlite:///{path}'
+    engine = create_engine(url, **db_profile.engine_options(url, settings))
+    db_profile.install_engine(engine, settings)
+    return engine
+
+
+def test_app_connections_use_wal(app):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+
+
+def hold_write_lock(engine, seconds):
+    """Thread holding an open write transaction on engine for a while"""
+    holding = threading.Event()
+
+    def hold():
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO t VALUES (1)'))
+            holding.set()
+            time.sleep(seconds)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait()
+    return thread
+
+
+@pytest.mark.parametrize('busy_timeout_ms, waits', [(5000, True), (50, False)])
+def test_a_second_writer_waits_up_to_the_busy_timeout(tmp_path, busy_timeout_ms, waits):
+    engine = tuned_engine(tmp_path / 'locks.db', SQLITE_BUSY_TIMEOUT_MS=busy_timeout_ms)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (n INTEGER)'))
+
+    holder = hold_write_lock(engine, 0.3)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO t VALUES (2)'))
+    except OperationalError as e:
+        assert not waits and 'locked' in str(e)
+    else:
+        assert waits
+    holder.join()
+
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM t')).scalar() == (2 if waits else 1)
+    engine.dispose()
+
+
+def test_engine_options_by_profile():
+    settings = db_profile.load_settings()
+
+    assert db_profile.engine_options('sqlite:///x.db', {**settings, 'DB_ENGINE_PROFILE': 'default'}) == {}
+    assert 'pool_size' not in db_profile.engine_options('sqlite://', settings)
+    server = db_profile.engine_options('postgresql://u@localhost/w', settings)
+    assert server['pool_pre_ping'] and server['pool_size'] == settings['DB_POOL_SIZE']
+    with pytest.raises(ValueError):
+        db_profile.engine_options('sqlite://', {**settings, 'DB_ENGINE_PROFILE': 'fast'})
+
+
+def test_async_database_url():
+    assert db_profile.async_database_url('sqlite:///w.db') == 'sqlite+aiosqlite:///w.db'
+    assert db_profile.async_database_url('postgresql://u:p@h/w') == 'postgresql+asyncpg://u:p@h/w'
+    assert db_profile.async_database_url('sqlite+aiosqlite:///w.db') == 'sqlite+aiosqlite:///w.db'
@@ -0,0 +1,76 @@
+"""The corpus ETag (DocumentCorpus.fingerprint) depends on the files, not on the process"""
+
+import os
+import shutil
+import threading
+
+from documents import DocumentCorpus
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'documents')
+
+
+def corpus_copy(tmp_path):
+    root = tmp_path / 'documents'
+    shutil.copytree(SOURCE, root)
+    return str(root)
+
+
+def test_fingerprint_is_shared_by_processes_with_different_histories(tmp_path):
+    root = corpus_copy(tmp_path)
+    busy = DocumentCorpus(root, watch='off')
+    busy.tree()
+    busy.write('Story Chapters/Draft.md', 'first')
+    busy.write('Story Chapters/Draft.md', 'second')
+    fresh = DocumentCorpus(root, watch='off')
+
+    assert busy.generation != fresh.generation
+    assert busy.tree() == fresh.tree()
+    assert busy.fingerprint() == fresh.fingerprint()
+
+
+def test_fingerprint_follows_edits_and_ordering(tmp_path):
+    root = corpus_copy(tmp_path)
+    corpus = DocumentCorpus(root, watch='off')
+    seen = {corpus.fingerprint()}
+
+    corpus.write('Story Chapters/Draft.md', 'text')
+    seen.add(corpus.fingerprint())
+    corpus.write('Story Chapters/Draft.md', 'longer text')
+    seen.add(corpus.fingerprint())
+    corpus.save_order({'.': ['World Lore', 'Story Chapters']})
+    seen.add(corpus.fingerprint())
+    os.makedirs(os.path.join(root, 'Empty folder'))
+    corpus.poll()
+    seen.add(corpus.fingerprint())
+
+    assert len(seen) == 5
+
+
+def test_tree_etag(client, auth):
+    first = client.get('/api/documents', headers=auth)
+    assert first.headers['ETag'].startswith('"documents-')
+    again = client.get('/api/documents', headers=dict(auth, **{'If-None-Match': first.headers['ETag']}))
+    assert again.status_code == 304
+
+
+def test_concurrent_writes_of_one_file(tmp_path):
+    corpus = DocumentCorpus(corpus_copy(tmp_path), watch='off')
+    texts = [f'version {n}\n' * 2000 for n in range(8)]
+    errors = []
+
+    def save(text):
+        try:
+            for _ in range(20):
+                corpus.write('Story Chapters/Draft.md', text)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert corpus.read('Story Chapters/Draft.md')['content'] in texts
+    assert not [name for name in os.listdir(os.path.join(corpus.root, 'Story Chapters')) if name.endswith('.tmp')]
@@ -0,0 +1,66 @@
+"""Background extraction jobs with the stub extractor (POST/GET /api/projects/<id>/extractions)"""
+
+import os
+import socket
+import time
+
+import app as app_module
+from models import ExtractionJob, db
+
+TEXT = "King Eldor's brother is Draco Arion. Lorron Gasku killed Captain Aris Vorn."
+
+
+def wait(client, auth, location):
+    for _ in range(200):
+        job = client.get(location, headers=auth).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job still {job["status"]}')
+
+
+def test_job_runs_and_resubmission_hits_the_cache(client, auth, project):
+    first = client.post(f'/api/projects/{project}/extractions', json={'text': TEXT}, headers=auth)
+    assert first.status_code == 202
+    job = wait(client, auth, first.headers['Location'])
+    assert job['status'] == 'done'
+    assert {'source': 'Lorron Gasku', 'target': 'Captain Aris Vorn', 'label': 'killed'} in job['result']['relationships']
+
+    again = wait(client, auth, client.post(
+        f'/api/projects/{project}/extractions', json={'text': TEXT}, headers=auth
+    ).headers['Location'])
+    assert again['progress']['cached'] == again['progress']['total']
+
+
+def test_invalid_bodies_are_400(client, auth, project):
+    url = f'/api/projects/{project}/extractions'
+    assert client.post(url, json={'text': 5}, headers=auth).get_json() == {'message': 'text must be a string'}
+    assert client.post(url, json=['text'], headers=auth).status_code == 400
+    assert client.post(url, json={'text': '  '}, headers=auth).status_code == 400
+    assert client.post(url, json={'document': '../secrets'}, headers=auth).status_code == 400
+    assert client.post(url, json={'document': 'No such file'}, headers=auth).status_code == 404
+
+
+def test_submit_during_shutdown_leaves_no_job(client, auth, project):
+    service = app_module.extraction_service
+    service._closed = True
+    try:
+        response = client.post(f'/api/projects/{project}/extractions', json={'text': TEXT}, headers=auth)
+    finally:
+        service._closed = False
+    assert response.status_code == 503
+    assert client.get(f'/api/projects/{project}/extractions', headers=auth).get_json()['jobs'] == []
+
+
+def test_job_of_a_dead_process_is_failed_when_read(client, auth, project):
+    with app_module.app.app_context():
+        job = ExtractionJob(project_id=project, status='running', extractor='stub', chunks_total=3,
+                            worker=f'{socket.gethostname()}:{os.getpid()}')
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+    # Recorded as this process, but this process isn't running it
+    job = client.get(f'/api/projects/{project}/extractions/{job_id}', headers=auth).get_json()
+    assert job['status'] == 'failed'
+    assert 'stopped' in job['error']
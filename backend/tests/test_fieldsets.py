@@ -0,0 +1,70 @@
+"""Sparse fieldsets (?fields=, ?edge_fields=) and database-side summaries"""
+
+import pytest
+
+
+@pytest.fixture
+def world(client, auth, project):
+    base = f'/api/projects/{project}'
+    mira = client.post(f'{base}/characters', json={
+        'name': 'Mira', 'description': 'A cartographer of the northern reaches ' * 10, 'position': {'x': 1, 'y': 2}
+    }, headers=auth).get_json()
+    oren = client.post(f'{base}/characters', json={'name': 'Oren', 'description': 'Keeper'},
+                       headers=auth).get_json()
+    client.post(f'{base}/relationships', json={
+        'source_character_id': mira['id'], 'target_character_id': oren['id'], 'label': 'mentor of'
+    }, headers=auth)
+    return project
+
+
+@pytest.fixture(params=[True, False], ids=['rows', 'orm'])
+def serializer(request, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ROW_SERIALIZER', request.param)
+
+
+def get(client, auth, url):
+    response = client.get(url, headers=auth)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_only_requested_fields_come_back(client, auth, world, serializer):
+    characters = get(client, auth, f'/api/projects/{world}/characters?fields=name,position')
+    relationships = get(client, auth, f'/api/projects/{world}/relationships?fields=label,source_character_name')
+
+    assert [set(char) for char in characters] == [{'id', 'name', 'position'}] * 2
+    assert characters[0]['position'] == {'x': 1, 'y': 2}
+    assert [(rel['label'], rel['source_character_name']) for rel in relationships] == [('mentor of', 'Mira')]
+    assert set(relationships[0]) == {'id', 'label', 'source_character_name'}
+
+
+def test_graph_narrows_nodes_and_edges(client, auth, world, serializer):
+    graph = get(client, auth, f'/api/projects/{world}/graph?fields=name&edge_fields=source_character_id')
+
+    assert {frozenset(node) for node in graph['nodes']} == {frozenset({'id', 'name'})}
+    assert {frozenset(edge) for edge in graph['edges']} == {frozenset({'id', 'source_character_id'})}
+
+
+def test_summaries_are_cut_by_the_database(client, auth, world, serializer):
+    url = f'/api/projects/{world}/characters?fields=summary'
+    mira, oren = get(client, auth, url + '&summary_length=20')
+
+    assert mira['summary'] == 'A cartographer of th…'
+    assert oren['summary'] == 'Keeper'
+    assert get(client, auth, url)[0]['summary'].endswith('reaches A ca…')
+
+
+def test_each_fieldset_has_its_own_etag(client, auth, world):
+    base = f'/api/projects/{world}/characters'
+    etags = {client.get(url, headers=auth).headers['ETag'] for url in (
+        base, f'{base}?fields=name', f'{base}?fields=summary', f'{base}?fields=summary&summary_length=20'
+    )}
+
+    assert len(etags) == 4
+
+
+def test_unknown_fields_are_400(client, auth, world):
+    base = f'/api/projects/{world}'
+    for url in (f'{base}/characters?fields=name,secret', f'{base}/relationships?fields=summary',
+                f'{base}/graph?edge_fields=position', f'{base}/characters?fields=summary&summary_length=0'):
+        assert client.get(url, headers=auth).status_code == 400, url
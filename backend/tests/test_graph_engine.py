@@ -0,0 +1,47 @@
+"""Graph queries (/graph/neighborhood, /graph/path, /graph/components)"""
+
+
+def seed_chain(client, auth, project):
+    """Characters A -> B -> C; returns their ids by name"""
+    client.post(f'/api/projects/{project}/batch', headers=auth, json={'operations': [
+        {'op': 'create', 'type': 'character', 'data': {'name': name}} for name in 'ABC'
+    ] + [
+        {'op': 'create', 'type': 'relationship',
+         'data': {'source_character_name': source, 'target_character_name': target, 'label': 'knows'}}
+        for source, target in (('A', 'B'), ('B', 'C'))
+    ]})
+    characters = client.get(f'/api/projects/{project}/characters', headers=auth).get_json()
+    return {char['name']: char['id'] for char in characters}
+
+
+def test_queries_answer_and_have_their_own_etags(client, auth, project):
+    ids = seed_chain(client, auth, project)
+    base = f'/api/projects/{project}'
+    urls = [
+        f"{base}/graph/neighborhood?character_id={ids['A']}",
+        f"{base}/graph/neighborhood?character_id={ids['A']}&depth=2",
+        f"{base}/graph/neighborhood?character_id={ids['B']}",
+        f"{base}/graph/path?source={ids['A']}&target={ids['C']}",
+        f"{base}/graph/path?source={ids['C']}&target={ids['A']}&direction=out",
+        f'{base}/graph/components',
+        base,
+    ]
+    responses = [client.get(url, headers=auth) for url in urls]
+
+    assert [response.status_code for response in responses] == [200] * len(urls)
+    assert len({response.headers['ETag'] for response in responses}) == len(urls)
+    assert responses[3].get_json()['length'] == 2
+    assert responses[4].get_json()['path'] is None
+    assert responses[5].get_json()['count'] == 1
+
+    # A validator of one query never answers another with 304
+    stale = dict(auth, **{'If-None-Match': responses[0].headers['ETag']})
+    assert client.get(urls[1], headers=stale).status_code == 200
+    assert client.get(urls[0], headers=stale).status_code == 304
+
+
+def test_bad_arguments_are_400(client, auth, project):
+    base = f'/api/projects/{project}/graph'
+    assert client.get(f'{base}/neighborhood?character_id=x', headers=auth).status_code == 400
+    assert client.get(f'{base}/neighborhood?character_id=1&depth=9', headers=auth).status_code == 400
+    assert client.get(f'{base}/path?source=1&target=2&direction=up', headers=auth).status_code == 400
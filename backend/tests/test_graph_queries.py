@@ -0,0 +1,67 @@
+"""The graph and listing endpoints use a fixed number of SQL statements however big the project is"""
+
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+import app as app_module
+from models import db, Character, CharacterRelationship
+
+ROUTES = ('graph', 'characters', 'relationships')
+
+
+def seed_project(client, size):
+    """A new user's project of size characters, each related to the next two"""
+    token = client.post('/api/auth/signup', json={
+        'name': 'Tester', 'email': f'{uuid.uuid4().hex}@example.com', 'password': 'correct horse'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    project = client.post('/api/projects', json={'name': f'{size} characters'}, headers=headers).get_json()['id']
+
+    with app_module.app.app_context():
+        characters = [Character(project_id=project, name=f'Character {i}') for i in range(size)]
+        db.session.add_all(characters)
+        db.session.flush()
+        db.session.add_all(
+            CharacterRelationship(project_id=project, source_character_id=characters[i].id,
+                                  target_character_id=characters[j].id, label='knows')
+            for i in range(size) for j in (i + 1, i + 2) if j < size
+        )
+        db.session.commit()
+    return project, headers
+
+
+def count_statements(client, url, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app_module.app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements), response.get_json()
+
+
+@pytest.mark.parametrize('route', ROUTES)
+def test_query_count_does_not_grow_with_the_graph(client, route):
+    counts = {}
+    for size in (5, 200):
+        project, headers = seed_project(client, size)
+        # One request first, so both sizes are measured from the same warm state
+        client.get(f'/api/projects/{project}', headers=headers)
+        counts[size], body = count_statements(client, f'/api/projects/{project}/{route}', headers)
+        if route == 'graph':
+            assert len(body['nodes']) == size
+            assert len(body['edges']) == 2 * size - 3
+        else:
+            assert len(body) == (size if route == 'characters' else 2 * size - 3)
+
+    assert counts[5] == counts[200]
+    assert counts[200] <= 5
@@ -0,0 +1,55 @@
+"""Password hashing runs on a bounded pool (hashing.PasswordHasher)"""
+
+import threading
+import uuid
+
+import pytest
+
+import app as app_module
+from hashing import HasherBusy, PasswordHasher
+
+
+def test_hashing_runs_on_the_pool_and_rejects_when_full():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+        return threading.current_thread().name
+
+    results = []
+    holder = threading.Thread(target=lambda: results.append(hasher.run(hold)))
+    holder.start()
+    assert started.wait(5)
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.run(str, 'rejected')
+        assert hasher.rejected == 1
+    finally:
+        release.set()
+        holder.join(5)
+    hasher.shutdown()
+
+    assert results[0].startswith('hasher')
+
+
+def test_login_checks_the_password(client):
+    email = f'{uuid.uuid4().hex}@example.com'
+    client.post('/api/auth/signup', json={'name': 'Tester', 'email': email, 'password': 'correct horse'})
+
+    assert client.post('/api/auth/login', json={'email': email, 'password': 'correct horse'}).status_code == 200
+    assert client.post('/api/auth/login', json={'email': email, 'password': 'wrong horse'}).status_code == 401
+
+
+def test_a_full_pool_answers_503(client, monkeypatch):
+    def busy(*args):
+        raise HasherBusy('Password hashing queue is full')
+
+    monkeypatch.setattr(app_module.password_hasher, 'run', busy)
+    response = client.post('/api/auth/signup', json={
+        'name': 'Tester', 'email': f'{uuid.uuid4().hex}@example.com', 'password': 'correct horse'
+    })
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,51 @@
+"""Bulk world import (importer.py)"""
+
+
+def test_malformed_entries_are_reported_not_fatal(client, auth, project):
+    response = client.post(f'/api/projects/{project}/import', headers=auth, json={
+        'entities': [
+            {'name': 'Mira', 'position': [10, 20]},
+            {'name': 'Oren', 'colors': 'red'},
+            {'name': 'Tamsin', 'description': 'A cartographer', 'position': {'x': 5, 'y': 6}},
+            'Halvard',
+            {'description': 'Nameless'},
+        ],
+        'relationships': [
+            {'source': 'Tamsin', 'target': 'Ilse', 'label': ['knows']},
+            {'source': 'Tamsin'},
+            {'source': 'Tamsin', 'target': 'Ilse', 'label': 'mentor of'},
+        ],
+        'layout': False,
+    })
+
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['errors'] == [
+        {'type': 'entity', 'index': 0, 'message': 'position must be an object'},
+        {'type': 'entity', 'index': 1, 'message': 'colors must be an object'},
+        {'type': 'entity', 'index': 3, 'message': 'Entity must be an object'},
+        {'type': 'entity', 'index': 4, 'message': 'name is required'},
+        {'type': 'relationship', 'index': 0, 'message': 'label must be a string'},
+        {'type': 'relationship', 'index': 1, 'message': 'source and target are required'},
+    ]
+    assert sorted(summary['characters']) == ['Ilse', 'Tamsin']
+    assert summary['created_relationships'] == 1
+    relationships = client.get(f'/api/projects/{project}/relationships', headers=auth).get_json()
+    assert [rel['label'] for rel in relationships] == ['mentor of']
+
+
+def test_created_relationships_are_logged(client, auth, project):
+    feed = client.get(f'/api/projects/{project}/changes?since=0', headers=auth).get_json()
+    client.post(f'/api/projects/{project}/import', headers=auth, json={
+        'relationships': [{'source': 'A', 'target': 'B'}, {'source': 'B', 'target': 'C'}], 'layout': False,
+    })
+
+    changes = client.get(f"/api/projects/{project}/changes?since={feed['version']}", headers=auth).get_json()
+    assert sorted(rel['label'] for rel in changes['relationships']) == ['connected to', 'connected to']
+    assert len(changes['characters']) == 3
+
+
+def test_import_document_must_be_an_object(client, auth, project):
+    response = client.post(f'/api/projects/{project}/import', headers=auth, json=[{'name': 'Mira'}])
+
+    assert response.status_code == 400
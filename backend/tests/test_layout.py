@@ -0,0 +1,69 @@
+"""Server-side force-directed layout (POST /api/projects/<id>/layout)"""
+
+import numpy as np
+
+import layout
+
+
+def characters(client, auth, project):
+    return {char['name']: char for char in client.get(f'/api/projects/{project}/characters', headers=auth).get_json()}
+
+
+def test_new_mode_places_only_unpositioned_characters(client, auth, project):
+    base = f'/api/projects/{project}'
+    fixed = {'Mira': {'x': 0, 'y': 0}, 'Oren': {'x': 400, 'y': 0}}
+    ids = {}
+    for name in ('Mira', 'Oren', 'Sela', 'Tavi', 'Ulric'):
+        ids[name] = client.post(f'{base}/characters', json={'name': name, 'position': fixed.get(name, {})},
+                                headers=auth).get_json()['id']
+    for source, target in [('Mira', 'Sela'), ('Oren', 'Sela'), ('Sela', 'Tavi')]:
+        client.post(f'{base}/relationships', json={
+            'source_character_id': ids[source], 'target_character_id': ids[target], 'label': 'knows'
+        }, headers=auth)
+    since = client.get(f'{base}/changes?since=0', headers=auth).get_json()['version']
+
+    response = client.post(f'{base}/layout', json={}, headers=auth)
+
+    assert response.status_code == 200, response.get_json()
+    summary = response.get_json()
+    assert (summary['mode'], summary['characters'], summary['placed']) == ('new', 5, 3)
+    placed = characters(client, auth, project)
+    assert {name: placed[name]['position'] for name in fixed} == fixed
+    assert all(char['position'] is not None for char in placed.values())
+    feed = client.get(f'{base}/changes?since={since}', headers=auth).get_json()
+    assert feed['version'] == summary['version'] > since
+    assert sorted(char['name'] for char in feed['characters']) == ['Sela', 'Tavi', 'Ulric']
+
+    again = client.post(f'{base}/layout', json={'mode': 'new'}, headers=auth).get_json()
+    assert again['placed'] == 0
+
+
+def test_bad_arguments_are_400(client, auth, project):
+    for body in ({'mode': 'some'}, {'iterations': -1}, {'spacing': 1}, {'seed': 'x'}):
+        assert client.post(f'/api/projects/{project}/layout', json=body, headers=auth).status_code == 400, body
+
+
+def test_connected_characters_end_up_closer():
+    # Two rings of 20, joined by one edge
+    sources = [i for i in range(40) if i % 20 != 19] + [19, 39, 0]
+    targets = [i + 1 for i in range(40) if i % 20 != 19] + [0, 20, 20]
+    positions = np.full((40, 2), np.nan)
+
+    pos = layout.force_layout(positions, sources, targets, iterations=100, spacing=100.0)
+
+    edge = np.linalg.norm(pos[sources] - pos[targets], axis=1)
+    everything = np.linalg.norm(pos[:, None] - pos[None, :], axis=2)[np.triu_indices(40, 1)]
+    assert not np.isnan(pos).any()
+    assert np.median(edge) < np.median(everything) / 2
+
+
+def test_mesh_repulsion_approximates_the_exact_sum():
+    rng = np.random.default_rng(3)
+    pos = rng.uniform(0, 4000, (800, 2))
+    rows = np.arange(800)
+
+    exact = layout._exact_repulsion(pos, rows, 200.0 ** 2)
+    mesh = layout._mesh_repulsion(pos, rows, 200.0 ** 2, 200.0)
+
+    error = np.linalg.norm(exact - mesh, axis=1) / np.linalg.norm(exact, axis=1)
+    assert np.median(error) < 0.1
@@ -0,0 +1,44 @@
+"""Process startup, drain and shutdown hooks"""
+
+from lifecycle import Lifecycle
+
+
+def recording_lifecycle(calls):
+    lifecycle = Lifecycle()
+    lifecycle.on_startup(lambda: calls.append('open database'))
+    lifecycle.on_startup(lambda: calls.append('warm index'))
+    lifecycle.on_drain(lambda: calls.append('end streams'))
+    lifecycle.on_shutdown(lambda: calls.append('close database'))
+    lifecycle.on_shutdown(lambda: calls.append('stop pools'))
+    return lifecycle
+
+
+def test_hooks_run_once_in_order():
+    calls = []
+    lifecycle = recording_lifecycle(calls)
+
+    lifecycle.drain()
+    lifecycle.stop()
+    assert calls == []  # nothing to stop before a start
+
+    lifecycle.start()
+    lifecycle.start()
+    lifecycle.stop()
+    lifecycle.drain()
+    lifecycle.stop()
+
+    assert calls == ['open database', 'warm index', 'end streams', 'stop pools', 'close database']
+
+
+def test_a_failing_hook_does_not_stop_the_rest():
+    calls = []
+    lifecycle = recording_lifecycle(calls)
+
+    def broken():
+        raise RuntimeError('pool already gone')
+
+    lifecycle.shutdown_hooks.insert(1, broken)
+    lifecycle.start()
+    lifecycle.stop()
+
+    assert calls[-2:] == ['stop pools', 'close database']
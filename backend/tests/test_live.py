@@ -0,0 +1,101 @@
+"""Server-sent change events (GET /api/projects/<id>/events) and subscriber buffers"""
+
+import json
+import time
+
+import pytest
+
+import app as app_module
+import live
+from models import Project
+
+
+@pytest.fixture
+def events(app, client, auth, monkeypatch):
+    """Open an event stream; returns a function reading its next non-keepalive frame"""
+    monkeypatch.setitem(app.config, 'LIVE_HEARTBEAT_SECONDS', 0.05)
+    token = auth['Authorization'].split()[1]
+    opened = []
+
+    def open_stream(project, last_event_id=None):
+        query = f'token={token}' + (f'&last_event_id={last_event_id}' if last_event_id is not None else '')
+        response = client.get(f'/api/projects/{project}/events?{query}', buffered=False)
+        assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+        opened.append(response)
+        frames = iter(response.response)
+        assert next(frames).startswith(b'retry:')
+
+        def next_frame(timeout=5):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                frame = next(frames).decode()
+                if not frame.startswith(':'):
+                    fields = dict(line.split(': ', 1) for line in frame.strip().split('\n'))
+                    return fields['event'], int(fields['id']), json.loads(fields['data'])
+            raise AssertionError('no event before the timeout')
+
+        return next_frame
+
+    yield open_stream
+    for response in opened:
+        response.close()
+
+
+def version_of(client, auth, project):
+    return client.get(f'/api/projects/{project}/changes?since=0', headers=auth).get_json()['version']
+
+
+def test_writes_are_pushed(client, auth, project, events):
+    next_frame = events(project)
+
+    character = client.post(f'/api/projects/{project}/characters', json={'name': 'Mira'}, headers=auth).get_json()
+
+    name, version, payload = next_frame()
+    assert name == 'changes'
+    assert version == payload['version'] == version_of(client, auth, project)
+    assert [char['id'] for char in payload['characters']] == [character['id']]
+
+
+def test_last_event_id_resumes_from_the_change_log(client, auth, project, events):
+    base = f'/api/projects/{project}/characters'
+    client.post(base, json={'name': 'Mira'}, headers=auth)
+    since = version_of(client, auth, project)
+    client.post(base, json={'name': 'Oren'}, headers=auth)
+    client.post(base, json={'name': 'Sela'}, headers=auth)
+
+    name, version, payload = events(project, last_event_id=since)()
+
+    assert (name, version) == ('changes', version_of(client, auth, project))
+    assert [char['name'] for char in payload['characters']] == ['Oren', 'Sela']
+
+
+def test_a_version_before_the_log_resets(client, auth, project, events):
+    # A project whose early writes predate the change log
+    with app_module.app.app_context():
+        app_module.db.session.query(Project).filter_by(id=project).update({'version': 5, 'changes_floor': None})
+        app_module.db.session.commit()
+    client.post(f'/api/projects/{project}/characters', json={'name': 'Mira'}, headers=auth)
+
+    name, version, payload = events(project, last_event_id=0)()
+
+    assert name == 'reset' and payload['reset']
+    assert version == version_of(client, auth, project)
+
+
+def test_streams_need_a_token(client, project):
+    assert client.get(f'/api/projects/{project}/events').status_code == 401
+    assert client.get(f'/api/projects/{project}/events?token=nope').status_code == 401
+
+
+def test_an_overflowing_subscriber_is_told_to_catch_up():
+    subscriber = live.Subscriber(1, 0, buffer_size=2)
+    for version in range(1, 4):
+        subscriber.deliver({'since': version - 1, 'version': version})
+
+    with pytest.raises(live.Overflow):
+        subscriber.next_event(0)
+    assert subscriber.next_event(0) is None
+
+    subscriber.close()
+    with pytest.raises(live.Closed):
+        subscriber.next_event(0)
@@ -0,0 +1,76 @@
+"""Character mentions in the documents (GET /api/projects/<id>/mentions) and the automaton behind them"""
+
+import random
+import re
+import uuid
+
+import mentions
+
+
+def save(client, auth, path, content):
+    response = client.put('/api/documents/file', json={'path': path, 'content': content}, headers=auth)
+    assert response.status_code in (200, 201), response.get_json()
+
+
+def found(client, auth, project, **query):
+    response = client.get(f'/api/projects/{project}/mentions', query_string=query, headers=auth)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['characters']
+
+
+def test_mentions_follow_characters_and_documents(client, auth, project):
+    base = f'/api/projects/{project}/characters'
+    path = f'Notes & Ideas/Mentions {uuid.uuid4().hex}.md'
+    content = 'Mira Valen met THE ARCHIVIST. Later, mira valen left; Miranda stayed.'
+    save(client, auth, path, content)
+    mira = client.post(base, json={'name': 'Mira Valen'}, headers=auth).get_json()
+    keeper = client.post(base, json={'name': 'The Archivist'}, headers=auth).get_json()
+
+    [result] = found(client, auth, project, character=mira['id'], document=path, context=4)
+    [document] = result['documents']
+    assert result['mentions'] == document['count'] == 2
+    assert [content[start:end] for start, end in document['spans']] == ['Mira Valen', 'mira valen']
+    assert document['snippets'][0] == 'Mira Valen met'
+
+    # An alias is picked up, a rename drops the old name
+    client.put(f"{base}/{keeper['id']}", json={'name': 'Oren', 'metadata': {'aliases': ['Miranda']}}, headers=auth)
+    [result] = found(client, auth, project, character=keeper['id'], document=path)
+    assert [content[start:end] for start, end in result['documents'][0]['spans']] == ['Miranda']
+
+    save(client, auth, path, 'Nobody here.')
+    [result] = found(client, auth, project, character=mira['id'], document=path)
+    assert result['mentions'] == 0
+
+
+def test_unknown_names_and_bad_arguments(client, auth, project):
+    url = f'/api/projects/{project}/mentions'
+    assert client.get(f'{url}?character=999999', headers=auth).status_code == 404
+    assert client.get(f'{url}?document=Nowhere/missing.md', headers=auth).status_code == 404
+    for query in ('character=x', 'context=9999', 'document=../etc/passwd'):
+        assert client.get(f'{url}?{query}', headers=auth).status_code == 400, query
+
+
+def leftmost_longest(patterns, text):
+    """Whole-word occurrences of every pattern, leftmost first, longest at a tie, without overlaps"""
+    occurrences = sorted(
+        ((match.start(), -len(pattern), pattern) for pattern in patterns
+         for match in re.finditer(rf'(?<!\w)(?={re.escape(pattern)}(?!\w))', text)),
+    )
+    matches, covered = [], 0
+    for start, negative, pattern in occurrences:
+        if start >= covered:
+            matches.append((start, start - negative, pattern))
+            covered = start - negative
+    return matches
+
+
+def test_automaton_matches_a_regex_reference():
+    rng = random.Random(3)
+    words = ['ka', 'kar', 'ren', 'mi', 'mira', 'ra', 'val']
+    for _ in range(300):
+        patterns = sorted({' '.join(rng.choices(words, k=rng.randint(1, 2))) for _ in range(4)})
+        text = ' '.join(rng.choices(words + ['x', 'miraval'], k=12))
+
+        automaton = mentions.Automaton((pattern, pattern) for pattern in patterns)
+
+        assert automaton.scan(text) == leftmost_longest(patterns, text), (patterns, text)
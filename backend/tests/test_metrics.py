@@ -0,0 +1,30 @@
+"""Request instrumentation: Server-Timing and the token-protected metrics endpoints"""
+
+import pytest
+
+
+def test_responses_carry_server_timing(client, auth, project):
+    timing = client.get(f'/api/projects/{project}/graph', headers=auth).headers['Server-Timing']
+
+    assert 'total;dur=' in timing
+    assert 'db;' in timing
+
+
+@pytest.mark.parametrize('url', ['/api/metrics', '/api/auth/cache'])
+def test_operational_endpoints_need_the_metrics_token(client, auth, monkeypatch, url):
+    monkeypatch.setitem(client.application.config, 'METRICS_TOKEN', None)
+    assert client.get(url).status_code == 404
+
+    monkeypatch.setitem(client.application.config, 'METRICS_TOKEN', 'scrape-secret')
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+def test_metrics_count_requests_per_endpoint(client, auth, project, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'METRICS_TOKEN', 'scrape-secret')
+    client.get(f'/api/projects/{project}/graph', headers=auth)
+
+    body = client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+
+    assert 'get_project_graph' in body
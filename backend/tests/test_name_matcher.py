@@ -0,0 +1,77 @@
+"""Fuzzy name matching (POST /api/projects/<id>/characters/match) and the trigram index"""
+
+import random
+
+from name_matcher import NameIndex, bounded_levenshtein, normalize, similarity
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def match(client, auth, project, body):
+    return client.post(f'/api/projects/{project}/characters/match', json=body, headers=auth)
+
+
+def test_misspelled_names_resolve(client, auth, project):
+    base = f'/api/projects/{project}/characters'
+    mira = client.post(base, json={'name': 'Mira Valen'}, headers=auth).get_json()
+    client.post(base, json={'name': 'Oren Thal'}, headers=auth)
+
+    response = match(client, auth, project, {'names': ['mira valne', 'Nobody At All'], 'limit': 1})
+
+    assert response.status_code == 200
+    found, missing = response.get_json()['results']
+    assert [m['id'] for m in found['matches']] == [mira['id']]
+    assert 0.7 <= found['matches'][0]['score'] < 1
+    assert missing == {'name': 'Nobody At All', 'matches': []}
+
+
+def test_index_is_rebuilt_after_a_rename(client, auth, project):
+    base = f'/api/projects/{project}/characters'
+    character = client.post(base, json={'name': 'Mira Valen'}, headers=auth).get_json()
+    assert match(client, auth, project, {'names': ['Mira Valen']}).get_json()['results'][0]['matches']
+
+    client.put(f"{base}/{character['id']}", json={'name': 'Sela Dorn'}, headers=auth)
+
+    old, new = match(client, auth, project, {'names': ['Mira Valen', 'Sela Dorn']}).get_json()['results']
+    assert old['matches'] == []
+    assert new['matches'] == [{'id': character['id'], 'name': 'Sela Dorn', 'score': 1.0}]
+
+
+def test_bad_bodies_are_400(client, auth, project):
+    for body in ({}, {'names': 'Mira'}, {'names': ['Mira'], 'limit': 0},
+                 {'names': ['Mira'], 'threshold': 2}, {'names': ['x'] * 501}):
+        assert match(client, auth, project, body).status_code == 400, body
+
+
+def test_bounded_levenshtein_agrees_with_the_full_distance():
+    rng = random.Random(7)
+    for _ in range(500):
+        a = ''.join(rng.choice('abc ') for _ in range(rng.randint(0, 8)))
+        b = ''.join(rng.choice('abc ') for _ in range(rng.randint(0, 8)))
+        bound = rng.randint(0, 8)
+        distance = levenshtein(a, b)
+        assert bounded_levenshtein(a, b, bound) == (distance if distance <= bound else None), (a, b, bound)
+
+
+def test_index_matches_a_brute_force_scan():
+    rng = random.Random(11)
+    syllables = ['ka', 'ren', 'mi', 'ra', 'val', 'en', 'or', 'thal', 'se', 'la']
+    names = [' '.join(''.join(rng.choice(syllables) for _ in range(2)) for _ in range(2)) for _ in range(300)]
+    index = NameIndex(1, 1, list(enumerate(names)))
+
+    for query in rng.sample(names, 40) + ['kara valen', 'mira thal']:
+        key = normalize(query)
+        expected = sorted(
+            ((-similarity(key, normalize(name)), name, slot) for slot, name in enumerate(names)
+             if similarity(key, normalize(name)) >= 0.7)
+        )[:3]
+        got = index.match(query, limit=3, threshold=0.7)
+        assert [(m['score'], m['name']) for m in got] == [(round(-s, 4), n) for s, n, _ in expected], query
@@ -0,0 +1,26 @@
+"""Paged and streamed listings get their own ETags"""
+
+import pytest
+
+
+@pytest.mark.parametrize('resource', ['characters', 'relationships'])
+def test_pages_and_streams_have_distinct_etags(client, auth, project, resource):
+    client.post(f'/api/projects/{project}/batch', headers=auth, json={'operations': [
+        {'op': 'create', 'type': 'character', 'data': {'name': 'A'}},
+        {'op': 'create', 'type': 'character', 'data': {'name': 'B'}},
+        {'op': 'create', 'type': 'character', 'data': {'name': 'C'}},
+        {'op': 'create', 'type': 'relationship',
+         'data': {'source_character_name': 'A', 'target_character_name': 'B', 'label': 'ally of'}},
+        {'op': 'create', 'type': 'relationship',
+         'data': {'source_character_name': 'B', 'target_character_name': 'C', 'label': 'rival of'}},
+    ]})
+    url = f'/api/projects/{project}/{resource}'
+    queries = ['', '?limit=1', '?limit=1&after=1', '?limit=2', '?stream=ndjson', '?stream=json']
+
+    etags = [client.get(url + query, headers=auth).headers['ETag'] for query in queries]
+    assert len(set(etags)) == len(queries)
+
+    full = etags[0]
+    response = client.get(url + '?limit=1', headers=dict(auth, **{'If-None-Match': full}))
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
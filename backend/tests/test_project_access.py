@@ -0,0 +1,61 @@
+"""Project ownership checks (verify_project_access and the auth cache behind it)"""
+
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import event
+
+import app as app_module
+
+
+def test_foreign_project_is_404(client, auth, project):
+    other = client.post('/api/auth/signup', json={
+        'name': 'Other', 'email': f'other-{project}@example.com', 'password': 'correct horse'
+    }).get_json()['token']
+
+    response = client.get(f'/api/projects/{project}/characters', headers={'Authorization': f'Bearer {other}'})
+
+    assert response.status_code == 404
+    assert response.get_json() == {'message': 'Project not found'}
+
+
+def test_project_created_by_another_process_is_accessible(client, auth, project):
+    # Warm the membership cache, then insert a project behind the app's back
+    # (another worker, or the import/archive CLIs)
+    assert client.get(f'/api/projects/{project}', headers=auth).status_code == 200
+    with app_module.app.app_context():
+        user_id = app_module.db.session.get(app_module.Project, project).user_id
+        path = app_module.db.engine.url.database
+    conn = sqlite3.connect(path)
+    with conn:
+        now = datetime.utcnow().isoformat(sep=' ')
+        new_id = conn.execute(
+            'INSERT INTO projects (user_id, name, description, version, created_at, updated_at) VALUES (?, ?, ?, 1, ?, ?)',
+            (user_id, 'Elsewhere', '', now, now)
+        ).lastrowid
+    conn.close()
+
+    listed = [item['id'] for item in client.get('/api/projects', headers=auth).get_json()]
+    assert new_id in listed
+    assert client.get(f'/api/projects/{new_id}', headers=auth).status_code == 200
+    assert client.get(f'/api/projects/{new_id}/characters', headers=auth).status_code == 200
+
+
+def test_repeat_requests_are_authorized_from_the_cache(client, auth, project):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    url = f'/api/projects/{project}/characters'
+    client.get(url, headers=auth)
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get(url, headers=auth).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements
+    assert not [statement for statement in statements if 'FROM users' in statement or 'projects.user_id' in statement]
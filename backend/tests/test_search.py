@@ -0,0 +1,62 @@
+"""Full-text search (GET /api/projects/<id>/search) and the in-process fallback index"""
+
+from search import InvertedIndex
+
+
+def search(client, auth, project, query, kinds='character'):
+    response = client.get(f'/api/projects/{project}/search?q={query}&kinds={kinds}', headers=auth)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['results']
+
+
+def test_index_follows_writes(client, auth, project):
+    base = f'/api/projects/{project}/characters'
+    character = client.post(base, json={'name': 'Mira Valen', 'description': 'A cartographer of the north'},
+                            headers=auth).get_json()
+
+    [found] = search(client, auth, project, 'cartographer')
+    assert (found['id'], found['title']) == (character['id'], 'Mira Valen')
+    assert '<mark>cartographer</mark>' in found['snippet']
+    assert [hit['title'] for hit in search(client, auth, project, 'cart')] == ['Mira Valen']
+
+    client.put(f"{base}/{character['id']}", json={'description': 'A smuggler of maps'}, headers=auth)
+    assert search(client, auth, project, 'cartographer') == []
+    assert [hit['id'] for hit in search(client, auth, project, 'smuggler')] == [character['id']]
+
+    client.delete(f"{base}/{character['id']}", headers=auth)
+    assert search(client, auth, project, 'smuggler') == []
+
+
+def test_results_stay_in_their_project(client, auth, project):
+    other = client.post('/api/projects', json={'name': 'Elsewhere'}, headers=auth).get_json()['id']
+    client.post(f'/api/projects/{other}/characters', json={'name': 'Oren', 'description': 'Lighthouse keeper'},
+                headers=auth)
+
+    assert search(client, auth, project, 'lighthouse') == []
+    assert len(search(client, auth, other, 'lighthouse')) == 1
+
+
+def test_documents_are_searched(client, auth, project):
+    results = search(client, auth, project, 'eldoria', kinds='document')
+
+    assert results
+    assert all(hit['kind'] == 'document' and hit['id'].endswith('.md') for hit in results)
+
+
+def test_bad_arguments_are_400(client, auth, project):
+    assert client.get(f'/api/projects/{project}/search', headers=auth).status_code == 400
+    assert client.get(f'/api/projects/{project}/search?q=a&kinds=spells', headers=auth).status_code == 400
+
+
+def test_inverted_index_ranks_and_forgets():
+    index = InvertedIndex({'title': 3.0, 'body': 1.0})
+    index.add('a', {'title': 'Mira', 'body': 'sails north'})
+    index.add('b', {'title': 'Oren', 'body': 'Mira taught Oren to sail'})
+
+    assert [key for _, key in index.search('mira')] == ['a', 'b']
+    assert [key for _, key in index.search('sail')] == ['a', 'b']
+    assert [key for _, key in index.search('mira north')] == ['a']
+
+    index.remove('a')
+    assert [key for _, key in index.search('mira')] == ['b']
+    assert len(index) == 1
@@ -0,0 +1,59 @@
+"""Row serializers for the large listings, and negotiated response compression"""
+
+import gzip
+
+import pytest
+
+
+@pytest.fixture
+def world(client, auth, project):
+    base = f'/api/projects/{project}'
+    ids = []
+    for i, (description, metadata) in enumerate([
+        ('Cartographer of "the north"', {'age': 31, 'tags': ['guide', 'ñandú']}),
+        ('Keeper\nof the light \\ tower', {}),
+        ('', {'alive': False, 'rank': 0, 'title': None}),
+    ] * 10):
+        character = client.post(f'{base}/characters', json={
+            'name': f'Character {i} ✦', 'description': description, 'metadata': metadata,
+            'position': {'x': i * 10.5, 'y': -i}, 'colors': {'background': '#fff'}
+        }, headers=auth).get_json()
+        ids.append(character['id'])
+    for source, target in zip(ids, ids[1:]):
+        client.post(f'{base}/relationships', json={
+            'source_character_id': source, 'target_character_id': target, 'label': 'knows «well»'
+        }, headers=auth)
+    return project
+
+
+@pytest.mark.parametrize('path', ['characters', 'relationships', 'graph'])
+def test_row_serializer_matches_to_dict(app, client, auth, world, monkeypatch, path):
+    url = f'/api/projects/{world}/{path}'
+    rows = client.get(url, headers=auth).get_json()
+    monkeypatch.setitem(app.config, 'ROW_SERIALIZER', False)
+
+    assert client.get(url, headers=auth).get_json() == rows
+
+
+def test_large_responses_are_gzipped(client, auth, world):
+    url = f'/api/projects/{world}/graph'
+    plain = client.get(url, headers=auth)
+    zipped = client.get(url, headers={**auth, 'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert len(zipped.get_data()) < len(plain.get_data())
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert zipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    for etag in (plain.headers['ETag'], zipped.headers['ETag']):
+        revalidated = client.get(url, headers={**auth, 'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert revalidated.status_code == 304
+
+
+def test_small_responses_are_sent_as_is(client, auth, project):
+    response = client.get(f'/api/projects/{project}', headers={**auth, 'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,30 @@
+"""Project versions and conditional GETs (ETag / If-None-Match -> 304)"""
+
+
+def test_each_representation_has_its_own_etag(client, auth, project):
+    for name in ('A', 'B'):
+        client.post(f'/api/projects/{project}/characters', json={'name': name}, headers=auth)
+    ids = [char['id'] for char in client.get(f'/api/projects/{project}/characters', headers=auth).get_json()]
+    base = f'/api/projects/{project}'
+    urls = [base, f'{base}/graph', f'{base}/characters', f'{base}/relationships',
+            f'{base}/characters/{ids[0]}', f'{base}/characters/{ids[1]}', f'{base}/characters?fields=name']
+
+    etags = [client.get(url, headers=auth).headers['ETag'] for url in urls]
+
+    assert len(set(etags)) == len(urls)
+
+
+def test_304_until_the_project_changes(client, auth, project):
+    url = f'/api/projects/{project}/graph'
+    etag = client.get(url, headers=auth).headers['ETag']
+    conditional = dict(auth, **{'If-None-Match': etag})
+
+    unchanged = client.get(url, headers=conditional)
+    assert unchanged.status_code == 304
+    assert unchanged.data == b''
+
+    client.post(f'/api/projects/{project}/characters', json={'name': 'A'}, headers=auth)
+    changed = client.get(url, headers=conditional)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert [node['name'] for node in changed.get_json()['nodes']] == ['A']
@@ -0,0 +1,71 @@
+"""
+Per-project version counters.
+
+Every flush that writes a project's characters or relationships (or the
+project row itself) bumps projects.version in the same transaction. Read
+endpoints use the version as a strong ETag and answer If-None-Match with
+304 without touching the character or relationship tables.
+"""
+
+from sqlalchemy import event, inspect
+from models import db, Project, Character, CharacterRelationship
+
+VERSIONED_MODELS = (Character, CharacterRelationship)
+
+
+def _touched_project_ids(session):
+    """Collect ids of projects whose content a pending flush changes"""
+    project_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, VERSIONED_MODELS):
+            if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                continue
+            history = inspect(obj).attrs.project_id.history
+            project_ids.update(pid for pid in history.sum() if pid is not None)
+        elif isinstance(obj, Project) and obj.id is not None and obj not in session.new:
+            if obj in session.deleted or session.is_modified(obj, include_collections=False):
+                project_ids.add(obj.id)
+    return project_ids
+
+
+def bump_versions(connection, project_ids):
+    """Increment the version of each project in project_ids"""
+    if not project_ids:
+        return
+    projects = Project.__table__
+    connection.execute(
+        projects.update()
+        .where(projects.c.id.in_(sorted(project_ids)))
+        .values(version=projects.c.version + 1)
+    )
+
+
+def get_project_version(project_id):
+    """Current version of a project, or None if it doesn't exist"""
+    return db.session.query(Project.version).filter_by(id=project_id).scalar()
+
+
+def project_etag(project_id, version, *parts):
+    """Strong ETag value for a representation of a project at a version (empty parts are skipped)"""
+    return '-'.join([f'p{project_id}', f'v{version}'] + [str(part) for part in parts if part != ''])
+
+
+def install():
+    """Hook version bumping into session flushes"""
+
+    @event.listens_for(db.session, 'before_flush')
+    def collect_touched_projects(session, flush_context, instances):
+        session.info.setdefault('touched_projects', set()).update(_touched_project_ids(session))
+
+    @event.listens_for(db.session, 'after_flush')
+    def bump_touched_projects(session, flush_context):
+        project_ids = session.info.pop('touched_projects', set())
+        # New rows only know their project once flushed
+        for obj in session.new:
+            if isinstance(obj, VERSIONED_MODELS) and obj.project_id is not None:
+                project_ids.add(obj.project_id)
+        bump_versions(session.connection(), project_ids)
+
+    @event.listens_for(db.session, 'after_soft_rollback')
+    def discard_touched_projects(session, previous_transaction):
+        session.info.pop('touched_projects', None)
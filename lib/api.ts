@@ -69,6 +69,7 @@ export interface Project {
   user_id: number
   name: string
   description?: string
+  version?: number
   created_at?: string
   updated_at?: string
 }
@@ -95,6 +96,7 @@ export interface Character {
   project_id: number
   name: string
   description?: string
+  summary?: string
   position?: { x: number; y: number } | null
   colors?: {
     bg?: string
@@ -111,12 +113,37 @@ export interface Character {
   }
 }
 
-export async function getCharacters(projectId: number): Promise<Character[]> {
-  return apiRequest<Character[]>(`/api/projects/${projectId}/characters`)
+// Sparse fieldsets: only these keys (plus id) come back. Characters also
+// accept 'summary', the description cut to summaryLength characters.
+export interface FieldsOptions {
+  fields?: string[]
+  summaryLength?: number
 }
 
-export async function getCharacter(projectId: number, characterId: number): Promise<Character> {
-  return apiRequest<Character>(`/api/projects/${projectId}/characters/${characterId}`)
+function fieldsQuery(options: FieldsOptions, edgeFields?: string[]): string {
+  const params = new URLSearchParams()
+  if (options.fields) params.set('fields', options.fields.join(','))
+  if (options.summaryLength) params.set('summary_length', String(options.summaryLength))
+  if (edgeFields) params.set('edge_fields', edgeFields.join(','))
+  const query = params.toString()
+  return query ? `?${query}` : ''
+}
+
+export async function getCharacters(
+  projectId: number,
+  options: FieldsOptions = {}
+): Promise<Character[]> {
+  return apiRequest<Character[]>(`/api/projects/${projectId}/characters${fieldsQuery(options)}`)
+}
+
+export async function getCharacter(
+  projectId: number,
+  characterId: number,
+  options: FieldsOptions = {}
+): Promise<Character> {
+  return apiRequest<Character>(
+    `/api/projects/${projectId}/characters/${characterId}${fieldsQuery(options)}`
+  )
 }
 
 export async function createCharacter(
@@ -168,6 +195,51 @@ export async function deleteCharacter(projectId: number, characterId: number): P
   })
 }
 
+export interface CharacterMatch {
+  id: number
+  name: string
+  score: number
+}
+
+export async function matchCharacters(
+  projectId: number,
+  names: string[],
+  options: { limit?: number; threshold?: number } = {}
+): Promise<{ results: Array<{ name: string; matches: CharacterMatch[] }> }> {
+  return apiRequest(`/api/projects/${projectId}/characters/match`, {
+    method: 'POST',
+    body: JSON.stringify({ names, ...options }),
+  })
+}
+
+// The backend matches at most this many names per request
+const MATCH_BATCH_SIZE = 500
+
+/**
+ * Map each name to the name of the project character it best matches.
+ * Names with no character scoring at least threshold are left out.
+ */
+export async function resolveCharacterNames(
+  projectId: number,
+  names: string[],
+  threshold: number = 0.7
+): Promise<Map<string, string>> {
+  const unique = Array.from(new Set(names.filter((name) => typeof name === 'string' && name.trim())))
+  const resolved = new Map<string, string>()
+  for (let start = 0; start < unique.length; start += MATCH_BATCH_SIZE) {
+    const { results } = await matchCharacters(projectId, unique.slice(start, start + MATCH_BATCH_SIZE), {
+      limit: 1,
+      threshold,
+    })
+    for (const result of results) {
+      if (result.matches.length > 0) {
+        resolved.set(result.name, result.matches[0].name)
+      }
+    }
+  }
+  return resolved
+}
+
 // ==================== RELATIONSHIPS ====================
 
 export interface Relationship {
@@ -183,8 +255,11 @@ export interface Relationship {
   created_at?: string
 }
 
-export async function getRelationships(projectId: number): Promise<Relationship[]> {
-  return apiRequest<Relationship[]>(`/api/projects/${projectId}/relationships`)
+export async function getRelationships(
+  projectId: number,
+  options: { fields?: string[] } = {}
+): Promise<Relationship[]> {
+  return apiRequest<Relationship[]>(`/api/projects/${projectId}/relationships${fieldsQuery(options)}`)
 }
 
 export async function createRelationship(
@@ -224,3 +299,393 @@ export async function deleteRelationship(projectId: number, relationshipId: numb
   })
 }
 
+
+// ==================== BATCH ====================
+
+export type BatchOperation =
+  | { op: 'create'; type: 'character'; data: Record<string, any> }
+  | { op: 'update'; type: 'character'; id?: number; name?: string; data: Record<string, any> }
+  | { op: 'delete'; type: 'character'; id?: number; name?: string }
+  | { op: 'create'; type: 'relationship'; data: Record<string, any> }
+  | { op: 'update'; type: 'relationship'; id: number; data: Record<string, any> }
+  | { op: 'delete'; type: 'relationship'; id: number }
+
+export interface BatchResult {
+  index: number
+  op: string
+  type: string
+  status: 'ok' | 'error'
+  message?: string
+  id?: number
+  character?: Character
+  relationship?: Relationship
+}
+
+export async function applyBatch(
+  projectId: number,
+  operations: BatchOperation[],
+  atomic: boolean = true
+): Promise<{ committed: boolean; results: BatchResult[] }> {
+  return apiRequest<{ committed: boolean; results: BatchResult[] }>(`/api/projects/${projectId}/batch`, {
+    method: 'POST',
+    body: JSON.stringify({ operations, atomic }),
+  })
+}
+
+// ==================== IMPORT ====================
+
+export interface ImportSummary {
+  created_characters: number
+  updated_characters: number
+  created_relationships: number
+  skipped_relationships: number
+  characters: Record<string, number>
+  // Entities and relationships that were skipped as malformed, by their index in the document
+  errors: Array<{ type: 'entity' | 'relationship'; index: number; message: string }>
+  // Present when new characters were placed by the server-side layout
+  layout?: LayoutSummary
+}
+
+export async function importWorld(
+  projectId: number,
+  document: {
+    entities: Array<{ name: string; description?: string }>
+    relationships: Array<{ source: string; target: string; label?: string }>
+    merge_descriptions?: boolean
+    // Place characters without a position (defaults to the server's LAYOUT_ON_IMPORT)
+    layout?: boolean
+  }
+): Promise<ImportSummary> {
+  return apiRequest<ImportSummary>(`/api/projects/${projectId}/import`, {
+    method: 'POST',
+    body: JSON.stringify(document),
+  })
+}
+
+// ==================== GRAPH ====================
+
+export interface ProjectGraph {
+  project: Project
+  nodes: Character[]
+  edges: Relationship[]
+}
+
+export async function getProjectGraph(
+  projectId: number,
+  options: FieldsOptions & { edgeFields?: string[] } = {}
+): Promise<ProjectGraph> {
+  return apiRequest<ProjectGraph>(
+    `/api/projects/${projectId}/graph${fieldsQuery(options, options.edgeFields)}`
+  )
+}
+
+export interface ProjectChanges {
+  project_id: number
+  since: number
+  version: number
+  // true when the change log can't answer from `since`: re-fetch the full graph
+  reset: boolean
+  characters?: Character[]
+  relationships?: Relationship[]
+  deleted?: { characters: number[]; relationships: number[] }
+}
+
+export async function getProjectChanges(projectId: number, since: number): Promise<ProjectChanges> {
+  return apiRequest<ProjectChanges>(`/api/projects/${projectId}/changes?since=${since}`)
+}
+
+/**
+ * Subscribe to a project's committed changes over server-sent events.
+ * EventSource reconnects on its own and resumes from the last event id;
+ * onReset means the stream couldn't catch up and the graph should be re-fetched.
+ * Returns a function that closes the stream.
+ */
+export function subscribeToProject(
+  projectId: number,
+  onChanges: (changes: ProjectChanges) => void,
+  onReset?: (changes: ProjectChanges) => void
+): () => void {
+  const token = getToken()
+  const source = new EventSource(
+    `${API_BASE_URL}/api/projects/${projectId}/events?token=${encodeURIComponent(token || '')}`
+  )
+  source.addEventListener('changes', (event) => onChanges(JSON.parse((event as MessageEvent).data)))
+  source.addEventListener('reset', (event) => onReset?.(JSON.parse((event as MessageEvent).data)))
+  return () => source.close()
+}
+
+export interface GraphNodeRef {
+  id: number
+  name: string
+  distance?: number
+}
+
+export async function getNeighborhood(
+  projectId: number,
+  characterId: number,
+  depth: number = 1,
+  direction: 'out' | 'in' | 'both' = 'both'
+): Promise<{ character_id: number; depth: number; direction: string; nodes: GraphNodeRef[] }> {
+  return apiRequest(`/api/projects/${projectId}/graph/neighborhood?character_id=${characterId}&depth=${depth}&direction=${direction}`)
+}
+
+export async function getShortestPath(
+  projectId: number,
+  sourceId: number,
+  targetId: number,
+  direction: 'out' | 'in' | 'both' = 'both'
+): Promise<{ direction: string; path: GraphNodeRef[] | null; relationship_ids: number[]; length: number | null }> {
+  return apiRequest(`/api/projects/${projectId}/graph/path?source=${sourceId}&target=${targetId}&direction=${direction}`)
+}
+
+export async function getComponents(projectId: number): Promise<{ count: number; components: GraphNodeRef[][] }> {
+  return apiRequest(`/api/projects/${projectId}/graph/components`)
+}
+
+export interface RankedCharacter extends GraphNodeRef {
+  score?: number
+  degree?: number
+  in_degree?: number
+  out_degree?: number
+}
+
+export interface ProjectAnalytics {
+  project_id: number
+  version: number
+  // true while a result for the current version is computed in the background
+  stale: boolean
+  computed_at: number
+  seconds: number
+  characters: number
+  relationships: number
+  degree: {
+    mean: number
+    median: number
+    max: number
+    isolated: number
+    // [degree, number of characters] pairs
+    distribution: Array<[number, number]>
+    top: RankedCharacter[]
+  }
+  pagerank: { damping: number; iterations: number; top: RankedCharacter[] }
+  betweenness: { sources: number; exact: boolean; top: RankedCharacter[] }
+  communities: {
+    count: number
+    modularity: number
+    top: Array<{ id: number; size: number; members: GraphNodeRef[] }>
+  }
+}
+
+/**
+ * Degree statistics, centrality and communities of a project's graph.
+ * Resolves to null while the first result is still being computed (retry shortly).
+ */
+export async function getProjectAnalytics(projectId: number, top: number = 20): Promise<ProjectAnalytics | null> {
+  const result = await apiRequest<ProjectAnalytics | { status: 'pending' }>(
+    `/api/projects/${projectId}/analytics?top=${top}`
+  )
+  return 'status' in result ? null : result
+}
+
+export interface LayoutSummary {
+  mode: 'new' | 'all'
+  characters: number
+  placed: number
+  iterations: number
+  seconds: number
+  version?: number
+}
+
+/**
+ * Compute force-directed positions on the server and save them.
+ * 'new' places only characters without a position; 'all' re-lays out everything.
+ */
+export async function layoutProject(
+  projectId: number,
+  options: { mode?: 'new' | 'all'; iterations?: number; spacing?: number; seed?: number } = {}
+): Promise<LayoutSummary> {
+  return apiRequest<LayoutSummary>(`/api/projects/${projectId}/layout`, {
+    method: 'POST',
+    body: JSON.stringify(options),
+  })
+}
+
+// ==================== SEARCH ====================
+
+export interface SearchResult {
+  kind: 'character' | 'relationship' | 'document'
+  id: number | string
+  title: string
+  snippet: string
+  score: number
+}
+
+export async function searchProject(
+  projectId: number,
+  query: string,
+  options: { kinds?: Array<'character' | 'relationship' | 'document'>; limit?: number } = {}
+): Promise<{ query: string; results: SearchResult[] }> {
+  const params = new URLSearchParams({ q: query })
+  if (options.kinds) params.set('kinds', options.kinds.join(','))
+  if (options.limit) params.set('limit', String(options.limit))
+  return apiRequest(`/api/projects/${projectId}/search?${params.toString()}`)
+}
+
+export interface ProjectContext {
+  query: string
+  terms: string[]
+  budget: number
+  // characters of names, descriptions and passages returned
+  used: number
+  // true when relevant items were left out to stay within the budget
+  truncated: boolean
+  characters: Array<{ id: number; name: string; description: string; score: number }>
+  documents: Array<{
+    path: string
+    name: string
+    chunks: Array<{ chunk: number; heading: string; text: string; score: number }>
+  }>
+}
+
+/**
+ * Characters and document passages most relevant to a query, within budget characters.
+ * Passages of the given documents are always considered.
+ */
+export async function getProjectContext(
+  projectId: number,
+  query: string,
+  options: { budget?: number; kinds?: Array<'character' | 'document'>; documents?: string[] } = {}
+): Promise<ProjectContext> {
+  const params = new URLSearchParams({ q: query })
+  if (options.budget) params.set('budget', String(options.budget))
+  if (options.kinds) params.set('kinds', options.kinds.join(','))
+  for (const path of options.documents || []) params.append('document', path)
+  return apiRequest(`/api/projects/${projectId}/context?${params.toString()}`)
+}
+
+export interface CharacterMentions {
+  id: number
+  name: string
+  // mentions across all the documents listed
+  mentions: number
+  documents: Array<{
+    path: string
+    name: string
+    count: number
+    // [start, end) offsets into the document's content
+    spans: Array<[number, number]>
+    // text around each span, when options.context is set
+    snippets?: string[]
+  }>
+}
+
+/**
+ * Where the project's characters (by name or metadata.aliases) are named in the documents.
+ * characterIds and document narrow the result; context adds that many characters around each mention.
+ */
+export async function getMentions(
+  projectId: number,
+  options: { characterIds?: number[]; document?: string; context?: number } = {}
+): Promise<{ characters: CharacterMentions[]; documents_scanned: number }> {
+  const params = new URLSearchParams()
+  for (const id of options.characterIds || []) params.append('character', String(id))
+  if (options.document) params.set('document', options.document)
+  if (options.context) params.set('context', String(options.context))
+  return apiRequest(`/api/projects/${projectId}/mentions?${params.toString()}`)
+}
+
+// ==================== EXTRACTION ====================
+
+export interface ExtractionResult {
+  entities: Array<{ name: string; description: string }>
+  relationships: Array<{ source: string; target: string; label: string }>
+}
+
+export interface ExtractionJob {
+  id: number
+  project_id: number
+  status: 'queued' | 'running' | 'done' | 'failed'
+  // document path, or null for submitted text
+  source: string | null
+  extractor: string
+  // chunks of the text, how many have finished and how many of those came from the cache
+  progress: { total: number; done: number; cached: number }
+  error: string | null
+  created_at: string
+  finished_at: string | null
+  // merged result, once status is 'done' (absent from startExtraction and listExtractions)
+  result?: ExtractionResult | null
+}
+
+/** Queue extraction over some text or a document of the corpus; poll getExtraction for the result */
+export async function startExtraction(
+  projectId: number,
+  input: { text: string } | { document: string }
+): Promise<ExtractionJob> {
+  return apiRequest(`/api/projects/${projectId}/extractions`, {
+    method: 'POST',
+    body: JSON.stringify(input),
+  })
+}
+
+export async function getExtraction(projectId: number, jobId: number): Promise<ExtractionJob> {
+  return apiRequest(`/api/projects/${projectId}/extractions/${jobId}`)
+}
+
+/** The project's most recent extraction jobs, without results */
+export async function listExtractions(projectId: number): Promise<ExtractionJob[]> {
+  const data = await apiRequest<{ jobs: ExtractionJob[] }>(`/api/projects/${projectId}/extractions`)
+  return data.jobs
+}
+
+// ==================== DOCUMENTS ====================
+
+export interface DocumentTreeItem {
+  name: string
+  path: string
+  type: 'file' | 'directory'
+  children?: DocumentTreeItem[]
+  size?: number
+  modified?: string
+}
+
+export interface DocumentFile {
+  name: string
+  path: string
+  content: string
+  size: number
+  modified: string
+}
+
+/** Folder tree of the documents/ corpus, in the saved order */
+export async function getDocumentTree(): Promise<DocumentTreeItem[]> {
+  const data = await apiRequest<{ documents: DocumentTreeItem[] }>('/api/documents')
+  return data.documents
+}
+
+export async function getDocument(path: string): Promise<DocumentFile> {
+  return apiRequest<DocumentFile>(`/api/documents/file?path=${encodeURIComponent(path)}`)
+}
+
+/** Several documents in one request (at most 100); paths that don't exist come back in missing */
+export async function getDocuments(paths: string[]): Promise<{ documents: DocumentFile[]; missing: string[] }> {
+  return apiRequest('/api/documents/batch', {
+    method: 'POST',
+    body: JSON.stringify({ paths }),
+  })
+}
+
+export async function saveDocument(path: string, content: string): Promise<Omit<DocumentFile, 'content'>> {
+  return apiRequest('/api/documents/file', {
+    method: 'PUT',
+    body: JSON.stringify({ path, content }),
+  })
+}
+
+/** Folder path ('.' for the top level) -> ordered child paths */
+export async function saveDocumentOrder(order: Record<string, string[]>): Promise<void> {
+  await apiRequest('/api/documents/order', {
+    method: 'PUT',
+    body: JSON.stringify({ order }),
+  })
+}